@@ -0,0 +1,239 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+"""
+AdminIndex.py
+
+This module manages the links of the running jobs in ADMINDIR ( the "process table" of Mobyle )
+and an index of these links by the md5 of the jobs, used to limit the number of similar jobs.
+
+The index is a directory by md5 in ADMINDIR/.digests, each one containing a relative link
+to the ADMINDIR link of each running job with this md5::
+
+  ADMINDIR/.digests/<md5>/<service>.<job key> -> ../../<service>.<job key> -> <job dir>/.admin
+
+The links are created and removed atomically. The index is replaced by L{rebuild} under a WRITE
+lock on ADMINDIR/.digests.lock, the entries are added and removed under a READ lock, thus an
+entry is never added to an index which is being replaced. An entry whose job link has been
+removed without updating the index ( a crash ) is dangling, it is ignored and removed by
+L{count}. The index can be rebuilt from the ADMINDIR links by L{rebuild}.
+"""
+
+import os
+import errno
+import shutil
+
+from logging import getLogger
+a_log = getLogger( __name__ )
+
+from Mobyle.Admin import Admin
+from Mobyle.MobyleError import MobyleError
+from Mobyle.ConfigManager import Config
+from Mobyle.LockManager import lockManager
+
+DIGESTS = '.digests'
+
+
+def _digestsDir( adminDir = None ):
+    if adminDir is None:
+        adminDir = Config().admindir()
+    return os.path.join( adminDir , DIGESTS )
+
+
+def _lock( adminDir , lockType ):
+    """
+    @return: the lock file of the md5 index of adminDir, locked with lockType
+    @rtype: file object
+    @raise IOError: if the lock cannot be acquired
+    """
+    lockFile = open( os.path.join( adminDir , DIGESTS + '.lock' ) , 'a+' )
+    try:
+        lockManager.acquire( lockFile , lockType )
+    except:
+        lockFile.close()
+        raise
+    return lockFile
+
+
+def _unlock( lockFile ):
+    try:
+        lockManager.release( lockFile )
+    finally:
+        lockFile.close()
+
+
+def _getDigest( adminPath ):
+    """
+    @return: the md5 of the job or None if the job must not be indexed ( no md5 or a job of a workflow )
+    @rtype: string
+    """
+    adm = Admin( adminPath )
+    if adm.getWorkflowID():
+        #a workflow is allowed to run several identical jobs in parallel
+        return None
+    return adm.getMd5()
+
+
+def _addEntry( digestsDir , digest , name ):
+    digestDir = os.path.join( digestsDir , digest )
+    for attempt in range( 3 ):
+        try:
+            os.mkdir( digestDir )
+        except OSError , err :
+            if err.errno == errno.ENOENT:
+                #no index, the job will be indexed when it is rebuilt from the ADMINDIR links
+                return
+            if err.errno != errno.EEXIST:
+                raise
+        try:
+            os.symlink( os.path.join( os.pardir , os.pardir , name ) , os.path.join( digestDir , name ) )
+            return
+        except OSError , err :
+            if err.errno == errno.EEXIST:
+                return
+            if err.errno != errno.ENOENT:
+                raise
+            #the directory has been removed by an other process between makedirs and symlink
+
+
+def link( adminPath , linkName ):
+    """
+    link the .admin file of a job in ADMINDIR and index it by its md5
+    @param adminPath: the absolute path of the .admin file of the job
+    @type adminPath: string
+    @param linkName: the absolute path of the link in ADMINDIR ( ADMINDIR/<service name>.<job key> )
+    @type linkName: string
+    @raise OSError: if the link cannot be created
+    """
+    os.symlink( adminPath , linkName )
+    try:
+        digest = _getDigest( adminPath )
+        if digest:
+            adminDir = os.path.dirname( linkName )
+            if not os.path.isdir( _digestsDir( adminDir ) ):
+                #the index is built with this job
+                rebuild( adminDir , onlyIfMissing = True )
+            lockFile = _lock( adminDir , lockManager.READ )
+            try:
+                _addEntry( _digestsDir( adminDir ) , digest , os.path.basename( linkName ) )
+            finally:
+                _unlock( lockFile )
+    except ( MobyleError , OSError , IOError ) , err :
+        #the job is running, only the limit of similar jobs is affected
+        a_log.error( "cannot index %s by md5 : %s" %( linkName , err ) )
+
+
+def unlink( linkName ):
+    """
+    remove the link of a job from ADMINDIR and from the md5 index
+    @param linkName: the absolute path of the link in ADMINDIR
+    @type linkName: string
+    @raise OSError: if the link cannot be removed
+    """
+    try:
+        digest = _getDigest( linkName )
+        if digest:
+            adminDir = os.path.dirname( linkName )
+            digestDir = os.path.join( _digestsDir( adminDir ) , digest )
+            lockFile = _lock( adminDir , lockManager.READ )
+            try:
+                os.unlink( os.path.join( digestDir , os.path.basename( linkName ) ) )
+                try:
+                    os.rmdir( digestDir )
+                except OSError:
+                    pass #there are other jobs with this md5
+            finally:
+                _unlock( lockFile )
+    except ( MobyleError , OSError , IOError ) , err :
+        #the dangling entry will be removed by count
+        a_log.debug( "cannot remove %s from the md5 index : %s" %( linkName , err ) )
+    os.unlink( linkName )
+
+
+def count( serviceName , digest , adminDir = None ):
+    """
+    @param serviceName: the name of the service
+    @type serviceName: string
+    @param digest: the md5 of a job
+    @type digest: string
+    @return: the number of running jobs of this service with this md5
+    @rtype: int
+    """
+    digestsDir = _digestsDir( adminDir )
+    if not os.path.isdir( digestsDir ):
+        try:
+            rebuild( adminDir , onlyIfMissing = True )
+        except ( OSError , IOError ) , err :
+            #the limit of similar jobs is not applied rather than refusing the job
+            a_log.error( "cannot rebuild the md5 index : %s" % err )
+    digestDir = os.path.join( digestsDir , digest )
+    try:
+        names = os.listdir( digestDir )
+    except OSError:
+        return 0
+    nb_of_jobs = 0
+    for name in names:
+        if not name.startswith( serviceName + '.' ):
+            continue
+        entry = os.path.join( digestDir , name )
+        if os.path.exists( entry ):
+            nb_of_jobs += 1
+        else:
+            a_log.warning( "remove the dangling entry %s from the md5 index" % entry )
+            try:
+                os.unlink( entry )
+            except OSError:
+                pass
+    return nb_of_jobs
+
+
+def rebuild( adminDir = None , onlyIfMissing = False ):
+    """
+    rebuild the md5 index from the links in ADMINDIR.
+    The index is not modified by the other processes in the meantime ( WRITE lock ).
+    @param adminDir: the ADMINDIR path, by default Config.admindir()
+    @type adminDir: string
+    @param onlyIfMissing: do nothing if the index exists ( it has been rebuilt by another process
+    while we were waiting for the lock )
+    @type onlyIfMissing: boolean
+    @raise IOError: if the lock cannot be acquired
+    """
+    if adminDir is None:
+        adminDir = Config().admindir()
+    lockFile = _lock( adminDir , lockManager.WRITE )
+    try:
+        if onlyIfMissing and os.path.isdir( _digestsDir( adminDir ) ):
+            return
+        _rebuild( adminDir )
+    finally:
+        _unlock( lockFile )
+
+
+def _rebuild( adminDir ):
+    digestsDir = _digestsDir( adminDir )
+    newDir = "%s.%d" %( digestsDir , os.getpid() )
+    shutil.rmtree( newDir , ignore_errors = True )
+    os.makedirs( newDir )
+    for name in os.listdir( adminDir ):
+        if name.startswith( '.' ):
+            continue
+        try:
+            digest = _getDigest( os.path.join( adminDir , name ) )
+        except MobyleError , err :
+            a_log.warning( "invalid job in ADMINDIR : %s : %s" %( name , err ) )
+            continue
+        if digest:
+            _addEntry( newDir , digest , name )
+    oldDir = "%s.old.%d" %( digestsDir , os.getpid() )
+    try:
+        os.rename( digestsDir , oldDir )
+    except OSError , err :
+        if err.errno != errno.ENOENT:
+            raise
+    os.rename( newDir , digestsDir )
+    shutil.rmtree( oldDir , ignore_errors = True )
+    a_log.info( "the md5 index of %s has been rebuilt" % adminDir )
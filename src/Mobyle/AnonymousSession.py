@@ -64,9 +64,9 @@ class AnonymousSession( Session ):
                 raise SessionError , "unable to create anonymous session"
             
             if anonymousSessionAllowed == 'yes':
-                Transaction.create( os.path.join( self.Dir, self.FILENAME ) , False , True )
+                self._createStorage( False , True )
             else:#anonymousSessionAllowed == 'captcha'
-                Transaction.create( os.path.join( self.Dir , self.FILENAME ) , False , False )
+                self._createStorage( False , False )
            
             self.log.debug( "%f : %s  create a new session call by= %s" %( time() ,
                                                                         self.getKey()  , 
@@ -79,11 +79,10 @@ class AuthenticatedSession( Session ):
             
             authenticatedSessionAllowed = self.cfg.authenticatedSession()        
             if authenticatedSessionAllowed == "yes":  
-                Transaction.create( os.path.join( sessionDir , self.FILENAME ) , 
-                                    True , #authenticated
-                                    True , #activated
-                                    userEmail = str( self.__userEmail ) , 
-                                    passwd = cryptPasswd )
+                self._createStorage( True , #authenticated
+                                     True , #activated
+                                     userEmail = str( self.__userEmail ) , 
+                                     passwd = cryptPasswd )
                 self.__generateTicketId()
             elif authenticatedSessionAllowed == "email" :
                 activatingKey = self.__newActivatingKey()
@@ -97,12 +96,11 @@ class AuthenticatedSession( Session ):
                                                      'CGI_URL'        : self.cfg.cgi_url() } 
                                )
                     
-                    Transaction.create( os.path.join( sessionDir , self.FILENAME ) , 
-                                        True ,  #authenticated
-                                        False , #activated
-                                        activatingKey = activatingKey , 
-                                        userEmail = self.__userEmail , 
-                                        passwd = cryptPasswd )
+                    self._createStorage( True ,  #authenticated
+                                         False , #activated
+                                         activatingKey = activatingKey , 
+                                         userEmail = self.__userEmail , 
+                                         passwd = cryptPasswd )
                     self.__generateTicketId()
                     # api create( id , authenticated , activated , activatingKey = None , userEmail = None, passwd = None)
                 except MobyleError , err :
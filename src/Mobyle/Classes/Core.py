@@ -12,6 +12,7 @@ Content the basics Mobyle Parameter types
 
 import os 
 import re
+import sys
 from types import BooleanType , StringTypes
 from logging import getLogger
 c_log = getLogger(__name__)
@@ -22,6 +23,7 @@ import shutil
 from Mobyle.Utils import safeFileName
 from Mobyle.Classes.DataType import DataType
 from Mobyle.Service import MobyleType
+from Mobyle.FormatDetectionCache import detectionCache
 
 from Mobyle.MobyleError import MobyleError , UserValueError , UnDefAttrError , UnSupportedFormatError
 from Mobyle.ConfigManager import Config
@@ -30,6 +32,64 @@ _cfg = Config()
 
 
 
+class _WriteError( IOError ):
+    """
+    raised when the destination of a copy cannot be written ( to tell it from the errors raised
+    when the source is read )
+    """
+    pass
+
+
+class _CopyDestination( object ):
+    """
+    the file where an output file of a job is copied, the write errors are raised as L{_WriteError}
+    """
+    def __init__( self , fh ):
+        self._fh = fh
+
+    def write( self , data ):
+        try:
+            self._fh.write( data )
+        except IOError , err:
+            raise _WriteError( *err.args )
+
+
+def _copyOutputFile( src , srcFileName , abs_DestFileName , mode ):
+    """
+    copy an output file of src in abs_DestFileName without loading it in memory.
+    if the output file cannot be read ( remote portal unreachable, connection lost ... )
+    the destination file is removed and the error is raised.
+    @param src: the job which has produced the file
+    @type src: Job , JobState , MobyleJob or DataProvider instance
+    @param srcFileName: the name of the output file
+    @type srcFileName: string
+    @param abs_DestFileName: the absolute path of the file to write
+    @type abs_DestFileName: string
+    @param mode: the mode used to open the destination file ( 'w' or 'wb' )
+    @type mode: string
+    @raise _WriteError: if the destination file cannot be written
+    """
+    try:
+        f = open( abs_DestFileName , mode )
+    except IOError , err:
+        raise _WriteError( *err.args )
+    try:
+        try:
+            src.copyOutputFile( srcFileName , _CopyDestination( f ) )
+        finally:
+            f.close()
+    except _WriteError:
+        raise
+    except:
+        #a partial file must not be taken as the data
+        exc_info = sys.exc_info()
+        try:
+            os.unlink( abs_DestFileName )
+        except OSError:
+            pass
+        raise exc_info[0] , exc_info[1] , exc_info[2]
+
+
 def safeMask( mask ):
     import string
     for car in mask :
@@ -487,12 +547,9 @@ class AbstractTextDataType( DataType ):
                         c_log.error( msg )
                         raise MobyleError , "can't copy data : "+ str(err)
             else: #src is a job , jobState , MobyleJob instance ( Session is always Local )
-                data = src.getOutputFile( srcFileName )
                 try:
-                    f = open( abs_DestFileName , 'w' )
-                    f.write( data )
-                    f.close()
-                except IOError ,err:
+                    _copyOutputFile( src , srcFileName , abs_DestFileName , 'w' )
+                except _WriteError ,err:
                     msg = "unable to write data from %s to %s: %s"%(src , dest , err )
                     c_log.error( msg )
                     raise MobyleError , msg
@@ -558,7 +615,7 @@ class AbstractTextDataType( DataType ):
         
         all_converters = _cfg.dataconverter( self.__class__.__name__[:-8] )
         for converter in all_converters:
-            detected_format , seq_nb = converter.detect( absFileName )
+            detected_format , seq_nb = detectionCache.detect( converter , absFileName )
             prg = converter.program_name
             if detected_format:
                 detected_mt = MobyleType( self , dataFormat = detected_format , format_program = prg , item_nb = seq_nb) 
@@ -784,12 +841,9 @@ class BinaryDataType( DataType ):
                                                                       err )
                         raise MobyleError , "can't copy data : "+ str(err)
             else: #src is a job , jobState , MobyleJOb instance ( session is Local )
-                data = src.getOutputFile( srcFileName )
                 try:
-                    f = open( abs_DestFileName , 'wb' )
-                    f.write( data )
-                    f.close()
-                except IOError ,err:
+                    _copyOutputFile( src , srcFileName , abs_DestFileName , 'wb' )
+                except _WriteError ,err:
                     pass
         else:
             try:
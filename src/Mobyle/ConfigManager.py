@@ -165,6 +165,9 @@ class Config( object ):
             
             self._accounting = False
             self._session_debug = None
+            self._session_storage = 'xml'
+            self._lock_timeout = 5.0
+            self._qstat_cache_ttl = 5.0
             self._status_debug = False
             
             if self._htdocs_prefix:
@@ -188,6 +191,10 @@ class Config( object ):
             
             self._binary_path = []  
             self._format_detector_cache_path = None
+            self._format_detector_cache_size = 100000
+            self._format_detector_memory_cache_size = 1000
+            self._service_cache_path = os.path.realpath( os.path.join( self._services_path , 'compiled' ) )
+            self._service_cache_size = 50
             
             self._databanks_config = {}
             
@@ -209,6 +216,13 @@ class Config( object ):
             self._sessionlimit = 52428800    # 50 Mib
             self._previewDataLimit = 1048576 #  1 Mib
             self._simultaneous_jobs = 1
+            self._workflow_submission_threads = 4
+            self._workflow_server_submissions = 2
+            self._jobstate_cache_size = 1000
+            self._runner_socket = None
+            self._runner_workers = 2
+            self._remote_probe_threads = 8
+            self._remote_host_down_ttl = 60.0
             
             self._result_remain = 10 # in day
             
@@ -249,6 +263,42 @@ class Config( object ):
                 self._status_debug = Local.Config.Config.STATUS_DEBUG
             except AttributeError:
                 pass
+            try:
+                self._session_storage = Local.Config.Config.SESSION_STORAGE.lower()
+                if self._session_storage not in ( 'xml' , 'sqlite' ):
+                    msg = "SESSION_STORAGE have an invalid value : %s .\nIt must be \"xml\" or \"sqlite\"" % Local.Config.Config.SESSION_STORAGE
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "SESSION_STORAGE not found in  Local/Config/Config.py, set SESSION_STORAGE to %s" % self._session_storage )
+            try:
+                if Local.Config.Config.LOCK_TIMEOUT is None:
+                    #wait for the locks without deadline
+                    self._lock_timeout = None
+                else:
+                    self._lock_timeout = float( Local.Config.Config.LOCK_TIMEOUT )
+                if self._lock_timeout is not None and self._lock_timeout < 0 :
+                    msg = "LOCK_TIMEOUT have an invalid value : %s .\nIt must be a positive number of seconds" % Local.Config.Config.LOCK_TIMEOUT
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "LOCK_TIMEOUT not found in  Local/Config/Config.py, set LOCK_TIMEOUT to %.1f sec" % self._lock_timeout )
+            except ValueError:
+                msg = "LOCK_TIMEOUT have an invalid value : %s .\nIt must be a positive number of seconds" % Local.Config.Config.LOCK_TIMEOUT
+                self.log.error( msg )
+                raise ConfigError , msg
+            try:
+                self._qstat_cache_ttl = float( Local.Config.Config.QSTAT_CACHE_TTL )
+                if self._qstat_cache_ttl < 0 :
+                    msg = "QSTAT_CACHE_TTL have an invalid value : %s .\nIt must be a positive number of seconds" % Local.Config.Config.QSTAT_CACHE_TTL
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "QSTAT_CACHE_TTL not found in  Local/Config/Config.py, set QSTAT_CACHE_TTL to %.1f sec" % self._qstat_cache_ttl )
+            except ValueError:
+                msg = "QSTAT_CACHE_TTL have an invalid value : %s .\nIt must be a positive number of seconds" % Local.Config.Config.QSTAT_CACHE_TTL
+                self.log.error( msg )
+                raise ConfigError , msg
             ######################
             #
             #  Directories
@@ -290,6 +340,41 @@ class Config( object ):
                     raise ConfigError , msg
             except AttributeError:
                 pass
+            for option , attr in ( ( 'FORMAT_DETECTOR_CACHE_SIZE' , '_format_detector_cache_size' ) ,
+                                   ( 'FORMAT_DETECTOR_MEMORY_CACHE_SIZE' , '_format_detector_memory_cache_size' ) ):
+                try:
+                    value = int( getattr( Local.Config.Config , option ) )
+                    if value < 0 :
+                        msg = "%s have an invalid value : %s .\nIt must be a positive or null integer" %( option , getattr( Local.Config.Config , option ) )
+                        self.log.error( msg )
+                        raise ConfigError , msg
+                    setattr( self , attr , value )
+                except AttributeError:
+                    self.log.info( "%s not found in  Local/Config/Config.py, set %s to %d " %( option , option , getattr( self , attr ) ))
+                except ValueError:
+                    msg = "%s have an invalid value : %s .\nIt must be a positive or null integer" %( option , getattr( Local.Config.Config , option ) )
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            
+            try:
+                if Local.Config.Config.SERVICE_CACHE_PATH is None:
+                    self._service_cache_path = None
+                else:
+                    self._service_cache_path = os.path.realpath( Local.Config.Config.SERVICE_CACHE_PATH )
+            except AttributeError:
+                self.log.info( "SERVICE_CACHE_PATH not found in Local/Config/Config.py default value used : %s" % self._service_cache_path )
+            try:
+                self._service_cache_size = int( Local.Config.Config.SERVICE_CACHE_SIZE )
+                if self._service_cache_size < 0 :
+                    msg = "SERVICE_CACHE_SIZE have an invalid value : %s .\nIt must be a positive or null integer" % Local.Config.Config.SERVICE_CACHE_SIZE
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "SERVICE_CACHE_SIZE not found in Local/Config/Config.py, set SERVICE_CACHE_SIZE to %d" % self._service_cache_size )
+            except ValueError:
+                msg = "SERVICE_CACHE_SIZE have an invalid value : %s .\nIt must be a positive or null integer" % Local.Config.Config.SERVICE_CACHE_SIZE
+                self.log.error( msg )
+                raise ConfigError , msg
                 
             try:
                 self._databanks_config = Local.Config.Config.DATABANKS_CONFIG
@@ -520,6 +605,74 @@ class Config( object ):
                 msg = "SIMULTANEOUS_JOBS have an invalid value : %s .\nIt must be a positive or null integer" % Local.Config.Config.SIMULTANEOUS_JOBS
                 self.log.error( msg )
                 raise ConfigError , msg   
+            for option , attr in ( ( 'WORKFLOW_SUBMISSION_THREADS' , '_workflow_submission_threads' ) ,
+                                   ( 'WORKFLOW_SERVER_SUBMISSIONS' , '_workflow_server_submissions' ) ):
+                try:
+                    value = int( getattr( Local.Config.Config , option ) )
+                    if value < 1 :
+                        msg = "%s have an invalid value : %s .\nIt must be a positive integer" %( option , getattr( Local.Config.Config , option ) )
+                        self.log.error( msg )
+                        raise ConfigError , msg
+                    setattr( self , attr , value )
+                except AttributeError:
+                    self.log.info( "%s not found in  Local/Config/Config.py, set %s to %d " %( option , option , getattr( self , attr ) ))
+                except ValueError:
+                    msg = "%s have an invalid value : %s .\nIt must be a positive integer" %( option , getattr( Local.Config.Config , option ) )
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            try:
+                self._jobstate_cache_size = int( Local.Config.Config.JOBSTATE_CACHE_SIZE )
+                if self._jobstate_cache_size < 0 :
+                    msg = "JOBSTATE_CACHE_SIZE have an invalid value : %s .\nIt must be a positive or null integer" % Local.Config.Config.JOBSTATE_CACHE_SIZE
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "JOBSTATE_CACHE_SIZE not found in  Local/Config/Config.py, set JOBSTATE_CACHE_SIZE to %d " %( self._jobstate_cache_size ))
+            except ValueError:
+                msg = "JOBSTATE_CACHE_SIZE have an invalid value : %s .\nIt must be a positive or null integer" % Local.Config.Config.JOBSTATE_CACHE_SIZE
+                self.log.error( msg )
+                raise ConfigError , msg
+            try:
+                if Local.Config.Config.RUNNER_SOCKET is not None:
+                    self._runner_socket = os.path.realpath( Local.Config.Config.RUNNER_SOCKET )
+            except AttributeError:
+                self.log.info( "RUNNER_SOCKET not found in  Local/Config/Config.py, the jobs will be run without runner daemon" )
+            try:
+                self._runner_workers = int( Local.Config.Config.RUNNER_WORKERS )
+                if self._runner_workers < 1 :
+                    msg = "RUNNER_WORKERS have an invalid value : %s .\nIt must be a positive integer" % Local.Config.Config.RUNNER_WORKERS
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "RUNNER_WORKERS not found in  Local/Config/Config.py, set RUNNER_WORKERS to %d " %( self._runner_workers ))
+            except ValueError:
+                msg = "RUNNER_WORKERS have an invalid value : %s .\nIt must be a positive integer" % Local.Config.Config.RUNNER_WORKERS
+                self.log.error( msg )
+                raise ConfigError , msg
+            try:
+                self._remote_probe_threads = int( Local.Config.Config.REMOTE_PROBE_THREADS )
+                if self._remote_probe_threads < 1 :
+                    msg = "REMOTE_PROBE_THREADS have an invalid value : %s .\nIt must be a positive integer" % Local.Config.Config.REMOTE_PROBE_THREADS
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "REMOTE_PROBE_THREADS not found in  Local/Config/Config.py, set REMOTE_PROBE_THREADS to %d " %( self._remote_probe_threads ))
+            except ValueError:
+                msg = "REMOTE_PROBE_THREADS have an invalid value : %s .\nIt must be a positive integer" % Local.Config.Config.REMOTE_PROBE_THREADS
+                self.log.error( msg )
+                raise ConfigError , msg
+            try:
+                self._remote_host_down_ttl = float( Local.Config.Config.REMOTE_HOST_DOWN_TTL )
+                if self._remote_host_down_ttl < 0 :
+                    msg = "REMOTE_HOST_DOWN_TTL have an invalid value : %s .\nIt must be a positive number of seconds" % Local.Config.Config.REMOTE_HOST_DOWN_TTL
+                    self.log.error( msg )
+                    raise ConfigError , msg
+            except AttributeError:
+                self.log.info( "REMOTE_HOST_DOWN_TTL not found in  Local/Config/Config.py, set REMOTE_HOST_DOWN_TTL to %.1f sec" % self._remote_host_down_ttl )
+            except ValueError:
+                msg = "REMOTE_HOST_DOWN_TTL have an invalid value : %s .\nIt must be a positive number of seconds" % Local.Config.Config.REMOTE_HOST_DOWN_TTL
+                self.log.error( msg )
+                raise ConfigError , msg
             #############################
             #
             #       CONVERTER
@@ -812,10 +965,43 @@ class Config( object ):
     def format_detector_cache_path( self ):
         """
         @return: the absolute path where the invalid sequences and alignment are dumped for analysis
+        and where the formats detected are stored ( see L{FormatDetectionCache} )
         @rtype: string
         """
         return self._format_detector_cache_path
 
+    def format_detector_cache_size( self ):
+        """
+        @return: the max number of detections stored in the format_detector_cache_path.
+        0 means that the detections are not stored.
+        @rtype: int
+        """
+        return self._format_detector_cache_size
+
+    def format_detector_memory_cache_size( self ):
+        """
+        @return: the max number of detections kept in memory by each process.
+        0 means that the detections are not kept in memory.
+        @rtype: int
+        """
+        return self._format_detector_memory_cache_size
+
+    def service_cache_path( self ):
+        """
+        @return: the absolute path of the directory where the compiled service definitions are stored,
+        None if the service definitions are not compiled on disk.
+        @rtype: string
+        """
+        return self._service_cache_path
+
+    def service_cache_size( self ):
+        """
+        @return: the max number of service definitions kept in memory by each process. 
+        0 means that the definitions are not kept in memory.
+        @rtype: int
+        """
+        return self._service_cache_size
+
 
     def user_sessions_path( self ):
         """
@@ -1003,6 +1189,58 @@ class Config( object ):
         @rtype: int
         """
         return self._simultaneous_jobs
+    
+    def workflow_submission_threads( self ):
+        """
+        @return: how many jobs of the ready tasks of a workflow are submitted concurrently.
+        @rtype: int
+        """
+        return self._workflow_submission_threads
+    
+    def workflow_server_submissions( self ):
+        """
+        @return: how many jobs of a workflow are submitted concurrently to the same remote server.
+        @rtype: int
+        """
+        return self._workflow_server_submissions
+
+    def jobstate_cache_size( self ):
+        """
+        @return: the max number of JobState instances kept in memory by each process.
+        0 means that a new JobState is built for each request.
+        @rtype: int
+        """
+        return self._jobstate_cache_size
+
+    def runner_socket( self ):
+        """
+        @return: the absolute path of the unix socket of the runner daemon ( see L{RunnerDaemon} ) 
+        or None if the jobs are run by a new RunnerChild process.
+        @rtype: string
+        """
+        return self._runner_socket
+    
+    def runner_workers( self ):
+        """
+        @return: how many idle workers the runner daemon keeps ready to accept a job.
+        @rtype: int
+        """
+        return self._runner_workers
+
+    def remote_probe_threads( self ):
+        """
+        @return: how many threads query concurrently the remote portals about the jobs of a session.
+        @rtype: int
+        """
+        return self._remote_probe_threads
+
+    def remote_host_down_ttl( self ):
+        """
+        @return: how long ( in sec ) a remote portal which does not answer is considered as down
+        and is not queried anymore about the jobs of the sessions.
+        @rtype: float
+        """
+        return self._remote_host_down_ttl
        
      
     def lang( self ):
@@ -1110,6 +1348,29 @@ class Config( object ):
         @rtype: int
         """
         return self._session_debug
+
+    def session_storage( self ):
+        """
+        @return: the storage used for the user sessions: 'xml' ( .session.xml ) or 'sqlite' ( .session.db ).
+        @rtype: string
+        """
+        return self._session_storage
+
+    def lock_timeout( self ):
+        """
+        @return: how long ( in sec ) a process waits for a lock on a session or a status file before to give up,
+        None to wait without deadline.
+        @rtype: float
+        """
+        return self._lock_timeout
+    
+    def qstat_cache_ttl( self ):
+        """
+        @return: how long ( in sec ) the parsed output of qstat is reused to answer the sge status requests.
+        0 means that qstat is called for each request.
+        @rtype: float
+        """
+        return self._qstat_cache_ttl
     
     def status_debug( self ):
         """
@@ -2,6 +2,8 @@
 This module is used as template to build a converter module
 """
 
+import os
+
 
 
 
@@ -24,6 +26,19 @@ class DataConverter( object ):
         raise NotImplementedError("this method must be overriden")
         return None
     
+    def version( self ):
+        """
+        @return: a string which changes when the results of the detection may change 
+        ( the program is upgraded ... ). The detections stored in the L{FormatDetectionCache} 
+        with an other version are not used.
+        @rtype: string
+        """
+        try:
+            mtime = os.path.getmtime( self.path )
+        except ( OSError , TypeError ):
+            mtime = None
+        return "%s %s %s" %( self.__class__.__name__ , self.path , mtime )
+    
     def detectedFormat(self):
         """
         @return: the list of detectables formats.
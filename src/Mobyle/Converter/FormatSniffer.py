@@ -0,0 +1,339 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+"""
+detection of the common sequence and alignment formats without running squizz.
+
+The format is guessed from the first lines of the data ( L{HEAD_SIZE} bytes ), then the data
+is read once to count the entries and to check that each line looks like what the format expects.
+When the data is not clearly in one of the supported formats the functions return ( None , None )
+and the caller must ask squizz ( see L{sniffer_sequence} and L{sniffer_alignment} ).
+The names of the formats are those of squizz.
+
+to compare the sniffer and squizz on a set of files::
+  python FormatSniffer.py [-a] [-r REPEAT] -s SQUIZZ_PATH FILE ...
+"""
+
+import re
+import string
+
+HEAD_SIZE = 8192
+
+_LETTERS = string.ascii_letters
+#the characters allowed in the sequence lines of the sequences and alignments
+_SEQ_CHARS = _LETTERS + '*-.~?' + string.whitespace
+
+_NBRF_HEADER = re.compile( r'^>[A-Z][A-Z0-9];\S' )
+_PHYLIP_HEADER = re.compile( r'^\s*(\d+)\s+(\d+)\s*$' )
+
+
+def _head( fileName ):
+    f = open( fileName , 'rb' )
+    try:
+        return f.read( HEAD_SIZE )
+    finally:
+        f.close()
+
+def _firstLine( head ):
+    """
+    @return: the first non blank line of head
+    @rtype: string
+    """
+    for line in head.splitlines():
+        if line.strip():
+            return line
+    return ''
+
+def _isSequence( line , chars ):
+    return not line.translate( None , chars )
+
+
+def sniffSequence( fileName ):
+    """
+    detect the format of a sequence file among FASTA, NBRF, PIR, EMBL, SWISSPROT and GENBANK
+    @param fileName: the absolute path of the data
+    @type fileName: string
+    @return: the format and the number of sequences, ( None , None ) if the format is not clearly identified.
+    @rtype: ( string , int )
+    """
+    first = _firstLine( _head( fileName ) )
+    if first.startswith( '>' ):
+        if _NBRF_HEADER.match( first ):
+            return _count( fileName , 'NBRF' , _nbrfEntries )
+        return _count( fileName , 'FASTA' , _fastaEntries )
+    if first.startswith( 'ID   ' ):
+        id_line = first.rstrip()
+        if id_line.endswith( ' AA.' ):
+            return _count( fileName , 'SWISSPROT' , _flatEntries , 'ID   ' , 'SQ   ' )
+        if id_line.endswith( ' BP.' ):
+            return _count( fileName , 'EMBL' , _flatEntries , 'ID   ' , 'SQ   ' )
+        return None , None
+    if first.startswith( 'LOCUS ' ):
+        return _count( fileName , 'GENBANK' , _flatEntries , 'LOCUS ' , 'ORIGIN' )
+    if first.startswith( 'ENTRY ' ):
+        return _count( fileName , 'PIR' , _flatEntries , 'ENTRY ' , 'SEQUENCE' , '///' )
+    return None , None
+
+
+def sniffAlignment( fileName ):
+    """
+    detect the format of an alignment file among CLUSTAL, STOCKHOLM, PHYLIPI, PHYLIPS and FASTA
+    @param fileName: the absolute path of the data
+    @type fileName: string
+    @return: the format and the number of alignments, ( None , None ) if the format is not clearly identified.
+    @rtype: ( string , int )
+    """
+    first = _firstLine( _head( fileName ) )
+    if first.startswith( 'CLUSTAL' ):
+        return _count( fileName , 'CLUSTAL' , _clustalEntries )
+    if first.startswith( '# STOCKHOLM' ):
+        return _count( fileName , 'STOCKHOLM' , _stockholmEntries )
+    if first.startswith( '>' ) and not _NBRF_HEADER.match( first ):
+        return _count( fileName , 'FASTA' , _fastaAlignment )
+    if _PHYLIP_HEADER.match( first ):
+        return _count( fileName , None , _phylipEntries )
+    return None , None
+
+
+def _count( fileName , format , counter , *args ):
+    """
+    read the whole file with the counter of the format
+    @param counter: a function which takes the lines of the file and the args and return
+    the number of entries , or None if a line does not fit the format. The counters of the
+    formats which have several flavors return the flavor and the number of entries.
+    @return: the format and the number of entries, ( None , None ) if the data does not fit the format
+    @rtype: ( string , int )
+    """
+    f = open( fileName , 'rU' )
+    try:
+        result = counter( f , *args )
+    finally:
+        f.close()
+    if format is None:
+        if result is None:
+            return None , None
+        format , result = result
+    if not result:
+        return None , None
+    return format , result
+
+def _fastaEntries( lines ):
+    entries = 0
+    for line in lines:
+        if line.startswith( '>' ):
+            entries += 1
+        elif not _isSequence( line , _SEQ_CHARS ):
+            return None
+    return entries
+
+def _nbrfEntries( lines ):
+    entries = 0
+    #the line following the header is a free description
+    description = False
+    for line in lines:
+        if description:
+            description = False
+        elif line.startswith( '>' ):
+            if not _NBRF_HEADER.match( line ):
+                return None
+            entries += 1
+            description = True
+        elif not _isSequence( line , _SEQ_CHARS ):
+            return None
+    return entries
+
+def _flatEntries( lines , header , sequence , end = '//' ):
+    """
+    count the entries of the flat file formats ( EMBL , SWISSPROT , GENBANK , PIR ):
+    each entry begins by a header line, contains a line starting the sequence and
+    ends by a line end.
+    """
+    entries = 0
+    seq = ends = 0
+    for line in lines:
+        if line.startswith( header ):
+            if seq != entries or ends != entries:
+                return None
+            entries += 1
+        elif line.startswith( sequence ):
+            seq += 1
+        elif line.rstrip() == end:
+            ends += 1
+    if seq != entries or ends != entries:
+        return None
+    return entries
+
+def _fastaAlignment( lines ):
+    lengths = []
+    for line in lines:
+        if line.startswith( '>' ):
+            lengths.append( 0 )
+        elif not line.strip():
+            continue
+        elif not _isSequence( line , _SEQ_CHARS ) or not lengths:
+            return None
+        else:
+            lengths[-1] += len( line.translate( None , string.whitespace ) )
+    if len( lengths ) < 2 or lengths.count( lengths[0] ) != len( lengths ) or not lengths[0]:
+        return None
+    return 1
+
+def _clustalEntries( lines ):
+    entries = 0
+    for line in lines:
+        if line.startswith( 'CLUSTAL' ):
+            entries += 1
+        elif not line.strip() or line[0] in string.whitespace:
+            #blank or consensus line
+            continue
+        else:
+            fields = line.split()
+            if len( fields ) not in ( 2 , 3 ) or not _isSequence( fields[1] , _SEQ_CHARS ):
+                return None
+            if len( fields ) == 3 and not fields[2].isdigit():
+                return None
+    return entries
+
+def _stockholmEntries( lines ):
+    headers = ends = 0
+    for line in lines:
+        if line.startswith( '# STOCKHOLM' ):
+            if headers != ends:
+                return None
+            headers += 1
+        elif line.rstrip() == '//':
+            ends += 1
+    if headers != ends:
+        return None
+    return ends
+
+def _phylipEntries( lines ):
+    """
+    @return: 'PHYLIPI' or 'PHYLIPS' and 1, None if the data is not a strict phylip alignment or
+    if it could be interleaved as well as sequential ( all the sequences on one line ).
+    """
+    lines = iter( lines )
+    match = _PHYLIP_HEADER.match( lines.next() )
+    ntax , nchar = int( match.group(1) ) , int( match.group(2) )
+    blocks = [ [] ]
+    for line in lines:
+        line = line.rstrip()
+        if not line:
+            if blocks[-1]:
+                blocks.append( [] )
+            continue
+        if _PHYLIP_HEADER.match( line ):
+            #several data sets
+            return None
+        blocks[-1].append( line )
+    if not blocks[-1]:
+        blocks.pop()
+    if not ntax or not nchar or not blocks:
+        return None
+    def residues( line ):
+        res = line.translate( None , string.whitespace )
+        if not _isSequence( res , _SEQ_CHARS ):
+            return None
+        return len( res )
+    if len( blocks ) > 1 and len( blocks[0] ) == ntax:
+        #interleaved: the names in the first block only
+        lengths = []
+        for line in blocks[0]:
+            lengths.append( residues( line[10:] ) )
+        for block in blocks[1:]:
+            if len( block ) != ntax:
+                return None
+            for i , line in enumerate( block ):
+                n = residues( line )
+                if n is None or lengths[i] is None:
+                    return None
+                lengths[i] += n
+        if lengths.count( nchar ) == ntax:
+            return 'PHYLIPI' , 1
+        return None
+    if len( blocks ) == 1 and len( blocks[0] ) > ntax:
+        #sequential: each sequence is spread on several lines
+        taxa = 0
+        length = None
+        for line in blocks[0]:
+            if length is None:
+                length = residues( line[10:] )
+            else:
+                n = residues( line )
+                length = None if n is None else length + n
+            if length is None or length > nchar:
+                return None
+            if length == nchar:
+                taxa += 1
+                length = None
+        if taxa == ntax and length is None:
+            return 'PHYLIPS' , 1
+    return None
+
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    from time import time
+    from optparse import OptionParser
+    from subprocess import Popen , PIPE
+
+    usage = """usage: %prog [-a] [-r REPEAT] -s SQUIZZ_PATH FILE ...
+    compare the format detection and the detection time of the sniffer and squizz"""
+    parser = OptionParser( usage = usage )
+    parser.add_option( "-s" , "--squizz" , dest = "squizz" , help = "the path of the squizz binary" )
+    parser.add_option( "-a" , "--alignment" , dest = "alignment" , action = "store_true" , default = False ,
+                       help = "detect alignments instead of sequences" )
+    parser.add_option( "-r" , "--repeat" , dest = "repeat" , type = "int" , default = 10 ,
+                       help = "the number of detections of each file ( default 10 )" )
+    options , args = parser.parse_args()
+    if not options.squizz or not args:
+        parser.error( "the squizz path and at least one file must be specified" )
+
+    if options.alignment:
+        sniff = sniffAlignment
+        squizz_option = "-An"
+    else:
+        sniff = sniffSequence
+        squizz_option = "-Sn"
+    squizz_re = re.compile( ": (.+) format, (\d+) entries\.$" , re.M )
+
+    def squizz( fileName ):
+        pipe = Popen( [ options.squizz , squizz_option , fileName ] , stdout = PIPE , stderr = PIPE )
+        out , err = pipe.communicate()
+        match = squizz_re.search( err )
+        if match and match.group(1) != 'UNKNOWN':
+            return match.group(1) , int( match.group(2) )
+        return None , None
+
+    def timeit( func , fileName ):
+        start = time()
+        for i in xrange( options.repeat ):
+            result = func( fileName )
+        return result , ( time() - start ) / options.repeat * 1000
+
+    total_sniff = total_squizz = 0.0
+    print "%-30s %10s %-16s %-16s %10s %10s" %( 'file' , 'size' , 'sniffer' , 'squizz' , 'sniff ms' , 'squizz ms' )
+    for fileName in args:
+        sniffed , sniff_time = timeit( sniff , fileName )
+        squizzed , squizz_time = timeit( squizz , fileName )
+        total_sniff += sniff_time
+        total_squizz += squizz_time
+        if sniffed[0] is None:
+            #the sniffer gives up, squizz is run after it
+            total_sniff += squizz_time
+        elif sniffed != squizzed:
+            print >> sys.stderr , "%s : the sniffer and squizz disagree" % fileName
+        print "%-30s %10d %-16s %-16s %10.2f %10.2f" %( os.path.basename( fileName )[:30] ,
+                                                         os.path.getsize( fileName ) ,
+                                                         "%s %s" % sniffed ,
+                                                         "%s %s" % squizzed ,
+                                                         sniff_time ,
+                                                         squizz_time )
+    print "total ( sniffer followed by squizz when needed ) : %.2f ms , squizz : %.2f ms" %( total_sniff , total_squizz )
@@ -0,0 +1,39 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+"""
+a alignment converter which detects the common formats in python and runs squizz 
+only for the other data. The conversions are made by squizz.
+To use it replace squizz_alignment by sniffer_alignment in the DATA_CONVERTER of Local/Config/Config.py::
+  DATA_CONVERTER = { 'Alignment' : [ sniffer_alignment( SQUIZZ_PATH ) ] , ... }
+"""
+
+from Mobyle.Converter.squizz_alignment import squizz_alignment
+from Mobyle.Converter.FormatSniffer import sniffAlignment
+
+
+class sniffer_alignment( squizz_alignment ):
+    """
+    the program_name remains 'squizz' as the detected data are converted by squizz.
+    """
+    
+    def detect( self, dataFileName ):
+        """
+        detect the format of the data.
+        @param dataFileName: the filename of the data which the format must be detected
+        @type dataFileName: string
+        @return: the format of this data and the number of entry. 
+               if the format cannot be detected, return None
+               if the number of entry cannot be detected, return None
+        @rtype: ( string format , int number of entry ) 
+        """
+        format , nb = sniffAlignment( dataFileName )
+        if format is None:
+            #ambiguous data
+            return super( sniffer_alignment , self ).detect( dataFileName )
+        return format , nb
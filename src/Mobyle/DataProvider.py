@@ -6,6 +6,7 @@
 #                                                                                      #
 ########################################################################################
 import urllib #@UnresolvedImport
+import shutil #@UnresolvedImport
 from logging import getLogger #@UnresolvedImport
 log = getLogger(__name__)
 
@@ -36,4 +37,14 @@ class DataProvider(object):
         return self.url
     
     def getOutputFile(self,fileName): # mimics job's getOutputFile (called by Core toFile() methods)
-        return urllib.urlopen('%s/%s' % (self.url, fileName)).read()
\ No newline at end of file
+        return urllib.urlopen('%s/%s' % (self.url, fileName)).read()
+
+    def copyOutputFile(self, fileName, dest): # mimics job's copyOutputFile (called by Core toFile() methods)
+        """
+        write the file in dest block by block
+        """
+        fh = urllib.urlopen('%s/%s' % (self.url, fileName))
+        try:
+            shutil.copyfileobj(fh, dest, 65536)
+        finally:
+            fh.close()
\ No newline at end of file
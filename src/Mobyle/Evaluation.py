@@ -6,7 +6,9 @@
 #                                                                                      #
 ########################################################################################
 
-import imp
+import re
+from time import time
+from threading import Lock
 from logging import getLogger
 e_log = getLogger( __name__ )
 
@@ -17,21 +19,133 @@ __extra_epydoc_fields__ = [('call', 'Called by','Called by')]
 
 
 
-
-class Evaluation:
+class _CodeCache( object ):
     """
-    The Evaluation Class stock the parameter values and permit to evaluate expression (Ctrl precond format ...) in a protected environment avoidig names collision
+    a process wide cache of the compiled expressions. The expressions come from the service
+    definitions, the same preconds, ctrls and formats are evaluated for each job.
     """
-    def __init__(self):
+    
+    #the stats are logged each time this number of expressions have been evaluated
+    REPORT_INTERVAL = 1000
+    
+    def __init__( self , size = 10000 ):
+        """
+        @param size: the max number of compiled expressions, the cache is emptied when it is reached.
+        @type size: int
+        """
+        self.size = size
+        self._codes = {}
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+        self._compile_time = 0.0
+        
+    def get( self , expr ):
+        """
+        @param expr: the expression to compile
+        @type expr: String
+        @return: the code object of the expression
+        @raise SyntaxError: if expr is not a valid python expression
+        """
+        #as the builtin eval of a string, the leading spaces and tabs of the code from the service definitions are ignored
+        expr = expr.lstrip( ' \t' )
+        self._lock.acquire()
+        try:
+            code = self._codes.get( expr )
+            if code is not None:
+                self._hits += 1
+            else:
+                start = time()
+                code = compile( expr , '<Mobyle expression>' , 'eval' )
+                self._compile_time += time() - start
+                self._misses += 1
+                if len( self._codes ) >= self.size:
+                    self._codes.clear()
+                self._codes[ expr ] = code
+            lookups = self._hits + self._misses
+        finally:
+            self._lock.release()
+        if lookups % self.REPORT_INTERVAL == 0:
+            self.logStats()
+        return code
+    
+    def getStats( self ):
+        """
+        @return: the number of hits and misses, the number of compiled expressions, 
+        the time spent to compile them and the estimated compilation time saved by the hits ( in sec )
+        @rtype: dict
+        """
+        self._lock.acquire()
         try:
-            fp , pathname , description = imp.find_module("re")
-            self.re = imp.load_module( "re" , fp , pathname , description )
+            if self._misses:
+                saved = self._hits * self._compile_time / self._misses
+            else:
+                saved = 0.0
+            return { 'hits' : self._hits ,
+                     'misses' : self._misses ,
+                     'size' : len( self._codes ) ,
+                     'compile_time' : self._compile_time ,
+                     'saved_time' : saved
+                    }
+        finally:
+            self._lock.release()
             
+    def logStats( self ):
+        stats = self.getStats()
+        lookups = stats[ 'hits' ] + stats[ 'misses' ]
+        if lookups:
+            e_log.debug( "compiled expressions cache: %d lookups , hit rate %.1f%% , %d expressions , compilation %.3fms , saved %.3fms" %( 
+                                                                                                        lookups ,
+                                                                                                        100.0 * stats[ 'hits' ] / lookups ,
+                                                                                                        stats[ 'size' ] ,
+                                                                                                        stats[ 'compile_time' ] * 1000 ,
+                                                                                                        stats[ 'saved_time' ] * 1000 ) )
+        
+    def clear( self ):
+        self._lock.acquire()
+        try:
+            self._codes.clear()
+            self._hits = self._misses = 0
+            self._compile_time = 0.0
         finally:
-            if fp:
-                fp.close()
+            self._lock.release()
+    
+    
+    
+class Evaluation:
+    """
+    The Evaluation Class stock the parameter values and permit to evaluate expression (Ctrl precond format ...) in a protected environment avoidig names collision
+    """
+    
+    #the compiled expressions shared by all the instances
+    _codes = _CodeCache()
+    
+    def __init__(self):
+        #the module re is shared by all the instances
+        self.re = re
 
+    @classmethod
+    def getCacheStats( cls ):
+        """
+        @return: the statistics of the compiled expressions cache ( see L{_CodeCache.getStats} )
+        @rtype: dict
+        """
+        return cls._codes.getStats()
         
+    def __getstate__( self ):
+        """
+        the module re and the builtins added by eval cannot be pickled,
+        they are rebuilt by L{__setstate__}
+        """
+        state = self.__dict__.copy()
+        for name in ( 're' , '__builtins__' ):
+            state.pop( name , None )
+        return state
+
+    def __setstate__( self , state ):
+        self.__init__()
+        self.__dict__.update( state )
+
     def isFill( self ):
         """
         @return: returns True if the Evaluation is already filled, if there isn't any user value in evalution return False.
@@ -92,10 +206,9 @@ class Evaluation:
         @param expr: the expression to evalute
         @type expr: String
         @return: the expression evaluated in the Evalution namespace
-        @todo: evaluer le temps passe a importe re a chaque fois, le faire que si re dans la string a evalue?
         """
         try:
-            myEval = eval( expr , vars(self) )
+            myEval = eval( self._codes.get( expr ) , vars(self) )
             return myEval
         
         except Exception , err:
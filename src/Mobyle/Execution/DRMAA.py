@@ -12,12 +12,17 @@
 Classes executing the command and managing the results  
 """
 import os 
+import sys
 import imp
+import atexit
+import threading
+from time import time
 from logging import getLogger
 _log = getLogger(__name__)
 
 from Mobyle.Status import Status
 from Mobyle.Admin import Admin
+from Mobyle import AdminIndex
 from Mobyle.Execution.ExecutionSystem import ExecutionSystem 
 
 from Mobyle.MobyleError import MobyleError
@@ -26,6 +31,127 @@ __extra_epydoc_fields__ = [('call', 'Called by','Called by')]
 
 
 
+class DRMAASessionManager( object ):
+    """
+    hold the drmaa session of this process.
+    a drmaa library supports only one active session per process, thus the session
+    is opened on the first request and reused by all the following ones
+    until the end of the process or until it is found broken.
+    """
+
+    #the time ( in sec ) after which an idle session is checked before being reused
+    CHECK_INTERVAL = 30
+    #the job queried to check the session, it does not exist
+    PROBE_JOB = '0'
+
+    def __init__( self ):
+        self._mutex = threading.RLock()
+        self._session = None
+        self._contactString = None
+        self._pid = None
+        self._lastUse = 0
+        self.opened = 0
+        self.reused = 0
+        self.reconnected = 0
+
+    def getSession( self , drmaa , contactString ):
+        """
+        @param drmaa: the drmaa module
+        @type drmaa: module
+        @param contactString: the contact string of the DRM
+        @type contactString: string
+        @return: an initialized drmaa session
+        @rtype: drmaa.Session instance
+        @raise Exception: any error raised by the drmaa library during the initialization
+        """
+        self._mutex.acquire()
+        try:
+            if self._session is not None and self._pid != os.getpid():
+                #the session has been inherited from the parent process, it belongs to it
+                self._session = None
+            if self._session is not None and self._contactString != contactString:
+                self.close()
+            if self._session is not None:
+                if time() - self._lastUse > self.CHECK_INTERVAL and not self._isAlive( drmaa ):
+                    _log.warning( "the drmaa session ( %s ) is broken, reconnect" % contactString )
+                    self.reconnect()
+                else:
+                    self.reused += 1
+            if self._session is None:
+                session = drmaa.Session( contactString = contactString )
+                try:
+                    session.initialize()
+                except drmaa.errors.AlreadyActiveSessionException:
+                    pass
+                self._session = session
+                self._contactString = contactString
+                self._pid = os.getpid()
+                self.opened += 1
+            self._lastUse = time()
+            return self._session
+        finally:
+            self._mutex.release()
+
+    def close( self ):
+        """
+        exit the drmaa session of this process if any
+        """
+        self._mutex.acquire()
+        try:
+            if self._session is not None and self._pid == os.getpid():
+                try:
+                    self._session.exit()
+                except Exception , err :
+                    _log.error( "cannot exit from drmaa properly : " + str( err ) )
+            self._session = None
+            self._contactString = None
+        finally:
+            self._mutex.release()
+
+    def reconnect( self ):
+        """
+        exit the current session, the next call to getSession will open a new one
+        """
+        self._mutex.acquire()
+        try:
+            self.close()
+            self.reconnected += 1
+        finally:
+            self._mutex.release()
+
+    def getStats( self ):
+        """
+        @return: the number of sessions opened, reused and reopened because they were broken
+        @rtype: dict { 'opened' : int , 'reused' : int , 'reconnected' : int }
+        """
+        return { 'opened'      : self.opened ,
+                 'reused'      : self.reused ,
+                 'reconnected' : self.reconnected ,
+                 }
+
+    def _isAlive( self , drmaa ):
+        """
+        check the session by a call to the DRM: the status of a job which does not exist
+        @param drmaa: the drmaa module
+        @type drmaa: module
+        @return: False if the session is not active anymore or if the DRM cannot be reached, True otherwise
+        @rtype: boolean
+        """
+        try:
+            self._session.jobStatus( self.PROBE_JOB )
+        except ( drmaa.errors.NoActiveSessionException , drmaa.errors.DrmCommunicationException ) , err :
+            _log.debug( "drmaa session health check failed: %s" % err )
+            return False
+        except Exception :
+            #the DRM has answered ( the job is unknown )
+            pass
+        return True
+
+
+sessionManager = DRMAASessionManager()
+atexit.register( sessionManager.close )
+
+
 
 class DRMAA(ExecutionSystem):
     """
@@ -35,10 +161,29 @@ class DRMAA(ExecutionSystem):
         super( DRMAA , self ).__init__( drmaa_config )
         self.drmaa_library_path = drmaa_config.drmaa_library_path
         os.environ[ 'DRMAA_LIBRARY_PATH'] = self.drmaa_library_path
-        fp , pathname , description = imp.find_module("drmaa")
-        self.drmaa = imp.load_module( "drmaa" , fp , pathname , description )
+        try:
+            #the drmaa library must be loaded once per process to share its session
+            self.drmaa = sys.modules[ 'drmaa' ]
+        except KeyError:
+            fp , pathname , description = imp.find_module("drmaa")
+            self.drmaa = imp.load_module( "drmaa" , fp , pathname , description )
         self.contactString = drmaa_config.contactString
         
+    def _getSession( self ):
+        """
+        @return: the drmaa session of this process
+        @rtype: drmaa.Session instance
+        """
+        return sessionManager.getSession( self.drmaa , self.contactString )
+
+    def _isSessionError( self , err ):
+        """
+        @return: True if err means that the drmaa session cannot be used anymore
+        @rtype: boolean
+        """
+        return isinstance( err , ( self.drmaa.errors.NoActiveSessionException ,
+                                   self.drmaa.errors.DrmCommunicationException ) )
+        
     def _drmaaStatus2mobyleStatus( self , drmaaStatus ):
         if drmaaStatus == self.drmaa.JobState.RUNNING:
             return Status( 3 ) #running
@@ -89,16 +234,14 @@ class DRMAA(ExecutionSystem):
             fout = open( serviceName + ".out" , 'w' )
             ferr = open( serviceName + ".err" , 'w' )
             try:
-                drmaaSession = self.drmaa.Session( contactString = self.contactString )
                 try:
-                    drmaaSession.initialize()
-                except self.drmaa.errors.AlreadyActiveSessionException:
-                    pass
+                    drmaaSession = self._getSession()
                 except Exception, err:
                     self._logError( dirPath , serviceName , jobKey ,
                                     userMsg = "Mobyle internal server error" ,
                                     logMsg = None )
                     _log.critical( "error during drmaa intitialization for job %s/%s: %s" %(serviceName, jobKey , err) ,  exc_info= True )
+                    raise
             
                 jt = drmaaSession.createJobTemplate()
                 jt.workingDirectory = dirPath
@@ -122,7 +265,7 @@ class DRMAA(ExecutionSystem):
                 _log.error( "cannot exit from drmaa properly try to deleting JobTemplate: " + str( err ) )
                 try:
                     drmaaSession.deleteJobTemplate( jt )
-                    drmaaSession.exit()
+                    sessionManager.close()
                 except Exception , err :
                     _log.error( "cannot exit from drmaa properly : " + str( err ) )
                
@@ -154,14 +297,14 @@ class DRMAA(ExecutionSystem):
                          )
             
             try:
-                os.symlink(
+                AdminIndex.link(
                     os.path.join( dirPath , '.admin') ,
                     linkName
                     )
             except OSError , err:
                 try:
                     drmaaSession.deleteJobTemplate( jt )
-                    drmaaSession.exit()
+                    sessionManager.close()
                 except Exception , err :
                     _log.error( "cannot exit from drmaa properly : " + str( err ) )
                     
@@ -186,7 +329,7 @@ class DRMAA(ExecutionSystem):
             except self.drmaa.errors , err :
                 try:
                     drmaaSession.deleteJobTemplate( jt )
-                    drmaaSession.exit()
+                    sessionManager.close()
                 except Exception , err :
                     _log.error( "cannot exit from drmaa properly : " + str( err ) )
                 
@@ -201,11 +344,11 @@ class DRMAA(ExecutionSystem):
                                  )
 
             try:
-                os.unlink( linkName )
+                AdminIndex.unlink( linkName )
             except OSError , err:
                 try:
                     drmaaSession.deleteJobTemplate( jt )
-                    drmaaSession.exit()
+                    sessionManager.close()
                 except Exception , err :
                     _log.error( "cannot exit from drmaa properly : " + str( err ) )
                     
@@ -242,10 +385,10 @@ class DRMAA(ExecutionSystem):
                         status = Status( code = 6 , message = "Your job execution failed ( %d )" %jobInfos[ 6 ] ) 
 
             try:
+                #the session is kept for the next drmaa calls of this process
                 drmaaSession.deleteJobTemplate( jt )
-                drmaaSession.exit()
             except :
-                _log.error( "cannot exit from drmaa properly" )
+                _log.error( "cannot delete the drmaa job template" )
             
             return status
         
@@ -260,25 +403,34 @@ class DRMAA(ExecutionSystem):
         @rtype: Status instance
         @call: by L{Utils.getStatus}
         """
+        return self.getStatuses( [ key ] )[ key ]
+
+
+    def getStatuses( self , keys ):
+        """
+        query the status of several jobs with the drmaa session of this process
+        @param keys: the values associate to the key "NUMBER" in Admin object (and .admin file )
+        @type keys: list of strings
+        @return: the status of each job
+        @rtype: dict { key : Status instance }
+        @call: by L{Utils.getStatuses}
+        """
+        statuses = {}
         try:
-            s = self.drmaa.Session( contactString = self.contactString )
+            self._getSession()
         except Exception , err:
-            _log.error( "getStatus(%s) cannot open drmma session : %s " %( key , err ) )
-            return Status( -1 ) #unknown 
-        try:
-            s.initialize()
-        except self.drmaa.errors.AlreadyActiveSessionException:
-            pass
-        except Exception, err:
-            _log.critical( "error during drmaa intitialization for job %s: %s" %(key , err) ,  exc_info= True )
-            
-        try:
-            drmaaStatus = s.jobStatus( key )
-        except :
-            s.exit()
-            return Status( -1 ) #unknown 
-        s.exit()
-        return self._drmaaStatus2mobyleStatus( drmaaStatus ) 
+            _log.error( "getStatuses(%s) cannot open drmma session : %s " %( keys , err ) )
+            for key in keys:
+                statuses[ key ] = Status( -1 ) #unknown
+            return statuses
+        for key in keys:
+            try:
+                drmaaStatus = self._sessionCall( lambda session : session.jobStatus( key ) )
+            except :
+                statuses[ key ] = Status( -1 ) #unknown
+                continue
+            statuses[ key ] = self._drmaaStatus2mobyleStatus( drmaaStatus )
+        return statuses
 
 
     def kill( self , key ):
@@ -292,24 +444,33 @@ class DRMAA(ExecutionSystem):
         @call: by L{Utils.Mkill}
         """
         try:
-            s = self.drmaa.Session( contactString = self.contactString )
+            self._getSession()
         except Exception , err:
             _log.error( "kill( %s ) cannot open drmma session : %s " %( key , err ) )
             return
         try:
-            s.initialize()
-        except self.drmaa.errors.AlreadyActiveSessionException:
-            pass
-        except Exception, err:
-            _log.critical( "error during drmaa intitialization for job %s: %s" %(key , err) ,  exc_info= True )
-            
-        try:
-            s.control( key , self.drmaa.JobControlAction.TERMINATE )
+            self._sessionCall( lambda session : session.control( key , self.drmaa.JobControlAction.TERMINATE ) )
         except Exception , err :
             msg = "error when trying to kill job %s : %s" %( key , err )
             _log.error( msg )
             raise MobyleError( msg )
-        finally:    
-            s.exit()
         return
 
+
+    def _sessionCall( self , action ):
+        """
+        call action with the drmaa session of this process, 
+        if the session is broken reconnect and call action again.
+        @param action: the function to call with the session as argument
+        @type action: callable
+        @return: the value returned by action
+        """
+        session = self._getSession()
+        try:
+            return action( session )
+        except Exception , err :
+            if not self._isSessionError( err ):
+                raise
+            _log.warning( "the drmaa session is broken ( %s ), reconnect" % err )
+            sessionManager.reconnect()
+            return action( self._getSession() )
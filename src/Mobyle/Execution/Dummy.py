@@ -19,6 +19,7 @@ _log = logging.getLogger(__name__)
 from Mobyle.Execution.ExecutionSystem import ExecutionSystem 
 from Mobyle.MobyleError import MobyleError
 from Mobyle.Admin import Admin
+from Mobyle import AdminIndex
 from Mobyle.Status import Status
 from Mobyle.ConfigManager import Config
 _cfg = Config()
@@ -71,7 +72,7 @@ class Dummy(ExecutionSystem):
                          )
             
             try:
-                os.symlink(
+                AdminIndex.link(
                     os.path.join( self.dirPath , '.admin') ,
                     linkName
                     )
@@ -95,7 +96,7 @@ class Dummy(ExecutionSystem):
 
             try:
                 ## remove the job from the ADMINDIR ( "process table" )
-                os.unlink( linkName )
+                AdminIndex.unlink( linkName )
             except OSError , err:
                 msg = "can't remove symbolic link %s in ADMINDIR: %s" %( linkName , err )
                 self._logError( dirPath , serviceName ,jobKey,
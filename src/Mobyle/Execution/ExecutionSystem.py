@@ -132,6 +132,22 @@ class ExecutionSystem(object):
         """
         raise NotImplementedError, "Must be Implemented in child classes"
 
+    def getStatuses( self , numbers ):
+        """
+        get the status of several jobs at once.
+        this implementation calls getStatus for each job,
+        the child classes which can query the status of all jobs in one round trip should override it.
+        @param numbers: the numbers of the jobs ( the value associate to the key "NUMBER" in Admin object )
+        @type numbers: list of strings
+        @return: the status of each job
+        @rtype: dict { number : L{Status} instance }
+        @call: by L{Utils.getStatuses}
+        """
+        statuses = {}
+        for number in numbers:
+            statuses[ number ] = self.getStatus( number )
+        return statuses
+
     def kill(  self , number ):
         """
         kill the Job
@@ -12,14 +12,18 @@ Classes executing the command and managing the results
 """
 import os
 from subprocess import Popen, PIPE
+from tempfile import mkstemp
+from time import time
 
 from logging import getLogger
 _log = getLogger(__name__)
 
 from Mobyle.Admin import Admin
+from Mobyle import AdminIndex
 from Mobyle.Execution.ExecutionSystem import ExecutionSystem 
 from Mobyle.MobyleError import MobyleError
 from Mobyle.Status import Status
+from Mobyle.LockManager import lockManager
 
 __extra_epydoc_fields__ = [('call', 'Called by','Called by')]
 
@@ -29,7 +33,10 @@ class SGE (ExecutionSystem):
     """
     Run the commandline with Sun GridEngine commands
     """
-        
+
+    #the qstat snapshots loaded by this process { snapshot path : ( date , { job name : state } ) }
+    _snapshots = {}
+
     def __init__( self, sge_config ):
         super( SGE , self ).__init__( sge_config )
         arch_path= os.path.join( sge_config.root , 'util' , 'arch' )
@@ -129,7 +136,7 @@ class SGE (ExecutionSystem):
                                    )
                                    )
         try:
-            os.symlink(
+            AdminIndex.link(
                        os.path.join( dirPath , '.admin') ,
                        linkName
                        )
@@ -147,7 +154,7 @@ class SGE (ExecutionSystem):
             raise MobyleError , msg
         pipe.wait()
         try:
-            os.unlink( linkName )
+            AdminIndex.unlink( linkName )
         except OSError , err:
             msg = "can't remove symbolic link %s in ADMINDIR: %s" %( linkName , err )
             self._logError( dirPath , serviceName , jobKey ,
@@ -197,8 +204,153 @@ class SGE (ExecutionSystem):
         @rtype: a Mobyle.Status.Status instance
         @todo: for best performance, restrict the sge querying to one queue
         """
+        return self.getStatuses( [ jobNum ] )[ jobNum ]
+
+
+    def getStatuses( self , jobNums ):
+        """
+        query the status of all jobs with one qstat call
+        @param jobNums: the numbers of the jobs
+        @type jobNums: list of strings
+        @return: the status of each job, Status( code = -1 ) for the jobs unknown by sge
+        @rtype: dict { jobNum : L{Status} instance }
+        @raise MobyleError: if sge cannot be queried
+        """
+        sge2mobyleStatus = { 'r' : 3 , # running
+                             't' : 3 ,
+                             'R' : 3 ,
+                             's' : 7 , #hold
+                             'S' : 7 ,
+                             'T' : 7 ,
+                             'h' : 7 ,
+                             'w' : 2 , #pending
+                             'd' : 6 , #killed
+                             'E' : 5 , #error
+                             }
+        sge_statuses = self._qstat()
+        statuses = {}
+        for jobNum in jobNums:
+            try:
+                status = sge_statuses[ jobNum ]
+            except KeyError:
+                statuses[ jobNum ] = Status( code = -1 ) #unknown
+                continue
+            try:
+                statuses[ jobNum ] = Status( code = sge2mobyleStatus[ status ]  )
+            except KeyError:
+                _log.error( "unexpected sge status for job %s : %s" %( jobNum , status ) )
+                statuses[ jobNum ] = Status( code = -1 ) #unknown
+        return statuses
+
+
+    def _qstat( self ):
+        """
+        The parsed output of qstat is shared by all the Mobyle processes through a snapshot
+        file in ADMINDIR, which is refreshed by one process at a time when it is older
+        than QSTAT_CACHE_TTL. Within the ttl the states are served from memory.
+        @return: the last letter of the sge state of each job known by sge
+        @rtype: dict { string job name : string state }
+        @raise MobyleError: if sge cannot be queried
+        """
+        ttl = self._cfg.qstat_cache_ttl()
+        if not ttl:
+            return self._queryQstat()
+        path = os.path.join( self._cfg.admindir() , '.qstat.%s' % self.sge_env[ 'SGE_CELL' ] )
+        snapshot = SGE._snapshots.get( path )
+        if snapshot is None or time() - snapshot[0] >= ttl:
+            snapshot = self._readSnapshot( path , ttl )
+            if snapshot is None:
+                snapshot = self._refreshSnapshot( path , ttl )
+            SGE._snapshots[ path ] = snapshot
+        return snapshot[1]
+
+
+    def _refreshSnapshot( self , path , ttl ):
+        """
+        query sge and write the snapshot, unless another process did it while we were waiting for the lock
+        @return: the date and the states of the snapshot
+        @rtype: ( float , dict { string job name : string state } )
+        @raise MobyleError: if sge cannot be queried
+        """
+        try:
+            lockFile = open( path + '.lock' , 'a' )
+        except IOError , err:
+            _log.warning( "cannot open the qstat snapshot lock %s : %s" %( path , err ) )
+            return ( time() , self._queryQstat() )
+        try:
+            try:
+                lockManager.acquire( lockFile , lockManager.WRITE )
+            except IOError , err:
+                #the refresher seems stuck, we do not wait any longer
+                _log.warning( "cannot lock the qstat snapshot %s : %s" %( path , err ) )
+                return ( time() , self._queryQstat() )
+            try:
+                snapshot = self._readSnapshot( path , ttl )
+                if snapshot is None:
+                    date = time()
+                    snapshot = ( date , self._queryQstat() )
+                    self._writeSnapshot( path , snapshot )
+                return snapshot
+            finally:
+                lockManager.release( lockFile )
+        finally:
+            lockFile.close()
+
+
+    def _readSnapshot( self , path , ttl ):
+        """
+        @return: the date and the states of the snapshot, None if there is no valid snapshot younger than ttl
+        @rtype: ( float , dict { string job name : string state } )
+        """
+        try:
+            snapshotFile = open( path )
+        except IOError:
+            return None
+        try:
+            try:
+                date = float( snapshotFile.readline() )
+                if time() - date >= ttl:
+                    return None
+                sge_statuses = {}
+                for line in snapshotFile:
+                    name , state = line.split()
+                    sge_statuses[ name ] = state
+            except ValueError , err:
+                _log.warning( "invalid qstat snapshot %s : %s" %( path , err ) )
+                return None
+        finally:
+            snapshotFile.close()
+        return ( date , sge_statuses )
+
+
+    def _writeSnapshot( self , path , snapshot ):
+        """
+        write the snapshot in a temporary file then rename it, thus the readers never see a partial snapshot.
+        """
+        date , sge_statuses = snapshot
+        try:
+            fd , tmpPath = mkstemp( dir = os.path.dirname( path ) , prefix = '.qstat' )
+            tmpFile = os.fdopen( fd , 'w' )
+            try:
+                tmpFile.write( "%f\n" % date )
+                for name , state in sge_statuses.items():
+                    tmpFile.write( "%s %s\n" %( name , state ) )
+            finally:
+                tmpFile.close()
+            os.chmod( tmpPath , 0644 )
+            os.rename( tmpPath , path )
+        except ( IOError , OSError ) , err:
+            _log.warning( "cannot write the qstat snapshot %s : %s" %( path , err ) )
+
+
+    def _queryQstat( self ):
+        """
+        @return: the last letter of the sge state of each job known by sge
+        @rtype: dict { string job name : string state }
+        @raise MobyleError: if sge cannot be queried
+        """
         sge_cmd = [ os.path.join( self.sge_prefix , 'qstat' ) , '-r' ]
-        
+
         try:
             pipe = Popen( sge_cmd,
                           executable = sge_cmd[0] ,
@@ -212,20 +364,9 @@ class SGE (ExecutionSystem):
         except OSError , err:
             raise MobyleError , "can't querying sge : %s :%s "%( sge_cmd , err )
 
-        sge2mobyleStatus = { 'r' : 3 , # running
-                             't' : 3 ,
-                             'R' : 3 ,
-                             's' : 7 , #hold
-                             'S' : 7 , 
-                             'T' : 7 ,
-                             'h' : 7 ,
-                             'w' : 2 , #pending
-                             'd' : 6 , #killed 
-                             'E' : 5 , #error
-                             }
-
+        sge_statuses = {}
+        status = None
         for job in pipe.stdout :
-            
             job_sge_status = job.split()
             try:
                 status = job_sge_status[ 4 ][ -1 ]
@@ -233,22 +374,15 @@ class SGE (ExecutionSystem):
             except ( ValueError , IndexError ):
                 pass #it's not the fisrt line
             try:
-                if not ( jobNum == job_sge_status[2] and 'Full' == job_sge_status[0] ):
-                    continue #it's not the right jobNum
+                if 'Full' == job_sge_status[0] and status is not None:
+                    sge_statuses[ job_sge_status[2] ] = status
             except IndexError :
                 continue #it's not the 2nde line
-
-            pipe.stdout.close()
-            pipe.wait()
-            
-            if pipe.returncode == 0 :
-                try:
-                    return Status( code = sge2mobyleStatus[ status ]  )
-                except MobyleError , err :
-                    raise MobyleError , "unexpected sge status: " +str( status )
-            else:
-                raise MobyleError , "cannot get status " + str( pipe.returncode )
-        return Status( code = -1 ) #unknown
+        pipe.stdout.close()
+        pipe.wait()
+        if pipe.returncode != 0 :
+            raise MobyleError , "cannot get status " + str( pipe.returncode )
+        return sge_statuses
 
         
     def kill( self, job_number ):
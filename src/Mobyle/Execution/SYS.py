@@ -19,6 +19,7 @@ from logging import getLogger
 _log = getLogger(__name__)
 
 from Mobyle.Admin import Admin
+from Mobyle import AdminIndex
 from Mobyle.Status import Status
 from Mobyle.Execution.ExecutionSystem import ExecutionSystem
 from Mobyle.MobyleError import MobyleError
@@ -93,7 +94,7 @@ class SYS(ExecutionSystem):
                                 )
                      )
         try:
-            os.symlink(
+            AdminIndex.link(
                 os.path.join( dirPath , '.admin') ,
                 linkName
                 )
@@ -112,7 +113,7 @@ class SYS(ExecutionSystem):
         pipe.wait()
 
         try:
-            os.unlink( linkName )
+            AdminIndex.unlink( linkName )
         except OSError , err:
             msg = "can't remove symbolic link %s in ADMINDIR: %s" %( linkName , err )
 
@@ -0,0 +1,261 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+"""
+FormatDetectionCache.py
+
+The same data is detected again and again: when it is uploaded, bookmarked in a session,
+reused in a job or passed through a workflow link, and each detection by squizz forks a process.
+This module keeps the result of the detections ( format , number of items ) by content and by
+detector, in memory ( for each process ) and in a sqlite database shared by all the processes
+located in the FORMAT_DETECTOR_CACHE_PATH directory.
+"""
+
+import os
+import sqlite3
+from hashlib import sha1
+from threading import Lock
+from collections import OrderedDict
+from time import time
+
+from logging import getLogger
+d_log = getLogger( __name__ )
+
+from Mobyle.ConfigManager import Config
+
+
+class FormatDetectionCache( object ):
+    """
+    the cache of the data format detections.
+    The detections are indexed by the sha1 of the data and the name and version of the detector
+    ( see L{DataConverter.version} ) thus a new version of a detector does not use the old detections.
+    A data whose format is not detected ( None , None ) may be the result of a temporary failure
+    of the detector, it is not stored on disk and it is kept in memory for NEGATIVE_TTL sec only.
+    """
+
+    FILE_NAME = '.format_detection.db'
+    SCHEMA_VERSION = 1
+    SCHEMA = """
+    CREATE TABLE detection ( digest TEXT ,
+                             detector TEXT ,
+                             format TEXT ,
+                             item_nb INTEGER ,
+                             used REAL ,
+                             PRIMARY KEY ( digest , detector ) ) ;
+    CREATE INDEX detection_used ON detection ( used ) ;
+    """
+    #the time ( in sec ) sqlite waits for a lock before to raise an error
+    TIMEOUT = 10
+    #the number of detections stored by a process between 2 checks of the database size
+    EVICTION_INTERVAL = 100
+    CHUNK_SIZE = 65536
+    #the time ( in sec ) a format not detected is kept in memory
+    NEGATIVE_TTL = 60
+
+    def __init__( self , path = None , size = None , memorySize = None ):
+        """
+        @param path: the directory where the detections are stored, None to use the FORMAT_DETECTOR_CACHE_PATH
+        @type path: string
+        @param size: the max number of detections stored, None to use the FORMAT_DETECTOR_CACHE_SIZE
+        @type size: int
+        @param memorySize: the max number of detections kept in memory, None to use the FORMAT_DETECTOR_MEMORY_CACHE_SIZE
+        @type memorySize: int
+        """
+        cfg = Config()
+        if path is None:
+            path = cfg.format_detector_cache_path()
+        if size is None:
+            size = cfg.format_detector_cache_size()
+        if memorySize is None:
+            memorySize = cfg.format_detector_memory_cache_size()
+        if path and size:
+            self.dbPath = os.path.join( path , self.FILE_NAME )
+        else:
+            self.dbPath = None
+        self.size = size
+        self.memorySize = memorySize
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self._db = None
+        self._db_pid = None
+        self._stored = 0
+        self._stats = { 'memory' : 0 , 'disk' : 0 , 'detected' : 0 , 'evicted' : 0 }
+
+    def detect( self , converter , fileName ):
+        """
+        @param converter: the detector
+        @type converter: a L{DataConverter} instance
+        @param fileName: the absolute path of the data to detect
+        @type fileName: string
+        @return: the result of converter.detect( fileName ) , from the cache if this data has
+        already been detected by this converter.
+        @rtype: ( string format , int number of entry )
+        """
+        if self.dbPath is None and not self.memorySize:
+            return converter.detect( fileName )
+        try:
+            key = ( self._digest( fileName ) , "%s %s" %( converter.program_name , converter.version() ) )
+        except IOError , err:
+            d_log.warning( "cannot compute the digest of %s : %s" %( fileName , err ) )
+            return converter.detect( fileName )
+        self._lock.acquire()
+        try:
+            entry = self._memory.pop( key , None )
+            if entry is not None:
+                result , expires = entry
+                if expires is None or expires > time():
+                    self._memory[ key ] = entry
+                    self._stats[ 'memory' ] += 1
+                    return result
+            result = self._load( key )
+            if result is not None:
+                self._stats[ 'disk' ] += 1
+                self._remember( key , result )
+                return result
+        finally:
+            self._lock.release()
+        result = tuple( converter.detect( fileName ) )
+        self._lock.acquire()
+        try:
+            self._stats[ 'detected' ] += 1
+            self._remember( key , result )
+            if result[0] is not None:
+                self._store( key , result )
+        finally:
+            self._lock.release()
+        return result
+
+    def getStats( self ):
+        """
+        @return: the number of detections found in memory, found on disk, computed by a detector
+        and removed from the disk
+        @rtype: dict
+        """
+        self._lock.acquire()
+        try:
+            return dict( self._stats )
+        finally:
+            self._lock.release()
+
+    def clear( self ):
+        """
+        remove all the detections kept in memory and stored on disk
+        """
+        self._lock.acquire()
+        try:
+            self._memory.clear()
+            db = self._connect()
+            if db is not None:
+                try:
+                    db.execute( "DELETE FROM detection" )
+                except sqlite3.Error , err:
+                    d_log.error( "cannot clear the format detection cache %s : %s" %( self.dbPath , err ) )
+        finally:
+            self._lock.release()
+
+    def _digest( self , fileName ):
+        digest = sha1()
+        f = open( fileName , 'rb' )
+        try:
+            while True:
+                chunk = f.read( self.CHUNK_SIZE )
+                if not chunk:
+                    break
+                digest.update( chunk )
+        finally:
+            f.close()
+        return digest.hexdigest()
+
+    def _remember( self , key , result ):
+        if not self.memorySize:
+            return
+        if result[0] is None:
+            self._memory[ key ] = ( result , time() + self.NEGATIVE_TTL )
+        else:
+            self._memory[ key ] = ( result , None )
+        while len( self._memory ) > self.memorySize:
+            self._memory.popitem( last = False )
+
+    def _connect( self ):
+        """
+        @return: the connection to the database of this process or None if the detections are not stored.
+        @rtype: sqlite3.Connection instance
+        """
+        if self.dbPath is None:
+            return None
+        if self._db is not None and self._db_pid == os.getpid():
+            return self._db
+        #the connections must not be shared with the forked processes
+        try:
+            db = sqlite3.connect( self.dbPath , timeout = self.TIMEOUT , isolation_level = None , check_same_thread = False )
+            version = db.execute( "PRAGMA user_version" ).fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                db.execute( "BEGIN IMMEDIATE" )
+                try:
+                    version = db.execute( "PRAGMA user_version" ).fetchone()[0]
+                    if version != self.SCHEMA_VERSION:
+                        db.execute( "DROP TABLE IF EXISTS detection" )
+                        for statement in self.SCHEMA.split( ';' ):
+                            if statement.strip():
+                                db.execute( statement )
+                        db.execute( "PRAGMA user_version = %d" % self.SCHEMA_VERSION )
+                    db.execute( "COMMIT" )
+                except:
+                    db.execute( "ROLLBACK" )
+                    raise
+        except sqlite3.Error , err:
+            d_log.error( "the format detection cache %s is not available : %s" %( self.dbPath , err ) )
+            self.dbPath = None
+            return None
+        self._db = db
+        self._db_pid = os.getpid()
+        return db
+
+    def _load( self , key ):
+        db = self._connect()
+        if db is None:
+            return None
+        try:
+            row = db.execute( "SELECT format , item_nb FROM detection WHERE digest = ? AND detector = ?" , key ).fetchone()
+            if row is None:
+                return None
+            if row[0] is None:
+                #stored by a previous version, the data is detected again
+                db.execute( "DELETE FROM detection WHERE digest = ? AND detector = ?" , key )
+                return None
+            db.execute( "UPDATE detection SET used = ? WHERE digest = ? AND detector = ?" , ( time() , ) + key )
+        except sqlite3.Error , err:
+            d_log.warning( "cannot read the format detection cache %s : %s" %( self.dbPath , err ) )
+            return None
+        format , item_nb = row
+        return ( str( format ) , item_nb )
+
+    def _store( self , key , result ):
+        db = self._connect()
+        if db is None:
+            return
+        try:
+            db.execute( "INSERT OR REPLACE INTO detection ( digest , detector , format , item_nb , used ) VALUES ( ? , ? , ? , ? , ? )" ,
+                        key + tuple( result ) + ( time() , ) )
+            self._stored += 1
+            if self._stored % self.EVICTION_INTERVAL == 0:
+                self._evict( db )
+        except sqlite3.Error , err:
+            d_log.warning( "cannot store in the format detection cache %s : %s" %( self.dbPath , err ) )
+
+    def _evict( self , db ):
+        """
+        remove the detections the least recently used to bring the database back to its size
+        """
+        count = db.execute( "SELECT count(*) FROM detection" ).fetchone()[0]
+        if count > self.size:
+            db.execute( "DELETE FROM detection WHERE rowid IN ( SELECT rowid FROM detection ORDER BY used LIMIT ? )" , ( count - self.size , ) )
+            self._stats[ 'evicted' ] += count - self.size
+
+
+detectionCache = FormatDetectionCache()
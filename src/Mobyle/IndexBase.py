@@ -61,7 +61,7 @@ class IndexGenerator(object):
                 i_log.error(s.path)
                 i_log.error(s.url)
 
-        pickle.dump(idx, output, 2)
+        pickle.dump(self.indexClass.buildIndex(idx), output, 2)
         output.close()
         
 class Index(object):
@@ -81,6 +81,17 @@ class Index(object):
     @classmethod
     def getIndexEntry(cls, doc):
         raise NotImplementedError
+
+    @classmethod
+    def buildIndex(cls, entries):
+        """
+        Return the index stored on disk
+        @param entries: the index entries of the services, indexed by url
+        @type entries: dict
+        @return: the index
+        @rtype: object
+        """
+        return entries
      
 
 def _XPathQuery(node, query, returnType="valueString"):
@@ -12,12 +12,12 @@ from string import ascii_uppercase
 import resource
 from hashlib import md5
 import time 
-import glob
 import logging 
 j_log = logging.getLogger( __name__ )
 
 from Mobyle.JobState import JobState , path2url , url2path
 from Mobyle.Admin import Admin
+from Mobyle import AdminIndex
 from Mobyle.Status import Status
 from Mobyle.StatusManager import StatusManager
 from Mobyle.MobyleError import MobyleError , UserValueError
@@ -312,47 +312,22 @@ class Job:
         thisJobAdm.setMd5( newDigest )
         thisJobAdm.commit()
 
-        mask = os.path.normpath( "%s/%s.*" %(
-            self.cfg.admindir() ,
-            self.service.getName()
-            )
-                                 )
-        jobs = glob.glob( mask )
         max_jobs = self.cfg.simultaneous_jobs()
         
         if max_jobs == 0 :
             return 
         
-        nb_of_jobs = 0
-        msg = None
-        for job in jobs:
-            try:
-                oldAdm = Admin( job )
-            except MobyleError, err :
-                if os.path.lexists( job ):
-                        j_log.critical( "%s/%s: invalid job in ADMINDIR : %s" %( self.service.getName() ,  self.key , err ) )
-                continue
-            if( oldAdm.getWorkflowID() ):
-                #we allow a workflow to run several identical job in parallel
-                continue
-            
-            oldDigest = oldAdm.getMd5()
-            if newDigest == oldDigest :
-                oldStatus = self.sm.getStatus( self.work_dir ) 
-                if not oldStatus.isEnded() :
-                    nb_of_jobs += 1
-                    if nb_of_jobs >= max_jobs:
-                        msg = "%d similar jobs (%s) have been already submitted (md5 = %s)" % (
-                                                                                      nb_of_jobs ,
-                                                                                      os.path.basename( job ),
-                                                                                      newDigest
-                                                                                      )
-                        userMsg = " %d similar job(s) have been already submitted, and are(is) not finished yet. Please wait for the end of these jobs before you resubmit." % ( nb_of_jobs )
-                        self._logError( logMsg = msg + " : run aborted " ,
-                                        userMsg = userMsg
-                                        )
-                        raise UserValueError( parameter = None, msg = userMsg )
-                    
+        nb_of_jobs = AdminIndex.count( self.service.getName() , newDigest )
+        if nb_of_jobs >= max_jobs:
+            msg = "%d similar jobs have been already submitted (md5 = %s)" % (
+                                                                           nb_of_jobs ,
+                                                                           newDigest
+                                                                           )
+            userMsg = " %d similar job(s) have been already submitted, and are(is) not finished yet. Please wait for the end of these jobs before you resubmit." % ( nb_of_jobs )
+            self._logError( logMsg = msg + " : run aborted " ,
+                            userMsg = userMsg
+                            )
+            raise UserValueError( parameter = None, msg = userMsg )
         return 
 
 
@@ -10,6 +10,7 @@
 manage the information in the index.xml
 """
 import os
+import mmap
 from lxml import etree
 
 from time import localtime, strftime , strptime
@@ -17,6 +18,7 @@ import urllib2 , urlparse
 import re
 import types
 import copy
+from collections import deque
 
 from logging import getLogger
 js_log = getLogger( __name__ )
@@ -105,12 +107,14 @@ def normUri( uri ):
     return path.rstrip( '/' )
 
 
-def getContentFile( uri ):
+#the size of the blocks read to stream a file
+CHUNK_SIZE = 65536
+
+def openContentFile( uri ):
     """
     @param uri: the url or a path (absolute or relative) to a file
     @type uri: string
-    @return: the content of the file designing by uri as a string
-    @rtype: string
+    @return: a file object if the file is local or a file like object if the file is distant
     @raise: MobyleError , if the protocol is not supported
     """
     protocol , host , path , _,_,_ = urlparse.urlparse( uri )
@@ -141,13 +145,83 @@ def getContentFile( uri ):
             raise URLError( err )
     else:
         raise MobyleError, "Mobyle doesn't support " + protocol + " protocol"
-    content = ''
-    l = fh.readline()
-    while l:
-        content = content + l
-        l = fh.readline()
-    fh.close()
-    return content
+    return fh
+
+
+def iterContentFile( uri , maxSize = None , chunkSize = CHUNK_SIZE ):
+    """
+    @param uri: the url or a path (absolute or relative) to a file
+    @type uri: string
+    @param maxSize: the max number of bytes to read, None to read the whole file
+    @type maxSize: int
+    @param chunkSize: the max size of each block
+    @type chunkSize: int
+    @return: an iterator on the successive blocks of the file designing by uri. 
+    The file is open when the iteration starts.
+    @rtype: iterator of strings
+    @raise: MobyleError , if the protocol is not supported
+    """
+    fh = openContentFile( uri )
+    try:
+        remaining = maxSize
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                chunk = fh.read( chunkSize )
+            else:
+                chunk = fh.read( min( chunkSize , remaining ) )
+                remaining -= len( chunk )
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        fh.close()
+
+
+def getContentFile( uri , maxSize = None ):
+    """
+    @param uri: the url or a path (absolute or relative) to a file
+    @type uri: string
+    @param maxSize: the max number of bytes to read, None to read the whole file
+    @type maxSize: int
+    @return: the content ( or the first maxSize bytes ) of the file designing by uri as a string
+    @rtype: string
+    @raise: MobyleError , if the protocol is not supported
+    """
+    return ''.join( iterContentFile( uri , maxSize = maxSize ) )
+
+
+def copyContentFile( uri , dest ):
+    """
+    write the content of the file designing by uri in dest without loading it in memory.
+    a local file is mapped in memory and written in one call, a distant file is copied block by block.
+    @param uri: the url or a path (absolute or relative) to a file
+    @type uri: string
+    @param dest: the file where the content is written
+    @type dest: file object
+    @return: the number of bytes written
+    @rtype: int
+    @raise: MobyleError , if the protocol is not supported
+    """
+    fh = openContentFile( uri )
+    try:
+        if isinstance( fh , file ):
+            size = os.fstat( fh.fileno() ).st_size
+            if size:
+                content = mmap.mmap( fh.fileno() , size , access = mmap.ACCESS_READ )
+                try:
+                    dest.write( content )
+                finally:
+                    content.close()
+            return size
+        size = 0
+        chunk = fh.read( CHUNK_SIZE )
+        while chunk:
+            dest.write( chunk )
+            size += len( chunk )
+            chunk = fh.read( CHUNK_SIZE )
+        return size
+    finally:
+        fh.close()
 
 
 
@@ -502,14 +576,37 @@ class _abstractState( object ):
         """
         self._updateNode( self.root , 'email' , str( email ) )
 
-    def getOutputFile( self, fileName ):
+    def getOutputFile( self, fileName , maxSize = None ):
         """
         @param fileName:
         @type fileName: String
-        @return: the content of a output file as a string
+        @param maxSize: the max number of bytes to read, None to read the whole file
+        @type maxSize: int
+        @return: the content ( or the first maxSize bytes ) of a output file as a string
         @rtype: string
         """
-        return getContentFile( self._MyUri + "/" + fileName )
+        return getContentFile( self._MyUri + "/" + fileName , maxSize = maxSize )
+
+    def iterOutputFile( self, fileName , chunkSize = CHUNK_SIZE ):
+        """
+        @param fileName:
+        @type fileName: String
+        @return: an iterator on the blocks of a output file, to serve it without loading it in memory
+        @rtype: iterator of strings
+        """
+        return iterContentFile( self._MyUri + "/" + fileName , chunkSize = chunkSize )
+    
+    def copyOutputFile( self, fileName , dest ):
+        """
+        write the content of a output file in dest without loading it in memory
+        @param fileName:
+        @type fileName: String
+        @param dest: the file where the content is written
+        @type dest: file object
+        @return: the number of bytes written
+        @rtype: int
+        """
+        return copyContentFile( self._MyUri + "/" + fileName , dest )
 
 
     def open( self, fileName ):
@@ -779,12 +876,115 @@ class _abstractState( object ):
                                  }
             return fdata
 
+class _JobStateCache( object ):
+    """
+    keep the last used JobState instances, by job uri.
+    An instance is reused only if the index.xml of the job has not been replaced
+    or modified since it was read or written by this instance.
+    """
+    
+    def __init__( self , size ):
+        """
+        @param size: the max number of JobState kept
+        @type size: int
+        """
+        self.size = size
+        #{ uri : [ JobState , stamp , tick ] }
+        self._entries = {}
+        #( tick , uri ) in the order of use, the tuples with an outdated tick are skipped
+        self._usage = deque()
+        self._tick = 0
+        self._stats = { 'hits' : 0 , 'misses' : 0 , 'evictions' : 0 , 'invalidations' : 0 }
+        
+    def get( self , uri , stamp ):
+        """
+        @param uri: the normalized uri of the job
+        @type uri: string
+        @param stamp: the current stamp of the index.xml of the job
+        @type stamp: tuple or None
+        @return: the cached JobState or None if it is not cached or outdated
+        @rtype: L{JobState} instance
+        """
+        entry = self._entries.get( uri )
+        if entry is None:
+            self._stats[ 'misses' ] += 1
+            return None
+        if entry[1] != stamp:
+            del self._entries[ uri ]
+            self._stats[ 'invalidations' ] += 1
+            self._stats[ 'misses' ] += 1
+            return None
+        self._stats[ 'hits' ] += 1
+        self._use( uri , entry )
+        return entry[0]
+    
+    def put( self , uri , jobState , stamp ):
+        """
+        add a JobState in the cache and evict the least recently used ones
+        """
+        if self.size < 1:
+            return
+        entry = [ jobState , stamp , None ]
+        self._entries[ uri ] = entry
+        self._use( uri , entry )
+        while len( self._entries ) > self.size:
+            tick , old_uri = self._usage.popleft()
+            old_entry = self._entries.get( old_uri )
+            if old_entry is not None and old_entry[2] == tick:
+                del self._entries[ old_uri ]
+                self._stats[ 'evictions' ] += 1
+    
+    def setStamp( self , uri , jobState , stamp ):
+        """
+        record the new stamp of the index.xml written by jobState
+        """
+        entry = self._entries.get( uri )
+        if entry is not None and entry[0] is jobState:
+            entry[1] = stamp
+            
+    def clear( self ):
+        self._entries.clear()
+        self._usage.clear()
+        
+    def getStats( self ):
+        """
+        @return: the number of hits, misses, evictions and invalidations ( index.xml changed on disk ) 
+        since the beginning of the process and the number of JobState cached.
+        @rtype: dict
+        """
+        stats = self._stats.copy()
+        stats[ 'size' ] = len( self._entries )
+        return stats
+    
+    def _use( self , uri , entry ):
+        self._tick += 1
+        entry[2] = self._tick
+        self._usage.append( ( self._tick , uri ) )
+        if len( self._usage ) > 2 * len( self._entries ) + 100:
+            #forget the outdated usages
+            usage = [ ( e[2] , u ) for u , e in self._entries.items() ]
+            usage.sort()
+            self._usage = deque( usage )
+
+
+def _indexStamp( indexUri ):
+    """
+    @return: the inode, modification time and size of the index.xml file, None if it does not exist
+    @rtype: tuple
+    """
+    try:
+        st = os.stat( indexUri )
+    except OSError:
+        return None
+    return ( st.st_ino , st.st_mtime , st.st_size )
+
+
 class JobState( object ):
     """
     the JobState Object manage the informations in index.xml file
     G{}
     """
-    _refs = {}
+    _refs = _JobStateCache( _cfg.jobstate_cache_size() )
     
     def __new__( cls , uri = None , service = None ):
 
@@ -819,9 +1019,15 @@ class JobState( object ):
                 raise JobError( ENOTDIR , "not a directory" , MyUri )
             indexUri = os.path.join( MyUri , "index.xml" )
             islocal = True
-        try:
-            return cls._refs[ MyUri ]
-        except KeyError:
+        if islocal:
+            stamp = _indexStamp( indexUri )
+        else:
+            #there is no cheap way to check a distant index.xml
+            stamp = None
+        self = cls._refs.get( MyUri , stamp )
+        if self is not None:
+            return self
+        else:
             self = super( JobState , cls ).__new__( cls )
             self.state = state
             self.uri = uri        #uri given by the user
@@ -850,9 +1056,24 @@ class JobState( object ):
             self.state.indexName = indexUri  
             self.state._islocal = self._islocal
 
-            cls._refs[ MyUri ] = self
+            cls._refs.put( MyUri , self , stamp )
             return self
         
+    @classmethod
+    def getCacheStats( cls ):
+        """
+        @return: the statistics of the cache of JobState instances of this process
+        @rtype: dict { 'hits' : int , 'misses' : int , 'evictions' : int , 'invalidations' : int , 'size' : int }
+        """
+        return cls._refs.getStats()
+    
+    def commit( self ):
+        """
+        write into the file index.xml in the working directory 
+        """
+        self.state.commit()
+        self._refs.setStamp( self._MyUri , self , _indexStamp( self.state.indexName ) )
+        
 
     def __getattr__( self , name ):
         if self.state :
@@ -969,9 +1190,11 @@ class ProgramJobState( _abstractState ):
         """
         self._updateNode( self.root , 'commandLine' , command )
 
-    def getStdout( self ):
+    def getStdout( self , maxSize = None ):
         """
         we assume that the standart output was redirect in programName.out
+        @param maxSize: the max number of bytes to read, None to read the whole file
+        @type maxSize: int
         @return: the content of the job stdout as a string
         @rtype: string
         @raise MobyleError: if the job is not finished a L{MobyleError} is raised
@@ -980,11 +1203,13 @@ class ProgramJobState( _abstractState ):
             outName = self.root.xpath( './data/output/parameter[@isstdout=1]/name/text()' )[0]
         except IndexError:
             outName = os.path.join( self._MyUri , os.path.basename(self.getName())[:-4] + ".out" )
-        return getContentFile( outName )
+        return getContentFile( outName , maxSize = maxSize )
     
 
-    def getStderr( self ):
+    def getStderr( self , maxSize = None ):
         """
+        @param maxSize: the max number of bytes to read, None to read the whole file
+        @type maxSize: int
         @return: the content of the job stderr as a string
         @rtype: string
         @raise MobyleError: if the job is not finished a L{MobyleError} is raised
@@ -993,7 +1218,7 @@ class ProgramJobState( _abstractState ):
             errname = os.path.join( self._MyUri , os.path.basename(self.getName())[:-4] + ".err" )
         except KeyError:
             return None
-        return getContentFile( errname )
+        return getContentFile( errname , maxSize = maxSize )
 
     def getParamfiles(self):
         """
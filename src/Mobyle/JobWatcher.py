@@ -0,0 +1,299 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+"""
+JobWatcher.py
+
+This module holds the JobWatcher class used by a workflow to sleep until
+something may have changed in the state of its sub jobs.
+"""
+
+import os
+import sys
+import errno
+import fcntl
+import signal
+import select
+import struct
+from time import time
+
+from logging import getLogger
+w_log = getLogger( __name__ )
+
+from Mobyle.StatusManager import StatusManager
+
+
+class _Inotify( object ):
+    """
+    minimal binding to the linux inotify api.
+    """
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+
+    _EVENT_HEADER = 'iIII'
+
+    def __init__( self ):
+        """
+        @raise OSError: if inotify is not available on this system
+        """
+        if not sys.platform.startswith( 'linux' ):
+            raise OSError( errno.ENOSYS , "inotify is only available on linux" )
+        import ctypes
+        import ctypes.util
+        libc_name = ctypes.util.find_library( 'c' )
+        if libc_name is None:
+            raise OSError( errno.ENOSYS , "cannot find the libc" )
+        self._libc = ctypes.CDLL( libc_name , use_errno = True )
+        try:
+            self._inotify_add_watch = self._libc.inotify_add_watch
+        except AttributeError:
+            raise OSError( errno.ENOSYS , "the libc does not provide inotify" )
+        self._fd = self._libc.inotify_init()
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError( err , os.strerror( err ) )
+        flags = fcntl.fcntl( self._fd , fcntl.F_GETFL )
+        fcntl.fcntl( self._fd , fcntl.F_SETFL , flags | os.O_NONBLOCK )
+        self._ctypes = ctypes
+
+    def fileno( self ):
+        return self._fd
+
+    def add_watch( self , path ):
+        """
+        watch the files written or moved in the directory path
+        @raise OSError: if the directory cannot be watched
+        """
+        wd = self._inotify_add_watch( self._fd , path , self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE )
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            raise OSError( err , "%s : %s" %( path , os.strerror( err ) ) )
+        return wd
+
+    def read_names( self ):
+        """
+        @return: the names of the files of the pending events
+        @rtype: list of strings
+        """
+        names = []
+        header_size = struct.calcsize( self._EVENT_HEADER )
+        while True:
+            try:
+                buf = os.read( self._fd , 65536 )
+            except OSError , err:
+                if err.errno in ( errno.EAGAIN , errno.EINTR ):
+                    break
+                raise
+            if not buf:
+                break
+            pos = 0
+            while pos + header_size <= len( buf ):
+                wd , mask , cookie , length = struct.unpack( self._EVENT_HEADER , buf[ pos : pos + header_size ] )
+                pos += header_size
+                names.append( buf[ pos : pos + length ].rstrip( '\0' ) )
+                pos += length
+        return names
+
+    def close( self ):
+        os.close( self._fd )
+
+
+class JobWatcher( object ):
+    """
+    wait for an event which may change the state of the jobs of a workflow:
+     - the end of a child process ( SIGCHLD ),
+     - the writing of the status file of a watched job ( inotify, or polling of the
+       modification time of the status files if inotify is not available ),
+     - the time to poll the remote jobs. This delay is doubled from MIN_REMOTE_DELAY
+       up to MAX_REMOTE_DELAY each time a poll brings no news and reset when something changes.
+    """
+
+    #the delay between 2 checks of the status files when inotify is not available
+    POLL_INTERVAL = 1.0
+    MIN_REMOTE_DELAY = 1.0
+    MAX_REMOTE_DELAY = 30.0
+    #the max time to sleep without any event
+    MAX_SLEEP = 30.0
+
+    STATUS_FILES = ( StatusManager.file_name , 'index.xml' )
+
+    def __init__( self , use_inotify = True ):
+        """
+        @param use_inotify: if False the status files are polled even if inotify is available
+        @type use_inotify: boolean
+        """
+        self._rfd , self._wfd = os.pipe()
+        for fd in ( self._rfd , self._wfd ):
+            flags = fcntl.fcntl( fd , fcntl.F_GETFL )
+            fcntl.fcntl( fd , fcntl.F_SETFL , flags | os.O_NONBLOCK )
+        self._inotify = None
+        if use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except OSError , err:
+                w_log.info( "inotify is not available ( %s ), the status files will be polled" % err )
+        #{ dir path : mtime of the status file }
+        self._watched = {}
+        self.remote_delay = self.MIN_REMOTE_DELAY
+        self._next_remote_poll = time() + self.remote_delay
+        self._old_handler = signal.signal( signal.SIGCHLD , self._sigchld_handler )
+        #the blocking system calls of the workflow ( http requests to remote servers ... )
+        #must not be interrupted by the end of a child
+        signal.siginterrupt( signal.SIGCHLD , False )
+
+    def _sigchld_handler( self , signum , frame ):
+        try:
+            os.write( self._wfd , 'c' )
+        except OSError:
+            pass #the pipe is full, a wake up is already pending
+
+    def watch( self , path ):
+        """
+        watch the status of the job located in the directory path
+        @param path: the absolute path of a job directory
+        @type path: string
+        """
+        if path in self._watched:
+            return
+        if self._inotify is not None:
+            try:
+                self._inotify.add_watch( path )
+            except OSError , err:
+                w_log.warning( "cannot watch %s with inotify ( %s ), the status files will be polled" %( path , err ) )
+                self._inotify.close()
+                self._inotify = None
+        self._watched[ path ] = self._statusMtime( path )
+
+    def unwatch( self , path ):
+        """
+        stop the polling of the status of the job located in path.
+        ( the inotify watch is kept until close, the events of this directory are ignored by the caller. )
+        """
+        self._watched.pop( path , None )
+
+    def remote_polled( self , changed ):
+        """
+        to call after each poll of the remote jobs
+        @param changed: True if the poll brought a new status
+        @type changed: boolean
+        """
+        if changed:
+            self.remote_delay = self.MIN_REMOTE_DELAY
+        else:
+            self.remote_delay = min( self.remote_delay * 2 , self.MAX_REMOTE_DELAY )
+        self._next_remote_poll = time() + self.remote_delay
+
+    def remote_due( self ):
+        """
+        @return: True if it's time to poll the remote jobs
+        @rtype: boolean
+        """
+        return time() >= self._next_remote_poll
+
+    def wait( self , remote = False ):
+        """
+        sleep until an event occurs
+        @param remote: True if some remote jobs are running
+        @type remote: boolean
+        @return: the reason of the wake up: 'child' , 'status' , 'remote' or 'timeout'
+        @rtype: string
+        """
+        deadline = time() + self.MAX_SLEEP
+        if remote:
+            deadline = min( deadline , self._next_remote_poll )
+        while True:
+            now = time()
+            if remote and now >= self._next_remote_poll:
+                return 'remote'
+            if now >= deadline:
+                return 'timeout'
+            timeout = deadline - now
+            fds = [ self._rfd ]
+            if self._inotify is not None:
+                fds.append( self._inotify.fileno() )
+            elif self._watched:
+                timeout = min( timeout , self.POLL_INTERVAL )
+            try:
+                readable , _ , _ = select.select( fds , [] , [] , timeout )
+            except select.error , err:
+                if err.args[0] == errno.EINTR:
+                    #interrupted by SIGCHLD, the handler has written in the pipe
+                    continue
+                raise
+            if self._rfd in readable:
+                self._drain()
+                self._reap()
+                return 'child'
+            if self._inotify is not None:
+                if readable:
+                    names = self._inotify.read_names()
+                    if [ name for name in names if name in self.STATUS_FILES ]:
+                        return 'status'
+            elif self._pollStatus():
+                return 'status'
+
+    def close( self ):
+        """
+        restore the SIGCHLD handler and release the resources
+        """
+        signal.signal( signal.SIGCHLD , self._old_handler or signal.SIG_DFL )
+        os.close( self._rfd )
+        os.close( self._wfd )
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _drain( self ):
+        while True:
+            try:
+                if not os.read( self._rfd , 4096 ):
+                    break
+            except OSError , err:
+                if err.errno in ( errno.EAGAIN , errno.EINTR ):
+                    break
+                raise
+
+    def _reap( self ):
+        """
+        collect the ended child processes to not leave zombies
+        """
+        while True:
+            try:
+                pid , returncode = os.waitpid( -1 , os.WNOHANG )
+            except OSError , err:
+                if err.errno == errno.EINTR:
+                    continue
+                break #ECHILD no more children
+            if pid == 0:
+                break
+            w_log.log( 12 , "child process %d ended, returncode = %s" %( pid , returncode ) )
+
+    def _statusMtime( self , path ):
+        mtimes = []
+        for name in self.STATUS_FILES:
+            try:
+                mtimes.append( os.path.getmtime( os.path.join( path , name ) ) )
+            except OSError:
+                continue
+        if mtimes:
+            return max( mtimes )
+        return None
+
+    def _pollStatus( self ):
+        """
+        @return: True if a status file has been modified since the last poll
+        @rtype: boolean
+        """
+        changed = False
+        for path , mtime in self._watched.items():
+            new_mtime = self._statusMtime( path )
+            if new_mtime != mtime:
+                self._watched[ path ] = new_mtime
+                changed = True
+        return changed
@@ -0,0 +1,401 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+"""
+LockManager.py
+
+This module holds the LockManager class which acquires and releases the fcntl locks
+on the Mobyle files ( .session.xml , mobyle_status.xml ... ) and the lockManager instance
+shared by all the Mobyle modules of the process.
+"""
+
+import os
+import sys
+import errno
+import fcntl
+import signal
+import struct
+import threading
+from collections import deque
+from time import time , sleep
+
+from logging import getLogger
+l_log = getLogger( __name__ )
+
+
+class _FileQueue( object ):
+    """
+    the waiters of one file in this process, served in the order of their arrival.
+    """
+
+    def __init__( self ):
+        self.condition = threading.Condition( threading.Lock() )
+        self.waiters = deque()
+        self.holder = None
+        self.next_ticket = 0
+        #the number of threads which wait for or hold the file
+        self.users = 0
+
+
+class LockManager( object ):
+    """
+    acquire a fcntl lock on a file, waiting for it until a deadline.
+
+     - the threads of this process which wait for the same file are served in FIFO order.
+       the posix locks belong to the process, thus 2 threads of the same process never hold
+       a lock on the same file at the same time ( the release by one thread would release
+       the lock of the other ).
+     - the lock held by another process is waited for with a blocking lockf, the kernel wakes
+       us up as soon as it is released. Without deadline ( LOCK_TIMEOUT is None ) nothing else
+       is needed. With a deadline, the main thread arms a timer ( ITIMER_REAL ) which interrupts
+       the lockf with a SIGALRM. The signals are delivered to the main thread only, thus the
+       other threads ( or the main thread if the timer is already used by someone else ) poll
+       the lock with an increasing delay ( from MIN_DELAY to MAX_DELAY ) until the deadline.
+     - for each file the contention is recorded: number of acquisitions, number of acquisitions
+       which had to wait, waiting time, timeouts, and the pid and lock type of the last process
+       which was holding the lock when we had to wait.
+    """
+
+    WRITE = fcntl.LOCK_EX
+    READ  = fcntl.LOCK_SH
+
+    MIN_DELAY = 0.005
+    MAX_DELAY = 0.1
+
+    #the max number of files for which statistics are kept
+    MAX_STATS = 1000
+
+    _LOCK_NAMES = { fcntl.LOCK_SH : 'READ' , fcntl.LOCK_EX : 'WRITE' }
+
+    _UNSET = object()
+
+    def __init__( self ):
+        self._timeout = self._UNSET
+        self._queues = {}
+        self._stats = {}
+        self._mutex = threading.Lock()
+
+    def timeout( self ):
+        """
+        @return: the default time ( in sec ) to wait for a lock before to give up, None to wait without deadline
+        @rtype: float
+        """
+        if self._timeout is self._UNSET:
+            from Mobyle.ConfigManager import Config
+            self._timeout = Config().lock_timeout()
+        return self._timeout
+
+    def setTimeout( self , timeout ):
+        """
+        @param timeout: the default time ( in sec ) to wait for a lock before to give up, None to wait without deadline
+        @type timeout: float
+        """
+        self._timeout = timeout
+
+    def acquire( self , File , lockType , timeout = None ):
+        """
+        acquire a lock of lockType on File
+        @param File: the file to lock
+        @type File: file object
+        @param lockType: the type of lock READ or WRITE
+        @type lockType: int
+        @param timeout: the time ( in sec ) to wait before to give up, if None the LOCK_TIMEOUT of the configuration is used
+        @type timeout: float
+        @raise IOError: when it could not acquire a lock before the deadline
+        """
+        if timeout is None:
+            timeout = self.timeout()
+        start = time()
+        if timeout is None:
+            deadline = None
+        else:
+            deadline = start + timeout
+        path = os.path.normpath( os.path.abspath( File.name ) )
+        queue = self._getQueue( path )
+        served = False
+        queue.condition.acquire()
+        try:
+            ticket = queue.next_ticket
+            queue.next_ticket += 1
+            queue.waiters.append( ticket )
+            try:
+                while queue.holder is not None or queue.waiters[0] != ticket :
+                    if deadline is None:
+                        queue.condition.wait()
+                        continue
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        break
+                    queue.condition.wait( remaining )
+                else:
+                    queue.waiters.popleft()
+                    queue.holder = ticket
+                    served = True
+            finally:
+                if not served:
+                    #I give up my place to the next waiter
+                    queue.waiters.remove( ticket )
+                    queue.condition.notifyAll()
+        finally:
+            queue.condition.release()
+        if not served:
+            self._leaveQueue( path , queue )
+            self._record( path , lockType , None , None , None , timeout = True )
+            msg = "%s : cannot acquire a %s lock in %.3f sec ( waiting for a thread of this process )" % ( path ,
+                                                                                                          self._LOCK_NAMES.get( lockType , lockType ) ,
+                                                                                                          timeout )
+            l_log.error( msg )
+            raise IOError( msg )
+        try:
+            holder_pid , holder_type = self._lock( File , path , lockType , deadline )
+        except IOError:
+            self._releaseQueue( path , queue )
+            raise
+        waited = time() - start
+        self._record( path , lockType , waited , holder_pid , holder_type )
+        if holder_pid is not None:
+            l_log.debug( "%f : %s : %s lock acquired after %.3f sec held by pid %s ( %s ) call by= %s" % ( time() ,
+                                                                                                        path ,
+                                                                                                        self._LOCK_NAMES.get( lockType , lockType ) ,
+                                                                                                        waited ,
+                                                                                                        holder_pid ,
+                                                                                                        self._LOCK_NAMES.get( holder_type , holder_type ) ,
+                                                                                                        os.path.basename( sys.argv[0] ) ) )
+
+    def release( self , File ):
+        """
+        release the lock held on File
+        @param File: the locked file
+        @type File: file object
+        @raise IOError: if the lock cannot be released
+        """
+        path = os.path.normpath( os.path.abspath( File.name ) )
+        try:
+            fcntl.lockf( File , fcntl.LOCK_UN )
+        finally:
+            self._mutex.acquire()
+            try:
+                queue = self._queues.get( path )
+            finally:
+                self._mutex.release()
+            if queue is not None and queue.holder is not None:
+                self._releaseQueue( path , queue )
+
+    def getStats( self , path = None ):
+        """
+        @param path: the absolute path of a locked file. if path is None return the statistics of all files.
+        @type path: string
+        @return: the contention statistics for path ( or all files ).
+        @rtype: { 'acquired' : int , 'contended' : int , 'timeouts' : int , 'wait_time' : float ,
+                  'max_wait' : float , 'holder_pid' : int , 'holder_type' : string } or
+                 { string path : { ... } , ... }
+        """
+        self._mutex.acquire()
+        try:
+            if path is not None:
+                return dict( self._stats.get( os.path.normpath( path ) , {} ) )
+            return dict( [ ( p , dict( s ) ) for p , s in self._stats.items() ] )
+        finally:
+            self._mutex.release()
+
+    def _getQueue( self , path ):
+        """
+        @return: the queue of the waiters of this process for path
+        @rtype: L{_FileQueue} instance
+        """
+        self._mutex.acquire()
+        try:
+            try:
+                queue = self._queues[ path ]
+            except KeyError:
+                queue = _FileQueue()
+                self._queues[ path ] = queue
+            queue.users += 1
+            return queue
+        finally:
+            self._mutex.release()
+
+    def _leaveQueue( self , path , queue ):
+        """
+        forget the queue if nobody else use it
+        """
+        self._mutex.acquire()
+        try:
+            queue.users -= 1
+            if queue.users == 0 and self._queues.get( path ) is queue:
+                del self._queues[ path ]
+        finally:
+            self._mutex.release()
+
+    def _releaseQueue( self , path , queue ):
+        """
+        give the file to the next waiter of this process
+        """
+        queue.condition.acquire()
+        try:
+            queue.holder = None
+            queue.condition.notifyAll()
+        finally:
+            queue.condition.release()
+        self._leaveQueue( path , queue )
+
+    def _lock( self , File , path , lockType , deadline ):
+        """
+        acquire the lock between processes
+        @param deadline: the time to give up, None to wait without deadline
+        @type deadline: float
+        @return: the pid and the lock type of the process which held the lock when we had to wait, ( None , None ) otherwise
+        @rtype: ( int , int )
+        @raise IOError: when it could not acquire a lock before the deadline
+        """
+        try:
+            fcntl.lockf( File , lockType | fcntl.LOCK_NB )
+            return None , None
+        except IOError , err:
+            if err.errno not in ( errno.EACCES , errno.EAGAIN ):
+                raise
+        holder_pid , holder_type = self._getHolder( File , lockType )
+        try:
+            if deadline is None:
+                self._lockBlocking( File , lockType )
+            elif not self._lockAlarm( File , lockType , deadline ):
+                self._lockPolling( File , lockType , deadline )
+        except IOError , err:
+            self._record( path , lockType , None , holder_pid , holder_type , timeout = True )
+            msg = "%s : cannot acquire a %s lock : %s ( held by pid %s ( %s ) )" % ( path ,
+                                                                                     self._LOCK_NAMES.get( lockType , lockType ) ,
+                                                                                     err ,
+                                                                                     holder_pid ,
+                                                                                     self._LOCK_NAMES.get( holder_type , holder_type ) )
+            l_log.error( msg )
+            raise IOError( msg )
+        return holder_pid , holder_type
+
+    def _lockBlocking( self , File , lockType ):
+        """
+        wait for the lock without deadline
+        """
+        while True:
+            try:
+                fcntl.lockf( File , lockType )
+                return
+            except IOError , err:
+                #interrupted by a signal
+                if err.errno != errno.EINTR:
+                    raise
+
+    def _lockAlarm( self , File , lockType , deadline ):
+        """
+        wait for the lock with a blocking lockf interrupted by a SIGALRM at the deadline
+        @return: False if the alarm cannot be used by this thread, True if the lock is acquired
+        @rtype: boolean
+        @raise IOError: when it could not acquire a lock before the deadline
+        """
+        if not isinstance( threading.currentThread() , threading._MainThread ):
+            return False
+        if signal.getitimer( signal.ITIMER_REAL )[0] > 0:
+            #the timer is used by someone else
+            return False
+        def alarm( signum , frame ):
+            pass
+        old_handler = signal.signal( signal.SIGALRM , alarm )
+        try:
+            while True:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise IOError( errno.EAGAIN , "timeout" )
+                signal.setitimer( signal.ITIMER_REAL , remaining )
+                try:
+                    fcntl.lockf( File , lockType )
+                    return True
+                except IOError , err:
+                    #interrupted by the alarm or by another signal
+                    if err.errno != errno.EINTR:
+                        raise
+                finally:
+                    signal.setitimer( signal.ITIMER_REAL , 0 )
+        finally:
+            signal.signal( signal.SIGALRM , old_handler if old_handler is not None else signal.SIG_DFL )
+
+    def _lockPolling( self , File , lockType , deadline ):
+        """
+        poll the lock with an increasing delay until the deadline
+        @raise IOError: when it could not acquire a lock before the deadline
+        """
+        delay = self.MIN_DELAY
+        while True:
+            remaining = deadline - time()
+            if remaining <= 0:
+                raise IOError( errno.EAGAIN , "timeout" )
+            sleep( min( delay , remaining ) )
+            delay = min( delay * 2 , self.MAX_DELAY )
+            try:
+                fcntl.lockf( File , lockType | fcntl.LOCK_NB )
+                return
+            except IOError , err:
+                if err.errno not in ( errno.EACCES , errno.EAGAIN ):
+                    raise
+
+    def _getHolder( self , File , lockType ):
+        """
+        @return: the pid and the lock type of a process which held a lock incompatible with lockType on File
+        or ( None , None ) if it cannot be determined.
+        @rtype: ( int , int )
+        """
+        if not sys.platform.startswith( 'linux' ):
+            return None , None
+        #struct flock { short l_type; short l_whence; off_t l_start; off_t l_len; pid_t l_pid; }
+        if lockType == fcntl.LOCK_EX:
+            l_type = fcntl.F_WRLCK
+        else:
+            l_type = fcntl.F_RDLCK
+        try:
+            query = struct.pack( 'hhqqi' , l_type , os.SEEK_SET , 0 , 0 , 0 )
+            l_type , l_whence , l_start , l_len , l_pid = struct.unpack( 'hhqqi' , fcntl.fcntl( File , fcntl.F_GETLK , query ) )
+        except ( IOError , struct.error ):
+            return None , None
+        if l_type == fcntl.F_UNLCK:
+            return None , None
+        if l_type == fcntl.F_WRLCK:
+            return l_pid , fcntl.LOCK_EX
+        return l_pid , fcntl.LOCK_SH
+
+    def _record( self , path , lockType , waited , holder_pid , holder_type , timeout = False ):
+        self._mutex.acquire()
+        try:
+            try:
+                stats = self._stats[ path ]
+            except KeyError:
+                if len( self._stats ) >= self.MAX_STATS:
+                    oldest = min( self._stats.items() , key = lambda item : item[1][ 'last' ] )[0]
+                    del self._stats[ oldest ]
+                stats = { 'acquired'    : 0 ,
+                          'contended'   : 0 ,
+                          'timeouts'    : 0 ,
+                          'wait_time'   : 0.0 ,
+                          'max_wait'    : 0.0 ,
+                          'holder_pid'  : None ,
+                          'holder_type' : None ,
+                          }
+                self._stats[ path ] = stats
+            stats[ 'last' ] = time()
+            if timeout:
+                stats[ 'timeouts' ] += 1
+            else:
+                stats[ 'acquired' ] += 1
+                if holder_pid is not None or waited >= self.MIN_DELAY:
+                    stats[ 'contended' ] += 1
+                    stats[ 'wait_time' ] += waited
+                    stats[ 'max_wait' ] = max( stats[ 'max_wait' ] , waited )
+            if holder_pid is not None:
+                stats[ 'holder_pid' ] = holder_pid
+                stats[ 'holder_type' ] = self._LOCK_NAMES.get( holder_type , holder_type )
+        finally:
+            self._mutex.release()
+
+
+lockManager = LockManager()
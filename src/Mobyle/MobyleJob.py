@@ -875,17 +875,39 @@ class MobyleJob:
         else:
             return None
 
-    def getOutputFile( self, fileName ):
+    def getOutputFile( self, fileName , maxSize = None ):
         """
         @param fileName:
         @type fileName: String
+        @param maxSize: the max number of bytes to read, None to read the whole file
+        @type maxSize: int
         @return: the content of a output file as a string
         @rtype: string
         @raise exception: 
         """
         if self.jobState:
             if self._hasRun:
-                return self.jobState.getOutputFile( fileName )
+                return self.jobState.getOutputFile( fileName , maxSize = maxSize )
+            else:
+                msg = "try to get result but the job had not run"
+                raise MobyleError , msg
+        else:
+            return None  
+        
+    def copyOutputFile( self, fileName , dest ):
+        """
+        write the content of a output file in dest without loading it in memory
+        @param fileName:
+        @type fileName: String
+        @param dest: the file where the content is written
+        @type dest: file object
+        @return: the number of bytes written
+        @rtype: int
+        @raise exception: 
+        """
+        if self.jobState:
+            if self._hasRun:
+                return self.jobState.copyOutputFile( fileName , dest )
             else:
                 msg = "try to get result but the job had not run"
                 raise MobyleError , msg
@@ -10,7 +10,15 @@
  Tools to parse and build services for Mobyle
 
 """
+import os
 import os.path
+import threading
+import tempfile
+import cPickle
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import sha as sha1
 from lxml import etree
 from logging import getLogger
 b_log = getLogger( 'Mobyle.builder' )
@@ -34,14 +42,52 @@ def parseService( serviceUrl  , debug = 0 ) :
     @return: a service
     @rtype: service instance
     """
+    return getServiceCache().getService( serviceUrl , debug = debug )
+
+
+
+_serviceCache = None
+_serviceCacheLock = threading.Lock()
+
+def getServiceCache():
+    """
+    @return: the service cache shared by the process, created on first use ( the configuration
+    is not read when this module is imported )
+    @rtype: L{ServiceCache} instance
+    """
+    global _serviceCache
+    if _serviceCache is None:
+        _serviceCacheLock.acquire()
+        try:
+            if _serviceCache is None:
+                _serviceCache = ServiceCache()
+        finally:
+            _serviceCacheLock.release()
+    return _serviceCache
+
+
+
+def _parseService( serviceUrl , content = None , debug = 0 ):
+    """
+    parse the definition of a service without using the cache.
+    @param serviceUrl: the url of a Mobyle Service definition
+    @type serviceUrl: string
+    @param content: the xml definition already read from serviceUrl
+    @type content: string
+    @return: a service
+    @rtype: service instance
+    """
     try:
         servicePath = serviceUrl
     except KeyError:
         raise MobyleError , "the service %s doesn't exist" % serviceUrl
     
     parser = etree.XMLParser( no_network = False )
-    doc = etree.parse( servicePath , parser )
-    root = doc.getroot()
+    if content is None:
+        doc = etree.parse( servicePath , parser )
+        root = doc.getroot()
+    else:
+        root = etree.fromstring( content , parser , base_url = servicePath )
     if root.tag == "program":
         service = parseProgram( root , debug = debug )
     elif root.tag == "workflow":
@@ -51,6 +97,230 @@ def parseService( serviceUrl  , debug = 0 ) :
     service.header.setUrl( serviceUrl )   
     return service
 
+
+
+class ServiceCache( object ):
+    """
+    keep the parsed service definitions to not parse the xml of a service for each request.
+    The services are kept pickled:
+     - in memory, for the last service_cache_size services used by the process,
+     - on disk, in the service_cache_path directory, one file per service which is shared
+       by all the processes.
+    A compiled definition is used as long as the modification time and the size 
+    of the xml file are unchanged, or if the content of the file has the same digest.
+    Each call returns a new instance of the service, which can be modified by the caller.
+    """
+    
+    #must be incremented each time the pickled classes of Mobyle.Service change
+    VERSION = 1
+    
+    def __init__( self , path = None , size = None ):
+        """
+        @param path: the directory where the compiled services are stored, by default Config.service_cache_path
+        @type path: string
+        @param size: the max number of services kept in memory, by default Config.service_cache_size
+        @type size: int
+        """
+        cfg = Config()
+        if path is None:
+            path = cfg.service_cache_path()
+        if size is None:
+            size = cfg.service_cache_size()
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        #{ service path : ( ( mtime , size ) , digest , pickled service ) }
+        self._entries = {}
+        #the service paths from the least to the most recently used 
+        self._order = []
+        self._stats = { 'memory' : 0 , 'disk' : 0 , 'parsed' : 0 , 'evicted' : 0 }
+    
+    def getService( self , serviceUrl , debug = 0 ):
+        """
+        @param serviceUrl: the url of a Mobyle Service definition
+        @type serviceUrl: string
+        @return: a service
+        @rtype: service instance
+        """
+        try:
+            stat = os.stat( serviceUrl )
+        except OSError:
+            #a remote url or a missing file, let the parser handle it
+            return _parseService( serviceUrl , debug = debug )
+        stamp = ( stat.st_mtime , stat.st_size )
+        self._lock.acquire()
+        try:
+            entry = self._entries.get( serviceUrl )
+            if entry is not None and entry[0] == stamp:
+                self._order.remove( serviceUrl )
+                self._order.append( serviceUrl )
+                self._stats[ 'memory' ] += 1
+                blob = entry[2]
+            else:
+                blob = None
+        finally:
+            self._lock.release()
+        if blob is not None:
+            service = self._loads( serviceUrl , blob )
+            if service is not None:
+                return service
+        
+        compiled = self._readCompiled( serviceUrl )
+        if compiled is not None and compiled[0] == stamp:
+            digest , blob = compiled[1:]
+            service = self._loads( serviceUrl , blob )
+            if service is not None:
+                self._count( 'disk' )
+                self._remember( serviceUrl , stamp , digest , blob )
+                return service
+        fh = open( serviceUrl )
+        try:
+            content = fh.read()
+        finally:
+            fh.close()
+        digest = sha1( content ).hexdigest()
+        if compiled is not None and compiled[1] == digest:
+            #the file has been touched but not modified
+            blob = compiled[2]
+            service = self._loads( serviceUrl , blob )
+            if service is not None:
+                self._count( 'disk' )
+                self._writeCompiled( serviceUrl , stamp , digest , blob )
+                self._remember( serviceUrl , stamp , digest , blob )
+                return service
+        service = _parseService( serviceUrl , content = content , debug = debug )
+        self._count( 'parsed' )
+        try:
+            blob = cPickle.dumps( service , cPickle.HIGHEST_PROTOCOL )
+        except Exception , err :
+            p_log.warning( "the service %s cannot be compiled : %s" %( serviceUrl , err ) )
+            return service
+        self._writeCompiled( serviceUrl , stamp , digest , blob )
+        self._remember( serviceUrl , stamp , digest , blob )
+        return service
+    
+    def clear( self ):
+        """
+        forget the services kept in memory ( the compiled files are kept ).
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._order = []
+        finally:
+            self._lock.release()
+            
+    def getStats( self ):
+        """
+        @return: the number of services served from the memory, from the compiled files, 
+        the number of services parsed and the number of services evicted from the memory
+        @rtype: dict { 'memory' : int , 'disk' : int , 'parsed' : int , 'evicted' : int }
+        """
+        self._lock.acquire()
+        try:
+            return self._stats.copy()
+        finally:
+            self._lock.release()
+    
+    def _count( self , key ):
+        self._lock.acquire()
+        try:
+            self._stats[ key ] += 1
+        finally:
+            self._lock.release()
+        
+    def _remember( self , serviceUrl , stamp , digest , blob ):
+        """
+        keep the pickled service in memory and evict the least recently used services
+        """
+        if not self.size:
+            return
+        self._lock.acquire()
+        try:
+            if serviceUrl in self._entries:
+                self._order.remove( serviceUrl )
+            self._entries[ serviceUrl ] = ( stamp , digest , blob )
+            self._order.append( serviceUrl )
+            while len( self._order ) > self.size:
+                del self._entries[ self._order.pop( 0 ) ]
+                self._stats[ 'evicted' ] += 1
+        finally:
+            self._lock.release()
+            
+    def _loads( self , serviceUrl , blob ):
+        """
+        @return: the unpickled service or None if the blob cannot be unpickled
+        """
+        try:
+            return cPickle.loads( blob )
+        except Exception , err :
+            p_log.warning( "cannot load the compiled service %s : %s" %( serviceUrl , err ) )
+            self._lock.acquire()
+            try:
+                if serviceUrl in self._entries:
+                    del self._entries[ serviceUrl ]
+                    self._order.remove( serviceUrl )
+            finally:
+                self._lock.release()
+            return None
+        
+    def _compiledPath( self , serviceUrl ):
+        name = os.path.splitext( os.path.basename( serviceUrl ) )[0]
+        key = sha1( os.path.realpath( serviceUrl ) ).hexdigest()
+        return os.path.join( self.path , "%s.%s.pickle" %( name , key ) )
+    
+    def _readCompiled( self , serviceUrl ):
+        """
+        @return: the stamp, the digest of the xml and the pickled service 
+        or None if there is no valid compiled file for this service
+        @rtype: tuple ( ( float , int ) , string , string )
+        """
+        if self.path is None:
+            return None
+        try:
+            fh = open( self._compiledPath( serviceUrl ) , 'rb' )
+        except IOError:
+            return None
+        try:
+            try:
+                version , path , stamp , digest = cPickle.load( fh )
+                blob = fh.read()
+            except Exception , err :
+                p_log.warning( "invalid compiled service %s : %s" %( serviceUrl , err ) )
+                return None
+        finally:
+            fh.close()
+        if version != self.VERSION or path != os.path.realpath( serviceUrl ):
+            return None
+        return stamp , digest , blob
+    
+    def _writeCompiled( self , serviceUrl , stamp , digest , blob ):
+        """
+        store the pickled service in the compiled file of this service. 
+        The file is replaced atomically to not be read by an other process while it's written.
+        """
+        if self.path is None:
+            return
+        try:
+            if not os.path.exists( self.path ):
+                os.makedirs( self.path )
+            fd , tmpPath = tempfile.mkstemp( dir = self.path , prefix = '.tmp' )
+            try:
+                fh = os.fdopen( fd , 'wb' )
+                try:
+                    cPickle.dump( ( self.VERSION , os.path.realpath( serviceUrl ) , stamp , digest ) , fh , cPickle.HIGHEST_PROTOCOL )
+                    fh.write( blob )
+                finally:
+                    fh.close()
+                #mkstemp creates the file readable by its owner only
+                os.chmod( tmpPath , 0644 )
+                os.rename( tmpPath , self._compiledPath( serviceUrl ) )
+            except:
+                os.unlink( tmpPath )
+                raise
+        except ( IOError , OSError ) , err :
+            p_log.warning( "cannot store the compiled service %s : %s" %( serviceUrl , err ) )
+
     
     
 def parseWorkflow( workflowNode ):
@@ -305,6 +305,33 @@ class Registry(DefNode):
 #                    self.servers.remove(service.server)
 
 
+    def pruneServices(self, services):
+        """
+        remove several Service Definitions from the registry. 
+        Each list of the registry is filtered once whatever the number of services to remove.
+        @param services: the Services to remove
+        @type services: a list of ServiceDef instances
+        """
+        for klass, kind in ((ProgramDef, 'program'), (WorkflowDef, 'workflow'), (ViewerDef, 'viewer')):
+            pruned = {}
+            for service in services:
+                if isinstance(service, klass) and self.has_service(service):
+                    pruned[(service.server.name, service.name)] = service
+            if not pruned:
+                continue
+            keep = lambda s: (s.server.name, s.name) not in pruned
+            services_list = getattr(self, kind + 's')
+            services_list[:] = [s for s in services_list if keep(s)]
+            servers = {}
+            for service in pruned.values():
+                del getattr(self, kind + 'sByUrl')[service.url]
+                server = self.serversByName[service.server.name]
+                del getattr(server, kind + 'sByName')[service.name]
+                servers[server.name] = server
+            for server in servers.values():
+                services_list = getattr(server, kind + 's')
+                services_list[:] = [s for s in services_list if keep(s)]
+
     def _getServerProperties(self):
         """
         @return: a dict of all deployed servers associated with their respective properties
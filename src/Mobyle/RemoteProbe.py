@@ -0,0 +1,323 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+"""
+RemoteProbe.py
+
+The jobs of a session may run on remote portals. To display a session, each remote job is
+checked ( does it still exist ? what is its status ? ) by a request to its portal.
+This module sends these requests concurrently, by a bounded number of threads, and reuses the
+connection to a portal for all the jobs of this portal ( keep-alive ).
+A portal which does not answer several times in a row is considered as down during
+REMOTE_HOST_DOWN_TTL seconds: its jobs are not checked anymore and their existence is unknown ( 2 ).
+"""
+
+import socket
+import threading
+import Queue
+import urlparse
+from httplib import HTTPConnection , HTTPSConnection , HTTPException
+from time import time
+
+from logging import getLogger
+p_log = getLogger( __name__ )
+
+from Mobyle.ConfigManager import Config
+from Mobyle.MobyleError import MobyleError
+
+
+class HostBreaker( object ):
+    """
+    a circuit breaker per remote host: after FAILURE_THRESHOLD failures in a row, the host is
+    down for ttl seconds, then the next request is allowed to try again.
+    The breaker is shared by all the threads of the process.
+    """
+
+    FAILURE_THRESHOLD = 3
+
+    def __init__( self , ttl = None ):
+        """
+        @param ttl: how long ( in sec ) a host is down after too many failures, None to use the REMOTE_HOST_DOWN_TTL
+        @type ttl: float
+        """
+        self._ttl = ttl
+        self._failures = {}
+        self._downUntil = {}
+        self._lock = threading.Lock()
+
+    def _getTTL( self ):
+        if self._ttl is None:
+            #read lazily as the configuration is not loaded when this module is imported
+            self._ttl = Config().remote_host_down_ttl()
+        return self._ttl
+
+    def isDown( self , host ):
+        """
+        @return: True if the host has failed recently and must not be requested, False otherwise.
+        @rtype: boolean
+        """
+        self._lock.acquire()
+        try:
+            downUntil = self._downUntil.get( host )
+            if downUntil is None:
+                return False
+            if downUntil > time():
+                return True
+            #half open: let one request try, it will close or open the breaker again
+            del self._downUntil[ host ]
+            self._failures[ host ] = self.FAILURE_THRESHOLD - 1
+            return False
+        finally:
+            self._lock.release()
+
+    def succeeded( self , host ):
+        self._lock.acquire()
+        try:
+            self._failures.pop( host , None )
+            self._downUntil.pop( host , None )
+        finally:
+            self._lock.release()
+
+    def failed( self , host ):
+        self._lock.acquire()
+        try:
+            failures = self._failures.get( host , 0 ) + 1
+            self._failures[ host ] = failures
+            if failures >= self.FAILURE_THRESHOLD and host not in self._downUntil:
+                p_log.warning( "the host %s has failed %d times, it is considered as down for %.0f sec" %( host , failures , self._getTTL() ) )
+                self._downUntil[ host ] = time() + self._getTTL()
+        finally:
+            self._lock.release()
+
+    def clear( self ):
+        self._lock.acquire()
+        try:
+            self._failures.clear()
+            self._downUntil.clear()
+        finally:
+            self._lock.release()
+
+
+hostBreaker = HostBreaker()
+
+
+def getHost( url ):
+    """
+    @return: the host ( and port ) part of the url
+    @rtype: string
+    """
+    return urlparse.urlparse( url )[1]
+
+
+class RemoteJobProbe( object ):
+    """
+    check concurrently the jobs of the remote portals
+    """
+
+    #the timeout ( in sec ) of the connections to the remote portals
+    TIMEOUT = 10
+    MAX_REDIRECTIONS = 10
+    #the max number of connections opened at the same time to the same host
+    HOST_CONNECTIONS = 2
+
+    def __init__( self , threads = None , breaker = None ):
+        """
+        @param threads: the max number of threads used to probe the jobs, None to use the REMOTE_PROBE_THREADS
+        @type threads: int
+        @param breaker: the circuit breaker of the hosts, None to use the breaker shared by the process
+        @type breaker: L{HostBreaker} instance
+        """
+        if threads is None:
+            threads = Config().remote_probe_threads()
+        if breaker is None:
+            breaker = hostBreaker
+        self.threads = threads
+        self.breaker = breaker
+
+    def exists( self , jobIDs ):
+        """
+        @param jobIDs: the url of remote jobs ( without index.xml )
+        @type jobIDs: list of string
+        @return: for each job 1 if the job exists, 0 if it does not exist anymore and 2 if
+        its existence cannot be decided ( the portal is down , timeout ... )
+        @rtype: { string jobID : int }
+        """
+        results = {}
+        byHost = {}
+        for jobID in jobIDs:
+            byHost.setdefault( getHost( jobID ) , [] ).append( jobID )
+        tasks = []
+        for host , hostJobs in byHost.items():
+            if self.breaker.isDown( host ):
+                for jobID in hostJobs:
+                    results[ jobID ] = 2
+                continue
+            connections = min( self.HOST_CONNECTIONS , len( hostJobs ) )
+            for i in range( connections ):
+                tasks.append( ( host , hostJobs[ i::connections ] ) )
+        self._runPool( tasks , lambda task : self._probeHost( task[0] , task[1] , results ) )
+        return results
+
+    def run( self , tasks ):
+        """
+        call functions which request the remote portals concurrently.
+        @param tasks: the host requested by each function and the function to call ( without argument )
+        @type tasks: [ ( string host , callable ) , ... ]
+        @return: for each task , the value returned by the function and None or None and the exception
+        raised by the function ( a MobyleError if the host is down )
+        @rtype: [ ( object result , Exception error ) , ... ]
+        """
+        results = [ None ] * len( tasks )
+        limits = {}
+        for host , func in tasks:
+            if host not in limits:
+                limits[ host ] = threading.BoundedSemaphore( self.HOST_CONNECTIONS )
+        def call( item ):
+            index , ( host , func ) = item
+            if self.breaker.isDown( host ):
+                results[ index ] = ( None , MobyleError( "the host %s is down" % host ) )
+                return
+            limits[ host ].acquire()
+            try:
+                try:
+                    results[ index ] = ( func() , None )
+                except Exception , err:
+                    p_log.error( "request to %s failed : %s" %( host , err ) )
+                    self.breaker.failed( host )
+                    results[ index ] = ( None , err )
+                else:
+                    self.breaker.succeeded( host )
+            finally:
+                limits[ host ].release()
+        self._runPool( list( enumerate( tasks ) ) , call )
+        return results
+
+    def _runPool( self , items , func ):
+        """
+        call func on each item by at most self.threads threads
+        """
+        if not items:
+            return
+        if len( items ) == 1 or self.threads == 1:
+            for item in items:
+                func( item )
+            return
+        pending = Queue.Queue()
+        for item in items:
+            pending.put( item )
+        def worker():
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    func( item )
+                except Exception , err:
+                    p_log.error( "remote probe error : %s" % err , exc_info = True )
+        threads = [ threading.Thread( target = worker ) for i in range( min( self.threads , len( items ) ) ) ]
+        for thread in threads:
+            thread.setDaemon( True )
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _connection( self , scheme , host ):
+        if scheme == 'https':
+            return HTTPSConnection( host , timeout = self.TIMEOUT )
+        return HTTPConnection( host , timeout = self.TIMEOUT )
+
+    def _head( self , connection , url ):
+        """
+        @return: the status class ( 2 , 3 , 4 , 5 ) of the answer and the redirection url
+        @rtype: ( int , string )
+        @raise socket.error , HTTPException: if the host cannot be reached
+        """
+        scheme , host , path , params , query , fragment = urlparse.urlparse( url )
+        if params:
+            path = "%s;%s" %( path , params )
+        if query:
+            path = "%s?%s" %( path , query )
+        connection.request( "HEAD" , path or '/' )
+        response = connection.getresponse()
+        #the response must be read to reuse the connection
+        response.read()
+        location = response.getheader( 'Location' )
+        if location:
+            location = urlparse.urljoin( url , location )
+        return response.status / 100 , location
+
+    def _probeHost( self , host , jobIDs , results ):
+        """
+        check the jobs of one host with one connection
+        @param results: the dict where the existence of each job is stored
+        @type results: dict
+        """
+        connection = None
+        requests = 0
+        try:
+            for jobID in jobIDs:
+                if self.breaker.isDown( host ):
+                    results[ jobID ] = 2
+                    continue
+                url = jobID + '/index.xml'
+                verdict = 2
+                for attempt in range( self.MAX_REDIRECTIONS + 1 ):
+                    scheme = urlparse.urlparse( url )[0]
+                    urlHost = getHost( url )
+                    try:
+                        if urlHost == host:
+                            if connection is None:
+                                connection = self._connection( scheme , host )
+                                requests = 0
+                            try:
+                                status , location = self._head( connection , url )
+                            except ( socket.error , HTTPException ):
+                                if not requests:
+                                    raise
+                                #the host may have closed the idle connection
+                                connection.close()
+                                connection = self._connection( scheme , host )
+                                requests = 0
+                                status , location = self._head( connection , url )
+                            requests += 1
+                        else:
+                            #redirection to an other host
+                            other = self._connection( scheme , urlHost )
+                            try:
+                                status , location = self._head( other , url )
+                            finally:
+                                other.close()
+                    except ( socket.error , HTTPException ) , err:
+                        p_log.error( "job %s is unreachable : %s " %( url , err ) )
+                        if urlHost == host and connection is not None:
+                            connection.close()
+                            connection = None
+                        self.breaker.failed( urlHost )
+                        break
+                    if status == 5:
+                        p_log.error( "%s : %s" %( jobID , status ) )
+                        self.breaker.failed( urlHost )
+                        break
+                    self.breaker.succeeded( urlHost )
+                    if status == 3 and location:
+                        url = location
+                        continue
+                    if status == 2:
+                        verdict = 1
+                    elif status == 4:
+                        verdict = 0
+                    else:
+                        p_log.error( "%s : %s" %( jobID , status ) )
+                    break
+                else:
+                    p_log.error( "we attempt %d redirections whithout reaching the target url: %s" %( self.MAX_REDIRECTIONS , jobID ) )
+                results[ jobID ] = verdict
+        finally:
+            if connection is not None:
+                connection.close()
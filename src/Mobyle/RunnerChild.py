@@ -215,15 +215,17 @@ class AsynchronJob:
         zip_filename = zipFiles( zipFileName , files2zip )
         return  zip_filename    
 
-if __name__ == '__main__':
-    try:
-        fh = open(".forChild.dump", "r")
-        fromFather = cPickle.load( fh )
-        fh.close() 
-    except Exception, err :
-        rc_log.critical( str( err ) )
-        raise MobyleError( err )
 
+def runFromFather( fromFather ):
+    """
+    run the job described by the father in the current process. 
+    @param fromFather: the job description built by L{RunnerFather.AsynchronRunner} 
+    ( the content of the .forChild.dump file of the job )
+    @type fromFather: dict
+    @return: the job once completed
+    @rtype: L{AsynchronJob} instance
+    @call: the main of this module and L{RunnerDaemon}
+    """
     try:
         os.chdir( fromFather[ 'dirPath' ] )
     except OSError, err:
@@ -235,11 +237,23 @@ if __name__ == '__main__':
     if userEmail is not None:
         userEmail = EmailAddress( userEmail  )
         
-    child = AsynchronJob( fromFather[ 'commandLine' ] , # string the unix command line
-                          fromFather[ 'dirPath' ] ,     # absolute path of the working directory
-                          fromFather[ 'serviceName' ] , # string 
-                          fromFather[ 'resultsMask'] ,  # 
-                          userEmail = userEmail  ,      # Net.EmailAddress to
-                          xmlEnv = fromFather[ 'xmlEnv' ] , #a dict
-                          email_notify = fromFather[ 'email_notify' ] #'true' , 'false' or 'auto'
-                          )
+    return AsynchronJob( fromFather[ 'commandLine' ] , # string the unix command line
+                         fromFather[ 'dirPath' ] ,     # absolute path of the working directory
+                         fromFather[ 'serviceName' ] , # string 
+                         fromFather[ 'resultsMask'] ,  # 
+                         userEmail = userEmail  ,      # Net.EmailAddress to
+                         xmlEnv = fromFather[ 'xmlEnv' ] , #a dict
+                         email_notify = fromFather[ 'email_notify' ] #'true' , 'false' or 'auto'
+                         )
+
+
+if __name__ == '__main__':
+    try:
+        fh = open(".forChild.dump", "r")
+        fromFather = cPickle.load( fh )
+        fh.close() 
+    except Exception, err :
+        rc_log.critical( str( err ) )
+        raise MobyleError( err )
+        
+    child = runFromFather( fromFather )
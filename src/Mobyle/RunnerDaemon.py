@@ -0,0 +1,376 @@
+#! /usr/bin/env python
+
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+"""
+RunnerDaemon.py
+
+A persistent process which runs the jobs in place of a new RunnerChild.py interpreter.
+
+The daemon imports the Mobyle modules, reads the configuration and loads the registry once,
+then keeps a pool of idle workers ( forked processes ) listening on a unix socket.
+When L{RunnerFather.AsynchronRunner} has written the .forChild.dump file of a job, it sends
+the job directory to the daemon. A worker takes the job, leaves the pool and runs it exactly
+like RunnerChild.py does ( L{RunnerChild.runFromFather} ), the daemon forks a new worker to
+replace it. If the daemon cannot be reached the father falls back on the fork / exec of RunnerChild.py.
+
+the dialog on the socket::
+  father -> worker : RUN <job directory>
+  worker -> father : OK <worker pid>  or  ERROR <message>
+  father -> worker : GO
+the worker runs the job only after the GO, thus a job whose father gave up ( timeout )
+and fell back on RunnerChild.py is never run twice.
+
+The socket can be used by the owner of the daemon only, it must be run by the user of the
+Mobyle server. A worker loads only the .forChild.dump files located in the jobs directory
+( RESULTS_PATH ).
+"""
+
+import os
+import sys
+import errno
+import socket
+import select
+import signal
+import atexit
+import cPickle
+
+from logging import getLogger
+rd_log = getLogger( 'Mobyle.RunnerDaemon' )
+
+from Mobyle.MobyleError import MobyleError
+
+__extra_epydoc_fields__ = [('call', 'Called by','Called by')]
+
+#the max time in sec to wait for the other side of the socket during the dialog
+DIALOG_TIMEOUT = 10
+
+#the permissions of the socket
+SOCKET_MODE = 0600
+
+
+def _readLine( conn ):
+    """
+    @return: the next line read on the socket conn without the trailing new line
+    @rtype: string
+    @raise socket.error: if the connection is closed before the end of the line
+    """
+    chunks = []
+    while True:
+        chunk = conn.recv( 4096 )
+        if not chunk:
+            raise socket.error( errno.ECONNRESET , "connection closed by the peer" )
+        chunks.append( chunk )
+        if chunk.endswith( '\n' ):
+            break
+    return ''.join( chunks )[:-1]
+
+
+def submit( socketPath , dirPath , timeout = DIALOG_TIMEOUT ):
+    """
+    ask the runner daemon to run the job located in dirPath.
+    the .forChild.dump file of the job must be already written.
+    @param socketPath: the absolute path of the unix socket of the daemon
+    @type socketPath: string
+    @param dirPath: the absolute path of the job directory
+    @type dirPath: string
+    @param timeout: the max time in sec to wait for the daemon
+    @type timeout: float
+    @return: the pid of the worker which runs the job
+    @rtype: int
+    @raise socket.error: if the daemon cannot be reached
+    @raise MobyleError: if the daemon refuses the job
+    @call: L{RunnerFather.AsynchronRunner}
+    """
+    conn = socket.socket( socket.AF_UNIX , socket.SOCK_STREAM )
+    try:
+        conn.settimeout( timeout )
+        conn.connect( socketPath )
+        conn.sendall( "RUN %s\n" % dirPath )
+        answer = _readLine( conn )
+        if not answer.startswith( 'OK ' ):
+            raise MobyleError , "the runner daemon refused the job %s : %s" %( dirPath , answer )
+        try:
+            pid = int( answer[3:] )
+        except ValueError:
+            raise MobyleError , "invalid answer of the runner daemon : %s" % answer
+        conn.sendall( "GO\n" )
+        return pid
+    finally:
+        conn.close()
+
+
+class RunnerDaemon( object ):
+    """
+    the daemon process: keep the pool of workers full and reap the ended workers.
+    """
+
+    #the max time in sec between 2 checks of the pool
+    POLL_INTERVAL = 1.0
+
+    def __init__( self , socketPath , workers , jobsRoot = None ):
+        """
+        @param socketPath: the absolute path of the unix socket to listen on
+        @type socketPath: string
+        @param workers: the number of idle workers to keep ready
+        @type workers: int
+        @param jobsRoot: the directory of the jobs which can be run, by default Config.results_path
+        @type jobsRoot: string
+        """
+        self.socketPath = socketPath
+        self.workers = workers
+        if jobsRoot is None:
+            from Mobyle.ConfigManager import Config
+            jobsRoot = Config().results_path()
+        self.jobsRoot = os.path.realpath( jobsRoot )
+        self._pid = os.getpid()
+        self._sock = None
+        self._rfd = self._wfd = None
+        #the pids of the workers waiting for a job
+        self._idle = set()
+        #the pids of the workers running a job
+        self._busy = set()
+        self._running = False
+        self._runnerChild = None
+
+    def _preload( self ):
+        """
+        import the modules needed to run a job. This is done once by the daemon,
+        the workers inherit them.
+        """
+        import Mobyle.RunnerChild
+        self._runnerChild = Mobyle.RunnerChild
+
+    def _bind( self ):
+        if os.path.exists( self.socketPath ):
+            probe = socket.socket( socket.AF_UNIX , socket.SOCK_STREAM )
+            try:
+                try:
+                    probe.connect( self.socketPath )
+                except socket.error:
+                    #a socket left by a daemon which has been killed
+                    os.unlink( self.socketPath )
+                else:
+                    raise MobyleError , "a runner daemon is already listening on %s" % self.socketPath
+            finally:
+                probe.close()
+        sock = socket.socket( socket.AF_UNIX , socket.SOCK_STREAM )
+        #the socket must not be reachable by the other users between the bind and the chmod
+        oldMask = os.umask( 0777 & ~SOCKET_MODE )
+        try:
+            sock.bind( self.socketPath )
+        finally:
+            os.umask( oldMask )
+        os.chmod( self.socketPath , SOCKET_MODE )
+        sock.listen( 128 )
+        return sock
+
+    def serve( self ):
+        """
+        run the daemon until it receive a SIGTERM or SIGINT.
+        The workers which are running a job are not stopped.
+        """
+        self._preload()
+        self._sock = self._bind()
+        self._rfd , self._wfd = os.pipe()
+        self._running = True
+        def stop( signum , frame ):
+            self._running = False
+        signal.signal( signal.SIGTERM , stop )
+        signal.signal( signal.SIGINT , stop )
+        rd_log.info( "runner daemon %d listening on %s with %d workers" %( self._pid , self.socketPath , self.workers ) )
+        try:
+            while self._running:
+                while len( self._idle ) < self.workers and self._running:
+                    self._spawn()
+                try:
+                    readable , _ , _ = select.select( [ self._rfd ] , [] , [] , self.POLL_INTERVAL )
+                except select.error , err:
+                    if err.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if readable:
+                    for pid in os.read( self._rfd , 4096 ).split():
+                        pid = int( pid )
+                        self._idle.discard( pid )
+                        self._busy.add( pid )
+                self._reap()
+        finally:
+            if os.getpid() == self._pid:
+                self._shutdown()
+
+    def _shutdown( self ):
+        self._sock.close()
+        try:
+            os.unlink( self.socketPath )
+        except OSError:
+            pass
+        for pid in self._idle:
+            try:
+                os.kill( pid , signal.SIGTERM )
+            except OSError:
+                pass
+        for pid in list( self._idle ):
+            try:
+                os.waitpid( pid , 0 )
+            except OSError:
+                pass
+        os.close( self._rfd )
+        os.close( self._wfd )
+        rd_log.info( "runner daemon %d stopped, %d jobs still running" %( self._pid , len( self._busy ) ) )
+
+    def _reap( self ):
+        """
+        collect the ended workers
+        """
+        while True:
+            try:
+                pid , returncode = os.waitpid( -1 , os.WNOHANG )
+            except OSError , err:
+                if err.errno == errno.EINTR:
+                    continue
+                break #ECHILD no more children
+            if pid == 0:
+                break
+            if pid in self._idle:
+                rd_log.error( "the idle worker %d died, returncode = %s" %( pid , returncode ) )
+            self._idle.discard( pid )
+            self._busy.discard( pid )
+
+    def _spawn( self ):
+        pid = os.fork()
+        if pid:
+            self._idle.add( pid )
+            return
+        returncode = 1
+        try:
+            try:
+                returncode = self._worker()
+            except Exception , err:
+                rd_log.critical( "runner worker %d : %s" %( os.getpid() , err ) , exc_info = True )
+        finally:
+            #the atexit functions registered during the job ( AsynchronJob.childExit ... )
+            #must be run as at the end of RunnerChild.py
+            try:
+                atexit._run_exitfuncs()
+            except Exception:
+                pass
+            os._exit( returncode )
+
+    def _worker( self ):
+        """
+        the worker process: wait for a job and run it
+        @return: the exit code of the worker
+        @rtype: int
+        """
+        for signum in ( signal.SIGTERM , signal.SIGINT ):
+            signal.signal( signum , signal.SIG_DFL )
+        os.close( self._rfd )
+        while True:
+            conn , addr = self._sock.accept()
+            try:
+                fromFather = self._dialog( conn )
+            finally:
+                conn.close()
+            if fromFather is not None:
+                break
+        os.write( self._wfd , "%d\n" % os.getpid() )
+        os.close( self._wfd )
+        self._sock.close()
+        self._runJob( fromFather )
+        return 0
+
+    def _dialog( self , conn ):
+        """
+        @return: the description of the job to run or None if the job must not be run
+        @rtype: dict
+        """
+        conn.settimeout( DIALOG_TIMEOUT )
+        try:
+            request = _readLine( conn )
+            if not request.startswith( 'RUN ' ):
+                conn.sendall( "ERROR invalid request\n" )
+                return None
+            dirPath = request[4:]
+            dumpPath = os.path.realpath( os.path.join( dirPath , ".forChild.dump" ) )
+            if not dumpPath.startswith( self.jobsRoot + os.sep ):
+                rd_log.error( "refuse the job %s : not in %s" %( dirPath , self.jobsRoot ) )
+                conn.sendall( "ERROR the job is not in the jobs directory\n" )
+                return None
+            try:
+                fh = open( dumpPath , 'r' )
+                try:
+                    fromFather = cPickle.load( fh )
+                finally:
+                    fh.close()
+            except Exception , err:
+                rd_log.error( "cannot load the job %s : %s" %( dirPath , err ) )
+                conn.sendall( "ERROR cannot load the job : %s\n" % err )
+                return None
+            conn.sendall( "OK %d\n" % os.getpid() )
+            if _readLine( conn ) != 'GO':
+                return None
+            return fromFather
+        except socket.error , err:
+            #the father gave up, it runs the job itself
+            rd_log.warning( "dialog with the father aborted : %s" % err )
+            return None
+
+    def _runJob( self , fromFather ):
+        """
+        detach the worker from the daemon, then run the job as RunnerChild.py does.
+        @param fromFather: the content of the .forChild.dump file of the job
+        @type fromFather: dict
+        """
+        from Mobyle.ConfigManager import Config
+        cfg = Config()
+        os.setsid()
+        devnull = os.open( "/dev/null" , os.O_RDWR )
+        os.dup2( devnull , sys.stdin.fileno() )
+        try:
+            logfile = os.open( os.path.join( cfg.log_dir(), 'child_log' ) , os.O_APPEND | os.O_WRONLY | os.O_CREAT , 0664 )
+            os.dup2( logfile , sys.stdout.fileno() )
+            os.dup2( logfile , sys.stderr.fileno() )
+            os.close( logfile )
+        except ( IOError , OSError ) , err :
+            rd_log.critical( "error in redirecting stderr or stdout to child_log : ", exc_info = True )
+            os.dup2( devnull , sys.stdout.fileno() )
+            os.dup2( devnull , sys.stderr.fileno() )
+        self._runnerChild.runFromFather( fromFather )
+
+
+
+if __name__ == '__main__':
+    MOBYLEHOME = os.environ.get( 'MOBYLEHOME' )
+    if not MOBYLEHOME:
+        sys.exit( 'MOBYLEHOME must be defined in your environment' )
+    if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+        sys.path.append(  os.path.join( MOBYLEHOME , 'Src' )  )
+
+    from optparse import OptionParser
+    usage = """usage: %prog [options]
+    run the jobs submitted by the Mobyle server ( RUNNER_SOCKET in Local/Config/Config.py ).
+    the daemon stays in foreground, it stops on SIGTERM or SIGINT."""
+    parser = OptionParser( usage = usage )
+    parser.add_option( "-s" , "--socket" , dest = "socket" , help = "the unix socket to listen on ( default RUNNER_SOCKET )" )
+    parser.add_option( "-w" , "--workers" , dest = "workers" , type = "int" , help = "the number of idle workers ( default RUNNER_WORKERS )" )
+    options , args = parser.parse_args()
+
+    from Mobyle.MobyleLogger import MLogger
+    MLogger( child = True )
+    from Mobyle.ConfigManager import Config
+    cfg = Config()
+    socketPath = options.socket or cfg.runner_socket()
+    if not socketPath:
+        parser.error( "no socket specified and RUNNER_SOCKET is not set in Local/Config/Config.py" )
+    workers = options.workers or cfg.runner_workers()
+    try:
+        RunnerDaemon( socketPath , workers ).serve()
+    except MobyleError , err:
+        sys.exit( str( err ) )
@@ -16,6 +16,7 @@ import os
 import sys
 import time
 import cPickle
+import socket
 
 from logging import getLogger , shutdown as logging_shutdown
 rf_log = getLogger( __name__ )
@@ -26,6 +27,7 @@ from Mobyle.Status import Status
 from Mobyle.StatusManager import StatusManager
 from Mobyle.Admin import Admin
 from Mobyle.MobyleError import MobyleError
+from Mobyle.RunnerDaemon import submit
 
 __extra_epydoc_fields__ = [ ('call', 'Calledby','Called by') ]
 
@@ -180,6 +182,19 @@ class AsynchronRunner:
             self.jobState = JobState( self.work_dir )
         else:
             self.jobState = jobState
+        
+        dumped = False
+        socketPath = self._cfg.runner_socket()
+        if socketPath:
+            dumped = self._dumpForChild()
+            if dumped:
+                try:
+                    self._child_pid = submit( socketPath , self.work_dir )
+                    return
+                except ( socket.error , MobyleError ) , err:
+                    rf_log.warning( "%s/%s : the runner daemon is not available ( %s ), the job is run by a new RunnerChild process" %( self._service.getName() ,
+                                                                                                                                       self._job.getKey() ,
+                                                                                                                                       err ) )
         try:
             self._child_pid = os.fork()
         except Exception , err:
@@ -240,64 +255,8 @@ class AsynchronRunner:
                                       )
 
 
-            email = self._job.getEmail()
-            
-            if email is None:
-                email_to = None
-            else:
-                email_to = str( email )
-
-            try:
-                paramsOut = self._service.getAllOutParameter(  )
-                results_mask ={}
-                evaluator = self._service.getEvaluator()
-                stdout = False
-                for paramName in paramsOut :
-                    if self._service.precondHas_proglang( paramName , 'python' ):
-                        preconds = self._service.getPreconds( paramName , proglang='python' )
-                        allPrecondTrue = True
-                        for precond in preconds:
-                            if not evaluator.eval( precond ) :
-                                allPrecondTrue = False
-                                break
-                        if not allPrecondTrue :
-                            continue #next parameter
-                    if self._service.isstdout( paramName ):
-                        stdout = True
-
-                    unixMasks = self._service.getFilenames( paramName , proglang = 'python' )
-                    results_mask [ paramName ] = unixMasks 
-                serviceName = self._service.getName()
-                
-                if not stdout :
-                    results_mask [ 'stdout' ] =  [ serviceName + '.out' ]
-                results_mask [ 'stderr' ] = [ serviceName + '.err']
-            
-            except MobyleError, err:
-                msg = "AsynchronRunner.__init__ : " + str( err )
-                self._logError( logMsg = msg ,
-                                userMsg = "Mobyle Internal server error"
-                                )
-                raise MobyleError , msg
-                
-            forChild = { 'serviceName' : self._service.getName() ,
-                         'email'       : email_to ,
-                         'dirPath'     : self.work_dir,
-                         'commandLine' : self._command ,
-                         'resultsMask' : results_mask ,
-                         'xmlEnv'      : self._xmlEnv ,
-                         'email_notify': self._job.email_notify
-                         }
-            try:
-                fh = open( os.path.join( self.work_dir , ".forChild.dump") ,'w' )
-                cPickle.dump( forChild , fh )
-                fh.close()
-            except IOError , err:
-                msg = "error during dumping forChild.dump of job %s" %self.work_dir
-                self._logError( logMsg = msg ,
-                                userMsg = "Mobyle Internal server error"
-                                )
-            
+            if not dumped:
+                self._dumpForChild()
             cmd = [ childName ]
             
             logging_shutdown() #close all loggers
@@ -321,6 +280,74 @@ class AsynchronRunner:
                 raise MobyleError, msg
 
 
+    def _dumpForChild( self ):
+        """
+        compute the masks of the results of the job and write the description of the job 
+        for the child ( L{RunnerChild} or a worker of the L{RunnerDaemon} ) in the .forChild.dump file
+        @return: True if the .forChild.dump file is written, False otherwise
+        @rtype: boolean
+        """
+        email = self._job.getEmail()
+        
+        if email is None:
+            email_to = None
+        else:
+            email_to = str( email )
+
+        try:
+            paramsOut = self._service.getAllOutParameter(  )
+            results_mask ={}
+            evaluator = self._service.getEvaluator()
+            stdout = False
+            for paramName in paramsOut :
+                if self._service.precondHas_proglang( paramName , 'python' ):
+                    preconds = self._service.getPreconds( paramName , proglang='python' )
+                    allPrecondTrue = True
+                    for precond in preconds:
+                        if not evaluator.eval( precond ) :
+                            allPrecondTrue = False
+                            break
+                    if not allPrecondTrue :
+                        continue #next parameter
+                if self._service.isstdout( paramName ):
+                    stdout = True
+
+                unixMasks = self._service.getFilenames( paramName , proglang = 'python' )
+                results_mask [ paramName ] = unixMasks 
+            serviceName = self._service.getName()
+            
+            if not stdout :
+                results_mask [ 'stdout' ] =  [ serviceName + '.out' ]
+            results_mask [ 'stderr' ] = [ serviceName + '.err']
+        
+        except MobyleError, err:
+            msg = "AsynchronRunner.__init__ : " + str( err )
+            self._logError( logMsg = msg ,
+                            userMsg = "Mobyle Internal server error"
+                            )
+            raise MobyleError , msg
+            
+        forChild = { 'serviceName' : self._service.getName() ,
+                     'email'       : email_to ,
+                     'dirPath'     : self.work_dir,
+                     'commandLine' : self._command ,
+                     'resultsMask' : results_mask ,
+                     'xmlEnv'      : self._xmlEnv ,
+                     'email_notify': self._job.email_notify
+                     }
+        try:
+            fh = open( os.path.join( self.work_dir , ".forChild.dump") ,'w' )
+            cPickle.dump( forChild , fh )
+            fh.close()
+        except IOError , err:
+            msg = "error during dumping forChild.dump of job %s" %self.work_dir
+            self._logError( logMsg = msg ,
+                            userMsg = "Mobyle Internal server error"
+                            )
+            return False
+        return True
+
+
     def _logError( self , userMsg = None , logMsg = None ):
 
         if userMsg :
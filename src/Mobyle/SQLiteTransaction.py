@@ -0,0 +1,1150 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+
+import os
+import sys
+import pickle
+import sqlite3
+from lxml import etree
+from time import strptime , strftime , time
+from logging import getLogger
+
+from Mobyle.Parser import parseType
+from Mobyle.Classes.DataType import DataTypeFactory
+from Mobyle.MobyleError import MobyleError , SessionError , ParserError
+from Mobyle.Status import Status
+from Mobyle.Transaction import Transaction
+
+
+class SQLiteTransaction( object ):
+    """
+    This class provides the same api as L{Transaction} but stores the session
+    in a sqlite database instead of a xml document.
+    Each entry ( data , job , label ... ) is a row indexed by its identifier,
+    thus the lookups and the updates of one entry do not depend on the session size.
+    The locks are managed by sqlite: a READ transaction take a shared lock,
+    a WRITE transaction a reserved lock until commit or rollback.
+    @author: Bertrand Neron
+    @organization: Institut Pasteur
+    @contact:mobyle@pasteur.fr
+    """
+    __ref = {}
+
+    WRITE  = Transaction.WRITE
+    READ   = Transaction.READ
+
+    SCHEMA_VERSION = 1
+
+    SCHEMA = """
+    CREATE TABLE session ( name TEXT PRIMARY KEY ,
+                           value TEXT ) ;
+    CREATE TABLE data ( id TEXT PRIMARY KEY ,
+                        userName TEXT ,
+                        size INTEGER ,
+                        type TEXT ,
+                        headOfData TEXT ) ;
+    CREATE TABLE inputMode ( data_id TEXT ,
+                             mode TEXT ,
+                             PRIMARY KEY ( data_id , mode ) ) ;
+    CREATE TABLE job ( id TEXT PRIMARY KEY ,
+                       userName TEXT ,
+                       programName TEXT ,
+                       date TEXT ,
+                       status TEXT ,
+                       message TEXT ,
+                       description TEXT ) ;
+    CREATE TABLE label ( job_id TEXT ,
+                         position INTEGER ,
+                         label TEXT ,
+                         PRIMARY KEY ( job_id , position ) ) ;
+    CREATE INDEX label_label ON label ( label ) ;
+    CREATE TABLE link ( job_id TEXT ,
+                        data_id TEXT ,
+                        kind TEXT ,
+                        PRIMARY KEY ( job_id , data_id , kind ) ) ;
+    CREATE INDEX link_data ON link ( data_id , kind ) ;
+    CREATE TABLE workflow ( id INTEGER PRIMARY KEY ) ;
+    CREATE TABLE openid ( name TEXT PRIMARY KEY ,
+                          value TEXT ) ;
+    """
+
+    USED = 'used'
+    PRODUCED = 'produced'
+
+    #the time ( in sec ) sqlite waits for a lock before to raise an error
+    TIMEOUT = 10
+
+    def __new__( cls , fileName , lockType ):
+        fileName = os.path.normpath( fileName )
+        if not cls.__ref.has_key( fileName ) :
+            self = super( SQLiteTransaction , cls ).__new__( cls )
+            self._log = getLogger( 'Mobyle.Session.Transaction' )
+            if lockType not in ( self.READ , self.WRITE ):
+                raise MobyleError , 'invalid lockType : ' +  str( lockType )
+            if not os.path.exists( fileName ):
+                msg = "can't open session %s : no such file %s" % ( os.path.basename( os.path.dirname( fileName ) ) , fileName )
+                self._log.critical( msg )
+                raise SessionError , msg
+            self.__fileName = fileName
+            self.__lockType = lockType
+            self._db = None
+            try:
+                self._db = cls._connect( fileName )
+                if lockType == self.WRITE :
+                    self._db.execute( "BEGIN IMMEDIATE" )
+                else:
+                    #sqlite takes the shared lock lazily at the first read
+                    #the read is done right now to get the same semantic as Transaction
+                    self._db.execute( "BEGIN" )
+                version = self._db.execute( "PRAGMA user_version" ).fetchone()[0]
+            except sqlite3.Error , err:
+                if self._db is not None:
+                    self._db.close()
+                msg = "can't open session %s : %s" % ( os.path.basename( os.path.dirname( fileName ) ) , err )
+                self._log.critical( msg )
+                raise SessionError , msg
+            if version != cls.SCHEMA_VERSION :
+                self._db.close()
+                msg = "the session %s has an unsupported schema version: %s" % ( os.path.basename( os.path.dirname( fileName ) ) , version )
+                self._log.error( msg )
+                raise SessionError , msg
+            self._log.debug( "%f : %s : _lock Type= %s ( call by= %s )"  %( time() ,
+                                                                            os.path.basename( os.path.dirname( fileName ) ),
+                                                                            ( 'UNKNOWN LOCK', 'READ' , 'WRITE' )[ self.__lockType ] ,
+                                                                            os.path.basename( sys.argv[0] ) ,
+                                                                            ))
+            self._modified = False
+            cls.__ref[ fileName ] = True
+            return self
+        else:
+            raise SessionError , "try to open 2 transactions on the same file at the same time"
+
+
+    @classmethod
+    def _connect( cls , fileName ):
+        """
+        @return: a connection on the sqlite database fileName in autocommit mode,
+        the transactions are explicitly opened by BEGIN
+        @rtype: sqlite3.Connection instance
+        """
+        db = sqlite3.connect( fileName , timeout = cls.TIMEOUT , isolation_level = None )
+        db.text_factory = str
+        return db
+
+
+    @staticmethod
+    def create( fileName , authenticated , activated , activatingKey = None , userEmail = None , passwd = None):
+        """
+        create a minimal sqlite session
+        @param fileName: the absolute path of the sqlite session file
+        @type fileName: string
+        @param authenticated: True if the session is authenticated , false otherwise
+        @type authenticated: boolean
+        @param activated: True if the session is activated, False otherwise.
+        @type activated: boolean
+        @param activatingKey: the key send to the user to activate this session
+        @type activatingKey: boolean
+        @param userEmail: the userEmail of the user
+        @type userEmail: string
+        """
+        id = os.path.basename( os.path.dirname( fileName ))
+        if authenticated and not passwd:
+            msg = "cannot create authenticated session %s for %s without passwd" % ( id , userEmail )
+            raise SessionError, msg
+
+        if not authenticated and passwd:
+            msg = "cannot create anonymous session %s for %s with passwd" % ( id , userEmail )
+            raise SessionError, msg
+
+        if authenticated and not userEmail:
+            msg = "cannot create authenticated session %s without userEmail" % ( id )
+            raise SessionError, msg
+
+        if os.path.exists( fileName ):
+            msg = "cannot create session %s, file already exists" % fileName
+            raise SessionError, msg
+
+        values = [ ( 'id' , id ) ]
+        if authenticated:
+            values.append( ( 'authenticated' , 'true' ) )
+            values.append( ( 'ticket_id' , None ) )
+            values.append( ( 'ticket_exp_date' , None ) )
+        else:
+            values.append( ( 'authenticated' , 'false' ) )
+        if activated:
+            values.append( ( 'activated' , 'true' ) )
+        else:
+            values.append( ( 'activated' , 'false' ) )
+        if userEmail:
+            values.append( ( 'email' , str( userEmail ) ) )
+        if passwd:
+            values.append( ( 'passwd' , passwd ) )
+        if activatingKey:
+            values.append( ( 'activatingKey' , activatingKey ) )
+        #the database is built aside then moved in place
+        #thus a session file is never seen half created
+        tmpName = "%s.%d" % ( fileName , os.getpid() )
+        db = SQLiteTransaction._connect( tmpName )
+        try:
+            db.executescript( SQLiteTransaction.SCHEMA )
+            db.execute( "PRAGMA user_version = %d" % SQLiteTransaction.SCHEMA_VERSION )
+            db.executemany( "INSERT INTO session ( name , value ) VALUES ( ? , ? )" , values )
+        finally:
+            db.close()
+        os.rename( tmpName , fileName )
+
+
+    def _setModified(self , modified ):
+        """
+        to avoid that a 1rst method set modified to True and a 2 method reset it to False
+        """
+        if self._modified is False:
+            self._modified = modified
+
+
+    def _text( self , content ):
+        """
+        @return: content as an utf-8 encoded string suitable to be stored in the database
+        @rtype: string
+        """
+        if content is None:
+            return None
+        if isinstance( content , unicode ):
+            return content.encode( 'utf-8' )
+        content = str( content )
+        try:
+            content.decode( 'utf-8' )
+            return content
+        except UnicodeDecodeError:
+            # the same heuristic as Transaction to guess the encoding
+            try:
+                data = unicode( content , 'utf_16' )
+            except UnicodeDecodeError:
+                data = unicode( content , 'latin1' )
+            return data.encode( 'utf-8' )
+
+
+    def _getValue( self , name ):
+        """
+        @return: the value stored for name in the session table or None if there is no such entry
+        @rtype: string
+        """
+        row = self._db.execute( "SELECT value FROM session WHERE name = ?" , ( name , ) ).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+
+    def _hasValue( self , name ):
+        """
+        @return: True if there is an entry for name in the session table, False otherwise.
+        @rtype: boolean
+        """
+        row = self._db.execute( "SELECT 1 FROM session WHERE name = ?" , ( name , ) ).fetchone()
+        return row is not None
+
+
+    def _setValue( self , name , value ):
+        """
+        set the value of the entry name of the session table. if the entry doesn't exist, it make it
+        @return: True if the value has been modified , False otherwise
+        @rtype: boolean
+        """
+        value = self._text( value )
+        row = self._db.execute( "SELECT value FROM session WHERE name = ?" , ( name , ) ).fetchone()
+        if row is not None and row[0] == value :
+            return False
+        self._db.execute( "INSERT OR REPLACE INTO session ( name , value ) VALUES ( ? , ? )" , ( name , value ) )
+        return True
+
+
+    def _endTransaction( self , sqlOrder ):
+        """
+        send sqlOrder ( COMMIT or ROLLBACK ) to the database, release the locks
+        and close the database this transaction could not be used again
+        """
+        if self.__lockType == self.READ :
+            logType = 'READ'
+        elif self.__lockType == self.WRITE :
+            logType = 'WRITE'
+        else:
+            logType = 'UNKNOWN LOCK( ' + str( self.__lockType ) +' )'
+        key2del = self.__fileName
+        try:
+            self._log.debug( "%f : %s : %s Type= %s modified = %s ( call by= %s )"  %( time(),
+                                                                                       os.path.basename( os.path.dirname( key2del ) ) ,
+                                                                                       sqlOrder ,
+                                                                                       logType ,
+                                                                                       self._modified ,
+                                                                                       os.path.basename( sys.argv[0] )
+                                                                                       ))
+            self._db.execute( sqlOrder )
+        except sqlite3.Error , err:
+            msg = "can't %s this transaction: %s" % ( sqlOrder.lower() , err )
+            self._log.error( "session/%s : %s" %( os.path.basename( os.path.dirname( key2del ) ) , msg ) )
+            raise SessionError , msg
+        finally:
+            try:
+                self._db.close()
+            except sqlite3.Error , err:
+                self._log.error( "session/%s : cannot close transaction type= %s : %s" %( os.path.basename( os.path.dirname( key2del ) ) ,
+                                                                                           logType ,
+                                                                                           err ) )
+            self._db = None
+            self.__lockType = None
+            self._modified = False
+            try:
+                del( SQLiteTransaction.__ref[ key2del ] )
+            except KeyError:
+                pass
+
+
+    def commit(self):
+        """
+        if the transaction was open in WRITE
+         - commit the modifications in the database
+        and release the lock and close the database this transaction could not be used again
+        """
+        if self.__lockType == self.WRITE and self._modified :
+            self._endTransaction( "COMMIT" )
+        else:
+            self._endTransaction( "ROLLBACK" )
+
+
+    def rollback(self):
+        """
+        release the lock , close the database without modification.
+        this transaction could not be used again
+        """
+        self._endTransaction( "ROLLBACK" )
+
+
+    def getID(self):
+        """
+        @return: the id of the session
+        @rtype: string
+        """
+        id = self._getValue( 'id' )
+        if id:
+            return id
+        else:
+            msg = "the session %s has no identifier" % self.__fileName
+            self._log.error( msg )
+            raise SessionError , msg
+
+    def getEmail(self):
+        """
+        @return: the email of the user session
+        @rtype: string
+        """
+        return self._getValue( 'email' )
+
+    def setEmail( self , email ):
+        """
+        set the user email of this session
+        @param email: the email of the user of this session
+        @type email: string
+        """
+        modified = self._setValue( 'email' ,  email )
+        self._setModified( modified )
+
+    def isActivated( self ):
+        """
+        @return: True if this session is activated, False otherwise.
+        @rtype: boolean
+        """
+        activated = self._getValue( 'activated' )
+        if activated is None:
+            msg = "the session %s has no tag 'activated'" % self.__fileName
+            self._log.error( msg )
+            raise SessionError , msg
+        return activated == 'true'
+
+    def activate(self):
+        """
+        activate this session
+        """
+        modified = self._setValue( 'activated' ,  'true' )
+        self._setModified( modified )
+
+    def inactivate(self):
+        """
+        inactivate this session
+        """
+        modified = self._setValue( 'activated' ,  'false' )
+        self._setModified( modified )
+
+    def getActivatingKey(self):
+        """
+        @return: the key needed to activate this session ( which is send by email to the user )
+        @rtype: string
+        """
+        return self._getValue( 'activatingKey' )
+
+    def isAuthenticated(self):
+        """
+        @return: True if this session is authenticated, False otherwise.
+        @rtype: boolean
+        """
+        auth = self._getValue( 'authenticated' )
+        if auth is None:
+            return None
+        return auth == 'true'
+
+    def getPasswd(self):
+        """
+        @return: the password of the user ( encoded )
+        @rtype: string
+        """
+        return self._getValue( 'passwd' )
+
+    def setPasswd( self , passwd ):
+        """
+        set the session user pass word to passwd
+        @param passwd: the encoded user password
+        @type passwd: string
+        """
+        modified = self._setValue( 'passwd' ,  passwd )
+        self._setModified( modified )
+
+    def getTicket(self):
+        """
+        get the currently allocated ticket and its expiration date
+        @return: the ticket of the user and the expiration date
+        @rtype: tuple
+        """
+        if not self._hasValue( 'ticket_id' ):
+            return None
+        return ( self._getValue( 'ticket_id' ) , self._getValue( 'ticket_exp_date' ) )
+
+    def setTicket( self , ticket_id, exp_date ):
+        """
+        set the currently allocated ticket and its expiration date
+        @param ticket_id: the ticket
+        @type ticket_id: string
+        @param exp_date: the expiration date
+        @type exp_date: date
+        """
+        if self._hasValue( 'ticket_id' ):
+            m1 = self._setValue( 'ticket_id' , ticket_id )
+            m2 = self._setValue( 'ticket_exp_date' , exp_date )
+            self._setModified( m1 or m2 )
+        else:
+            msg = "try to set id and exp-date to a ticket but ticket does not exist (%s)" % self.__fileName
+            self._log.error( msg )
+            raise SessionError , msg
+
+    def getCaptchaSolution( self ):
+        """
+        @return: the solution of the captcha problem submitted to the user.
+        @rtype: string
+        """
+        return self._getValue( 'captchaSolution' )
+
+    def setCaptchaSolution( self  , solution ):
+        """
+        store the solution of the captcha problem submitted to the user.
+        @param solution: the solution of the captcha
+        @type solution: string
+        """
+        modified = self._setValue( 'captchaSolution' ,  solution )
+        self._setModified( modified )
+
+
+    ################################
+    #
+    #  operations on Data
+    #
+    #################################
+
+    def hasData(self , dataID ):
+        """
+        @param dataID: the identifier of the data in the session ( mdm5 name + ext )
+        @type dataID: string
+        @return: True if the session structure has an entry for the data corresponding to this ID, False otherwise.
+        @rtype: boolean
+        """
+        row = self._db.execute( "SELECT 1 FROM data WHERE id = ?" , ( dataID , ) ).fetchone()
+        return row is not None
+
+    def renameData( self , dataID  , newUserName ):
+        """
+        change the user name of the data corresponding to the dataID.
+        @param dataID: the identifier of the data in the session ( mdm5 name + ext )
+        @type dataID: string
+        @param newUserName: the new user name of the data.
+        @type newUserName: string
+        @raise ValueError: if dataID does not match any entry in session.
+        """
+        self._checkData( dataID )
+        cursor = self._db.execute( "UPDATE data SET userName = ? WHERE id = ? AND userName IS NOT ?" ,
+                                   ( self._text( newUserName ) , dataID , self._text( newUserName ) ) )
+        self._setModified( cursor.rowcount > 0 )
+
+    def getData(self , dataID ):
+        """
+        @param dataID: the identifier of the data in the session ( mdm5 name + ext )
+        @type dataID: string
+        @return: the data corresponding to the dataID
+        @rtype: { 'dataName'   =  string ,
+                  'userName'   =  string ,
+                  'size'       =  int ,
+                  'Type'       =  Mobyletype instance,
+                  'dataBegin'    =  string ,
+                  'inputModes' = [ string inputMode1 , string inputMode2 ,... ],
+                  'producedBy' = [ string jobID1 , string jobID2 , ... ],
+                  'usedBy'     = [ string jobID1 , string jobID2 , ... ]
+                  }
+        @raise ValueError: if dataID does not match any entry in session.
+        """
+        row = self._db.execute( "SELECT id , userName , size , type , headOfData FROM data WHERE id = ?" , ( dataID , ) ).fetchone()
+        if row is None:
+            msg = "the data %s does not exist in the session %s" % ( dataID , self.getID() )
+            raise ValueError , msg
+        dtf = DataTypeFactory()
+        return self._dataRow2dataDict( row , dtf )
+
+    def getAllData(self):
+        """
+        @return: all data in this session
+        @rtype: [ {'dataName'   =  string ,
+                  'userName'   =  string ,
+                  'size'       =  int ,
+                  'Type'       =  Mobyletype instance,
+                  'dataBegin'    =  string ,
+                  'inputModes' = [ string inputMode1 , string inputMode2 ,... ],
+                  'producedBy' = [ string jobID1 , string jobID2 , ... ],
+                  'usedBy'     = [ string jobID1 , string jobID2 , ... ]
+                  } , ... ]
+        """
+        dtf = DataTypeFactory()
+        inputModes = {}
+        for dataID , mode in self._db.execute( "SELECT data_id , mode FROM inputMode ORDER BY rowid" ):
+            inputModes.setdefault( dataID , [] ).append( mode )
+        links = {}
+        for jobID , dataID , kind in self._db.execute( "SELECT job_id , data_id , kind FROM link ORDER BY rowid" ):
+            links.setdefault( ( dataID , kind ) , [] ).append( jobID )
+        datas = []
+        for row in self._db.execute( "SELECT id , userName , size , type , headOfData FROM data ORDER BY rowid" ).fetchall():
+            datas.append( self._dataRow2dataDict( row , dtf , inputModes = inputModes , links = links ) )
+        return datas
+
+    def removeData(self , dataID ):
+        """
+        remove the data entry corresponding to dataID
+        @param dataID: the identifier of the data in the session ( mdm5 name + ext )
+        @type dataID: string
+        @raise ValueError: if dataID does not match any entry in session.
+        """
+        self._checkData( dataID )
+        size = self._db.execute( "SELECT size FROM data WHERE id = ?" , ( dataID , ) ).fetchone()[0]
+        self._db.execute( "DELETE FROM data WHERE id = ?" , ( dataID , ) )
+        self._addDiskUsage( - ( size or 0 ) )
+        self._db.execute( "DELETE FROM inputMode WHERE data_id = ?" , ( dataID , ) )
+        self._db.execute( "DELETE FROM link WHERE data_id = ?" , ( dataID , ) )
+        self._setModified( True )
+
+    def _link( self , datasID , jobsID , kind ):
+        """
+        add a ref between each data of datasID and each job of jobsID
+        @raise ValueError: if one dataID does not match any entry in session.
+        """
+        for dataID in datasID:
+            self._checkData( dataID )
+            for jobID in jobsID :
+                cursor = self._db.execute( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" ,
+                                           ( jobID , dataID , kind ) )
+                self._setModified( cursor.rowcount > 0 )
+
+    def linkJobInput2Data(self , datasID ,  jobsID ):
+        """
+        add a ref of each job using this data and a ref of this data in the corresponding job
+        @param datasID: the IDs of data which are used by these jobsID
+        @type datasID: list of string
+        @param jobsID: the IDs of job which has used these data
+        @type jobsID: list of string
+        @raise ValueError: if one dataID does not match any entry in session.
+        """
+        self._link( datasID , jobsID , self.USED )
+
+    def linkJobOutput2Data(self , datasID , jobsID ):
+        """
+        add a ref of each job producing these data and a ref of these data in corresponding jobs.
+        @param dataID: the list of the data ID
+        @type dataID: list of string
+        @param jobsID: the IDs of job which has produced this data
+        @type jobsID: list of string
+        @raise ValueError: if one dataID does not match any entry in session.
+        """
+        self._link( datasID , jobsID , self.PRODUCED )
+
+    def addInputModes(self , dataID , inputModes ):
+        """
+        add an inputmode in the list of inputModes of the data corresponding to the dataID
+        @param dataID: The identifier of one data in this session
+        @type dataID: string
+        @param inputModes: the list of inputMode to add the accepted value are 'db' , 'paste' , 'upload' , 'result'
+        @type inputModes: list of string
+        @raise ValueError: if dataID does not match any entry in session.
+        """
+        self._checkData( dataID )
+        for newMode in inputModes:
+            cursor = self._db.execute( "INSERT OR IGNORE INTO inputMode ( data_id , mode ) VALUES ( ? , ? )" , ( dataID , newMode ) )
+            self._setModified( cursor.rowcount > 0 )
+
+    def createData( self , dataID , userName , size , mobyleType , dataBegining , inputModes , producedBy = [] , usedBy = []):
+        """
+        add a new data entry in the session.
+        @param dataID: The identifier of one data in this session
+        @type dataID: string
+        @param userName: the name given by the user to this data
+        @type userName: string
+        @param size: the size of the file corresponding to this data
+        @type size: int
+        @param Type: the MobyleType of this data
+        @type Type: L{MobyleType} instance
+        @param dataBegining: the 50 first char of the data (if data inherits from Binary a string)
+        @type dataBegining: string
+        @param inputModes: the input modes of this data the accepted data are: 'paste' , 'db' , 'upload' , 'result'
+        @type inputModes: list of string
+        @param producedBy: the jobs Id which produced this data
+        @type producedBy: list of string
+        @param usedBy: the jobs ID which used this data
+        @type usedBy: list of string
+        """
+        typeXml = etree.tostring( mobyleType.toDom() , encoding = 'UTF-8' )
+        try:
+            self._db.execute( "INSERT INTO data ( id , userName , size , type , headOfData ) VALUES ( ? , ? , ? , ? , ? )" ,
+                              ( dataID , self._text( userName ) , int( size ) , typeXml , self._text( dataBegining ) ) )
+        except sqlite3.IntegrityError:
+            raise ValueError , "can't create a new data entry in session %s :the dataID %s already exist" % ( self.getID() , dataID )
+        if inputModes:
+            for inputMode in inputModes:
+                self._db.execute( "INSERT OR IGNORE INTO inputMode ( data_id , mode ) VALUES ( ? , ? )" , ( dataID , inputMode ) )
+        for jobID in producedBy:
+            self._db.execute( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" , ( jobID , dataID , self.PRODUCED ) )
+        for jobID in usedBy:
+            self._db.execute( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" , ( jobID , dataID , self.USED ) )
+        self._addDiskUsage( int( size ) )
+        self._setModified( True )
+
+    def getDiskUsage( self ):
+        """
+        @return: the size of the session directory ( in bytes ) maintained by L{createData} and L{removeData}
+        and the time of the last scan of the directory ( see L{setDiskUsage} ),
+        None if the size has never been computed.
+        @rtype: ( int , float )
+        """
+        try:
+            return int( self._getValue( 'diskUsage' ) ) , float( self._getValue( 'diskUsageScan' ) )
+        except ( TypeError , ValueError ):
+            return None
+
+    def setDiskUsage( self , size , scanTime ):
+        """
+        set the size of the session directory computed by a scan of the directory
+        @param size: the size of the session directory in bytes
+        @type size: int
+        @param scanTime: the time of the scan ( in sec since the epoch )
+        @type scanTime: float
+        """
+        modified = self._setValue( 'diskUsage' , int( size ) )
+        self._setModified( self._setValue( 'diskUsageScan' , repr( scanTime ) ) or modified )
+
+    def _addDiskUsage( self , size ):
+        usage = self.getDiskUsage()
+        if usage is not None:
+            self._setValue( 'diskUsage' , max( 0 , usage[0] + size ) )
+
+    def addWorkflowLink( self , id):
+        """
+        add a new workflow definition in the session.
+        @param id: The identifier of the workflow
+        @type id: string
+        """
+        self._db.execute( "INSERT OR IGNORE INTO workflow ( id ) VALUES ( ? )" , ( int( id ) , ) )
+        self._setModified( True )
+
+    def getWorkflows( self):
+        """
+        get the list of workflow definitions in the session.
+        @return: workflow definition identifiers list
+        @rtype: [ int , ... ]
+        """
+        return [ row[0] for row in self._db.execute( "SELECT id FROM workflow ORDER BY id" ) ]
+
+    def _checkData( self , dataID ):
+        """
+        @raise ValueError: if dataID does not match any entry in this session.
+        """
+        if not self.hasData( dataID ):
+            msg = "the data %s does not exist in the session %s" % ( dataID , self.getID() )
+            raise ValueError , msg
+
+    def _dataRow2dataDict( self , row , dtf , inputModes = None , links = None ):
+        """
+        @param row: a row of the data table ( id , userName , size , type , headOfData )
+        @type row: tuple
+        @param dtf: a dataTypeFactory
+        @type dtf: a L{Mobyle.Classes.Core.DataType.DataTypeFactory} instance
+        @param inputModes: the inputModes of all data already fetched, if None they are fetched for this data
+        @type inputModes: { string dataID : [ string mode , ... ] }
+        @param links: the jobs linked to all data already fetched, if None they are fetched for this data
+        @type links: { ( string dataID , string kind ) : [ string jobID , ... ] }
+        """
+        dataID , userName , size , typeXml , headOfData = row
+        data = {}
+        data[ 'dataName' ] = dataID
+        data[ 'userName' ] = userName
+        try:
+            data[ 'Type' ] = parseType( etree.fromstring( typeXml ) , dataTypeFactory = dtf )
+        except ( ParserError , MobyleError , etree.XMLSyntaxError ) :
+            msg = "error in type parsing for data %s "% dataID
+            self._log.error( msg , exc_info = True )
+            raise SessionError , msg
+        if headOfData is None:
+            data[ 'dataBegin' ] = ''
+        else:
+            data[ 'dataBegin' ] = headOfData
+        if inputModes is None:
+            data[ 'inputModes' ] = [ r[0] for r in self._db.execute( "SELECT mode FROM inputMode WHERE data_id = ? ORDER BY rowid" , ( dataID , ) ) ]
+        else:
+            data[ 'inputModes' ] = inputModes.get( dataID , [] )
+        if links is None:
+            data[ 'producedBy' ] = self._jobsLinkedTo( dataID , self.PRODUCED )
+            data[ 'usedBy' ] = self._jobsLinkedTo( dataID , self.USED )
+        else:
+            data[ 'producedBy' ] = links.get( ( dataID , self.PRODUCED ) , [] )
+            data[ 'usedBy' ] = links.get( ( dataID , self.USED ) , [] )
+        data[ 'size' ] = int( size )
+        return data
+
+    def _jobsLinkedTo( self , dataID , kind ):
+        return [ r[0] for r in self._db.execute( "SELECT job_id FROM link WHERE data_id = ? AND kind = ? ORDER BY rowid" , ( dataID , kind ) ) ]
+
+    def _datasLinkedTo( self , jobID , kind ):
+        return [ r[0] for r in self._db.execute( "SELECT data_id FROM link WHERE job_id = ? AND kind = ? ORDER BY rowid" , ( jobID , kind ) ) ]
+
+
+    #####################
+    #
+    #   jobs methods
+    #
+    #####################
+
+    def _checkJob( self , jobID ):
+        """
+        @raise ValueError: if jobID does not match any entry in this session.
+        """
+        if not self.hasJob( jobID ):
+            msg = "the job %s does not exist in the session %s" % ( jobID , self.getID() )
+            raise ValueError , msg
+
+    def getAllUniqueLabels(self):
+        return [ row[0] for row in self._db.execute( "SELECT label FROM label GROUP BY label ORDER BY MIN( rowid )" ) ]
+
+    def getJobDescription( self, jobID):
+        """
+        @return: the description for job with identifier jobID
+        @rtype: string or None if there is no description for this job
+        @param jobID: the job identifer (it's url) of a job
+        @type jobID: string
+        @raise ValueError: if there is no job with jobID in the session
+        """
+        row = self._db.execute( "SELECT description FROM job WHERE id = ?" , ( jobID , ) ).fetchone()
+        if row is None:
+            msg = "the job %s does not exist in the session %s" % ( jobID , self.getID() )
+            raise ValueError , msg
+        return row[0]
+
+    def setJobDescription( self, jobID , description):
+        """
+        set description for the job with jobId
+        @param jobID: the job identifer (it's url) of a job
+        @type jobID: string
+        @param description: the description of this job
+        @type description: string
+        @raise ValueError: if there is no job with jobID in the session
+        """
+        self._checkJob( jobID )
+        description = self._text( description )
+        cursor = self._db.execute( "UPDATE job SET description = ? WHERE id = ? AND description IS NOT ?" , ( description , jobID , description ) )
+        self._setModified( cursor.rowcount > 0 )
+
+    def setJobLabels( self, jobID, inputLabels):
+        """
+        set labels for job with  jobId
+        @param jobID: the job identifer (it's url) of a job
+        @type jobID: string
+        @param inputLabels: the labels of this job
+        @type inputLabels: list of string
+        @raise ValueError: if there is no job with jobID in the session
+        """
+        self._checkJob( jobID )
+        self._db.execute( "DELETE FROM label WHERE job_id = ?" , ( jobID , ) )
+        self._db.executemany( "INSERT INTO label ( job_id , position , label ) VALUES ( ? , ? , ? )" ,
+                              [ ( jobID , position , self._text( label ) ) for position , label in enumerate( inputLabels ) ] )
+        self._setModified( True )
+
+    def getJobLabels( self, jobID):
+        """
+        @return: the labels for job with identifier jobID
+        @rtype: list of strings , [ string label1 ,string label2 ,...] or None if this jobs has no labels.
+        @param jobID: the job identifer (it's url) of a job
+        @type jobID: string
+        @raise ValueError: if there is no job with jobID in the session
+        """
+        self._checkJob( jobID )
+        return [ row[0] for row in self._db.execute( "SELECT label FROM label WHERE job_id = ? ORDER BY position" , ( jobID , ) ) ]
+
+    def hasJob( self , jobID ):
+        """
+        @param jobID: the identifier of the job in the session ( the url without index.xml )
+        @type jobID: string
+        @return: True if the session structure has an entry for the job corresponding to this ID, False otherwise.
+        @rtype: boolean
+        """
+        row = self._db.execute( "SELECT 1 FROM job WHERE id = ?" , ( jobID , ) ).fetchone()
+        return row is not None
+
+    def getJob(self , jobID ):
+        """
+        @param jobID: the identifier of the job in the session ( the url without index.xml )
+        @type jobID: string
+        @return: the job corresponding to the jobID
+        @rtype: {'jobID'       : string ,
+                 'userName'    : string ,
+                 'programName' : string ,
+                 'status'      : Status object ,
+                 'date'        : time struct ,
+                 'dataProduced': [ string dataID1 , string dataID2 , ...] ,
+                 'dataUsed'    : [ string dataID1 , string dataID2 , ...] ,
+                }
+        @raise ValueError: if the jobID does not match any entry in this session
+        """
+        row = self._db.execute( "SELECT id , userName , programName , date , status , message FROM job WHERE id = ?" , ( jobID , ) ).fetchone()
+        if row is None:
+            msg = "the job %s does not exist in the session %s" % ( jobID , self.getID() )
+            raise ValueError , msg
+        return self._jobRow2jobDict( row )
+
+    def getAllJobs(self , annotations = False ):
+        """
+        @param annotations: if True the labels and the description of each job are returned too
+        @type annotations: boolean
+        @return: the list of jobs in this session
+        @rtype:  [ {'jobID'       : string ,
+                    'userName'    : string ,
+                    'programName' : string ,
+                    'status'      : Status object ,
+                    'date'        : time struct ,
+                    'dataProduced': [ string dataID1 , string dataID2 , ...] ,
+                    'dataUsed'    : [ string dataID1 , string dataID2 , ...] ,
+                    'labels'      : [ string label1 , string label2 , ...] , ( if annotations )
+                    'description' : string or None , ( if annotations )
+                   } , ... ]
+        """
+        links = {}
+        for jobID , dataID , kind in self._db.execute( "SELECT job_id , data_id , kind FROM link ORDER BY rowid" ):
+            links.setdefault( ( jobID , kind ) , [] ).append( dataID )
+        labels = {}
+        if annotations:
+            for jobID , label in self._db.execute( "SELECT job_id , label FROM label ORDER BY job_id , position" ):
+                labels.setdefault( jobID , [] ).append( label )
+        jobs = []
+        for row in self._db.execute( "SELECT id , userName , programName , date , status , message , description FROM job ORDER BY rowid" ).fetchall():
+            job = self._jobRow2jobDict( row[:-1] , links = links )
+            if annotations:
+                job[ 'labels' ] = labels.get( row[0] , [] )
+                job[ 'description' ] = row[-1]
+            jobs.append( job )
+        return jobs
+
+    #OPENID
+    def addOpenIdAuthData(self, authsession):
+        """
+        @param authsession: the session used by OpenId library
+        @type authsession: Session
+        @raise SessionError : if data cannot be saved
+        """
+        self._db.execute( "DELETE FROM openid" )
+        self._db.executemany( "INSERT INTO openid ( name , value ) VALUES ( ? , ? )" ,
+                              [ ( name , pickle.dumps( authsession[ name ] ) ) for name in authsession.keys() ] )
+        self._setModified( True )
+
+    #OPENID
+    def getOpenIdAuthData(self):
+        """
+        @return : Session with openid data
+        @raise SessionError : if data cannot be read
+        """
+        authsession = {}
+        for name , value in self._db.execute( "SELECT name , value FROM openid" ):
+            authsession[ name ] = pickle.loads( value )
+        if not authsession:
+            msg = "No auth data available"
+            raise ValueError , msg
+        return authsession
+
+    def createJob(self , jobID , userName , programName , status , date , dataUsed ,  dataProduced ):
+        """
+        add a new job entry in this session
+        @param jobID: the identifier of the job in the session ( the url without index.xml )
+        @type jobID: string
+        @param userName: the name of this job given by the user
+        @type userName: string
+        @param programName: the name of the program which generate this job
+        @type programName: string
+        @param status: the status of this job
+        @type status: L{Status.Status} instance
+        @param date: the date of job submission
+        @type date: time struct
+        @param dataUsed: the list of data stored in this session used by this job.
+        @type dataUsed: list of strings
+        @param dataProduced: the list of data stored in this session and produced by this job.
+        @type dataProduced: list of strings
+        """
+        if status.message:
+            message = self._text( status.message )
+        else:
+            message = None
+        try:
+            self._db.execute( "INSERT INTO job ( id , userName , programName , date , status , message ) VALUES ( ? , ? , ? , ? , ? , ? )" ,
+                              ( jobID ,
+                                self._text( userName ) ,
+                                self._text( programName ) ,
+                                strftime( "%x  %X" , date ) ,
+                                str( status ) ,
+                                message ) )
+        except sqlite3.IntegrityError:
+            raise ValueError , "can't create a new job entry in session %s :the jobID %s already exist" % ( self.getID() , jobID )
+        for dataID in dataUsed:
+            self._db.execute( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" , ( jobID , dataID , self.USED ) )
+        for dataID in dataProduced:
+            self._db.execute( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" , ( jobID , dataID , self.PRODUCED ) )
+        self._setModified( True )
+
+    def removeJob(self , jobID ):
+        """
+        remove the entry corresponding to this jobID
+        @param jobID: the identifier of the job in the session ( the url without index.xml )
+        @type jobID: string
+        @return: the job corresponding to jobID as a dict
+        @rtype: dictionary
+        @raise ValueError: if the jobID does not match any entry in this session
+        """
+        jobDict = self.getJob( jobID )
+        self._db.execute( "DELETE FROM job WHERE id = ?" , ( jobID , ) )
+        self._db.execute( "DELETE FROM label WHERE job_id = ?" , ( jobID , ) )
+        self._db.execute( "DELETE FROM link WHERE job_id = ?" , ( jobID , ) )
+        self._setModified( True )
+        return jobDict
+
+    def renameJob( self , jobID , newUserName ):
+        """
+        change the user name of the data corresponding to the dataID.
+        @param jobID: the identifier of the job in the session ( url without index.xml )
+        @type jobID: string
+        @param newUserName: the new user name of the job.
+        @type newUserName: string
+        @raise ValueError: if jobID does not match any entry in session.
+        """
+        self._checkJob( jobID )
+        newUserName = self._text( newUserName )
+        cursor = self._db.execute( "UPDATE job SET userName = ? WHERE id = ? AND userName IS NOT ?" , ( newUserName , jobID , newUserName ) )
+        self._setModified( cursor.rowcount > 0 )
+
+    def updateJobStatus( self , jobID , status ):
+        """
+        update the status of the job corresponding to the jobID
+        @param jobID: the identifier of the job in the session ( url without index.xml )
+        @type jobID: string
+        @param status: the status of this job
+        @type status: L{Status.Status} instance
+        @raise ValueError:
+        """
+        self._checkJob( jobID )
+        if status.message:
+            cursor = self._db.execute( "UPDATE job SET status = ? , message = ? WHERE id = ? AND ( status IS NOT ? OR message IS NOT ? )" ,
+                                       ( str( status ) , self._text( status.message ) , jobID , str( status ) , self._text( status.message ) ) )
+        else:
+            cursor = self._db.execute( "UPDATE job SET status = ? WHERE id = ? AND status IS NOT ?" ,
+                                       ( str( status ) , jobID , str( status ) ) )
+        self._setModified( cursor.rowcount > 0 )
+
+    def _jobRow2jobDict( self , row , links = None ):
+        """
+        @param row: a row of the job table ( id , userName , programName , date , status , message )
+        @type row: tuple
+        @param links: the data linked to all jobs already fetched, if None they are fetched for this job
+        @type links: { ( string jobID , string kind ) : [ string dataID , ... ] }
+        """
+        jobID , userName , programName , date , statusString , message = row
+        job = {}
+        job [ 'jobID' ] = jobID
+        if userName is None:
+            self._log.error( "the job %s in session %s has no userName" %( jobID , self.getID()) )
+        else:
+            job[ 'userName' ] = userName
+        if programName is None:
+            self._log.error( "the job %s in session %s has no programName" % ( jobID , self.getID()) )
+        else:
+            job[ 'programName' ] = programName
+        if statusString is None:
+            msg = "the job %s in session %s has no status" % ( jobID , self.getID())
+            self._log.error( msg )
+            raise MobyleError( msg )
+        try:
+            job[ 'status' ] = Status( string= statusString , message = message or '' )
+        except MobyleError:
+            msg = "error in status %s for job %s in session %s" % ( statusString , jobID , self.getID() )
+            self._log.error( msg )
+            raise MobyleError , msg
+        if date is not None:
+            job[ 'date' ] = strptime( date , "%x  %X")
+        if links is None:
+            job[ 'dataProduced' ] = self._datasLinkedTo( jobID , self.PRODUCED )
+            job[ 'dataUsed' ] = self._datasLinkedTo( jobID , self.USED )
+        else:
+            job[ 'dataProduced' ] = links.get( ( jobID , self.PRODUCED ) , [] )
+            job[ 'dataUsed' ] = links.get( ( jobID , self.USED ) , [] )
+        return job
+
+
+
+def migrate( xmlFileName , dbFileName ):
+    """
+    build a sqlite session from a .session.xml file.
+    The xml file is locked in WRITE during the migration to prevent any modification
+    and is left untouched, it can be used as backup.
+    If dbFileName already exists when the lock is acquired, the session has been migrated
+    by a concurrent request and it is left as is.
+    @param xmlFileName: the absolute path of the .session.xml file to migrate
+    @type xmlFileName: string
+    @param dbFileName: the absolute path of the sqlite session to create
+    @type dbFileName: string
+    @raise SessionError: if the xml session cannot be read or the sqlite session cannot be written
+    """
+    log = getLogger( 'Mobyle.Session.Transaction' )
+    src = Transaction( xmlFileName , Transaction.WRITE )
+    tmpName = "%s.%d" % ( dbFileName , os.getpid() )
+    try:
+        #checked under the lock: an other request may have migrated the session while we were waiting for it
+        if os.path.exists( dbFileName ):
+            log.debug( "session %s already migrated to %s" % ( xmlFileName , dbFileName ) )
+            return
+        if os.path.exists( tmpName ):
+            os.unlink( tmpName )
+        db = SQLiteTransaction._connect( tmpName )
+        try:
+            db.executescript( SQLiteTransaction.SCHEMA )
+            db.execute( "PRAGMA user_version = %d" % SQLiteTransaction.SCHEMA_VERSION )
+            db.execute( "BEGIN" )
+            values = [ ( 'id' , src.getID() ) ,
+                       ( 'email' , src.getEmail() ) ,
+                       ( 'passwd' , src.getPasswd() ) ,
+                       ( 'activatingKey' , src.getActivatingKey() ) ,
+                       ( 'captchaSolution' , src.getCaptchaSolution() ) ,
+                       ]
+            values = [ ( name , value ) for name , value in values if value is not None ]
+            values.append( ( 'activated' , src.isActivated() and 'true' or 'false' ) )
+            authenticated = src.isAuthenticated()
+            if authenticated is not None:
+                values.append( ( 'authenticated' , authenticated and 'true' or 'false' ) )
+            ticket = src.getTicket()
+            if ticket is not None:
+                values.append( ( 'ticket_id' , ticket[0] ) )
+                values.append( ( 'ticket_exp_date' , ticket[1] ) )
+            db.executemany( "INSERT INTO session ( name , value ) VALUES ( ? , ? )" , values )
+            try:
+                authsession = src.getOpenIdAuthData()
+                db.executemany( "INSERT INTO openid ( name , value ) VALUES ( ? , ? )" ,
+                                [ ( name , pickle.dumps( authsession[ name ] ) ) for name in authsession.keys() ] )
+            except ValueError:
+                pass
+            db.executemany( "INSERT OR IGNORE INTO workflow ( id ) VALUES ( ? )" , [ ( id , ) for id in src.getWorkflows() ] )
+
+            for data in src.getAllData():
+                db.execute( "INSERT INTO data ( id , userName , size , type , headOfData ) VALUES ( ? , ? , ? , ? , ? )" ,
+                            ( data[ 'dataName' ] ,
+                              _encode( data.get( 'userName' ) ) ,
+                              data[ 'size' ] ,
+                              etree.tostring( data[ 'Type' ].toDom() , encoding = 'UTF-8' ) ,
+                              _encode( data[ 'dataBegin' ] ) ) )
+                db.executemany( "INSERT OR IGNORE INTO inputMode ( data_id , mode ) VALUES ( ? , ? )" ,
+                                [ ( data[ 'dataName' ] , mode ) for mode in data.get( 'inputModes' , [] ) ] )
+                db.executemany( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" ,
+                                [ ( jobID , data[ 'dataName' ] , SQLiteTransaction.USED ) for jobID in data[ 'usedBy' ] ] )
+                db.executemany( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" ,
+                                [ ( jobID , data[ 'dataName' ] , SQLiteTransaction.PRODUCED ) for jobID in data[ 'producedBy' ] ] )
+            for job in src.getAllJobs():
+                jobID = job[ 'jobID' ]
+                if 'date' in job:
+                    date = strftime( "%x  %X" , job[ 'date' ] )
+                else:
+                    date = None
+                db.execute( "INSERT INTO job ( id , userName , programName , date , status , message , description ) VALUES ( ? , ? , ? , ? , ? , ? , ? )" ,
+                            ( jobID ,
+                              _encode( job.get( 'userName' ) ) ,
+                              _encode( job.get( 'programName' ) ) ,
+                              date ,
+                              str( job[ 'status' ] ) ,
+                              _encode( job[ 'status' ].message or None ) ,
+                              _encode( src.getJobDescription( jobID ) ) ) )
+                db.executemany( "INSERT INTO label ( job_id , position , label ) VALUES ( ? , ? , ? )" ,
+                                [ ( jobID , position , _encode( label ) ) for position , label in enumerate( src.getJobLabels( jobID ) ) ] )
+                db.executemany( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" ,
+                                [ ( jobID , dataID , SQLiteTransaction.USED ) for dataID in job[ 'dataUsed' ] ] )
+                db.executemany( "INSERT OR IGNORE INTO link ( job_id , data_id , kind ) VALUES ( ? , ? , ? )" ,
+                                [ ( jobID , dataID , SQLiteTransaction.PRODUCED ) for dataID in job[ 'dataProduced' ] ] )
+            db.execute( "COMMIT" )
+        finally:
+            db.close()
+        os.rename( tmpName , dbFileName )
+        log.info( "session %s migrated to %s" % ( xmlFileName , dbFileName ) )
+    except Exception , err:
+        try:
+            os.unlink( tmpName )
+        except OSError:
+            pass
+        msg = "cannot migrate session %s : %s" % ( xmlFileName , err )
+        log.error( msg , exc_info = True )
+        raise SessionError , msg
+    finally:
+        #the xml session is never modified
+        src.rollback()
+
+
+def _encode( text ):
+    """
+    @return: text as an utf-8 encoded string ( lxml returns unicode for non ascii text )
+    """
+    if isinstance( text , unicode ):
+        return text.encode( 'utf-8' )
+    return text
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+    usage = """usage: %prog SESSION_DIR ...
+    build the sqlite storage ( .session.db ) of each session directory from its .session.xml"""
+    parser = OptionParser( usage = usage )
+    options , args = parser.parse_args()
+    if not args:
+        parser.error( "at least one session directory must be specified" )
+    for sessionDir in args:
+        xmlFileName = os.path.join( sessionDir , '.session.xml' )
+        dbFileName = os.path.join( sessionDir , '.session.db' )
+        if os.path.exists( dbFileName ):
+            print >> sys.stderr , "%s : already migrated" % sessionDir
+            continue
+        try:
+            migrate( xmlFileName , dbFileName )
+        except SessionError , err:
+            print >> sys.stderr , err
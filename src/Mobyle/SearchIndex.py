@@ -17,6 +17,7 @@ This module manages the list of available programs to:
 """
 from Mobyle.Registry import *
 import re
+from bisect import bisect_left
 
 from logging import getLogger
 r_log = getLogger(__name__)
@@ -47,29 +48,192 @@ queries = {
            'paragraph_comment': 'comment/text/text()'
           }
 
+# the weight of a match in a field to rank the results, 1 for the other fields
+weights = {
+           'name': 10,
+           'title': 5,
+           'package name': 4,
+           'categories': 3,
+           'description': 2,
+           'package title': 2,
+           'package categories': 2
+          }
+
+_tokenRe = re.compile(r'\w+', re.U)
+
+def tokenize(value):
+    """
+    @return: the lower case words of value
+    @rtype: list of strings
+    """
+    return _tokenRe.findall(value.lower())
+
 class SearchIndex(IndexBase.Index):
 
     indexFileName = 'search.dat'
+    
+    # the version of the index stored by buildIndex
+    indexVersion = 2
+
+    def __init__(self, type):
+        IndexBase.Index.__init__(self, type)
+        if self.index.get('version') == self.indexVersion:
+            stored = self.index
+        else:
+            # index generated by an older version of mobdeploy
+            r_log.warning("the %s search index has no inverted index, it is built in memory. Please regenerate the indexes." % type)
+            stored = self.buildIndex(self.index)
+        self.index = stored['entries']
+        self.postings = stored['postings']
+        self.tokens = stored['tokens']
+
+    @classmethod
+    def buildIndex(cls, entries):
+        """
+        Return the index stored on disk: the index entries and the inverted index
+        which gives for each word the fields of the services where it is found
+        @param entries: the index entries of the services, indexed by url
+        @type entries: dict
+        @return: the index
+        @rtype: dict
+        """
+        postings = {}
+        for url, fields in entries.items():
+            for field, value in fields.items():
+                if isinstance(value, basestring):
+                    value = [value]
+                for valueItem in value:
+                    for token in tokenize(valueItem):
+                        tokenPostings = postings.setdefault(token, {})
+                        fieldCounts = tokenPostings.setdefault(url, {})
+                        fieldCounts[field] = fieldCounts.get(field, 0) + 1
+        tokens = postings.keys()
+        tokens.sort()
+        return {'version': cls.indexVersion,
+                'entries': entries,
+                'postings': postings,
+                'tokens': tokens}
+
+    def _expand(self, term):
+        """
+        @return: the indexed words which start with term
+        @rtype: list of strings
+        """
+        expanded = []
+        i = bisect_left(self.tokens, term)
+        while i < len(self.tokens) and self.tokens[i].startswith(term):
+            expanded.append(self.tokens[i])
+            i += 1
+        return expanded
+
+    def search(self, keywordList):
+        """
+        search the services which have a word starting with one of the keywords.
+        The registry is not modified.
+        @param keywordList: the keywords
+        @type keywordList: list of strings
+        @return: the matching services of the registry with the matching fields highlighted, 
+        the services which match most keywords, in the most important fields, first.
+        @rtype: list of ( ServiceDef , [ ( field name , highlighted value ) , ... ] )
+        """
+        terms = []
+        for keyword in keywordList:
+            for term in tokenize(keyword):
+                if term not in terms:
+                    terms.append(term)
+        if not terms:
+            return []
+        servicesByUrl = getattr(registry, self.type + 'sByUrl')
+        scores = {}
+        matchedTerms = {}
+        matchedFields = {}
+        for term in terms:
+            for token in self._expand(term):
+                for url, fieldCounts in self.postings[token].items():
+                    if not servicesByUrl.has_key(url):
+                        continue
+                    for field, count in fieldCounts.items():
+                        score = weights.get(field, 1) * count
+                        if token == term:
+                            score *= 2
+                        scores[url] = scores.get(url, 0) + score
+                        matchedFields.setdefault(url, set()).add(field)
+                    matchedTerms.setdefault(url, set()).add(term)
+        ranked = scores.keys()
+        ranked.sort(key=lambda url: (-len(matchedTerms[url]), -scores[url], url))
+        rx = re.compile(r'\b(%s)' % '|'.join([re.escape(t) for t in terms]), re.I | re.U)
+        results = []
+        for url in ranked:
+            matches = []
+            for field, value in self.index[url].items():
+                if field not in matchedFields[url]:
+                    continue
+                if isinstance(value, basestring):
+                    value = [value]
+                for valueItem in value:
+                    self._searchFieldString(field, valueItem, rx, matches)
+            results.append((servicesByUrl[url], matches))
+        return results
+
+    def _candidates(self, keyword):
+        """
+        @return: the urls of the services where keyword may be found (a superset: each word
+        of the keyword is found in a word of the service), None if the inverted index cannot
+        tell (a keyword without any word character)
+        @rtype: set of strings
+        """
+        terms = tokenize(keyword)
+        if not terms:
+            return None
+        urls = None
+        for term in terms:
+            termUrls = set()
+            for token in self.tokens:
+                if term in token:
+                    termUrls.update(self.postings[token].keys())
+            if urls is None:
+                urls = termUrls
+            else:
+                urls &= termUrls
+        return urls
 
     def filterRegistry(self, keywordList):
-        keywordList = [re.escape(k) for k in keywordList] # escape special re characters...
-        keywordsRe = re.compile('(%s)' % '|'.join(keywordList), re.I)
-        servicesList = getattr( registry, self.type + 's')[:]
-        for s in servicesList:
+        """
+        remove from the registry the services which do not match the keywords
+        and set the searchMatches of the matching services.
+        Unlike search, a keyword matches any part of the fields (case insensitive),
+        the inverted index only restricts the services where the keywords are looked for.
+        @param keywordList: the keywords
+        @type keywordList: list of strings
+        """
+        keywordList = [k for k in keywordList if k]
+        if not keywordList:
+            # nothing to search, the registry is kept as it is
+            return
+        keywordsRe = re.compile('(%s)' % '|'.join([re.escape(k) for k in keywordList]), re.I)
+        candidates = set()
+        for keyword in keywordList:
+            urls = self._candidates(keyword)
+            if urls is None:
+                candidates = None
+                break
+            candidates |= urls
+        pruned = []
+        for s in getattr(registry, self.type + 's'):
             s.searchMatches = []
-            if self.index.has_key(s.url):
+            if (candidates is None or s.url in candidates) and self.index.has_key(s.url):
                 for field, value in self.index[s.url].items():
                     if isinstance(value, basestring):
-                        self._searchFieldString(field, value, keywordsRe, s)
-                    if isinstance(value, list):
-                        for valueItem in value:
-                            self._searchFieldString(field, valueItem, keywordsRe, s)
-            if len(s.searchMatches) == 0:
-                registry.pruneService(s)
-
-    def _searchFieldString(self, fieldName, fieldValue, rx, program):
-        if len(rx.findall(fieldValue))>0:
-            program.searchMatches.append((fieldName,rx.sub('<b>\\1</b>',fieldValue)))
+                        value = [value]
+                    for valueItem in value:
+                        self._searchFieldString(field, valueItem, keywordsRe, s.searchMatches)
+            if not s.searchMatches:
+                pruned.append(s)
+        registry.pruneServices(pruned)
+
+    def _searchFieldString(self, fieldName, fieldValue, rx, matches):
+        if rx.search(fieldValue):
+            matches.append((fieldName,rx.sub('<b>\\1</b>',fieldValue)))
         
     @classmethod
     def getIndexEntry(cls, doc, index):
@@ -52,6 +52,18 @@ class Program(object):
         self.cfg = Config()
         self.header = Header()
         self._parameters = Parameters()
+    
+    def __getstate__(self):
+        """
+        the configuration is not pickled with the program ( see L{Mobyle.Parser.ServiceCache} )
+        """
+        state = self.__dict__.copy()
+        del state[ 'cfg' ]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update( state )
+        self.cfg = Config()
         
     def _getAllParameter(self):
         """
@@ -2694,6 +2706,18 @@ class Parameter( Para ):
             else:
                 raise MobyleError , "if value is specified name must be specified"
         
+    def __getstate__(self):
+        """
+        the configuration is not pickled with the parameter ( see L{Mobyle.Parser.ServiceCache} )
+        """
+        state = self.__dict__.copy()
+        del state[ 'cfg' ]
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update( state )
+        self.cfg = Config()
+        
     def ancestors( self ):
         #1 exclude the parameter self.__class__.__name__ itself
         #-3 exclude "Parameter" , "Para" , and "object"
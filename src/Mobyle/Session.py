@@ -12,15 +12,15 @@ import types
 import glob
 from time import time , strptime 
 import urlparse
-from httplib import HTTPConnection
 from logging  import getLogger
 from lxml import etree
 
-from Mobyle.Utils import safeFileName , sizeFormat
+from Mobyle.Utils import safeFileName , sizeFormat , getStatuses
 from Mobyle.JobState import JobState , path2url , url2path
 from Mobyle.MobyleError import MobyleError , UserValueError , SessionError , NoSpaceLeftError 
-from Mobyle.JobFacade import JobFacade
+from Mobyle.JobFacade import JobFacade , LocalJobFacade
 from Mobyle.Registry import registry
+from Mobyle.RemoteProbe import RemoteJobProbe , getHost
 
 from Mobyle.Transaction import Transaction
 
@@ -35,6 +35,9 @@ class Session( object ):
     """
 
     FILENAME = '.session.xml'
+    DB_FILENAME = '.session.db'
+    #the max age ( in sec ) of the disk usage counted by the session before a new scan of the directory
+    DISK_USAGE_SCAN_INTERVAL = 3600
 
     def __init__( self , Dir , key , cfg ):
         
@@ -68,15 +71,38 @@ class Session( object ):
         """
         return  self.key
 
+    def _getStorage( self ):
+        """
+        @return: the transaction class used to store this session according to the SESSION_STORAGE configuration
+        and the absolute path of the file which store the session
+        @rtype: ( L{Transaction} or L{SQLiteTransaction} class , string )
+        """
+        if self.cfg.session_storage() == 'sqlite':
+            from Mobyle.SQLiteTransaction import SQLiteTransaction
+            return SQLiteTransaction , os.path.normpath( os.path.join( self.Dir , Session.DB_FILENAME ) )
+        else:
+            return Transaction , os.path.normpath( os.path.join( self.Dir , Session.FILENAME ) )
+
+    def _createStorage( self , authenticated , activated , activatingKey = None , userEmail = None , passwd = None ):
+        """
+        create the file which store this session
+        """
+        transactionClass , fileName = self._getStorage()
+        transactionClass.create( fileName , authenticated , activated , activatingKey = activatingKey , userEmail = userEmail , passwd = passwd )
+
     def _getTransaction( self , Type ):
         """
         @return: the transaction of this session
         @rtype: a L{Transaction} object
         @raise SessionError: if can't access to the session
         """
-        fileName = os.path.normpath( os.path.join( self.Dir , Session.FILENAME  ) )
+        transactionClass , fileName = self._getStorage()
         try:
-            return Transaction( fileName , Type )
+            if transactionClass is not Transaction and not os.path.exists( fileName ):
+                #this session was created before the sqlite storage was set
+                from Mobyle.SQLiteTransaction import migrate
+                migrate( os.path.join( self.Dir , Session.FILENAME ) , fileName )
+            return transactionClass( fileName , Type )
         except Exception , err:
             msg = "can't open transaction %s : %s" % ( self.getKey() , err )
             self.log.error( msg , exc_info= True )
@@ -216,7 +242,7 @@ class Session( object ):
 
         safeUserName = safeFileName( name )
         acceptedInputMode = ( 'db' , 'paste' , 'upload' , 'result' )
-        if safeUserName == Session.FILENAME :
+        if safeUserName in ( Session.FILENAME , Session.DB_FILENAME ) :
             #logger l'erreur dans adm et logs?
             raise MobyleError , "permission denied"
         if inputModes :   
@@ -270,6 +296,7 @@ class Session( object ):
             usedBy         = data[ 'usedBy' ]
             producedBy     = data[ 'producedBy' ]
             inputModes     = data[ 'inputModes' ]
+            dataSize       = data[ 'size' ]
             dataID  = str( nameInProducer )
          
             dataMask = os.path.join( self.Dir , dataID + "*" )
@@ -279,6 +306,7 @@ class Session( object ):
                 nameInProducer = None
                 dataID , content = self._cleanData( content , dataType )
                 dataBegining = dataType.head( content )
+                dataSize = len( content )
             else :
                 #there is a producer and it's a jobState or MobyleJob ...
                 #I must read the file to compute the md5
@@ -290,6 +318,7 @@ class Session( object ):
                 nameInProducer = name    
                 dataID , content = self._cleanData( content , dataType )
                 dataBegining = dataType.head( content )
+                dataSize = len( content )
                 content = None 
                 
             userExt = os.path.splitext( safeUserName )[1]
@@ -329,7 +358,8 @@ class Session( object ):
                                      dataBegining , 
                                      producedBy = producedBy ,
                                      usedBy = usedBy ,
-                                     inputModes = inputModes )
+                                     inputModes = inputModes ,
+                                     dataSize = dataSize )
  
                 return dataID 
 
@@ -356,7 +386,8 @@ class Session( object ):
                                  dataBegining , 
                                  usedBy = usedBy , 
                                  producedBy = producedBy ,
-                                 inputModes = inputModes )
+                                 inputModes = inputModes ,
+                                 dataSize = dataSize )
             return dataID 
    
     def addWorkflow(self, workflow):
@@ -421,7 +452,7 @@ class Session( object ):
         """
         return self.url+'/workflow%s.xml' % ID
 
-    def _createNewData(self , safeUserName , content , dataID , producer , nameInProducer , mobyleType , dataBegining , usedBy = None , producedBy = None ,  inputModes = None ):
+    def _createNewData(self , safeUserName , content , dataID , producer , nameInProducer , mobyleType , dataBegining , usedBy = None , producedBy = None ,  inputModes = None , dataSize = 0 ):
         """
         @param safeUserName: the user name for this  data
         @type safeUserName: string
@@ -443,8 +474,11 @@ class Session( object ):
         @type producedBy: string or sequence of strings   
         @param inputModes: the source of data
         @type inputModes: a list of string among this values : 'db' , 'paste' , 'upload' , 'result'
+        @param dataSize: the expected size of the data ( in bytes ) to check the session limit before to write it
+        @type dataSize: int
         @return: the identifier of the data in this session
         @rtype: string
+        @raise NoSpaceLeftError: if the data would exceed the session limit
         """     
         self.log.info( "%f : %s : _createNewData safeUserName = %s, dataID= %s, producer= %s, nameInProducer= %s, mobyleType=%s, usedBy=%s, producedBy=%s, inputModes=%s" %(time() ,
                                                                                                                                                                             self.getKey(),
@@ -457,6 +491,14 @@ class Session( object ):
                                                                                                                                                                             producedBy,
                                                                                                                                                                             inputModes
                                                                                                                                                                             ) )
+        if not self._checkSpaceLeft( dataSize ):
+            self.log.error( "session/%s : the data %s ( %d ) cannot be added because the session size exceed the session limit ( %d )" %(
+                                                                                                                                      self.getKey() ,           
+                                                                                                                                      dataID ,
+                                                                                                                                      dataSize ,
+                                                                                                                                      self.sessionLimit
+                                                                                                                                      ) )
+            raise NoSpaceLeftError , "this data cannot be added to your bookmarks, because the resulting size exceed the limit ( %s )" % sizeFormat( self.sessionLimit )
         try:
             #                 mobyleType.toFile( data    , dest , destFileName , src      , srcFileName     )
             fileName , size = mobyleType.toFile( content , self , dataID       , producer , nameInProducer  )
@@ -472,10 +514,10 @@ class Session( object ):
             self.log.critical( "Exception in _createNewData: %s" % self.getKey(), exc_info = True )
             raise err
         dataID = fileName
-          
-        if not self._checkSpaceLeft():
+        
+        #the size of a converted data may differ from the expected size
+        if size > dataSize and not self._checkSpaceLeft( size ):
             path = os.path.join( self.Dir , dataID )
-            size = os.path.getsize( path )
             os.unlink( path )
             self.log.info( "%f : %s : _addData unlink %s ( %d ) because there is no space in session"%( time() ,
                                                                                                        self.getKey(),
@@ -521,23 +563,55 @@ class Session( object ):
         return dataID        
        
 
-    def _checkSpaceLeft( self ):
+    def _checkSpaceLeft( self , size = 0 ):
         """
-        @return: True if there is space disk available for this session, False otherwise
+        @param size: the size ( in bytes ) of the data to add in this session
+        @type size: int
+        @return: True if size bytes can be added to this session without exceeding the session limit, False otherwise
         @rtype: boolean
         """
-        sessionSize = 0
-        for f in os.listdir( self.Dir ):
-            sessionSize += os.path.getsize( os.path.join( self.Dir  , f ) )
-            if sessionSize > self.sessionLimit:  
-                self.log.debug( "%f : %s : _checkSpaceLeft call by= %s size found = %d" %( time() ,
-                                                                                       self.getKey()  , 
-                                                                                       os.path.basename( sys.argv[0] ) ,
-                                                                                       sessionSize
-                                                                                       )) 
-                return False
+        if size > self.sessionLimit:
+            return False
+        transaction = self._getTransaction( Transaction.READ )
+        usage = transaction.getDiskUsage()
+        transaction.commit()
+        if usage is None or usage[1] + self.DISK_USAGE_SCAN_INTERVAL < time():
+            sessionSize = self.scanDiskUsage()
+        else:
+            sessionSize = usage[0]
+        if sessionSize + size > self.sessionLimit:  
+            self.log.debug( "%f : %s : _checkSpaceLeft call by= %s size found = %d" %( time() ,
+                                                                                   self.getKey()  , 
+                                                                                   os.path.basename( sys.argv[0] ) ,
+                                                                                   sessionSize
+                                                                                   )) 
+            return False
         return True       
        
+    def scanDiskUsage( self ):
+        """
+        compute the size of the session directory and store it in the session.
+        Then the size is maintained by the creation and the removal of the data 
+        and the directory is scanned again only after DISK_USAGE_SCAN_INTERVAL.
+        @return: the size of the session directory in bytes
+        @rtype: int
+        """
+        transaction = self._getTransaction( Transaction.WRITE )
+        try:
+            sessionSize = 0
+            for f in os.listdir( self.Dir ):
+                try:
+                    sessionSize += os.path.getsize( os.path.join( self.Dir  , f ) )
+                except OSError:
+                    #a temporary file ( sqlite journal , transaction commit ) has been removed meanwhile
+                    continue
+            transaction.setDiskUsage( sessionSize , time() )
+        except Exception:
+            transaction.rollback()
+            raise
+        transaction.commit()
+        return sessionSize
+       
 
     def removeData( self , dataID ):
         """
@@ -550,8 +624,8 @@ class Session( object ):
                                                            self.getKey(),
                                                            dataID
                                                            ) )
-        if dataID == Session.FILENAME :
-            self.log.error( "session/%s : can't remove file %s" %( self.getKey(), Session.FILENAME ) )
+        if dataID in ( Session.FILENAME , Session.DB_FILENAME ) :
+            self.log.error( "session/%s : can't remove file %s" %( self.getKey(), dataID ) )
             raise MobyleError, "permission denied"
 
         fileName = os.path.join( self.Dir , dataID  )
@@ -658,7 +732,7 @@ class Session( object ):
                                                       self.getKey() ,
                                                       dataID 
                                                       ))
-        if dataID == Session.FILENAME:
+        if dataID in ( Session.FILENAME , Session.DB_FILENAME ):
             raise MobyleError , "permission denied"
         try:
             fh = open( os.path.join( self.Dir , dataID ), 'r' )
@@ -856,30 +930,70 @@ class Session( object ):
                                         } , ...
                                     ]
         """
-        results = []
-        job2remove = []
-        job2updateStatus = []
-        
         transaction = self._getTransaction( Transaction.READ )
         jobs = transaction.getAllJobs()
         transaction.commit()
+        return self._refreshJobs( jobs )
+
+    def _refreshJobs( self , jobs ):
+        """
+        update the status of the jobs and remove from the session the jobs which do not exist anymore
+        @param jobs: the jobs read from the session
+        @type jobs: list of dictionary ( see L{getAllJobs} )
+        @return: the jobs which still exist with their status updated
+        @rtype: list of dictionary
+        """
+        results = []
+        job2remove = []
+        job2updateStatus = []
+        localJobs = []
+        remoteJobs = []
+        existences = self.jobsExist( [ job[ 'jobID' ] for job in jobs ] )
         for job in jobs:
-            jobExist = self.jobExists(job[ 'jobID' ])
+            jobExist = existences[ job[ 'jobID' ] ]
             if jobExist == 1: #yes
                 job[ 'jobPID' ] = registry.getJobPID(job['jobID'])
                 results.append( job )
                 jf = JobFacade.getFromJobId( job[ 'jobID' ] )
-                job['subjobs']  = jf.getSubJobs() 
-                if job[ 'status' ].isQueryable():
-                    newStatus = jf.getStatus()
-                    if newStatus != job[ 'status' ]:
-                        job[ 'status' ] = newStatus
-                        job2updateStatus.append( ( job[ 'jobID' ] , newStatus ) )
+                if isinstance( jf , LocalJobFacade ):
+                    job['subjobs']  = jf.getSubJobs() 
+                    if job[ 'status' ].isQueryable():
+                        #the status of the local jobs are queried all together below
+                        localJobs.append( job )
+                else:
+                    #the remote portals are queried concurrently below
+                    job['subjobs'] = []
+                    remoteJobs.append( ( job , jf ) )
             elif jobExist == 2 :# maybe
                 results.append(job)
             else: #the job does not exists anymore
                 job2remove.append(job[ 'jobID' ])
         
+        if remoteJobs:
+            def query( job , jf ):
+                subjobs = jf.getSubJobs()
+                if job[ 'status' ].isQueryable():
+                    return subjobs , jf.getStatus()
+                return subjobs , job[ 'status' ]
+            tasks = [ ( getHost( job[ 'jobID' ] ) , lambda job = job , jf = jf : query( job , jf ) ) for job , jf in remoteJobs ]
+            for ( job , jf ) , ( result , err ) in zip( remoteJobs , RemoteJobProbe().run( tasks ) ):
+                if err is not None:
+                    #the status stored in the session is kept
+                    continue
+                job[ 'subjobs' ] , newStatus = result
+                if newStatus != job[ 'status' ]:
+                    job[ 'status' ] = newStatus
+                    job2updateStatus.append( ( job[ 'jobID' ] , newStatus ) )
+        
+        if localJobs:
+            #one query per execution system instead of one per job
+            newStatuses = getStatuses( [ job[ 'jobID' ] for job in localJobs ] )
+            for job in localJobs:
+                newStatus = newStatuses[ job[ 'jobID' ] ]
+                if newStatus != job[ 'status' ]:
+                    job[ 'status' ] = newStatus
+                    job2updateStatus.append( ( job[ 'jobID' ] , newStatus ) )
+        
         if job2remove or job2updateStatus :
             transaction = self._getTransaction(Transaction.WRITE)
             for jobID in job2remove:
@@ -897,6 +1011,38 @@ class Session( object ):
         return results
     
     
+    def getSnapshot( self , refresh = True ):
+        """
+        read all the session in one transaction. It is cheaper than to call getAllJobs, getAllData,
+        getJobLabels , ... which open one transaction ( a lock and a parsing of the session ) each.
+        @param refresh: if True the status of the jobs is updated and the jobs which do not exist anymore
+        are removed from the session as L{getAllJobs} does
+        @type refresh: boolean
+        @return: the content of this session at the time of the call
+        @rtype: a L{SessionSnapshot} instance
+        @raise SessionError: if the session cannot be read
+        """
+        transaction = self._getTransaction( Transaction.READ )
+        try:
+            baseInfo = ( transaction.getEmail() , transaction.isAuthenticated() , transaction.isActivated() )
+            jobs = transaction.getAllJobs( annotations = True )
+            datas = transaction.getAllData()
+            workflows = transaction.getWorkflows()
+        except:
+            transaction.rollback()
+            raise
+        transaction.commit()
+        if refresh:
+            jobIDs = [ job[ 'jobID' ] for job in jobs ]
+            jobs = self._refreshJobs( jobs )
+            removed = set( jobIDs ).difference( [ job[ 'jobID' ] for job in jobs ] )
+            if removed:
+                #the removal of a job removes its links with the data too
+                for data in datas:
+                    data[ 'producedBy' ] = [ jobID for jobID in data[ 'producedBy' ] if jobID not in removed ]
+                    data[ 'usedBy' ] = [ jobID for jobID in data[ 'usedBy' ] if jobID not in removed ]
+        return SessionSnapshot( self.getKey() , baseInfo , jobs , datas , workflows )
+
     def getJob(self , jobID ):
         """
         @param jobID: the url of a job 
@@ -1085,60 +1231,184 @@ class Session( object ):
         return  2 
         @rtype: int
         """
-        if jobID[-10:] == '/index.xml':
-            jobID = jobID[:-10]
-            
-        server = registry.getServerByJobId(jobID)
-        
-        if server is None :
-            self.log.warning('registry does not known this server: %s' % jobID )
-            return 0
-        if server.name == 'local':
-            try:
-                jobPath = url2path( jobID )
-            except MobyleError:
-                return 0
-            return os.path.exists( jobPath )
-        else: #this jobID correspond to a remote job
-            try:
-                status , newUri = self._connect( jobID + '/index.xml' ) 
-                if status == 3:
-                    for attempt in range(10):
-                        status , newUri = self._connect( newUri )
-                        if status != 3:
-                            break
-                    if status == 3:
-                        self.log.error("we attempt 10 redirections whithout reaching the target url: %s" % jobID )
-                        return 2
-                if status == 2:
-                    return 1
-                if status == 4:
-                    return 0
+        return self.jobsExist( [ jobID ] )[ jobID ]
+
+    def jobsExist( self , jobIDs ):
+        """
+        check the existence of several jobs, the remote jobs are checked concurrently ( see L{RemoteJobProbe} ).
+        @param jobIDs: the url of the jobs
+        @type jobIDs: list of string
+        @return: for each job 1 if the job directory exists, 0 otherwise and 2 if the existence of a remote job
+        could not be decided ( see L{jobExists} )
+        @rtype: { string jobID : int }
+        """
+        results = {}
+        remoteJobs = {}
+        for jobID in jobIDs:
+            url = jobID
+            if url[-10:] == '/index.xml':
+                url = url[:-10]
+            server = registry.getServerByJobId( url )
+            if server is None :
+                self.log.warning('registry does not known this server: %s' % jobID )
+                results[ jobID ] = 0
+            elif server.name == 'local':
+                try:
+                    jobPath = url2path( url )
+                except MobyleError:
+                    results[ jobID ] = 0
                 else:
-                    self.log.error( "%s : %s" %( jobID , status ) )                    
-                    return 2      
+                    results[ jobID ] = os.path.exists( jobPath )
+            else: #this jobID correspond to a remote job
+                remoteJobs[ url ] = jobID
+        if remoteJobs:
+            try:
+                for url , verdict in RemoteJobProbe().exists( remoteJobs.keys() ).items():
+                    results[ remoteJobs[ url ] ] = verdict
             except Exception, e:
                 self.log.error(e, exc_info=True)
-                return 2   
-   
-    def _connect(self , url ):
+                for jobID in remoteJobs.values():
+                    results.setdefault( jobID , 2 )
+        return results
+
+
+class _FrozenDict( dict ):
+    """
+    a dictionary which cannot be modified
+    """
+    def _readOnly( self , *args , **kwargs ):
+        raise TypeError , "a session snapshot cannot be modified"
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readOnly
+
+    def __init__( self , items ):
+        dict.__init__( self , [ ( key , tuple( value ) if isinstance( value , list ) else value ) for key , value in items.items() ] )
+
+
+class SessionSnapshot( object ):
+    """
+    an immutable view of the whole content of a session at a given time ( see L{Session.getSnapshot} ).
+    The jobs and the data are dictionaries as returned by L{Session.getAllJobs} and L{Session.getAllData}
+    whose lists are replaced by tuples, the jobs have the 'labels' and 'description' keys in addition.
+    """
+
+    __slots__ = ( '_key' , '_baseInfo' , '_jobs' , '_datas' , '_workflows' , '_jobIndex' , '_dataIndex' )
+
+    def __init__( self , key , baseInfo , jobs , datas , workflows ):
+        """
+        @param key: the session key
+        @type key: string
+        @param baseInfo: the email , isAuthenticated , isActivated of the session
+        @type baseInfo: ( string , boolean , boolean )
+        @param jobs: the jobs of the session
+        @type jobs: list of dictionary
+        @param datas: the data of the session
+        @type datas: list of dictionary
+        @param workflows: the identifiers of the workflows of the session
+        @type workflows: list of int
+        """
+        object.__setattr__( self , '_key' , key )
+        object.__setattr__( self , '_baseInfo' , tuple( baseInfo ) )
+        object.__setattr__( self , '_jobs' , tuple( [ _FrozenDict( job ) for job in jobs ] ) )
+        object.__setattr__( self , '_datas' , tuple( [ _FrozenDict( data ) for data in datas ] ) )
+        object.__setattr__( self , '_workflows' , tuple( workflows ) )
+        object.__setattr__( self , '_jobIndex' , dict( [ ( job[ 'jobID' ] , job ) for job in self._jobs ] ) )
+        object.__setattr__( self , '_dataIndex' , dict( [ ( data[ 'dataName' ] , data ) for data in self._datas ] ) )
+
+    def __setattr__( self , name , value ):
+        raise AttributeError , "a session snapshot cannot be modified"
+
+    def getKey( self ):
         """
-        
+        @return: the session key
+        @rtype: string
+        """
+        return self._key
+
+    def getBaseInfo( self ):
+        """
+        @return: the email , isAuthenticated , isActivated of the session
+        @rtype: ( string email , boolean isAuthenticated , boolean isActivated )
+        """
+        return self._baseInfo
+
+    def getAllJobs( self ):
+        """
+        @return: the jobs of the session
+        @rtype: tuple of dictionary
+        """
+        return self._jobs
+
+    def getAllData( self ):
+        """
+        @return: the data of the session
+        @rtype: tuple of dictionary
+        """
+        return self._datas
+
+    def getWorkflows( self ):
+        """
+        @return: the identifiers of the workflows of the session
+        @rtype: tuple of int
+        """
+        return self._workflows
+
+    def hasJob( self , jobID ):
+        return jobID in self._jobIndex
+
+    def hasData( self , dataID ):
+        return dataID in self._dataIndex
+
+    def getJob( self , jobID ):
+        """
+        @param jobID: the url of a job
+        @type jobID: string
+        @return: the job corresponding to the jobID
+        @rtype: dictionary
+        @raise SessionError: if the jobID does not match any job in this snapshot
+        """
+        try:
+            return self._jobIndex[ jobID ]
+        except KeyError:
+            raise SessionError , "the job %s does not exist in the session %s" %( jobID , self._key )
+
+    def getData( self , dataID ):
+        """
+        @param dataID: the ID of the data in the session
+        @type dataID: string
+        @return: the data corresponding to the dataID
+        @rtype: dictionary
+        @raise SessionError: if the dataID does not match any data in this snapshot
         """
-        protocol , host , path , a, b, c = urlparse.urlparse( url )
         try:
-            cn = HTTPConnection(host)
-            cn.connect()
-            cn.sock.settimeout( 10 ) #set the timeout to 10 sec
-            cn.request( "HEAD" , url )
-            resp = cn.getresponse()
-            status = resp.status / 100
-            newUri = resp.getheader('Location')
-        except Exception , e:
-            self.log.error( "job %s is unreachable : %s " %( url  , e )  )
-            status = 5 #in http code 500 are for errors 
-            newUri = url
-        return status , newUri
+            return self._dataIndex[ dataID ]
+        except KeyError:
+            raise SessionError , "the data %s does not exist in the session %s" %( dataID , self._key )
 
+    def getJobLabels( self , jobID ):
+        """
+        @return: the labels of the job
+        @rtype: tuple of string
+        @raise SessionError: if the jobID does not match any job in this snapshot
+        """
+        return self.getJob( jobID )[ 'labels' ]
 
-    
+    def getJobDescription( self , jobID ):
+        """
+        @return: the description of the job or None if the job has no description
+        @rtype: string
+        @raise SessionError: if the jobID does not match any job in this snapshot
+        """
+        return self.getJob( jobID )[ 'description' ]
+
+    def getAllUniqueLabels( self ):
+        """
+        @return: the labels of all the jobs in the order of their first use
+        @rtype: list of string
+        """
+        labels = []
+        for job in self._jobs:
+            for label in job[ 'labels' ]:
+                if label not in labels:
+                    labels.append( label )
+        return labels
@@ -10,10 +10,11 @@ import errno
 from lxml import etree
 import fcntl
 
-from time import sleep , time
+from time import time
 
 from Mobyle.Status import Status
 from Mobyle.MobyleError import MobyleError
+from Mobyle.LockManager import lockManager
 from Mobyle.Utils import parse_xml_file
 
 import logging
@@ -56,34 +57,20 @@ class StatusManager(object):
 
     def _lock( self , File , lockType ):
         """
-        try to acquire a lock of lockType on self.__File
+        try to acquire a lock of lockType on File
         @raise IOError: when it could not acquire a lock
         """
-        IGotALock = False
         _log.debug( "%f : %s : _lock Type= %s ( call by= %s )"  %( time() ,
                                                                         File.name,
                                                                         ( 'UNKNOWN LOCK', 'READ' , 'WRITE' )[ lockType ] ,
                                                                         os.path.basename( sys.argv[0] ) ,
                                                                         ))
-        for attempt in range( 5 ):
-            try:
-                fcntl.lockf( File , lockType | fcntl.LOCK_NB )
-                IGotALock  = True
-                _log.debug( "%f : %s : _lock IGotALock = True" %(time() , File.name ))
-                break
-            except IOError , err:
-                _log.debug( "%f : %s : _lock IGotALock = False" %(time() , File.name))
-                sleep( 0.2 )
-
-        if not IGotALock :
+        try:
+            lockManager.acquire( File , lockType )
+        except IOError , err:
             _log.error( "%s : %s" %( File.name , err ) )
-            _log.debug( "%f : %s : _lock Type= %s ( call by= %s )"  %( time() ,
-                                                                            File.name ,
-                                                                            ( 'UNKNOWN LOCK', 'READ' , 'WRITE' )[ lockType ] ,
-                                                                            os.path.basename( sys.argv[0] )
-                                                                            ))
-
-            raise IOError , err
+            raise
+        _log.debug( "%f : %s : _lock IGotALock = True" %(time() , File.name ))
 
 
     def setStatus(self, job_path , status ):
@@ -110,11 +97,20 @@ class StatusManager(object):
             msg = "error in parsing status %s : %s" % ( File.name , err )
             _log.error( msg )
             _log.debug("%f : %s : setStatus UNLOCK " %( time() , fileName ) )
-            fcntl.lockf( File , fcntl.LOCK_UN  )
+            lockManager.release( File )
             File.close()
             raise MobyleError( msg )
         #################
-        old_status = self.getStatus( job_path )
+        #the status is read from the document already locked
+        #a call to getStatus would wait for our own lock
+        try:
+            message_node = root.find( "message" )
+            if message_node is None:
+                old_status = Status( string = root.find( "value" ).text )
+            else:
+                old_status = Status( string = root.find( "value" ).text , message = message_node.text )
+        except Exception:
+            old_status = Status( code = -1 )
         _log.debug( "old_status= %s" %old_status )
         if old_status.isEnded():
             _log.warning( "%f : %s : try to update job status from %s to %s ( call by %s )"%( time() ,
@@ -125,7 +121,7 @@ class StatusManager(object):
                                                                                               ) )
             try:
                 _log.debug("%f : %s : setStatus UNLOCK " %( time() , fileName ) )
-                fcntl.lockf( File , fcntl.LOCK_UN  )
+                lockManager.release( File )
             except Exception , err :
                 _log.error( "%f : %s : setStatus cannot UNLOCK : %s" %( time() , fileName , err ) )
             finally:
@@ -140,7 +136,7 @@ class StatusManager(object):
             msg = "error in parsing status %s : %s" % ( File.name , err )
             _log.error( msg )
             _log.debug("%f : %s : setStatus UNLOCK " %( time() , fileName ) )
-            fcntl.lockf( File , fcntl.LOCK_UN  )
+            lockManager.release( File )
             File.close()
             raise MobyleError( msg )
         ##################
@@ -158,7 +154,7 @@ class StatusManager(object):
         finally:
             try:
                 _log.debug("%f : %s : setStatus UNLOCK " %( time() , fileName ) )
-                fcntl.lockf( File , fcntl.LOCK_UN  )
+                lockManager.release( File )
                 File.close()
                 tmpFile.close()
             except Exception , err :
@@ -194,7 +190,7 @@ class StatusManager(object):
             pass
         finally:
             _log.debug("%f : %s : getStatus UNLOCK " %( time() , fileName ) )
-            fcntl.lockf( File , fcntl.LOCK_UN  )
+            lockManager.release( File )
             File.close()
         try:
             value_node = root.find( "value" )
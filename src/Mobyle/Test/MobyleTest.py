@@ -40,10 +40,26 @@ class ConfigTest(Config):
         self._user_sessions_url = "%s/%s" % ( self._repository_url , 'sessions' )
         self._servers_url = "%s/%s/%s" % ( self._repository_url , 'services' , 'servers' )
         
-#        self._debug = 0
-#        self._particular_debug = {}
+        self._debug = 0
+        self._particular_debug = {}
 #        self._accounting = False
         self._session_debug = False
+        self._session_storage = 'xml'
+        self._lock_timeout = 5.0
+        self._qstat_cache_ttl = 5.0
+        self._workflow_submission_threads = 4
+        self._workflow_server_submissions = 2
+        self._simultaneous_jobs = 1
+        self._jobstate_cache_size = 1000
+        self._runner_socket = None
+        self._runner_workers = 2
+        self._remote_probe_threads = 8
+        self._remote_host_down_ttl = 60.0
+        self._format_detector_cache_path = None
+        self._format_detector_cache_size = 100000
+        self._format_detector_memory_cache_size = 1000
+        self._service_cache_path = None
+        self._service_cache_size = 50
         self._status_debug = False
 #        
 #        self._binary_path = []  
@@ -0,0 +1,117 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+import time
+import subprocess
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.Admin import Admin
+from Mobyle import AdminIndex
+
+MD5 = '0123456789abcdef0123456789abcdef'
+
+
+class AdminIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        self.cfg._admindir = os.path.join( self.cfg.test_dir , 'ADMINDIR' )
+        os.makedirs( self.cfg.admindir() )
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def _link( self , jobKey , md5 = MD5 , workflowID = None , service = 'blast' ):
+        jobDir = os.path.join( self.cfg.test_dir , jobKey )
+        os.makedirs( jobDir )
+        Admin.create( jobDir , 'no web' , service , jobKey , workflowID = workflowID )
+        adm = Admin( jobDir )
+        adm.setMd5( md5 )
+        adm.commit()
+        linkName = os.path.join( self.cfg.admindir() , "%s.%s" %( service , jobKey ) )
+        AdminIndex.link( os.path.join( jobDir , Admin.FILENAME ) , linkName )
+        return linkName
+
+    def testCount(self):
+        self.assertEqual( AdminIndex.count( 'blast' , MD5 ) , 0 )
+        link1 = self._link( 'A00000000000001' )
+        link2 = self._link( 'A00000000000002' )
+        self._link( 'A00000000000003' , md5 = 'f' * 32 )
+        self._link( 'A00000000000004' , workflowID = 'http://nowhere/jobs/W' )
+        self._link( 'A00000000000005' , service = 'clustalw' )
+        self.assertEqual( AdminIndex.count( 'blast' , MD5 ) , 2 )
+        self.assertEqual( AdminIndex.count( 'clustalw' , MD5 ) , 1 )
+        AdminIndex.unlink( link1 )
+        self.assertFalse( os.path.lexists( link1 ) )
+        self.assertEqual( AdminIndex.count( 'blast' , MD5 ) , 1 )
+        #the job link removed without the index
+        os.unlink( link2 )
+        self.assertEqual( AdminIndex.count( 'blast' , MD5 ) , 0 )
+        self.assertEqual( os.listdir( os.path.join( self.cfg.admindir() , AdminIndex.DIGESTS , MD5 ) ) , [ 'clustalw.A00000000000005' ] )
+
+    def testRebuild(self):
+        self._link( 'A00000000000001' )
+        self._link( 'A00000000000002' )
+        self._link( 'A00000000000003' , workflowID = 'http://nowhere/jobs/W' )
+        shutil.rmtree( os.path.join( self.cfg.admindir() , AdminIndex.DIGESTS ) )
+        #the index is rebuilt from the links if it does not exist
+        self.assertEqual( AdminIndex.count( 'blast' , MD5 ) , 2 )
+        AdminIndex.rebuild()
+        self.assertEqual( AdminIndex.count( 'blast' , MD5 ) , 2 )
+        self.assertEqual( sorted( [ n for n in os.listdir( self.cfg.admindir() ) if n.startswith( '.' ) ] ) ,
+                          [ AdminIndex.DIGESTS , AdminIndex.DIGESTS + '.lock' ] )
+
+    def testLinkDuringRebuild(self):
+        self._link( 'A00000000000001' )
+        jobDir = os.path.join( self.cfg.test_dir , 'A00000000000002' )
+        os.makedirs( jobDir )
+        Admin.create( jobDir , 'no web' , 'blast' , 'A00000000000002' )
+        adm = Admin( jobDir )
+        adm.setMd5( MD5 )
+        adm.commit()
+        linkName = os.path.join( self.cfg.admindir() , 'blast.A00000000000002' )
+        script = "import Mobyle.Test.MobyleTest ; from Mobyle import AdminIndex ; AdminIndex.link( %r , %r )" %( os.path.join( jobDir , Admin.FILENAME ) , linkName )
+        env = dict( os.environ )
+        env[ 'PYTHONPATH' ] = os.pathsep.join( sys.path )
+        children = []
+        getDigest = AdminIndex._getDigest
+        def linkInAnotherProcess( adminPath ):
+            if not children:
+                #the job is linked by another process while the index is rebuilt
+                children.append( subprocess.Popen( [ sys.executable , '-c' , script ] , env = env ) )
+                for i in range( 100 ):
+                    if os.path.lexists( linkName ):
+                        break
+                    time.sleep( 0.05 )
+                time.sleep( 0.2 )
+            return getDigest( adminPath )
+        AdminIndex._getDigest = linkInAnotherProcess
+        try:
+            AdminIndex.rebuild()
+        finally:
+            AdminIndex._getDigest = getDigest
+        self.assertEqual( children[0].wait() , 0 )
+        self.assertEqual( sorted( os.listdir( os.path.join( self.cfg.admindir() , AdminIndex.DIGESTS , MD5 ) ) ) ,
+                          [ 'blast.A00000000000001' , 'blast.A00000000000002' ] )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+import socket
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.JobState import getContentFile , iterContentFile , copyContentFile
+from Mobyle.MobyleError import MobyleError
+from Mobyle.Classes.Core import TextDataType , BinaryDataType
+
+
+class ContentFileTest(unittest.TestCase):
+    """Tests the functions which read the content of a file"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self.content = ''.join( [ ">seq%d\nACGTACGTACGT\n" % i for i in range( 10000 ) ] )
+        self.path = os.path.join( self.cfg.test_dir , 'seqs.fasta' )
+        fh = open( self.path , 'w' )
+        fh.write( self.content )
+        fh.close()
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def testGetContentFile(self):
+        self.assertEqual( getContentFile( self.path ) , self.content )
+        self.assertEqual( getContentFile( 'file://' + self.path ) , self.content )
+        self.assertEqual( getContentFile( self.path , maxSize = 100 ) , self.content[:100] )
+        self.assertRaises( MobyleError , getContentFile , self.path + '.none' )
+        self.assertRaises( MobyleError , getContentFile , 'ftp://ftp.nowhere.org/seqs.fasta' )
+
+    def testIterContentFile(self):
+        chunks = list( iterContentFile( self.path , chunkSize = 1000 ) )
+        self.assertEqual( ''.join( chunks ) , self.content )
+        self.assertTrue( max( [ len( c ) for c in chunks ] ) <= 1000 )
+        chunks = list( iterContentFile( self.path , maxSize = 2500 , chunkSize = 1000 ) )
+        self.assertEqual( [ len( c ) for c in chunks ] , [ 1000 , 1000 , 500 ] )
+
+    def testCopyContentFile(self):
+        destPath = os.path.join( self.cfg.test_dir , 'copy.fasta' )
+        dest = open( destPath , 'w' )
+        self.assertEqual( copyContentFile( self.path , dest ) , len( self.content ) )
+        dest.close()
+        self.assertEqual( open( destPath ).read() , self.content )
+        emptyPath = os.path.join( self.cfg.test_dir , 'empty' )
+        open( emptyPath , 'w' ).close()
+        dest = open( destPath , 'w' )
+        self.assertEqual( copyContentFile( emptyPath , dest ) , 0 )
+        dest.close()
+        self.assertEqual( os.path.getsize( destPath ) , 0 )
+
+
+class FakeDir( object ):
+
+    def __init__( self , path ):
+        self.path = path
+
+    def getDir( self ):
+        return self.path
+
+
+class FakeRemoteJob( FakeDir ):
+    """a remote job which loses the connection after sending the half of the file"""
+
+    def __init__( self , path , content , broken ):
+        FakeDir.__init__( self , path )
+        self.content = content
+        self.broken = broken
+
+    def isLocal( self ):
+        return False
+
+    def copyOutputFile( self , fileName , dest ):
+        half = len( self.content ) / 2
+        dest.write( self.content[ : half ] )
+        if self.broken:
+            raise socket.error( 104 , 'Connection reset by peer' )
+        dest.write( self.content[ half : ] )
+        return len( self.content )
+
+
+class ToFileTest( unittest.TestCase ):
+    """Tests the copy of the output of a remote job by the datatypes"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self.content = ''.join( [ ">seq%d\nACGTACGTACGT\n" % i for i in range( 1000 ) ] )
+        self.dest = FakeDir( self.cfg.test_dir )
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def testToFile(self):
+        for dataType in ( TextDataType() , BinaryDataType() ):
+            src = FakeRemoteJob( self.cfg.test_dir , self.content , False )
+            fileName , size = dataType.toFile( None , self.dest , 'copy.fasta' , src , 'seqs.fasta' )
+            self.assertEqual( size , len( self.content ) )
+            path = os.path.join( self.cfg.test_dir , fileName )
+            self.assertEqual( open( path ).read() , self.content )
+            os.unlink( path )
+
+    def testToFileReadError(self):
+        for dataType in ( TextDataType() , BinaryDataType() ):
+            src = FakeRemoteJob( self.cfg.test_dir , self.content , True )
+            self.assertRaises( socket.error , dataType.toFile , None , self.dest , 'copy.fasta' , src , 'seqs.fasta' )
+            #no truncated file is left
+            self.assertFalse( os.path.exists( os.path.join( self.cfg.test_dir , 'copy.fasta' ) ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import cPickle
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.Evaluation import Evaluation , _CodeCache
+from Mobyle.MobyleError import EvaluationError
+
+
+class EvaluationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        Evaluation._codes.clear()
+
+    def testEval(self):
+        ev1 = Evaluation()
+        ev1.setVar( 'value' , 'ACGT' )
+        ev2 = Evaluation()
+        ev2.setVar( 'value' , 'xyz' )
+        expr = "re.match( '^[ACGT]+$' , value ) is not None"
+        self.assertTrue( ev1.eval( expr ) )
+        self.assertFalse( ev2.eval( expr ) )
+        self.assertTrue( ev1.re is ev2.re )
+        stats = Evaluation.getCacheStats()
+        self.assertEqual( stats[ 'misses' ] , 1 )
+        self.assertEqual( stats[ 'hits' ] , 1 )
+        self.assertEqual( stats[ 'size' ] , 1 )
+
+    def testErrors(self):
+        ev = Evaluation()
+        self.assertRaises( EvaluationError , ev.eval , "value ==" )
+        self.assertRaises( EvaluationError , ev.eval , "undefined_var > 2" )
+        self.assertRaises( EvaluationError , ev.eval , "undefined_var > 2" )
+        self.assertEqual( Evaluation.getCacheStats()[ 'size' ] , 1 )
+
+    def testIndentedExpression(self):
+        ev = Evaluation()
+        ev.setVar( 'value' , 3 )
+        self.assertEqual( ev.eval( ' " -n=" + str(value)' ) , ' -n=3' )
+        self.assertEqual( ev.eval( '\t \t" -n=" + str(value)' ) , ' -n=3' )
+        self.assertEqual( ev.eval( '" -n=" + str(value)' ) , ' -n=3' )
+        #the indentation is not part of the key
+        self.assertEqual( Evaluation.getCacheStats()[ 'size' ] , 1 )
+
+    def testSize(self):
+        cache = _CodeCache( size = 2 )
+        for expr in ( "1" , "2" , "3" ):
+            cache.get( expr )
+        self.assertTrue( cache.getStats()[ 'size' ] <= 2 )
+        self.assertEqual( eval( cache.get( "3" ) ) , 3 )
+
+    def testPickle(self):
+        ev = Evaluation()
+        ev.setVar( 'value' , 3 )
+        ev.eval( "value > 2" )
+        ev = cPickle.loads( cPickle.dumps( ev ) )
+        self.assertTrue( ev.re is Evaluation().re )
+        self.assertTrue( ev.eval( "value > 2" ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,469 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+import types
+from lxml import etree
+from time import localtime, strftime
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+import Mobyle.Utils
+import Mobyle.Session
+from Mobyle.Admin import Admin
+from Mobyle.JobState import url2path
+from Mobyle.MobyleError import MobyleError
+from Mobyle.Status import Status
+from Mobyle.StatusManager import StatusManager
+from Mobyle.Transaction import Transaction
+from Mobyle.Execution.ExecutionSystem import ExecutionSystem
+
+
+class FakeConfig( object ):
+    """
+    the configuration of an execution system, as the ExecutionConfig of Local.Config.Execution
+    """
+    def __init__( self , execution_class_name , **kwargs ):
+        self.execution_class_name = execution_class_name
+        self.__dict__.update( kwargs )
+
+
+class FakeExecution( ExecutionSystem ):
+    """
+    an execution system which returns the statuses of its configuration
+    and records the queries
+    """
+    def __init__( self , execution_config ):
+        super( FakeExecution , self ).__init__( execution_config )
+        self.batches = []
+        self.queried = []
+
+    def getStatus( self , number ):
+        self.queried.append( number )
+        if self.execution_config.broken:
+            raise MobyleError( "the execution system is down" )
+        return self.execution_config.statuses.get( number , Status( -1 ) )
+
+    def getStatuses( self , numbers ):
+        self.batches.append( list( numbers ) )
+        return super( FakeExecution , self ).getStatuses( numbers )
+
+
+def fakeDrmaa():
+    """
+    @return: a module with the part of the drmaa api used by Mobyle
+    """
+    drmaa = types.ModuleType( 'drmaa' )
+    drmaa.errors = types.ModuleType( 'drmaa.errors' )
+    for name in ( 'AlreadyActiveSessionException' , 'NoActiveSessionException' ,
+                  'DrmCommunicationException' , 'InvalidJobException' ):
+        setattr( drmaa.errors , name , type( name , ( Exception , ) , {} ) )
+    class JobState( object ):
+        UNDETERMINED = 'undetermined'
+        QUEUED_ACTIVE = 'queued_active'
+        SYSTEM_ON_HOLD = 'system_on_hold'
+        USER_ON_HOLD = 'user_on_hold'
+        USER_SYSTEM_ON_HOLD = 'user_system_on_hold'
+        RUNNING = 'running'
+        SYSTEM_SUSPENDED = 'system_suspended'
+        USER_SUSPENDED = 'user_suspended'
+        USER_SYSTEM_SUSPENDED = 'user_system_suspended'
+        DONE = 'done'
+        FAILED = 'failed'
+    drmaa.JobState = JobState
+    class Session( object ):
+        #the states of the jobs known by the DRM
+        jobs = {}
+        #the sessions created
+        sessions = []
+        def __init__( self , contactString = None ):
+            self.contact = contactString
+            self.queried = []
+            self.active = False
+            #the connection to the DRM is lost
+            self.lost = False
+            Session.sessions.append( self )
+        def initialize( self ):
+            self.active = True
+        def exit( self ):
+            self.active = False
+        def jobStatus( self , key ):
+            if not self.active:
+                raise drmaa.errors.NoActiveSessionException( "No active session" )
+            self.queried.append( key )
+            if self.lost:
+                raise drmaa.errors.DrmCommunicationException( "unable to contact qmaster" )
+            try:
+                return Session.jobs[ key ]
+            except KeyError:
+                raise drmaa.errors.InvalidJobException( "The job specified by the 'jobid' does not exist." )
+    drmaa.Session = Session
+    return drmaa
+
+
+class ExecutionTestCase( unittest.TestCase ):
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self.configs = {}
+
+    def tearDown(self):
+        for attr in ( '_execution_system_alias' , '_revert_alias' ):
+            self.cfg.__dict__.pop( attr , None )
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def _addExecution( self , alias , config ):
+        self.configs[ alias ] = config
+        self.cfg._execution_system_alias = self.configs
+        self.cfg._revert_alias = dict( [ ( c , a ) for a , c in self.configs.items() ] )
+
+
+class GetStatusesTest( ExecutionTestCase ):
+
+    def setUp(self):
+        ExecutionTestCase.setUp( self )
+        self.engines = {}
+        self.loads = []
+        for alias in ( 'A' , 'B' , 'DOWN' ):
+            config = FakeConfig( 'FakeExecution' , statuses = {} , broken = alias == 'DOWN' )
+            self._addExecution( alias , config )
+        self.executionLoader = Mobyle.Utils.executionLoader
+        Mobyle.Utils.executionLoader = self._executionLoader
+
+    def tearDown(self):
+        Mobyle.Utils.executionLoader = self.executionLoader
+        ExecutionTestCase.tearDown( self )
+
+    def _executionLoader( self , jobID = None , alias = None , execution_config = None ):
+        if jobID:
+            alias = Admin( url2path( jobID ) ).getExecutionAlias()
+        self.loads.append( alias )
+        if alias not in self.engines:
+            self.engines[ alias ] = FakeExecution( self.configs[ alias ] )
+        return self.engines[ alias ]
+
+    def _fakejob( self , key , status , alias = None , number = None ):
+        job_url = os.path.join( self.cfg.results_url() , 'fake_job' , key )
+        job_dir = url2path( job_url )
+        os.makedirs( job_dir )
+        root = etree.Element( 'jobState' )
+        for tag , text in ( ( 'date' , strftime( "%x  %X" , localtime() ) ) , ( 'name' , 'dummy.xml' ) , ( 'id' , job_url ) ):
+            node = etree.Element( tag )
+            node.text = text
+            root.append( node )
+        fh = open( os.path.join( job_dir , 'index.xml' ) , 'w' )
+        fh.write( etree.tostring( root , xml_declaration = True , encoding = 'UTF-8' ) )
+        fh.close()
+        Admin.create( job_dir , None , None , None )
+        adm = Admin( job_dir )
+        if alias:
+            adm.setExecutionAlias( alias )
+        if number:
+            adm.setNumber( number )
+        adm.commit()
+        StatusManager.create( job_dir , status )
+        return job_url
+
+    def _setStatus( self , alias , number , status ):
+        self.configs[ alias ].statuses[ number ] = status
+
+    def _storedStatus( self , jobID ):
+        return StatusManager().getStatus( url2path( jobID ) )
+
+    def testDefaultGetStatuses(self):
+        self._setStatus( 'A' , '1' , Status( 3 ) )
+        engine = FakeExecution( self.configs[ 'A' ] )
+        self.assertEqual( engine.getStatuses( [ '1' , '2' ] ) , { '1' : Status( 3 ) , '2' : Status( -1 ) } )
+        self.assertEqual( engine.queried , [ '1' , '2' ] )
+
+    def testOneQueryByExecutionSystem(self):
+        a1 = self._fakejob( 'A00000000000001' , Status( 1 ) , 'A' , '1' )
+        a2 = self._fakejob( 'A00000000000002' , Status( 2 ) , 'A' , '2' )
+        a3 = self._fakejob( 'A00000000000003' , Status( 3 ) , 'A' , '3' )
+        b1 = self._fakejob( 'A00000000000004' , Status( 1 ) , 'B' , '1' )
+        self._setStatus( 'A' , '1' , Status( 3 ) )
+        self._setStatus( 'A' , '2' , Status( 2 ) )
+        self._setStatus( 'A' , '3' , Status( 4 ) )
+        self._setStatus( 'B' , '1' , Status( 7 ) )
+        statuses = Mobyle.Utils.getStatuses( [ a1 , a2 , a3 , b1 ] )
+        self.assertEqual( statuses , { a1 : Status( 3 ) , a2 : Status( 2 ) , a3 : Status( 4 ) , b1 : Status( 7 ) } )
+        self.assertEqual( sorted( self.loads ) , [ 'A' , 'B' ] )
+        self.assertEqual( [ sorted( batch ) for batch in self.engines[ 'A' ].batches ] , [ [ '1' , '2' , '3' ] ] )
+        self.assertEqual( self.engines[ 'B' ].batches , [ [ '1' ] ] )
+        #the changed statuses are stored
+        for jobID in ( a1 , a2 , a3 , b1 ):
+            self.assertEqual( self._storedStatus( jobID ) , statuses[ jobID ] )
+
+    def testStoredStatusKept(self):
+        ended = self._fakejob( 'A00000000000001' , Status( 4 ) , 'A' , '1' )
+        building = self._fakejob( 'A00000000000002' , Status( 0 ) , 'A' , '2' )
+        noAlias = self._fakejob( 'A00000000000003' , Status( 1 ) , number = '3' )
+        noNumber = self._fakejob( 'A00000000000004' , Status( 1 ) , 'A' )
+        unknown = self._fakejob( 'A00000000000005' , Status( 2 ) , 'A' , '5' )
+        down = self._fakejob( 'A00000000000006' , Status( 3 ) , 'DOWN' , '6' )
+        for number in ( '1' , '2' , '3' ):
+            self._setStatus( 'A' , number , Status( 6 ) )
+        statuses = Mobyle.Utils.getStatuses( [ ended , building , noAlias , noNumber , unknown , down ] )
+        self.assertEqual( statuses , { ended    : Status( 4 ) ,
+                                       building : Status( 0 ) ,
+                                       noAlias  : Status( 1 ) ,
+                                       noNumber : Status( 1 ) ,
+                                       unknown  : Status( 2 ) ,
+                                       down     : Status( 3 ) ,
+                                       } )
+        #only the queryable jobs with an execution system are queried
+        self.assertEqual( self.engines[ 'A' ].batches , [ [ '5' ] ] )
+        self.assertEqual( self.engines[ 'DOWN' ].batches , [ [ '6' ] ] )
+        for jobID , status in statuses.items():
+            self.assertEqual( self._storedStatus( jobID ) , status )
+
+    def testRefreshSessionJobs(self):
+        session_dir = os.path.join( self.cfg.user_sessions_path() , 'fake_session' )
+        session = Mobyle.Session.Session( session_dir , 'fake_session' , self.cfg )
+        os.makedirs( session_dir )
+        Transaction.create( os.path.join( session_dir , session.FILENAME ) , False , True )
+        a1 = self._fakejob( 'A00000000000001' , Status( 1 ) , 'A' , '1' )
+        a2 = self._fakejob( 'A00000000000002' , Status( 2 ) , 'A' , '2' )
+        b1 = self._fakejob( 'A00000000000003' , Status( 3 ) , 'B' , '1' )
+        ended = self._fakejob( 'A00000000000004' , Status( 4 ) , 'B' , '2' )
+        noAlias = self._fakejob( 'A00000000000005' , Status( 1 ) , number = '3' )
+        for jobID in ( a1 , a2 , b1 , ended , noAlias ):
+            session.addJob( jobID )
+        self.loads = []
+        self.engines = {}
+        self._setStatus( 'A' , '1' , Status( 3 ) )
+        self._setStatus( 'A' , '2' , Status( 4 ) )
+        self._setStatus( 'B' , '1' , Status( 3 ) )
+        self._setStatus( 'B' , '2' , Status( 6 ) )
+        jobs = dict( [ ( job[ 'jobID' ] , job[ 'status' ] ) for job in session.getAllJobs() ] )
+        self.assertEqual( jobs , { a1 : Status( 3 ) , a2 : Status( 4 ) , b1 : Status( 3 ) ,
+                                   ended : Status( 4 ) , noAlias : Status( 1 ) } )
+        self.assertEqual( sorted( self.loads ) , [ 'A' , 'B' ] )
+        self.assertEqual( [ sorted( batch ) for batch in self.engines[ 'A' ].batches ] , [ [ '1' , '2' ] ] )
+        self.assertEqual( self.engines[ 'B' ].batches , [ [ '1' ] ] )
+        #the new statuses are stored in the session, the ended job is not queried anymore
+        self.engines = {}
+        session.getAllJobs()
+        self.assertEqual( self.engines[ 'A' ].batches , [ [ '1' ] ] )
+        self.assertEqual( self.engines[ 'B' ].batches , [ [ '1' ] ] )
+
+
+class SGETest( ExecutionTestCase ):
+
+    QSTAT = """\
+   1001 0.55500 job1       mobyle       r     10/18/2026 10:00:00 all.q@node1                        1
+       Full jobname:     1001
+   1002 0.55500 job2       mobyle       qw    10/18/2026 10:00:01                                    1
+       Full jobname:     1002
+   1003 0.55500 job3       mobyle       s     10/18/2026 10:00:02 all.q@node2                        1
+       Full jobname:     1003
+"""
+
+    def setUp(self):
+        ExecutionTestCase.setUp( self )
+        #a fake sge installation whose qstat records its calls
+        self.sge_root = os.path.join( self.cfg.test_dir , 'sge' )
+        self.qstat_calls = os.path.join( self.cfg.test_dir , 'qstat_calls' )
+        self.qstat_output = os.path.join( self.cfg.test_dir , 'qstat_output' )
+        self._script( os.path.join( self.sge_root , 'util' , 'arch' ) , "echo fake-arch" )
+        self._script( os.path.join( self.sge_root , 'bin' , 'fake-arch' , 'qstat' ) ,
+                      'echo "$@" >> %s\ncat %s' %( self.qstat_calls , self.qstat_output ) )
+        self._qstatOutput( self.QSTAT )
+        self._addExecution( 'SGE' , FakeConfig( 'SGE' , root = self.sge_root , cell = 'default' ) )
+        self.ttl = self.cfg._qstat_cache_ttl
+        self.cfg._qstat_cache_ttl = 0
+        self.cfg._admindir = os.path.join( self.cfg.test_dir , 'ADMINDIR' )
+        os.makedirs( self.cfg._admindir )
+        #the clock of the snapshots
+        from Mobyle.Execution import SGE
+        self.now = 1000000.0
+        self.time = SGE.time
+        SGE.time = lambda : self.now
+        SGE.SGE._snapshots.clear()
+        self.sge = SGE.SGE( self.configs[ 'SGE' ] )
+
+    def tearDown(self):
+        from Mobyle.Execution import SGE
+        SGE.time = self.time
+        SGE.SGE._snapshots.clear()
+        self.cfg._qstat_cache_ttl = self.ttl
+        del self.cfg._admindir
+        ExecutionTestCase.tearDown( self )
+
+    def _script( self , path , body ):
+        if not os.path.exists( os.path.dirname( path ) ):
+            os.makedirs( os.path.dirname( path ) )
+        f = open( path , 'w' )
+        f.write( "#!/bin/sh\n%s\n" % body )
+        f.close()
+        os.chmod( path , 0755 )
+
+    def _qstatOutput( self , output ):
+        f = open( self.qstat_output , 'w' )
+        f.write( output )
+        f.close()
+
+    def _qstatCalls( self ):
+        try:
+            return len( open( self.qstat_calls ).readlines() )
+        except IOError:
+            return 0
+
+    def testOneQstatByBatch(self):
+        statuses = self.sge.getStatuses( [ '1001' , '1002' , '1003' , '1004' ] )
+        self.assertEqual( statuses , { '1001' : Status( 3 ) ,
+                                       '1002' : Status( 2 ) ,
+                                       '1003' : Status( 7 ) ,
+                                       '1004' : Status( -1 ) ,
+                                       } )
+        self.assertEqual( self._qstatCalls() , 1 )
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 3 ) )
+        self.assertEqual( self._qstatCalls() , 2 )
+
+    def testSnapshotReused(self):
+        self.cfg._qstat_cache_ttl = 5
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 3 ) )
+        self.assertEqual( self._qstatCalls() , 1 )
+        self._qstatOutput( self.QSTAT.replace( 'mobyle       r ' , 'mobyle       s ' ) )
+        #within the ttl the states are read from memory
+        self.now += 4
+        self.assertEqual( self.sge.getStatuses( [ '1001' , '1002' ] ) , { '1001' : Status( 3 ) , '1002' : Status( 2 ) } )
+        self.assertEqual( self._qstatCalls() , 1 )
+        #then from the snapshot written in ADMINDIR by another process
+        self.sge._snapshots.clear()
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 3 ) )
+        self.assertEqual( self._qstatCalls() , 1 )
+        self.assertEqual( sorted( os.listdir( self.cfg.admindir() ) ) , [ '.qstat.default' , '.qstat.default.lock' ] )
+
+    def testSnapshotRefreshed(self):
+        self.cfg._qstat_cache_ttl = 5
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 3 ) )
+        self._qstatOutput( self.QSTAT.replace( 'mobyle       r ' , 'mobyle       s ' ) )
+        #the snapshot has expired
+        self.now += 5
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 7 ) )
+        self.assertEqual( self._qstatCalls() , 2 )
+        #the new snapshot is shared with the other processes
+        self.sge._snapshots.clear()
+        self.now += 1
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 7 ) )
+        self.assertEqual( self._qstatCalls() , 2 )
+        snapshot = open( os.path.join( self.cfg.admindir() , '.qstat.default' ) )
+        self.assertEqual( float( snapshot.readline() ) , 1000005.0 )
+        snapshot.close()
+        #a snapshot which cannot be read is ignored
+        self.sge._snapshots.clear()
+        snapshot = open( os.path.join( self.cfg.admindir() , '.qstat.default' ) , 'w' )
+        snapshot.write( 'garbage\n' )
+        snapshot.close()
+        self.assertEqual( self.sge.getStatus( '1001' ) , Status( 7 ) )
+        self.assertEqual( self._qstatCalls() , 3 )
+
+    def testNoSnapshot(self):
+        for i in range( 3 ):
+            self.sge.getStatus( '1001' )
+        self.assertEqual( self._qstatCalls() , 3 )
+        self.assertFalse( os.listdir( self.cfg.admindir() ) )
+
+
+class DRMAATest( ExecutionTestCase ):
+
+    def setUp(self):
+        ExecutionTestCase.setUp( self )
+        self.drmaa = sys.modules.get( 'drmaa' )
+        sys.modules[ 'drmaa' ] = fakeDrmaa()
+        from Mobyle.Execution import DRMAA
+        self.probe = DRMAA.DRMAASessionManager.PROBE_JOB
+        self.sessionManager = DRMAA.sessionManager = DRMAA.DRMAASessionManager()
+        self._addExecution( 'DRMAA' , FakeConfig( 'DRMAA' , drmaa_library_path = '/nowhere/libdrmaa.so' , contactString = 'fake' ) )
+        self.engine = DRMAA.DRMAA( self.configs[ 'DRMAA' ] )
+        self.drmaa_session = self.engine.drmaa.Session
+        self.drmaa_session.jobs.update( { '1' : self.engine.drmaa.JobState.RUNNING ,
+                                          '2' : self.engine.drmaa.JobState.QUEUED_ACTIVE ,
+                                          '3' : self.engine.drmaa.JobState.DONE ,
+                                          } )
+
+    def tearDown(self):
+        self.sessionManager.close()
+        if self.drmaa is None:
+            del sys.modules[ 'drmaa' ]
+        else:
+            sys.modules[ 'drmaa' ] = self.drmaa
+        ExecutionTestCase.tearDown( self )
+
+    def testOneSessionByBatch(self):
+        statuses = self.engine.getStatuses( [ '1' , '2' , '3' , '4' ] )
+        self.assertEqual( statuses , { '1' : Status( 3 ) ,
+                                       '2' : Status( 2 ) ,
+                                       '3' : Status( 4 ) ,
+                                       '4' : Status( -1 ) ,
+                                       } )
+        self.assertEqual( len( self.drmaa_session.sessions ) , 1 )
+        self.assertEqual( self.drmaa_session.sessions[0].queried , [ '1' , '2' , '3' , '4' ] )
+        #the session is reused by the next batch
+        self.assertEqual( self.engine.getStatuses( [ '1' ] ) , { '1' : Status( 3 ) } )
+        self.assertEqual( len( self.drmaa_session.sessions ) , 1 )
+        stats = self.sessionManager.getStats()
+        self.assertEqual( ( stats[ 'opened' ] , stats[ 'reconnected' ] ) , ( 1 , 0 ) )
+
+    def _idle( self ):
+        self.sessionManager._lastUse -= self.sessionManager.CHECK_INTERVAL + 1
+
+    def testAliveSessionReused(self):
+        self.engine.getStatuses( [ '1' ] )
+        session = self.drmaa_session.sessions[0]
+        #a recent session is not checked
+        self.engine.getStatuses( [ '2' ] )
+        self.assertEqual( session.queried , [ '1' , '2' ] )
+        #an idle session is checked by a call to the DRM
+        self._idle()
+        self.assertEqual( self.engine.getStatuses( [ '3' ] ) , { '3' : Status( 4 ) } )
+        self.assertEqual( session.queried , [ '1' , '2' , self.probe , '3' ] )
+        self.assertEqual( len( self.drmaa_session.sessions ) , 1 )
+        self.assertEqual( self.sessionManager.getStats()[ 'reconnected' ] , 0 )
+
+    def testBrokenSessionReconnected(self):
+        self.engine.getStatuses( [ '1' ] )
+        broken = self.drmaa_session.sessions[0]
+        #the session object is still there but the DRM cannot be reached anymore
+        broken.lost = True
+        self._idle()
+        statuses = self.engine.getStatuses( [ '1' , '2' ] )
+        self.assertEqual( statuses , { '1' : Status( 3 ) , '2' : Status( 2 ) } )
+        #the broken session has been detected by the check, before querying the jobs
+        self.assertEqual( broken.queried , [ '1' , self.probe ] )
+        self.assertFalse( broken.active )
+        self.assertEqual( len( self.drmaa_session.sessions ) , 2 )
+        self.assertEqual( self.drmaa_session.sessions[1].queried , [ '1' , '2' ] )
+        self.assertEqual( self.sessionManager.getStats()[ 'reconnected' ] , 1 )
+
+    def testSessionErrorReconnected(self):
+        self.engine.getStatuses( [ '1' ] )
+        broken = self.drmaa_session.sessions[0]
+        #the connection is lost between two checks
+        broken.lost = True
+        self.assertEqual( self.engine.getStatuses( [ '1' ] ) , { '1' : Status( 3 ) } )
+        self.assertEqual( broken.queried , [ '1' , '1' ] )
+        self.assertEqual( self.drmaa_session.sessions[1].queried , [ '1' ] )
+        self.assertEqual( self.sessionManager.getStats()[ 'reconnected' ] , 1 )
+
+
+if __name__ == '__main__':
+    unittest.main()
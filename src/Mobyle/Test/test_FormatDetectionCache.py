@@ -0,0 +1,124 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.FormatDetectionCache import FormatDetectionCache
+from Mobyle.Converter.DataConverter import DataConverter
+
+
+class CountingConverter( DataConverter ):
+
+    def __init__( self , path = None ):
+        super( CountingConverter , self ).__init__( path )
+        self.program_name = 'counter'
+        self.calls = 0
+
+    def detect( self , dataFileName ):
+        self.calls += 1
+        if open( dataFileName ).read().startswith( '>' ):
+            return ( 'FASTA' , 1 )
+        return ( None , None )
+
+
+class FormatDetectionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self.converter = CountingConverter()
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def _data( self , name , content ):
+        path = os.path.join( self.cfg.test_dir , name )
+        f = open( path , 'w' )
+        f.write( content )
+        f.close()
+        return path
+
+    def testMemory(self):
+        cache = FormatDetectionCache( path = None , memorySize = 10 )
+        seq1 = self._data( 'seq1' , '>s1\nACGT\n' )
+        seq2 = self._data( 'seq2' , '>s1\nACGT\n' )
+        raw = self._data( 'raw' , 'ACGT\n' )
+        self.assertEqual( cache.detect( self.converter , seq1 ) , ( 'FASTA' , 1 ) )
+        #same content
+        self.assertEqual( cache.detect( self.converter , seq2 ) , ( 'FASTA' , 1 ) )
+        self.assertEqual( cache.detect( self.converter , raw ) , ( None , None ) )
+        self.assertEqual( cache.detect( self.converter , raw ) , ( None , None ) )
+        self.assertEqual( self.converter.calls , 2 )
+        stats = cache.getStats()
+        self.assertEqual( stats[ 'memory' ] , 2 )
+        self.assertEqual( stats[ 'detected' ] , 2 )
+
+    def testDisk(self):
+        seq = self._data( 'seq' , '>s1\nACGT\n' )
+        cache = FormatDetectionCache( path = self.cfg.test_dir , size = 10 , memorySize = 0 )
+        self.assertEqual( cache.detect( self.converter , seq ) , ( 'FASTA' , 1 ) )
+        #an other process
+        cache = FormatDetectionCache( path = self.cfg.test_dir , size = 10 , memorySize = 0 )
+        self.assertEqual( cache.detect( self.converter , seq ) , ( 'FASTA' , 1 ) )
+        self.assertEqual( self.converter.calls , 1 )
+        self.assertEqual( cache.getStats()[ 'disk' ] , 1 )
+        #a new version of the detector
+        self.converter.path = seq
+        self.assertEqual( cache.detect( self.converter , seq ) , ( 'FASTA' , 1 ) )
+        self.assertEqual( self.converter.calls , 2 )
+        cache.clear()
+        cache.detect( self.converter , seq )
+        self.assertEqual( self.converter.calls , 3 )
+
+    def testEviction(self):
+        cache = FormatDetectionCache( path = self.cfg.test_dir , size = 2 , memorySize = 0 )
+        cache.EVICTION_INTERVAL = 1
+        paths = [ self._data( 'seq%d' % i , '>s%d\nACGT\n' % i ) for i in range( 4 ) ]
+        for path in paths:
+            cache.detect( self.converter , path )
+        self.assertEqual( cache.getStats()[ 'evicted' ] , 2 )
+        cache.detect( self.converter , paths[3] )
+        self.assertEqual( self.converter.calls , 4 )
+        cache.detect( self.converter , paths[0] )
+        self.assertEqual( self.converter.calls , 5 )
+
+    def testNotDetected(self):
+        raw = self._data( 'raw' , 'ACGT\n' )
+        cache = FormatDetectionCache( path = self.cfg.test_dir , size = 10 , memorySize = 10 )
+        self.assertEqual( cache.detect( self.converter , raw ) , ( None , None ) )
+        self.assertEqual( cache.detect( self.converter , raw ) , ( None , None ) )
+        self.assertEqual( self.converter.calls , 1 )
+        #the failure is not stored on disk
+        other = FormatDetectionCache( path = self.cfg.test_dir , size = 10 , memorySize = 10 )
+        self.assertEqual( other.detect( self.converter , raw ) , ( None , None ) )
+        self.assertEqual( self.converter.calls , 2 )
+        self.assertEqual( other.getStats()[ 'disk' ] , 0 )
+        #and it expires in memory
+        cache = FormatDetectionCache( path = self.cfg.test_dir , size = 10 , memorySize = 10 )
+        cache.NEGATIVE_TTL = 0
+        cache.detect( self.converter , raw )
+        cache.detect( self.converter , raw )
+        self.assertEqual( self.converter.calls , 4 )
+        self.assertEqual( cache.getStats()[ 'memory' ] , 0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
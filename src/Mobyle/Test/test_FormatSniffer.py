@@ -0,0 +1,153 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.MobyleError import MobyleError
+from Mobyle.Converter.FormatSniffer import sniffSequence , sniffAlignment
+from Mobyle.Converter.sniffer_sequence import sniffer_sequence
+
+
+SEQUENCES = {
+'FASTA' : ( """
+>seq1 first sequence
+ACGTACGTAC
+GTAC
+>seq2
+MKV*
+""" , 2 ) ,
+'NBRF' : ( """>P1;CRAB_ANAPL
+ALPHA CRYSTALLIN B CHAIN (ALPHA(B)-CRYSTALLIN).
+  MDITIHNPLI RRPLFSWLAP SRIFDQIFGE HLQESELLPA SPSLSPFLMR
+  SPIFRMPSWL ETGLSEMRLE KDKFSVNLDV KHFSPEELKV KVLGDMVEIH*
+""" , 1 ) ,
+'EMBL' : ( """ID   X56734; SV 1; linear; mRNA; STD; PLN; 10 BP.
+XX
+SQ   Sequence 10 BP; 3 A; 2 C; 3 G; 2 T; 0 other;
+     aacgtgacgt                                                        10
+//
+ID   X56735; SV 1; linear; mRNA; STD; PLN; 4 BP.
+SQ   Sequence 4 BP;
+     acgt                                                               4
+//
+""" , 2 ) ,
+'SWISSPROT' : ( """ID   CYC_HUMAN               Reviewed;         10 AA.
+AC   P99999;
+SQ   SEQUENCE   10 AA;  11749 MW;  6F6D7F0B3B2F9F25 CRC64;
+     MGDVEKGKKI
+//
+""" , 1 ) ,
+'GENBANK' : ( """LOCUS       SCU49845     10 bp    DNA             PLN       21-JUN-1999
+DEFINITION  Saccharomyces cerevisiae TCP1-beta gene.
+ORIGIN
+        1 gatcctccat
+//
+""" , 1 ) ,
+}
+
+ALIGNMENTS = {
+'CLUSTAL' : ( """CLUSTAL W (1.83) multiple sequence alignment
+
+seq1      ACGT-ACGT 8
+seq2      ACGTTACG- 8
+          ****.***
+
+seq1      AC 10
+seq2      AC 10
+""" , 1 ) ,
+'STOCKHOLM' : ( """# STOCKHOLM 1.0
+#=GF ID test
+seq1 ACGT-
+seq2 ACGTT
+//
+""" , 1 ) ,
+'FASTA' : ( """>seq1
+ACGT-
+>seq2
+ACGTT
+""" , 1 ) ,
+'PHYLIPI' : ( """ 2 8
+seq1      ACGT
+seq2      ACGA
+
+TTTT
+TTTA
+""" , 1 ) ,
+'PHYLIPS' : ( """ 2 8
+seq1      ACGT
+TTTT
+seq2      ACGA
+TTTA
+""" , 1 ) ,
+}
+
+
+class FormatSnifferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def _data( self , name , content ):
+        path = os.path.join( self.cfg.test_dir , name )
+        f = open( path , 'w' )
+        f.write( content )
+        f.close()
+        return path
+
+    def testSequences(self):
+        for format , ( content , nb ) in SEQUENCES.items():
+            path = self._data( format , content )
+            self.assertEqual( sniffSequence( path ) , ( format , nb ) , format )
+
+    def testAlignments(self):
+        for format , ( content , nb ) in ALIGNMENTS.items():
+            path = self._data( format , content )
+            self.assertEqual( sniffAlignment( path ) , ( format , nb ) , format )
+
+    def testAmbiguous(self):
+        ambiguous = [ 'ACGTACGT\n' ,
+                      '>seq1\nACGT 12 ACGT\n' ,
+                      'ID   X56734; SV 1; linear;\n' ,
+                      '' ]
+        for content in ambiguous:
+            path = self._data( 'data' , content )
+            self.assertEqual( sniffSequence( path ) , ( None , None ) , content )
+        #sequences of different lengths , one line per sequence is interleaved as well as sequential
+        for content in ( '>seq1\nACGT\n>seq2\nACG\n' , ' 2 4\nseq1      ACGT\nseq2      ACGA\n' ):
+            path = self._data( 'data' , content )
+            self.assertEqual( sniffAlignment( path ) , ( None , None ) , content )
+
+    def testConverter(self):
+        converter = sniffer_sequence( None )
+        self.assertEqual( converter.program_name , 'squizz' )
+        path = self._data( 'seq' , SEQUENCES[ 'FASTA' ][0] )
+        self.assertEqual( converter.detect( path ) , ( 'FASTA' , 2 ) )
+        #the ambiguous data are detected by squizz which is not configured
+        path = self._data( 'raw' , 'ACGT\n' )
+        self.assertRaises( MobyleError , converter.detect , path )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.JobState import JobState , _JobStateCache
+
+DATADIR = os.path.dirname( __file__ )
+
+
+class JobStateCacheTest(unittest.TestCase):
+    """Tests the functionalities of the cache of JobState"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        self.jobDir = os.path.join( self.cfg.results_path() , 'fake_job' , 'A00000000000000' )
+        shutil.copytree( os.path.join( DATADIR , 'fake_job0' ) , self.jobDir )
+        JobState._refs.clear()
+
+    def tearDown(self):
+        JobState._refs.clear()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def testRevalidation(self):
+        stats = JobState.getCacheStats()
+        js1 = JobState( self.jobDir )
+        self.assertTrue( JobState( self.jobDir ) is js1 )
+        #a commit of the cached instance does not invalidate it
+        js1.setSessionKey( 'R12345678901234' )
+        js1.commit()
+        self.assertTrue( JobState( self.jobDir ) is js1 )
+        newStats = JobState.getCacheStats()
+        self.assertEqual( newStats[ 'hits' ] - stats[ 'hits' ] , 2 )
+        self.assertEqual( newStats[ 'misses' ] - stats[ 'misses' ] , 1 )
+        #index.xml replaced by an other process
+        indexPath = os.path.join( self.jobDir , 'index.xml' )
+        fh = open( indexPath )
+        content = fh.read()
+        fh.close()
+        fh = open( indexPath + '.new' , 'w' )
+        fh.write( content.replace( 'R12345678901234' , 'R00000000000000' ) )
+        fh.close()
+        os.rename( indexPath + '.new' , indexPath )
+        js2 = JobState( self.jobDir )
+        self.assertFalse( js2 is js1 )
+        self.assertEqual( js2.getSessionKey() , 'R00000000000000' )
+        self.assertEqual( JobState.getCacheStats()[ 'invalidations' ] - stats[ 'invalidations' ] , 1 )
+
+    def testEviction(self):
+        cache = _JobStateCache( 2 )
+        cache.put( 'a' , 'js_a' , None )
+        cache.put( 'b' , 'js_b' , None )
+        self.assertEqual( cache.get( 'a' , None ) , 'js_a' )
+        cache.put( 'c' , 'js_c' , None )
+        #b is the least recently used
+        self.assertEqual( cache.get( 'b' , None ) , None )
+        self.assertEqual( cache.get( 'a' , None ) , 'js_a' )
+        self.assertEqual( cache.get( 'c' , ( 1 , 2.0 , 3 ) ) , None )
+        self.assertEqual( cache.getStats() , { 'hits' : 2 , 'misses' : 2 , 'evictions' : 1 , 'invalidations' : 1 , 'size' : 1 } )
+        for i in range( 500 ):
+            cache.get( 'a' , None )
+        self.assertTrue( len( cache._usage ) < 200 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+import time
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.JobWatcher import JobWatcher
+
+
+class JobWatcherTest(unittest.TestCase):
+    """Tests the functionalities of JobWatcher"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        self.jobDir = os.path.join( self.cfg.test_dir , 'job' )
+        os.makedirs( self.jobDir )
+        self.statusPath = os.path.join( self.jobDir , 'mobyle_status.xml' )
+        open( self.statusPath , 'w' ).close()
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def _writeStatusLater( self , delay ):
+        pid = os.fork()
+        if not pid:
+            time.sleep( delay )
+            f = open( self.statusPath , 'w' )
+            f.write( '<status/>' )
+            f.close()
+            os._exit( 0 )
+        return pid
+
+    def testChild(self):
+        watcher = JobWatcher()
+        try:
+            pid = os.fork()
+            if not pid:
+                os._exit( 0 )
+            start = time.time()
+            self.assertEqual( watcher.wait() , 'child' )
+            self.assertTrue( time.time() - start < 5 )
+            #the child has been reaped
+            self.assertRaises( OSError , os.waitpid , pid , os.WNOHANG )
+        finally:
+            watcher.close()
+
+    def _testStatus( self , use_inotify ):
+        watcher = JobWatcher( use_inotify = use_inotify )
+        if use_inotify and watcher._inotify is None:
+            watcher.close()
+            self.skipTest( "inotify is not available" )
+        try:
+            #a file which is not a status file does not wake up the watcher
+            watcher.watch( self.jobDir )
+            open( os.path.join( self.jobDir , 'blast.out' ) , 'w' ).close()
+            watcher.MAX_SLEEP = 0.2
+            self.assertEqual( watcher.wait() , 'timeout' )
+            watcher.MAX_SLEEP = 10
+            #make sure the mtime will change
+            time.sleep( 1.1 )
+            start = time.time()
+            pid = self._writeStatusLater( 0.1 )
+            reason = watcher.wait()
+            if reason == 'child':
+                #the writer exited before the watcher noticed the new status
+                reason = watcher.wait()
+            else:
+                os.waitpid( pid , 0 )
+            self.assertEqual( reason , 'status' )
+            self.assertTrue( time.time() - start < 5 )
+        finally:
+            watcher.close()
+
+    def testStatusInotify(self):
+        self._testStatus( True )
+
+    def testStatusPolling(self):
+        self._testStatus( False )
+
+    def testRemoteBackoff(self):
+        watcher = JobWatcher()
+        try:
+            watcher.MIN_REMOTE_DELAY = 0.1
+            watcher.remote_polled( True )
+            self.assertEqual( watcher.remote_delay , 0.1 )
+            watcher.remote_polled( False )
+            watcher.remote_polled( False )
+            self.assertAlmostEqual( watcher.remote_delay , 0.4 )
+            self.assertFalse( watcher.remote_due() )
+            self.assertEqual( watcher.wait( remote = True ) , 'remote' )
+            self.assertTrue( watcher.remote_due() )
+            for i in range( 20 ):
+                watcher.remote_polled( False )
+            self.assertEqual( watcher.remote_delay , watcher.MAX_REMOTE_DELAY )
+        finally:
+            watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
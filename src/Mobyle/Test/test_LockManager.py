@@ -0,0 +1,205 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+import fcntl
+import signal
+import threading
+import time
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.LockManager import LockManager
+
+
+class LockManagerTest(unittest.TestCase):
+    """Tests the functionalities of LockManager"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self.fileName = os.path.join( self.cfg.test_dir , 'locked_file' )
+        open( self.fileName , 'w' ).close()
+        self.lm = LockManager()
+        self.lm.setTimeout( 2 )
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def testAcquireRelease(self):
+        File = open( self.fileName , 'r+' )
+        self.lm.acquire( File , LockManager.WRITE )
+        self.lm.release( File )
+        self.lm.acquire( File , LockManager.READ )
+        self.lm.release( File )
+        File.close()
+        stats = self.lm.getStats( self.fileName )
+        self.assertEqual( stats[ 'acquired' ] , 2 )
+        self.assertEqual( stats[ 'timeouts' ] , 0 )
+
+    def testFifo(self):
+        File = open( self.fileName , 'r+' )
+        self.lm.acquire( File , LockManager.WRITE )
+        served = []
+        def waiter( rank ):
+            f = open( self.fileName , 'r+' )
+            self.lm.acquire( f , LockManager.WRITE )
+            served.append( rank )
+            self.lm.release( f )
+            f.close()
+        threads = []
+        for rank in range( 4 ):
+            t = threading.Thread( target = waiter , args = ( rank , ) )
+            t.start()
+            threads.append( t )
+            #let the thread enter the queue before starting the next one
+            time.sleep( 0.05 )
+        self.lm.release( File )
+        for t in threads:
+            t.join()
+        File.close()
+        self.assertEqual( served , range( 4 ) )
+
+    def testTimeoutOtherProcess(self):
+        childPid = os.fork()
+        if not childPid:
+            f = open( self.fileName , 'r+' )
+            fcntl.lockf( f , fcntl.LOCK_EX )
+            time.sleep( 1 )
+            os._exit( 0 )
+        time.sleep( 0.2 )
+        File = open( self.fileName , 'r' )
+        self.assertRaises( IOError , self.lm.acquire , File , LockManager.READ , timeout = 0.1 )
+        stats = self.lm.getStats( self.fileName )
+        self.assertEqual( stats[ 'timeouts' ] , 1 )
+        self.assertEqual( stats[ 'holder_pid' ] , childPid )
+        self.assertEqual( stats[ 'holder_type' ] , 'WRITE' )
+        #the lock is released by the child before the deadline
+        self.lm.acquire( File , LockManager.READ , timeout = 5 )
+        self.lm.release( File )
+        File.close()
+        os.waitpid( childPid , 0 )
+        stats = self.lm.getStats( self.fileName )
+        self.assertEqual( stats[ 'acquired' ] , 1 )
+        self.assertEqual( stats[ 'contended' ] , 1 )
+        self.assertTrue( stats[ 'max_wait' ] > 0.3 )
+
+    def testContention(self):
+        #several processes increment a counter, the lost updates reveal a broken mutual exclusion
+        open( self.fileName , 'w' ).write( '0' )
+        nb_children = 5
+        nb_increments = 10
+        children = []
+        for i in range( nb_children ):
+            childPid = os.fork()
+            if not childPid:
+                status = 1
+                try:
+                    lm = LockManager()
+                    lm.setTimeout( 30 )
+                    for j in range( nb_increments ):
+                        f = open( self.fileName , 'r+' )
+                        lm.acquire( f , LockManager.WRITE )
+                        value = int( f.read() )
+                        time.sleep( 0.005 )
+                        f.seek( 0 )
+                        f.write( str( value + 1 ) )
+                        f.flush()
+                        lm.release( f )
+                        f.close()
+                    status = 0
+                finally:
+                    os._exit( status )
+            children.append( childPid )
+        for childPid in children:
+            pid , status = os.waitpid( childPid , 0 )
+            self.assertEqual( status , 0 )
+        self.assertEqual( int( open( self.fileName ).read() ) , nb_children * nb_increments )
+
+    def _holdInChild( self , duration ):
+        r , w = os.pipe()
+        childPid = os.fork()
+        if not childPid:
+            try:
+                os.close( r )
+                f = open( self.fileName , 'r+' )
+                fcntl.lockf( f , fcntl.LOCK_EX )
+                os.write( w , 'locked' )
+                time.sleep( duration )
+            finally:
+                os._exit( 0 )
+        os.close( w )
+        os.read( r , 6 )
+        os.close( r )
+        return childPid
+
+    def testBlockingWithDeadline(self):
+        #the main thread waits in lockf, it is not polling
+        def poll( *args ):
+            self.fail( "the main thread polls the lock" )
+        self.lm._lockPolling = poll
+        childPid = self._holdInChild( 0.3 )
+        File = open( self.fileName , 'r+' )
+        start = time.time()
+        self.lm.acquire( File , LockManager.WRITE , timeout = 5 )
+        waited = time.time() - start
+        self.lm.release( File )
+        File.close()
+        os.waitpid( childPid , 0 )
+        self.assertTrue( 0.2 < waited < 1 , waited )
+        #the timer and the handler are restored
+        self.assertEqual( signal.getitimer( signal.ITIMER_REAL ) , ( 0.0 , 0.0 ) )
+        self.assertEqual( signal.getsignal( signal.SIGALRM ) , signal.SIG_DFL )
+
+    def testWithoutDeadline(self):
+        def poll( *args ):
+            self.fail( "the lock is polled" )
+        self.lm._lockPolling = poll
+        self.lm.setTimeout( None )
+        childPid = self._holdInChild( 0.3 )
+        File = open( self.fileName , 'r+' )
+        self.lm.acquire( File , LockManager.WRITE )
+        self.lm.release( File )
+        File.close()
+        os.waitpid( childPid , 0 )
+        stats = self.lm.getStats( self.fileName )
+        self.assertEqual( stats[ 'acquired' ] , 1 )
+        self.assertEqual( stats[ 'holder_pid' ] , childPid )
+
+    def testTimeoutInThread(self):
+        #the threads other than the main thread cannot use the alarm
+        childPid = self._holdInChild( 1 )
+        errors = []
+        def waiter():
+            f = open( self.fileName , 'r+' )
+            try:
+                self.lm.acquire( f , LockManager.WRITE , timeout = 0.1 )
+            except IOError , err:
+                errors.append( err )
+            f.close()
+        t = threading.Thread( target = waiter )
+        t.start()
+        t.join()
+        os.waitpid( childPid , 0 )
+        self.assertEqual( len( errors ) , 1 )
+        self.assertEqual( self.lm.getStats( self.fileName )[ 'timeouts' ] , 1 )
+
+
+if __name__ == '__main__':
+    unittest.main()
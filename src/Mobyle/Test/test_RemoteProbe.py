@@ -0,0 +1,129 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import socket
+import threading
+from BaseHTTPServer import HTTPServer , BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.RemoteProbe import RemoteJobProbe , HostBreaker
+from Mobyle.MobyleError import MobyleError
+
+
+class PortalHandler( BaseHTTPRequestHandler ):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup( self ):
+        BaseHTTPRequestHandler.setup( self )
+        self.server.connections += 1
+
+    def do_HEAD( self ):
+        self.server.requests += 1
+        if self.path.startswith( '/jobs/moved/' ):
+            self.send_response( 302 )
+            self.send_header( 'Location' , '/jobs/ok/index.xml' )
+        elif self.path.startswith( '/jobs/ok/' ):
+            self.send_response( 200 )
+        elif self.path.startswith( '/jobs/error/' ):
+            self.send_response( 500 )
+        else:
+            self.send_response( 404 )
+        self.send_header( 'Content-Length' , '0' )
+        self.end_headers()
+
+    def log_message( self , format , *args ):
+        pass
+
+
+class Portal( ThreadingMixIn , HTTPServer ):
+
+    daemon_threads = True
+
+    def __init__( self ):
+        HTTPServer.__init__( self , ( '127.0.0.1' , 0 ) , PortalHandler )
+        self.connections = 0
+        self.requests = 0
+
+
+class RemoteProbeTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.portal = Portal()
+        self.thread = threading.Thread( target = self.portal.serve_forever )
+        self.thread.setDaemon( True )
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d" % self.portal.server_address[1]
+        #a port where nobody listens
+        s = socket.socket()
+        s.bind( ( '127.0.0.1' , 0 ) )
+        self.deadUrl = "http://127.0.0.1:%d" % s.getsockname()[1]
+        s.close()
+        self.breaker = HostBreaker( ttl = 60 )
+        self.probe = RemoteJobProbe( threads = 4 , breaker = self.breaker )
+
+    def tearDown(self):
+        self.portal.shutdown()
+        self.portal.server_close()
+
+    def testExists(self):
+        jobs = dict( [ ( self.url + '/jobs/ok/A%d' % i , 1 ) for i in range( 6 ) ] )
+        jobs[ self.url + '/jobs/gone/B0' ] = 0
+        jobs[ self.url + '/jobs/moved/C0' ] = 1
+        jobs[ self.url + '/jobs/error/D0' ] = 2
+        self.assertEqual( self.probe.exists( jobs.keys() ) , jobs )
+        #the connections are reused
+        self.assertEqual( self.portal.requests , 10 )
+        self.assertTrue( self.portal.connections <= RemoteJobProbe.HOST_CONNECTIONS )
+
+    def testBreaker(self):
+        jobs = [ self.deadUrl + '/jobs/ok/A%d' % i for i in range( 10 ) ]
+        self.assertEqual( set( self.probe.exists( jobs ).values() ) , set( [ 2 ] ) )
+        self.assertTrue( self.breaker.isDown( self.deadUrl[7:] ) )
+        self.assertFalse( self.breaker.isDown( self.url[7:] ) )
+        #the verdict is kept , the host is not requested anymore
+        results = self.probe.run( [ ( self.deadUrl[7:] , lambda : 1 ) , ( self.url[7:] , lambda : 2 ) ] )
+        self.assertEqual( results[1] , ( 2 , None ) )
+        self.assertTrue( isinstance( results[0][1] , MobyleError ) )
+        #at the end of the ttl one request is allowed, it opens the breaker again if it fails
+        breaker = HostBreaker( ttl = 0 )
+        for i in range( HostBreaker.FAILURE_THRESHOLD ):
+            breaker.failed( 'host' )
+        self.assertTrue( 'host' in breaker._downUntil )
+        self.assertFalse( breaker.isDown( 'host' ) )
+        breaker.failed( 'host' )
+        self.assertTrue( 'host' in breaker._downUntil )
+        breaker.isDown( 'host' )
+        breaker.succeeded( 'host' )
+        breaker.failed( 'host' )
+        self.assertFalse( 'host' in breaker._downUntil )
+
+    def testRun(self):
+        def fail():
+            raise IOError( "connection refused" )
+        results = self.probe.run( [ ( 'host1' , lambda : 1 ) , ( 'host1' , fail ) , ( 'host2' , lambda : 3 ) ] )
+        self.assertEqual( results[0] , ( 1 , None ) )
+        self.assertEqual( results[1][0] , None )
+        self.assertTrue( isinstance( results[1][1] , IOError ) )
+        self.assertEqual( results[2] , ( 3 , None ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import time
+import shutil
+import socket
+import signal
+import cPickle
+import tempfile
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.MobyleError import MobyleError
+from Mobyle.RunnerDaemon import RunnerDaemon , submit
+
+
+class FakeRunnerChild( object ):
+    """
+    write the job description and the process ids in the job directory in place of running the job
+    """
+
+    @staticmethod
+    def runFromFather( fromFather ):
+        os.chdir( fromFather[ 'dirPath' ] )
+        f = open( 'ran' , 'w' )
+        f.write( "%s %d %d" %( fromFather[ 'commandLine' ] , os.getpid() , os.getsid( 0 ) ) )
+        f.close()
+
+
+class TestDaemon( RunnerDaemon ):
+
+    POLL_INTERVAL = 0.05
+
+    def _preload( self ):
+        self._runnerChild = FakeRunnerChild
+
+
+class RunnerDaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self._logdir = self.cfg._logdir
+        self.cfg._logdir = self.cfg.test_dir
+        self.socketPath = os.path.join( self.cfg.test_dir , 'runner.sock' )
+        self.daemon_pid = None
+
+    def tearDown(self):
+        if self.daemon_pid:
+            os.kill( self.daemon_pid , signal.SIGTERM )
+            os.waitpid( self.daemon_pid , 0 )
+        self.cfg._logdir = self._logdir
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def _startDaemon( self ):
+        self.daemon_pid = os.fork()
+        if not self.daemon_pid:
+            try:
+                TestDaemon( self.socketPath , 2 , jobsRoot = self.cfg.test_dir ).serve()
+            finally:
+                os._exit( 0 )
+        for i in range( 100 ):
+            if os.path.exists( self.socketPath ):
+                break
+            time.sleep( 0.05 )
+
+    def _job( self , name ):
+        jobDir = os.path.join( self.cfg.test_dir , name )
+        os.makedirs( jobDir )
+        fh = open( os.path.join( jobDir , '.forChild.dump' ) , 'w' )
+        cPickle.dump( { 'dirPath' : jobDir , 'commandLine' : 'cmd_%s' % name } , fh )
+        fh.close()
+        return jobDir
+
+    def _waitResult( self , jobDir ):
+        path = os.path.join( jobDir , 'ran' )
+        for i in range( 100 ):
+            if os.path.exists( path ) and os.path.getsize( path ):
+                return open( path ).read().split()
+            time.sleep( 0.05 )
+        self.fail( "the job %s has not been run" % jobDir )
+
+    def testNoDaemon(self):
+        jobDir = self._job( 'job1' )
+        self.assertRaises( socket.error , submit , self.socketPath , jobDir )
+
+    def testSubmit(self):
+        self._startDaemon()
+        pids = []
+        for name in ( 'job1' , 'job2' , 'job3' ):
+            jobDir = self._job( name )
+            pid = submit( self.socketPath , jobDir )
+            cmd , job_pid , job_sid = self._waitResult( jobDir )
+            self.assertEqual( cmd , 'cmd_%s' % name )
+            self.assertEqual( int( job_pid ) , pid )
+            #the job is detached from the daemon
+            self.assertEqual( int( job_sid ) , pid )
+            pids.append( pid )
+        #each job is run by its own worker
+        self.assertEqual( len( set( pids ) ) , 3 )
+
+    def testBadJob(self):
+        self._startDaemon()
+        jobDir = os.path.join( self.cfg.test_dir , 'nojob' )
+        os.makedirs( jobDir )
+        self.assertRaises( MobyleError , submit , self.socketPath , jobDir )
+        #the worker which refused the job is still available
+        jobDir = self._job( 'job1' )
+        submit( self.socketPath , jobDir )
+        self._waitResult( jobDir )
+
+    def testAlreadyRunning(self):
+        self._startDaemon()
+        self.assertRaises( MobyleError , TestDaemon( self.socketPath , 1 , jobsRoot = self.cfg.test_dir )._bind )
+
+    def testSocketMode(self):
+        self._startDaemon()
+        self.assertEqual( os.stat( self.socketPath ).st_mode & 0777 , 0600 )
+
+    def testOutsideJobsRoot(self):
+        self._startDaemon()
+        outside = tempfile.mkdtemp()
+        try:
+            fh = open( os.path.join( outside , '.forChild.dump' ) , 'w' )
+            cPickle.dump( { 'dirPath' : outside , 'commandLine' : 'cmd_outside' } , fh )
+            fh.close()
+            self.assertRaises( MobyleError , submit , self.socketPath , outside )
+            #neither through a relative path nor a link
+            self.assertRaises( MobyleError , submit , self.socketPath , os.path.join( self.cfg.test_dir , os.path.relpath( outside , self.cfg.test_dir ) ) )
+            link = os.path.join( self.cfg.test_dir , 'link' )
+            os.symlink( outside , link )
+            self.assertRaises( MobyleError , submit , self.socketPath , link )
+            time.sleep( 0.2 )
+            self.assertFalse( os.path.exists( os.path.join( outside , 'ran' ) ) )
+        finally:
+            shutil.rmtree( outside , ignore_errors = True )
+        #the workers which refused the jobs are still available
+        jobDir = self._job( 'job1' )
+        submit( self.socketPath , jobDir )
+        self._waitResult( jobDir )
+
+
+if __name__ == '__main__':
+    unittest.main()
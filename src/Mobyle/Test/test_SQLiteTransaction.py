@@ -0,0 +1,222 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+import time
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+
+from Mobyle.SQLiteTransaction import SQLiteTransaction , migrate
+from Mobyle.Transaction import Transaction
+from Mobyle.MobyleError import MobyleError, SessionError
+from Mobyle.Classes.DataType import DataTypeFactory
+from Mobyle.Service import MobyleType
+from Mobyle.Status import Status
+
+DATADIR = os.path.dirname( __file__ )
+
+class SQLiteTransactionTest(unittest.TestCase):
+    """Tests the functionalities of SQLiteTransaction"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree(self.cfg.test_dir, ignore_errors=True)
+        os.makedirs(self.cfg.test_dir)
+
+        self.sessionKey = "Q12345678901234"
+        self.sessionDir = os.path.join( self.cfg.test_dir , self.sessionKey )
+        os.makedirs( self.sessionDir )
+
+        self.email  = 'dummy@domain.fr'
+        self.passwd = 'dummypass'
+
+        self.xmlSourcePath = os.path.join( DATADIR , 'session_test.xml')
+        self.xmlPath = os.path.join( self.sessionDir , '.session.xml' )
+        self.sessionPath = os.path.join( self.sessionDir , '.session.db' )
+        self.dataID = [ "f835ddf28cb6aa776a41d7c71ec9cb5a.out" , "16bd6f89e732eb7cb0bbc13c65d202d3.aln" ]
+        self.jobID = [ "file://tmp/mobyle/results/dnadist/X25423048243999" ,
+                       "file://tmp/mobyle/results/dnadist/G25406684175968" ]
+        dtf = DataTypeFactory()
+        self.mobyleType = MobyleType( dtf.newDataType( 'Sequence' ) , bioTypes = [ 'Protein' ] , dataFormat =  'FASTA' )
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors= True )
+
+    def _migrate(self):
+        shutil.copy( self.xmlSourcePath , self.xmlPath )
+        migrate( self.xmlPath , self.sessionPath )
+
+    def testTransaction(self):
+        SQLiteTransaction.create( self.sessionPath , False , False )
+        transaction = SQLiteTransaction( self.sessionPath, SQLiteTransaction.WRITE )
+        self.assertRaises( SessionError , SQLiteTransaction , self.sessionPath, SQLiteTransaction.READ )
+        transaction.rollback()
+        transaction = SQLiteTransaction( self.sessionPath, SQLiteTransaction.READ )
+        transaction.rollback()
+        self.assertRaises( MobyleError , SQLiteTransaction , self.sessionPath, None )
+        self.assertRaises( SessionError , SQLiteTransaction , str( None ) , SQLiteTransaction.READ )
+
+    def testCreation(self):
+        self.assertRaises( SessionError , SQLiteTransaction.create , self.sessionPath , False , False , passwd = self.passwd )
+        self.assertRaises( SessionError , SQLiteTransaction.create , self.sessionPath , True , False , userEmail = self.email )
+        SQLiteTransaction.create( self.sessionPath , True , False , userEmail = self.email , passwd = self.passwd )
+        self.assertRaises( SessionError , SQLiteTransaction.create , self.sessionPath , False , False )
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.READ )
+        self.assertEqual( transaction.getID() , self.sessionKey )
+        self.assertEqual( transaction.getEmail() , self.email )
+        self.assertTrue( transaction.isAuthenticated() )
+        self.assertFalse( transaction.isActivated() )
+        self.assertEqual( transaction.getTicket() , ( None , None ) )
+        transaction.commit()
+
+    def testCommitRollback(self):
+        SQLiteTransaction.create( self.sessionPath , False , False )
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        transaction.activate()
+        transaction.rollback()
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        self.assertFalse( transaction.isActivated() )
+        transaction.activate()
+        transaction.commit()
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.READ )
+        self.assertTrue( transaction.isActivated() )
+        transaction.commit()
+
+    def testMigrate(self):
+        shutil.copy( self.xmlSourcePath , self.xmlPath )
+        xmlTransaction = Transaction( self.xmlPath , Transaction.READ )
+        xmlDatas = xmlTransaction.getAllData()
+        xmlJobs = xmlTransaction.getAllJobs()
+        xmlLabels = xmlTransaction.getAllUniqueLabels()
+        xmlTransaction.rollback()
+        migrate( self.xmlPath , self.sessionPath )
+        #a concurrent request has already migrated the session and written in it
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        transaction.setEmail( 'migrated@test.org' )
+        transaction.commit()
+        migrate( self.xmlPath , self.sessionPath )
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.READ )
+        self.assertEqual( transaction.getEmail() , 'migrated@test.org' )
+        datas = transaction.getAllData()
+        jobs = transaction.getAllJobs()
+        self.assertEqual( transaction.getAllUniqueLabels() , xmlLabels )
+        transaction.commit()
+        self.assertEqual( len( datas ) , len( xmlDatas ) )
+        for data , xmlData in zip( datas , xmlDatas ):
+            for key in ( 'dataName' , 'userName' , 'size' , 'dataBegin' , 'inputModes' ):
+                self.assertEqual( data[ key ] , xmlData[ key ] )
+            self.assertEqual( str( data[ 'Type' ] ) , str( xmlData[ 'Type' ] ) )
+            self.assertEqual( sorted( data[ 'usedBy' ] ) , sorted( xmlData[ 'usedBy' ] ) )
+            self.assertEqual( sorted( data[ 'producedBy' ] ) , sorted( xmlData[ 'producedBy' ] ) )
+        self.assertEqual( len( jobs ) , len( xmlJobs ) )
+        for job , xmlJob in zip( jobs , xmlJobs ):
+            for key in ( 'jobID' , 'userName' , 'programName' , 'status' , 'date' ):
+                self.assertEqual( job[ key ] , xmlJob[ key ] )
+
+    def testData(self):
+        self._migrate()
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        self.assertTrue( transaction.hasData( self.dataID[0] ) )
+        transaction.renameData( self.dataID[0] , 'new_name' )
+        self.assertRaises( ValueError , transaction.renameData , 'nonexistent' , 'new_name' )
+        transaction.createData( 'new.fasta' , 'seq.fasta' , 12 , self.mobyleType , '>seq\nACGT' , [ 'paste' ] , usedBy = [ self.jobID[0] ] )
+        self.assertRaises( ValueError , transaction.createData , 'new.fasta' , 'seq.fasta' , 12 , self.mobyleType , '' , [] )
+        transaction.addInputModes( 'new.fasta' , [ 'paste' , 'upload' ] )
+        transaction.commit()
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        self.assertEqual( transaction.getData( self.dataID[0] )[ 'userName' ] , 'new_name' )
+        data = transaction.getData( 'new.fasta' )
+        self.assertEqual( data[ 'inputModes' ] , [ 'paste' , 'upload' ] )
+        self.assertEqual( data[ 'usedBy' ] , [ self.jobID[0] ] )
+        self.assertEqual( data[ 'size' ] , 12 )
+        self.assertTrue( 'new.fasta' in transaction.getJob( self.jobID[0] )[ 'dataUsed' ] )
+        transaction.removeData( 'new.fasta' )
+        self.assertFalse( transaction.hasData( 'new.fasta' ) )
+        self.assertFalse( 'new.fasta' in transaction.getJob( self.jobID[0] )[ 'dataUsed' ] )
+        self.assertRaises( ValueError , transaction.getData , 'new.fasta' )
+        transaction.commit()
+
+    def _testDiskUsage( self , transactionClass , path ):
+        transactionClass.create( path , False , False )
+        transaction = transactionClass( path , transactionClass.WRITE )
+        self.assertEqual( transaction.getDiskUsage() , None )
+        #the usage is not counted before the first scan
+        transaction.createData( 'seq1.fasta' , 'seq1.fasta' , 12 , self.mobyleType , '>seq\nACGT' , [ 'paste' ] )
+        self.assertEqual( transaction.getDiskUsage() , None )
+        transaction.setDiskUsage( 100 , 1000.5 )
+        transaction.createData( 'seq2.fasta' , 'seq2.fasta' , 30 , self.mobyleType , '>seq\nACGT' , [ 'paste' ] )
+        transaction.commit()
+        transaction = transactionClass( path , transactionClass.WRITE )
+        self.assertEqual( transaction.getDiskUsage() , ( 130 , 1000.5 ) )
+        transaction.removeData( 'seq1.fasta' )
+        self.assertEqual( transaction.getDiskUsage() , ( 118 , 1000.5 ) )
+        transaction.commit()
+
+    def testDiskUsage(self):
+        self._testDiskUsage( SQLiteTransaction , self.sessionPath )
+        self._testDiskUsage( Transaction , self.xmlPath )
+
+    def testJobAnnotations(self):
+        self._migrate()
+        for transactionClass , path in ( ( SQLiteTransaction , self.sessionPath ) , ( Transaction , self.xmlPath ) ):
+            transaction = transactionClass( path , transactionClass.WRITE )
+            transaction.setJobLabels( self.jobID[0] , [ 'label2' , 'label1' ] )
+            transaction.setJobDescription( self.jobID[0] , 'a description' )
+            transaction.commit()
+            transaction = transactionClass( path , transactionClass.READ )
+            jobs = dict( [ ( job[ 'jobID' ] , job ) for job in transaction.getAllJobs( annotations = True ) ] )
+            for jobID in self.jobID:
+                self.assertEqual( jobs[ jobID ][ 'labels' ] , transaction.getJobLabels( jobID ) )
+                self.assertEqual( jobs[ jobID ][ 'description' ] , transaction.getJobDescription( jobID ) )
+            self.assertEqual( jobs[ self.jobID[0] ][ 'labels' ] , [ 'label2' , 'label1' ] )
+            self.assertEqual( jobs[ self.jobID[0] ][ 'description' ] , 'a description' )
+            self.assertFalse( 'labels' in transaction.getAllJobs()[0] )
+            transaction.commit()
+
+    def testJob(self):
+        self._migrate()
+        newJobID = 'file://tmp/mobyle/results/clustalw/B12345678901234'
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        self.assertTrue( transaction.hasJob( self.jobID[1] ) )
+        transaction.createJob( newJobID , 'my job' , 'clustalw' , Status( code = 1 ) , time.localtime() , [ self.dataID[1] ] , [] )
+        self.assertRaises( ValueError , transaction.createJob , newJobID , 'my job' , 'clustalw' , Status( code = 1 ) , time.localtime() , [] , [] )
+        transaction.updateJobStatus( newJobID , Status( code = 3 ) )
+        transaction.renameJob( newJobID , 'my renamed job' )
+        transaction.setJobLabels( newJobID , [ 'label2' , 'label1' ] )
+        transaction.setJobDescription( newJobID , 'a description' )
+        transaction.commit()
+        transaction = SQLiteTransaction( self.sessionPath , SQLiteTransaction.WRITE )
+        job = transaction.getJob( newJobID )
+        self.assertEqual( job[ 'status' ] , Status( code = 3 ) )
+        self.assertEqual( job[ 'userName' ] , 'my renamed job' )
+        self.assertEqual( job[ 'dataUsed' ] , [ self.dataID[1] ] )
+        self.assertEqual( transaction.getJobLabels( newJobID ) , [ 'label2' , 'label1' ] )
+        self.assertEqual( transaction.getJobDescription( newJobID ) , 'a description' )
+        self.assertTrue( newJobID in transaction.getData( self.dataID[1] )[ 'usedBy' ] )
+        removed = transaction.removeJob( newJobID )
+        self.assertEqual( removed[ 'jobID' ] , newJobID )
+        self.assertFalse( transaction.hasJob( newJobID ) )
+        self.assertFalse( newJobID in transaction.getData( self.dataID[1] )[ 'usedBy' ] )
+        self.assertRaises( ValueError , transaction.getJobLabels , newJobID )
+        self.assertRaises( ValueError , transaction.updateJobStatus , newJobID , Status( code = 4 ) )
+        transaction.commit()
+
+
+if __name__ == '__main__':
+    unittest.main()
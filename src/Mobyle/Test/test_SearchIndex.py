@@ -0,0 +1,110 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+from Mobyle.Registry import registry , ProgramDef
+from Mobyle.SearchIndex import SearchIndex
+
+PROGRAM = """<program>
+  <head>
+    <name>%s</name>
+    <doc>
+      <title>%s</title>
+      <description><text lang="en">%s</text></description>
+    </doc>
+    <category>%s</category>
+  </head>
+  <parameters/>
+</program>
+"""
+
+class SearchIndexTest(unittest.TestCase):
+    """Tests the functionalities of SearchIndex"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.index_path() )
+        self.programs = []
+        for name , title , description , category in ( ( 'blastp' , 'Protein BLAST' , 'search a protein database' , 'database:search' ) ,
+                                                       ( 'clustalw' , 'Multiple alignment' , 'align protein or nucleic sequences' , 'alignment:multiple' ) ,
+                                                       ( 'protdist' , 'Distance matrix' , 'compute distances from protein sequences' , 'phylogeny' ) ) :
+            path = os.path.join( self.cfg.test_dir , name + '.xml' )
+            fh = open( path , 'w' )
+            fh.write( PROGRAM %( name , title , description , category ) )
+            fh.close()
+            program = ProgramDef( registry.getProgramUrl( name = name ) ,
+                                  name = name ,
+                                  path = path ,
+                                  server = registry.serversByName[ 'local' ]
+                                  )
+            registry.addProgram( program )
+            self.programs.append( program )
+        SearchIndex.generate( 'program' , self.cfg.index_path() , registry )
+
+    def tearDown(self):
+        registry.pruneServices( self.programs )
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def testSearch(self):
+        index = SearchIndex( 'program' )
+        results = index.search( [ 'prot' ] )
+        #the match in the name first
+        self.assertEqual( [ s.name for s , matches in results ] , [ 'protdist' , 'blastp' , 'clustalw' ] )
+        self.assertTrue( ( 'name' , '<b>prot</b>dist' ) in results[0][1] )
+        self.assertTrue( ( 'title' , '<b>Prot</b>ein BLAST' ) in results[1][1] )
+        #the services which match more keywords first
+        results = index.search( [ 'align' , 'protein' ] )
+        self.assertEqual( results[0][0].name , 'clustalw' )
+        #only the beginning of the words
+        self.assertEqual( index.search( [ 'lastp' ] ) , [] )
+        self.assertEqual( index.search( [] ) , [] )
+        #the registry is not modified
+        self.assertEqual( len( [ p for p in registry.programs if p in self.programs ] ) , 3 )
+
+    def testFilterRegistry(self):
+        index = SearchIndex( 'program' )
+        index.filterRegistry( [ 'phylogeny' ] )
+        self.assertFalse( registry.has_service( self.programs[0] ) )
+        self.assertFalse( registry.has_service( self.programs[1] ) )
+        self.assertTrue( registry.has_service( self.programs[2] ) )
+        self.assertFalse( self.programs[0] in registry.programs )
+        self.assertEqual( self.programs[2].searchMatches , [ ( 'categories' , '<b>phylogeny</b>' ) ] )
+
+    def testFilterRegistrySubstring(self):
+        index = SearchIndex( 'program' )
+        #any part of a word, as before the inverted index
+        index.filterRegistry( [ 'LASTP' ] )
+        self.assertTrue( registry.has_service( self.programs[0] ) )
+        self.assertFalse( registry.has_service( self.programs[1] ) )
+        self.assertFalse( registry.has_service( self.programs[2] ) )
+        self.assertTrue( ( 'name' , 'b<b>lastp</b>' ) in self.programs[0].searchMatches )
+
+    def testFilterRegistryPhrase(self):
+        index = SearchIndex( 'program' )
+        index.filterRegistry( [ 'protein or nucl' , 'trix' ] )
+        self.assertFalse( registry.has_service( self.programs[0] ) )
+        self.assertTrue( registry.has_service( self.programs[1] ) )
+        self.assertTrue( registry.has_service( self.programs[2] ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
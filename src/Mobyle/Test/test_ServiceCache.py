@@ -0,0 +1,120 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import shutil
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+import Mobyle.Parser
+from Mobyle.Parser import ServiceCache
+
+DATADIR = os.path.dirname( __file__ )
+
+
+class ServiceCacheTest(unittest.TestCase):
+    """Tests the functionalities of ServiceCache"""
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+        os.makedirs( self.cfg.test_dir )
+        self.cachePath = os.path.join( self.cfg.test_dir , 'compiled' )
+        self.programPath = os.path.join( self.cfg.test_dir , 'program.xml' )
+        shutil.copy( os.path.join( DATADIR , 'program.xml' ) , self.programPath )
+
+    def tearDown(self):
+        shutil.rmtree( self.cfg.test_dir , ignore_errors = True )
+
+    def testMemory(self):
+        cache = ServiceCache( path = None , size = 10 )
+        service1 = cache.getService( self.programPath )
+        service2 = cache.getService( self.programPath )
+        self.assertEqual( cache.getStats() , { 'memory' : 1 , 'disk' : 0 , 'parsed' : 1 , 'evicted' : 0 } )
+        #each caller get its own instance
+        self.assertFalse( service1 is service2 )
+        self.assertEqual( service2.getName() , 'program' )
+        self.assertEqual( service2.getUrl() , self.programPath )
+        self.assertEqual( service1.getAllParameterNameByArgpos() , service2.getAllParameterNameByArgpos() )
+        service2.setValue( 'param1' , 'user_value' )
+        self.assertEqual( cache.getService( self.programPath ).getValue( 'param1' ) , 'param1_vdef' )
+        self.assertFalse( os.path.exists( self.cachePath ) )
+
+    def testDisk(self):
+        ServiceCache( path = self.cachePath , size = 10 ).getService( self.programPath )
+        self.assertEqual( len( os.listdir( self.cachePath ) ) , 1 )
+        #the compiled file can be read by the other users ( cgi , job processes )
+        compiled = os.path.join( self.cachePath , os.listdir( self.cachePath )[0] )
+        self.assertEqual( os.stat( compiled ).st_mode & 0777 , 0644 )
+        cache = ServiceCache( path = self.cachePath , size = 10 )
+        service = cache.getService( self.programPath )
+        self.assertEqual( service.getName() , 'program' )
+        self.assertEqual( cache.getStats()[ 'disk' ] , 1 )
+        self.assertEqual( cache.getStats()[ 'parsed' ] , 0 )
+        #a touched file is not parsed again
+        stat = os.stat( self.programPath )
+        os.utime( self.programPath , ( stat.st_atime , stat.st_mtime + 10 ) )
+        cache = ServiceCache( path = self.cachePath , size = 10 )
+        cache.getService( self.programPath )
+        self.assertEqual( cache.getStats()[ 'disk' ] , 1 )
+        self.assertEqual( cache.getStats()[ 'parsed' ] , 0 )
+
+    def testInvalidation(self):
+        cache = ServiceCache( path = self.cachePath , size = 10 )
+        cache.getService( self.programPath )
+        fh = open( self.programPath )
+        content = fh.read()
+        fh.close()
+        fh = open( self.programPath , 'w' )
+        fh.write( content.replace( '<name>program</name>' , '<name>program2</name>' ) )
+        fh.close()
+        stat = os.stat( self.programPath )
+        os.utime( self.programPath , ( stat.st_atime , stat.st_mtime + 10 ) )
+        self.assertEqual( cache.getService( self.programPath ).getName() , 'program2' )
+        self.assertEqual( cache.getStats()[ 'parsed' ] , 2 )
+        cache = ServiceCache( path = self.cachePath , size = 10 )
+        self.assertEqual( cache.getService( self.programPath ).getName() , 'program2' )
+        self.assertEqual( cache.getStats()[ 'disk' ] , 1 )
+
+    def testEviction(self):
+        otherPath = os.path.join( self.cfg.test_dir , 'other.xml' )
+        shutil.copy( self.programPath , otherPath )
+        cache = ServiceCache( path = None , size = 1 )
+        cache.getService( self.programPath )
+        cache.getService( otherPath )
+        cache.getService( self.programPath )
+        self.assertEqual( cache.getStats() , { 'memory' : 0 , 'disk' : 0 , 'parsed' : 3 , 'evicted' : 2 } )
+        cache.getService( self.programPath )
+        self.assertEqual( cache.getStats()[ 'memory' ] , 1 )
+
+    def testSharedCache(self):
+        #the shared cache is created on first use
+        saved = Mobyle.Parser._serviceCache
+        Mobyle.Parser._serviceCache = None
+        try:
+            service = Mobyle.Parser.parseService( self.programPath )
+            self.assertEqual( service.getName() , 'program' )
+            cache = Mobyle.Parser.getServiceCache()
+            self.assertTrue( cache is Mobyle.Parser._serviceCache )
+            self.assertEqual( cache.path , self.cfg.service_cache_path() )
+            self.assertEqual( cache.getStats()[ 'memory' ] + cache.getStats()[ 'disk' ] + cache.getStats()[ 'parsed' ] , 1 )
+        finally:
+            Mobyle.Parser._serviceCache = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
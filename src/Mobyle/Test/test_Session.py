@@ -356,6 +356,41 @@ class SessionTest(unittest.TestCase):
         jobDescription_recieved = self.session.getJobDescription( url )
         self.assertEqual( None , jobDescription_recieved )
         
+    def testgetSnapshot(self):
+        mtype = self._faketype('Text')
+        url1 = self._fakejob('A00000000000000')
+        url2 = self._fakejob('A00000000000001')
+        self.session.addJob(url1)
+        self.session.addJob(url2)
+        did = self.session.addData(self.data_name, mtype,
+            content = self.data_text, usedBy = [url1, url2])
+        self.session.setJobLabels(url1, ['label_1', 'label_2'])
+        self.session.setJobDescription(url1, 'a description')
+        snapshot = self.session.getSnapshot()
+        self.assertEqual(snapshot.getBaseInfo(), self.session.getBaseInfo())
+        self.assertEqual(len(snapshot.getAllJobs()), 2)
+        self.assertEqual(snapshot.getJobLabels(url1), ('label_1', 'label_2'))
+        self.assertEqual(snapshot.getJobDescription(url1), 'a description')
+        self.assertEqual(snapshot.getJobLabels(url2), ())
+        self.assertEqual(snapshot.getJobDescription(url2), None)
+        self.assertEqual(snapshot.getAllUniqueLabels(), ['label_1', 'label_2'])
+        self.assertEqual(sorted(snapshot.getData(did)['usedBy']), sorted([url1, url2]))
+        self.assertRaises(SessionError, snapshot.getJob, 'nonexistent')
+        ## The snapshot cannot be modified
+        self.assertRaises(TypeError, snapshot.getJob(url1).__setitem__, 'userName', 'new name')
+        self.assertRaises(AttributeError, setattr, snapshot, '_jobs', ())
+        ## Check cleaned job
+        shutil.rmtree(Mobyle.JobState.url2path(url2))
+        snapshot = self.session.getSnapshot()
+        self.assertFalse(snapshot.hasJob(url2))
+        self.assertEqual(snapshot.getData(did)['usedBy'], (url1,))
+        self.assertFalse(self.session.hasJob(url2))
+        ## Without refresh the session is not modified
+        shutil.rmtree(Mobyle.JobState.url2path(url1))
+        snapshot = self.session.getSnapshot(refresh = False)
+        self.assertTrue(snapshot.hasJob(url1))
+        self.assertTrue(self.session.hasJob(url1))
+
     ## Workflow methods ...
 
     ## Utilities ...
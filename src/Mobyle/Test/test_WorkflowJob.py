@@ -0,0 +1,375 @@
+########################################################################################
+#                                                                                      #
+#   Author: Bertrand Neron,                                                            #
+#   Organization:'Biological Software and Databases' Group, Institut Pasteur, Paris.   #
+#   Distributed under GPLv2 Licence. Please refer to the COPYING.LIB document.         #
+#                                                                                      #
+########################################################################################
+
+import unittest2 as unittest
+import os
+import sys
+import time
+import threading
+
+MOBYLEHOME = os.path.abspath( os.path.join( os.path.dirname( __file__ ) , "../../../" ) )
+os.environ['MOBYLEHOME'] = MOBYLEHOME
+
+if ( MOBYLEHOME ) not in sys.path:
+    sys.path.append( MOBYLEHOME )
+if ( os.path.join( MOBYLEHOME , 'Src' ) ) not in sys.path:
+    sys.path.append( os.path.join( MOBYLEHOME , 'Src' ) )
+
+import Mobyle.Test.MobyleTest
+import Mobyle.ConfigManager
+from Mobyle.JobFacade import RemoteJobFacade, LocalJobFacade
+from Mobyle.Status import Status
+from Mobyle.Workflow import Workflow, Task, Link, Parameter, InputValue
+from Mobyle.WorkflowJob import WorkflowJob, WorkflowJobError
+
+
+def diamond():
+    """
+    A -> B , A -> C , B + C -> D , with the links to C before the links to B
+    """
+    wf = Workflow()
+    parameters = []
+    for p_id , name , isout in ( ( '1' , 'sequences' , False ) , ( '2' , 'tree' , True ) ):
+        p = Parameter()
+        p.id = p_id
+        p.name = name
+        p.isout = isout
+        parameters.append( p )
+    tasks = []
+    for t_id in ( 'A' , 'B' , 'C' , 'D' ):
+        t = Task()
+        t.id = t_id
+        t.service = 'service_%s' % t_id
+        tasks.append( t )
+    iv = InputValue()
+    iv.name = 'gapopen'
+    iv.value = '10'
+    tasks[0].input_values = [ iv ]
+    links = []
+    for from_task , from_parameter , to_task , to_parameter in ( ( None , '1' , 'A' , 'infile' ) ,
+                                                                 ( 'A' , 'outfile' , 'C' , 'infile' ) ,
+                                                                 ( 'A' , 'outfile' , 'B' , 'infile' ) ,
+                                                                 ( 'C' , 'outfile' , 'D' , 'infile2' ) ,
+                                                                 ( 'B' , 'outfile' , 'D' , 'infile1' ) ,
+                                                                 ( 'D' , 'outfile' , None , '2' ) ):
+        l = Link()
+        if from_task:
+            l.from_task = from_task
+        if to_task:
+            l.to_task = to_task
+        l.from_parameter = from_parameter
+        l.to_parameter = to_parameter
+        links.append( l )
+    wf.parameters = parameters
+    wf.tasks = tasks
+    wf.links = links
+    return wf
+
+
+def output( task_id ):
+    return { 'src' : 'http://nowhere/jobs/%s' % task_id , 'srcFileName' : '%s.out' % task_id }
+
+
+def old_engine( workflow , parameters ):
+    """
+    the data propagation and the detection of the ready tasks before the workflow graph
+    was compiled by WorkflowJob._prepare: all the data entries are scanned at each step.
+    the job of a task ends as soon as it is submitted.
+    @return: the tasks started at each step and the task inputs and workflow outputs by ( task id , parameter id )
+    """
+    data = []
+    for p in workflow.parameters:
+        data.append( { 'type' : p.isout and 'output' or 'input' , 'parameter' : p } )
+    for t in workflow.tasks:
+        for i in [ l for l in workflow.links if l.to_task == t.id ]:
+            data.append( { 'type' : 'task_input' , 'task' : t , 'parameter_id' : i.to_parameter } )
+        for o in [ l for l in workflow.links if l.from_task == t.id ]:
+            data.append( { 'type' : 'task_output' , 'task' : t , 'parameter_id' : o.from_parameter } )
+        for iv in t.input_values:
+            ti = { 'type' : 'task_input' , 'task' : t , 'parameter_id' : iv.name }
+            if iv.value is not None:
+                ti[ 'value' ] = iv.value
+            elif iv.reference:
+                ti[ 'src' ] = iv.reference
+            data.append( ti )
+    for l in workflow.links:
+        data.append( { 'type' : 'link' , 'link' : l } )
+    for entry in [ entry for entry in data if entry[ 'type' ] == 'input' ]:
+        entry[ 'value' ] = parameters.get( entry[ 'parameter' ].name )
+    started = set()
+    steps = []
+    while True:
+        #_iterate_tasks
+        step = []
+        for t in workflow.tasks:
+            input_entries = [ entry for entry in data if entry[ 'type' ] == 'task_input' and entry[ 'task' ].id == t.id ]
+            if t.id not in started and len( input_entries ) == len( [ e for e in input_entries if e.has_key( 'value' ) or e.has_key( 'srcFileName' ) ] ):
+                started.add( t.id )
+                step.append( t.id )
+                for o in [ entry for entry in data if entry[ 'type' ] == 'task_output' and entry[ 'task' ].id == t.id ]:
+                    o.update( output( t.id ) )
+        #_iterate_data
+        moved = False
+        for item in [ item for item in data if item[ 'type' ] == 'link' ]:
+            link = item[ 'link' ]
+            if not( link.from_task ):
+                source = [ e for e in data if e[ 'type' ] == 'input' and e[ 'parameter' ].id == link.from_parameter ][0]
+            else:
+                source = [ e for e in data if e[ 'type' ] == 'task_output' and e[ 'task' ].id == link.from_task and e[ 'parameter_id' ] == link.from_parameter ][0]
+            if link.to_task:
+                target = [ e for e in data if e[ 'type' ] == 'task_input' and e[ 'task' ].id == link.to_task and e[ 'parameter_id' ] == link.to_parameter ][0]
+            else:
+                target = [ e for e in data if e[ 'type' ] == 'output' and e[ 'parameter' ].id == link.to_parameter ][0]
+            if source.has_key( 'src' ):
+                target[ 'src' ] = source[ 'src' ]
+                target[ 'srcFileName' ] = source[ 'srcFileName' ]
+                data.remove( item )
+                moved = True
+            elif source.has_key( 'value' ):
+                target[ 'value' ] = source[ 'value' ]
+                data.remove( item )
+                moved = True
+        if step:
+            steps.append( step )
+        elif not moved:
+            break
+    return steps , values( data )
+
+
+def values( data ):
+    """
+    @return: the values of the task inputs and of the workflow outputs
+    @rtype: dict { ( task id or None , parameter id ) : { 'src' : , 'srcFileName' : , 'value' : } }
+    """
+    result = {}
+    for entry in data:
+        if entry[ 'type' ] == 'task_input':
+            key = ( entry[ 'task' ].id , entry[ 'parameter_id' ] )
+        elif entry[ 'type' ] == 'output':
+            key = ( None , entry[ 'parameter' ].id )
+        else:
+            continue
+        result[ key ] = dict( [ ( k , entry[ k ] ) for k in ( 'src' , 'srcFileName' , 'value' ) if entry.has_key( k ) ] )
+    return result
+
+
+class WorkflowJobTest( unittest.TestCase ):
+
+    def setUp(self):
+        self.workflow = diamond()
+        self.parameters = { 'sequences' : '>seq\nMKVLAAGIVG\n' }
+        wj = WorkflowJob.__new__( WorkflowJob )
+        wj.id = 'http://nowhere/jobs/W'
+        wj.workflow = self.workflow
+        wj.parameters = self.parameters
+        wj._submit_tasks = self._submit_tasks
+        self.wj = wj
+        self.steps = []
+
+    def _submit_tasks( self , job_entries ):
+        """
+        the jobs are submitted and end at once
+        """
+        self.steps.append( [ job_entry[ 'task' ].id for job_entry in job_entries ] )
+        for job_entry in job_entries:
+            task_id = job_entry[ 'task' ].id
+            job_entry[ 'job_id' ] = 'http://nowhere/jobs/%s' % task_id
+            job_entry[ 'job_status' ] = Status( 4 )
+            for o in self.wj._task_outputs[ task_id ]:
+                o.update( output( task_id ) )
+                self.wj._source_available( o )
+
+    def _run( self ):
+        self.wj._prepare()
+        #_iterate_processing
+        ts , ds = True , True
+        while ts or ds:
+            ts = self.wj._iterate_tasks()
+            ds = self.wj._iterate_data()
+
+    def testDiamond(self):
+        self._run()
+        self.assertEqual( self.steps , [ [ 'A' ] , [ 'B' , 'C' ] , [ 'D' ] ] )
+        result = values( self.wj.data )
+        self.assertEqual( result[ ( 'A' , 'infile' ) ] , { 'value' : self.parameters[ 'sequences' ] } )
+        self.assertEqual( result[ ( 'A' , 'gapopen' ) ] , { 'value' : '10' } )
+        self.assertEqual( result[ ( 'B' , 'infile' ) ] , output( 'A' ) )
+        self.assertEqual( result[ ( 'C' , 'infile' ) ] , output( 'A' ) )
+        self.assertEqual( result[ ( 'D' , 'infile1' ) ] , output( 'B' ) )
+        self.assertEqual( result[ ( 'D' , 'infile2' ) ] , output( 'C' ) )
+        self.assertEqual( result[ ( None , '2' ) ] , output( 'D' ) )
+        #D waited for its two predecessors
+        self.assertEqual( sorted( [ e[ 'source_task' ] for e in self.wj._task_inputs[ 'D' ] ] ) , [ 'B' , 'C' ] )
+        self.assertFalse( self.wj._links_to_process )
+        self.assertEqual( len( self.wj._linked ) , len( self.workflow.links ) )
+
+    def testSameAsBefore(self):
+        steps , result = old_engine( diamond() , self.parameters )
+        self._run()
+        self.assertEqual( self.steps , steps )
+        self.assertEqual( values( self.wj.data ) , result )
+
+
+class Recorder( object ):
+    """
+    records the create requests in flight, by server and by identical job
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.peaks = {}
+        self.threads = set()
+
+    def enter( self , keys ):
+        self.lock.acquire()
+        try:
+            self.threads.add( threading.currentThread() )
+            for key in keys:
+                self.in_flight[ key ] = self.in_flight.get( key , 0 ) + 1
+                self.peaks[ key ] = max( self.peaks.get( key , 0 ) , self.in_flight[ key ] )
+        finally:
+            self.lock.release()
+
+    def leave( self , keys ):
+        self.lock.acquire()
+        try:
+            for key in keys:
+                self.in_flight[ key ] -= 1
+        finally:
+            self.lock.release()
+
+
+class FakeRemoteJob( RemoteJobFacade ):
+    """
+    a remote job facade which does not contact any server, its creation takes a while
+    """
+
+    def __init__( self , recorder , task , parameters , fail = False ):
+        self.recorder = recorder
+        self.task = task
+        self.keys = ( 'all' , task.server , ( task.server , task.service , repr( sorted( parameters.items() ) ) ) )
+        self.fail = fail
+
+    def create( self , request_dict = None ):
+        self.recorder.enter( self.keys )
+        try:
+            time.sleep( 0.05 )
+            if self.fail:
+                raise IOError( "connection refused" )
+            return { 'id' : 'http://%s/jobs/%s' % ( self.task.server , self.task.id ) }
+        finally:
+            self.recorder.leave( self.keys )
+
+
+class FakeLocalJob( LocalJobFacade ):
+
+    def __init__( self , recorder , task ):
+        self.recorder = recorder
+        self.task = task
+
+    def create( self , request_dict = None ):
+        self.recorder.enter( ( 'local' , ) )
+        self.recorder.leave( ( 'local' , ) )
+        return { 'id' : 'http://local/jobs/%s' % self.task.id }
+
+
+class FakeJobState( object ):
+
+    def __init__(self):
+        self.jobs = {}
+
+    def setTaskJob( self , task , jobId ):
+        self.jobs[ task.id ] = jobId
+
+    def commit(self):
+        pass
+
+
+class SubmitTasksTest( unittest.TestCase ):
+    """
+    the concurrent submission of the jobs of the ready tasks
+    """
+
+    def setUp(self):
+        self.cfg = Mobyle.ConfigManager.Config()
+        self.recorder = Recorder()
+        self.failing = set()
+        wj = WorkflowJob.__new__( WorkflowJob )
+        wj.id = 'http://nowhere/jobs/W'
+        wj.cfg = self.cfg
+        wj.jobState = FakeJobState()
+        wj._watcher = None
+        wj._prepare_submission = self._prepare_submission
+        wj._process_subjob_status_update = lambda j , job_entry , t : None
+        self.wj = wj
+
+    def _prepare_submission( self , t , job_entry ):
+        if t.server == 'local':
+            return FakeLocalJob( self.recorder , t ) , {}
+        parameters = { 'programName' : 'http://%s/%s' % ( t.server , t.service ) , 'gapopen' : t.gapopen }
+        return FakeRemoteJob( self.recorder , t , parameters , fail = t.id in self.failing ) , parameters
+
+    def _entries( self , specs ):
+        """
+        @param specs: the server , the service and the value of gapopen of each task
+        """
+        entries = []
+        for i , ( server , service , gapopen ) in enumerate( specs ):
+            t = Task()
+            t.id = 'T%d' % i
+            t.description = 'task %d' % i
+            t.server = server
+            t.service = service
+            t.gapopen = gapopen
+            entries.append( { 'task' : t } )
+        return entries
+
+    def testLimits(self):
+        #3 identical jobs on alpha, 4 different jobs on beta
+        entries = self._entries( [ ( 'alpha' , 'clustalw' , '10' ) ] * 3 +
+                                 [ ( 'alpha' , 'muscle' , '10' ) ] +
+                                 [ ( 'beta' , 'clustalw' , str( i ) ) for i in range( 4 ) ] )
+        self.wj._submit_tasks( entries )
+        peaks = self.recorder.peaks
+        self.assertTrue( peaks[ 'all' ] <= self.cfg.workflow_submission_threads() )
+        self.assertEqual( peaks[ 'alpha' ] , self.cfg.workflow_server_submissions() )
+        self.assertEqual( peaks[ 'beta' ] , self.cfg.workflow_server_submissions() )
+        for key , peak in peaks.items():
+            if isinstance( key , tuple ):
+                self.assertEqual( peak , self.cfg.simultaneous_jobs() , key )
+        self.assertEqual( len( self.recorder.threads ) , self.cfg.workflow_submission_threads() )
+        self.assertFalse( threading.currentThread() in self.recorder.threads )
+        for job_entry in entries:
+            t = job_entry[ 'task' ]
+            self.assertEqual( job_entry[ 'job_id' ] , 'http://%s/jobs/%s' % ( t.server , t.id ) )
+            self.assertEqual( self.wj.jobState.jobs[ t.id ] , job_entry[ 'job_id' ] )
+            self.assertTrue( job_entry[ 'remote' ] )
+
+    def testLocalJobs(self):
+        entries = self._entries( [ ( 'local' , 'clustalw' , str( i ) ) for i in range( 3 ) ] +
+                                 [ ( 'alpha' , 'clustalw' , str( i ) ) for i in range( 3 ) ] )
+        self.wj._submit_tasks( entries )
+        #the local jobs are submitted by the main thread
+        self.assertEqual( self.recorder.peaks[ 'local' ] , 1 )
+        self.assertTrue( threading.currentThread() in self.recorder.threads )
+        for job_entry in entries:
+            t = job_entry[ 'task' ]
+            self.assertEqual( self.wj.jobState.jobs[ t.id ] , 'http://%s/jobs/%s' % ( t.server , t.id ) )
+
+    def testError(self):
+        entries = self._entries( [ ( 'alpha' , 'clustalw' , str( i ) ) for i in range( 4 ) ] )
+        self.failing.add( 'T1' )
+        self.assertRaises( WorkflowJobError , self.wj._submit_tasks , entries )
+        #the other jobs are recorded
+        self.assertEqual( sorted( self.wj.jobState.jobs.keys() ) , [ 'T0' , 'T2' , 'T3' ] )
+        self.assertFalse( entries[ 1 ].has_key( 'job_id' ) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,7 @@ import sys
 import fcntl
 import pickle
 from lxml import etree
-from time import strptime , strftime , time , sleep
+from time import strptime , strftime , time
 from logging import getLogger
 
 from Mobyle.Parser import parseType
@@ -21,6 +21,7 @@ from Mobyle.MobyleError import MobyleError , SessionError , ParserError
 #from Mobyle.Utils import indent, parse_xml_file
 from Mobyle.Utils import indent
 from Mobyle.Status import Status
+from Mobyle.LockManager import lockManager
 
 class Transaction( object ):
     """
@@ -153,35 +154,21 @@ class Transaction( object ):
         try to acquire a lock of self.__lockType on self.__File
         @raise IOError: when it could not acquire a lock
         """
-        IGotALock = False
         ID = os.path.basename( os.path.dirname( self.__File.name ))
         self._log.debug( "%f : %s : _lock Type= %s ( call by= %s )"  %( time() ,
                                                                         ID,
                                                                         ( 'UNKNOWN LOCK', 'READ' , 'WRITE' )[ self.__lockType ] ,
                                                                         os.path.basename( sys.argv[0] ) ,
                                                                         ))
-        for attempt in range( 4 ):
-            try:             
-                fcntl.lockf( self.__File , self.__lockType | fcntl.LOCK_NB )
-                IGotALock  = True
-                self._log.debug( "%f : %s : _lock IGotALock = True" %(time() , ID ))
-                break
-            except IOError , err:
-                self._log.debug( "%f : %s : _lock IGotALock = False" %(time() , ID))
-                sleep( 0.2 )
-
-        if not IGotALock :
+        try:
+            lockManager.acquire( self.__File , self.__lockType )
+        except IOError , err:
             self._log.error( "%s : %s" %( ID , err ) )
-            self._log.debug( "%f : %s : _lock Type= %s ( call by= %s )"  %( time() ,
-                                                                            ID ,
-                                                                            ( 'UNKNOWN LOCK', 'READ' , 'WRITE' )[ self.__lockType ] ,
-                                                                            os.path.basename( sys.argv[0] ) 
-                                                                            ))
             self.__File.close()
             self.__File = None
             self.__lockType = None
-               
-            raise IOError , err
+            raise
+        self._log.debug( "%f : %s : _lock IGotALock = True" %(time() , ID ))
     
     def _setModified(self , modified ):
         """
@@ -318,7 +305,7 @@ class Transaction( object ):
                                                                                           logType, 
                                                                                           self._modified
                                                                                           ))   
-                fcntl.lockf( self.__File , fcntl.LOCK_UN  )
+                lockManager.release( self.__File )
                 self.__File.close()
                 self.__File = None
                 self.__lockType = None
@@ -352,7 +339,7 @@ class Transaction( object ):
         try:
             key2del = self.__File.name 
             sys.stdout.flush()
-            fcntl.lockf( self.__File , fcntl.LOCK_UN  )
+            lockManager.release( self.__File )
             self.__File.close()
             self.__File = None
             self.__lockType = None
@@ -615,6 +602,7 @@ class Transaction( object ):
         dataNode = self._getDataNode( dataID )
         dataListNode = dataNode.getparent()
         dataListNode.remove( dataNode )
+        self._addDiskUsage( - int( dataNode.get( 'size' , 0 ) ) )
         ## remove the ref of this data from the jobs
         usedBy = dataNode.xpath('usedBy/@ref' )
         for jobID in usedBy:
@@ -773,8 +761,37 @@ class Transaction( object ):
             usedByNode = etree.Element( "usedBy" , ref = jobId )
             dataNode.append( usedByNode )           
         dataListNode.append( dataNode )  
+        self._addDiskUsage( int( size ) )
         self._setModified( True )
 
+    def getDiskUsage( self ):
+        """
+        @return: the size of the session directory ( in bytes ) maintained by L{createData} and L{removeData}
+        and the time of the last scan of the directory ( see L{setDiskUsage} ),
+        None if the size has never been computed.
+        @rtype: ( int , float )
+        """
+        try:
+            return int( self._root.find( 'diskUsage' ).text ) , float( self._root.find( 'diskUsageScan' ).text )
+        except ( AttributeError , TypeError , ValueError ):
+            return None
+        
+    def setDiskUsage( self , size , scanTime ):
+        """
+        set the size of the session directory computed by a scan of the directory
+        @param size: the size of the session directory in bytes
+        @type size: int
+        @param scanTime: the time of the scan ( in sec since the epoch )
+        @type scanTime: float
+        """
+        modified = self._updateNode( self._root , 'diskUsage' , int( size ) )
+        self._setModified( self._updateNode( self._root , 'diskUsageScan' , repr( scanTime ) ) or modified )
+        
+    def _addDiskUsage( self , size ):
+        usage = self.getDiskUsage()
+        if usage is not None:
+            self._updateNode( self._root , 'diskUsage' , max( 0 , usage[0] + size ) )
+            
     def addWorkflowLink( self , id):
         """
         add a new workflow definition in the session.
@@ -986,8 +1003,10 @@ class Transaction( object ):
         return self._jobNode2jobDict( jobNode )
 
     
-    def getAllJobs(self):
+    def getAllJobs(self , annotations = False ):
         """
+        @param annotations: if True the labels and the description of each job are returned too
+        @type annotations: boolean
         @return: the list of jobs in this session
         @rtype:  [ {'jobID'       : string ,
                     'userName'    : string ,
@@ -996,12 +1015,19 @@ class Transaction( object ):
                     'date'        : time struct ,
                     'dataProduced': [ string dataID1 , string dataID2 , ...] ,
                     'dataUsed'    : [ string dataID1 , string dataID2 , ...] ,
+                    'labels'      : [ string label1 , string label2 , ...] , ( if annotations )
+                    'description' : string or None , ( if annotations )
                    } , ... ]
         """
         jobs = []
         jobList = self._root.findall( 'jobList/job' )
         for jobNode in jobList:
             job = self._jobNode2jobDict( jobNode )
+            if annotations:
+                #read from the job node, getJobLabels would search the job again
+                job[ 'labels' ] = [ labelNode.text for labelNode in jobNode.findall( 'userAnnotation/labels/label' ) ]
+                descriptionNode = jobNode.find( 'userAnnotation/description' )
+                job[ 'description' ] = descriptionNode.text if descriptionNode is not None else None
             jobs.append( job )
         return jobs
 
@@ -114,7 +114,60 @@ def getStatus( jobID ):
             return oldStatus
         if newStatus != oldStatus :
             sm.setStatus( path , newStatus )
-        return newStatus 
+        return newStatus
+
+def getStatuses( jobIDs ):
+    """
+    get the current status of several local jobs.
+    the jobs are grouped by execution system and each execution system
+    is queried once for all its jobs ( see L{ExecutionSystem.getStatuses} ).
+    @param jobIDs: the urls of the jobs
+    @type jobIDs: list of strings
+    @return: the current status of each job
+    @rtype: dict { jobID : L{Status} instance }
+    @raise MobyleError: if a job doesn't exist anymore
+    """
+    from Mobyle.JobState import normUri
+    from urlparse import urlparse
+    from Mobyle.StatusManager import StatusManager
+
+    sm = StatusManager()
+    statuses = {}
+    jobsByAlias = {}
+    for jobID in jobIDs:
+        path = normUri( jobID )
+        protocol, host, path, a, b, c = urlparse( path )
+        if protocol == "http":
+            raise  NotImplementedError , "trying to querying a distant server"
+        if path[-9:] == "index.xml":
+            path = path[:-10 ]
+        oldStatus = sm.getStatus( path )
+        statuses[ jobID ] = oldStatus
+        if not oldStatus.isQueryable():
+            continue
+        adm = Admin( path )
+        batch = adm.getExecutionAlias()
+        jobNum = adm.getNumber()
+        if batch is None or jobNum is None:
+            continue
+        jobsByAlias.setdefault( batch , [] ).append( ( jobID , path , jobNum ) )
+
+    for batch , jobs in jobsByAlias.items():
+        try:
+            exec_engine = executionLoader( alias = batch )
+            newStatuses = exec_engine.getStatuses( [ jobNum for jobID , path , jobNum in jobs ] )
+        except MobyleError , err :
+            #the jobs of this execution system keep their last known status
+            u_log.error( str( err ) , exc_info = True )
+            continue
+        for jobID , path , jobNum in jobs:
+            newStatus = newStatuses.get( jobNum )
+            if newStatus is None or not newStatus.isKnown():
+                continue
+            if newStatus != statuses[ jobID ] :
+                sm.setStatus( path , newStatus )
+            statuses[ jobID ] = newStatus
+    return statuses
 
 def isExecuting( jobID ):
     """
@@ -213,7 +266,7 @@ def killJob( jobID ):
 def safeFileName( fileName ):
     import string , re
     
-    if fileName in ( 'index.xml' , '.admin' , '.command' ,'.forChild.dump' ,'.session.xml'):
+    if fileName in ( 'index.xml' , '.admin' , '.command' ,'.forChild.dump' ,'.session.xml' , '.session.db' ):
         raise UserValueError( msg = "value \"" + str( fileName ) + "\" is not allowed" )
     
     for car in fileName :
@@ -402,24 +455,23 @@ def indent(elem, level=0):
         if level and (not elem.tail or not elem.tail.strip()):
             elem.tail = i
 
-#def parse_xml_file(file_handle, parser):
-#    """
-#    wrapper for the lxml etree.parse() function
-#    the behavior of lxml.parse changes between v2.2 and v2.3:
-#    in v2.3 it closes automatically the file after parsing it,
-#    breaking the file-locking mechanism.
-#    this function uses a workaround for versions 2.3.x
-#    @param file_handle: the file handle for the XML file to be parsed
-#    @type zip_filename: {file}
-#    @param parser: parser object to pass to etree.parse
-#    @type parser: {lxml.etree._BaseParser}
-#    @return: the parsed document as an ElementTree object
-#    @rtype: {lxml.etree._ElementTree}
-#    """
-#    from lxml import etree
-#    if etree.__version__.startswith('2.3'):
-#        from StringIO import StringIO
-#        return etree.parse( StringIO(''.join(file_handle.readlines())) , parser )
-#    else:
-#        return etree.parse(file_handle)
+def parse_xml_file(file_handle, parser):
+    """
+    wrapper for the lxml etree.parse() function
+    the behavior of lxml.parse changes between v2.2 and v2.3:
+    in v2.3 it closes automatically the file after parsing it,
+    breaking the file-locking mechanism.
+    this function parses the content of the file handle, the file is never closed.
+    @param file_handle: the file handle for the XML file to be parsed, or its path
+    @type file_handle: {file} or string
+    @param parser: parser object to pass to etree.parse
+    @type parser: {lxml.etree._BaseParser}
+    @return: the parsed document as an ElementTree object
+    @rtype: {lxml.etree._ElementTree}
+    """
+    from lxml import etree
+    if isinstance(file_handle, basestring):
+        return etree.parse(file_handle, parser)
+    from StringIO import StringIO
+    return etree.parse(StringIO(file_handle.read()), parser)
 #    
\ No newline at end of file
@@ -7,19 +7,23 @@
 ########################################################################################
 import time #@UnresolvedImport
 import os, sys
-import signal
 import logging #@UnresolvedImport
 import atexit #@UnresolvedImport
+import threading
+import Queue
+from collections import deque
 
 from Mobyle.Job import Job
 from Mobyle.Registry import registry
 from Mobyle import ConfigManager
-from Mobyle.JobState import JobState
+from Mobyle.JobState import JobState, url2path
+from Mobyle.JobWatcher import JobWatcher
 from Mobyle.Service import MobyleType, Parameter
 from Mobyle.Classes.DataType import DataTypeFactory
 from Mobyle.DataProvider import DataProvider
 from Mobyle.Status import Status
 from Mobyle.StatusManager import StatusManager
+from Mobyle import AdminIndex
 from Utils import zipFiles , emailResults
 from Mobyle.MobyleError import MobyleError, UserValueError
 from Mobyle.Net import EmailAddress
@@ -224,7 +228,7 @@ class WorkflowJob(object):
                                        )
             try:
                 
-                os.symlink(
+                AdminIndex.link(
                            os.path.join( self.getDir() , '.admin') ,
                            linkName
                            )
@@ -240,7 +244,7 @@ class WorkflowJob(object):
             t1 = time.time()
             ################################################
             try:
-                os.unlink( linkName )
+                AdminIndex.unlink( linkName )
             except OSError , err:
                 self.set_status(Status(string="error", message="workflow execution failed"))
                 msg = "can't remove symbolic link %s in ADMINDIR: %s" %( linkName , err )
@@ -318,42 +322,39 @@ class WorkflowJob(object):
     
     def srun(self):
         """run the job synchronously"""
+        watcher = None
         try:
             self._prepare()
             self._debug_state()
             self.set_status(Status( code = 3 )) # status = running
             # run while no error status
             # and output parameters do not have a value
-            signal.signal( signal.SIGALRM , self.alarm_handler )
+            # between 2 iterations, sleep until a child process ends, a status file is written
+            # or it's time to poll the remote jobs
+            watcher = JobWatcher()
+            watcher.watch( self.getDir() )
+            self._watcher = watcher
             while True :
-                signal.alarm( 30 )
                 status = self.status_manager.getStatus( self.getDir() )
                 if status.isOnError() and status.code==6:#killed
                     self._kill_subjobs()
                     break
                 else:  
+                    self._remote_changed = False
                     self._iterate_processing()
+                    if self._poll_remote:
+                        watcher.remote_polled( self._remote_changed )
                 if len([j for j in self.sub_jobs if (not(j.has_key('job_status')) or not(j['job_status'].isEnded()))])==0:
                     # workflow is considered to be finished when all the tasks have completed
                     log.log( 12 , "all tasks completed." )
                     self.log("all tasks completed.")
                     break
-                try:
-                    pid = os.wait()
-                except OSError , err :
-                    if err.errno == 10 :
-                        log.log( 12 , "no more local child process, maybe remote jobs exist -> continue" )
-                        time.sleep(30)
-                        continue
-                    elif err.errno == 4 :
-                        log.log( 12 , "interrupt by a system call ( SIGALRM ? ), continue  err = %s time = %f "%( err , time.time() ) )
-                        continue
-                    else:
-                        log.log( 12 , "unexpected error, err = %s  time = %f -> break"%( err, time.time() ) , exc_info = True )
-                        break
-                log.log( 12, "end of loop at %f pid, returncode = %s" %(time.time(), pid ) )
-            signal.alarm(0)
+                remote = len([j for j in self.sub_jobs if j.get('remote') and not(j['job_status'].isEnded())]) > 0
+                reason = watcher.wait( remote = remote )
+                self._poll_remote = ( reason == 'remote' or watcher.remote_due() )
+                log.log( 12, "end of loop at %f wake up by %s" %(time.time(), reason ) )
             self._finalize()
+            self._report_overhead()
             log.debug("job processing ending for job %s, status %s" % (self.get_id(), self.status_manager.getStatus( self.getDir() )))
             self._debug_state()
         except WorkflowJobError, we:
@@ -363,22 +364,56 @@ class WorkflowJob(object):
             # if an unspecified runtime error occurs
             self.set_status(Status(string="error",message="workflow execution failed"))
             log.error("Error while running workflow job %s" % self.id, exc_info=True)
-    
-    def alarm_handler( self, signum ,frame ):
-        """
-        @call: when the a SIGALRM is raise
-        """
-        log.log( 12 , " %d : alarm_handler recieved a signal %d "% (os.getpid() , signum) )
-        pass
+        if watcher is not None:
+            watcher.close()
+            self._watcher = None
         
+    def _report_overhead(self):
+        """log for each task the time spent by the workflow engine between the availability 
+        of the task inputs and the submission of its job, and between the end of the job and its detection"""
+        total = 0.0
+        steps = 0
+        for job_entry in self.sub_jobs:
+            if not job_entry.has_key('submitted_at'):
+                continue
+            dispatch = job_entry['submitted_at'] - job_entry['ready_at']
+            detection = job_entry.get('detected_at', job_entry['submitted_at']) - job_entry.get('ended_at', job_entry['submitted_at'])
+            overhead = dispatch + max(detection, 0.0)
+            total += overhead
+            steps += 1
+            log.info("workflow %s task %s: overhead %.3fs (dispatched %.3fs after its inputs were ready, submission %.3fs, waited %.3fs for a submission slot, end detected after %.3fs)" 
+                     % (self.id, job_entry['task'].id, overhead, dispatch, job_entry['submission_time'], job_entry['submission_wait'], detection))
+        if steps:
+            self.log("workflow engine overhead: %.3fs for %d steps (%.3fs per step)" % (total, steps, total/steps))
         
     def _prepare(self):
-        """prepare for executions"""
+        """prepare for executions:
+        build the data entries (self.data) and compile the workflow graph in indexes
+        by task id and parameter id, so that the data propagation and the detection of 
+        the ready tasks only process what changed."""
+        self._start_time = time.time()
+        self._poll_remote = True
+        self._remote_changed = False
+        self._watcher = None
         self.sub_jobs = []
+        # job entry and position in the workflow by task id
+        self._job_entries = {}
+        self._task_index = {}
         for t in self.workflow.tasks:
-            self.sub_jobs.append({'task':t})
+            job_entry = {'task':t}
+            self.sub_jobs.append(job_entry)
+            self._job_entries[t.id] = job_entry
+            self._task_index.setdefault(t.id, len(self._task_index))
+        links_to = {}
+        links_from = {}
+        for l in self.workflow.links:
+            links_to.setdefault(l.to_task, []).append(l)
+            links_from.setdefault(l.from_task, []).append(l)
         # build data transfers scheduling self.data
         self.data = []
+        # workflow inputs and outputs by parameter id
+        self._inputs = {}
+        self._outputs = {}
         for p in self.workflow.parameters:
             # for each task that has to be run, check if an input is expected, and if expected,
             # check if this input is already "valued"
@@ -386,36 +421,102 @@ class WorkflowJob(object):
             # is mandatory and if so if it is linked to a default value or a link
             log.debug('preparing parameter %s' % p)
             if(not(bool(p.isout))):
-                self.data.append({'type':'input','parameter':p})
+                entry = {'type':'input','parameter':p}
+                self._inputs.setdefault(p.id, entry)
             else:
-                self.data.append({'type':'output','parameter':p})
+                entry = {'type':'output','parameter':p}
+                self._outputs.setdefault(p.id, entry)
+            self.data.append(entry)
+        # task inputs and outputs by task id, and by ( task id , parameter id )
+        self._task_inputs = {}
+        self._task_outputs = {}
+        task_input_index = {}
+        task_output_index = {}
         for t in self.workflow.tasks:
             # for each task that has to be run, check if an input is expected, and if expected,
             # check if this input is already "valued"
             # TODO at workflow validation time, we should check for each parameter of a service if a parameter
             # is mandatory and if so if it is linked to a default value or a link
             log.debug('preparing task %s' % t)
-            for i in [l for l in self.workflow.links if l.to_task==t.id]:
-                self.data.append({'type':'task_input','task':t, 'parameter_id':i.to_parameter})
-            for o in [l for l in self.workflow.links if l.from_task==t.id]:
-                self.data.append({'type':'task_output','task':t, 'parameter_id':o.from_parameter})
+            inputs = self._task_inputs.setdefault(t.id, [])
+            outputs = self._task_outputs.setdefault(t.id, [])
+            for i in links_to.get(t.id, []):
+                inputs.append({'type':'task_input','task':t, 'parameter_id':i.to_parameter})
+            for o in links_from.get(t.id, []):
+                outputs.append({'type':'task_output','task':t, 'parameter_id':o.from_parameter})
             for iv in t.input_values:
                 ti = {'type':'task_input','task':t, 'parameter_id':iv.name}
                 if iv.value is not None:
                     ti['value'] = iv.value
                 elif iv.reference:
                     ti['src'] = iv.reference
-                self.data.append(ti)
+                inputs.append(ti)
+            for entry in inputs:
+                task_input_index.setdefault((t.id, entry['parameter_id']), entry)
+            for entry in outputs:
+                task_output_index.setdefault((t.id, entry['parameter_id']), entry)
+            self.data.extend(inputs)
+            self.data.extend(outputs)
+        # the source and the target of each link, and the links by source
+        self._links_from = {}
+        self._links_to_process = deque()
+        # the links already processed (by id), they are not data to transfer anymore
+        self._linked = set()
         for l in self.workflow.links:
             log.debug('preparing link %s' % l)
-            self.data.append({'type':'link','link':l})
+            item = {'type':'link','link':l}
+            self.data.append(item)
+            try:
+                if not(l.from_task):
+                    source = self._inputs[l.from_parameter]
+                else:
+                    source = task_output_index[(l.from_task, l.from_parameter)]
+                if l.to_task:
+                    target = task_input_index[(l.to_task, l.to_parameter)]
+                else:
+                    target = self._outputs[l.to_parameter]
+            except KeyError, err:
+                raise WorkflowJobError("the link %s refers to an unknown parameter %s" % (l, err))
+            self._links_from.setdefault(id(source), []).append((item, source, target))
         # setting parameter values
-        for entry in [entry for entry in self.data if (entry['type']=='input' and not(entry.has_key('value') or entry.has_key('src') or entry.has_key('srcFileName')))]:
+        for entry in [entry for entry in self._inputs.values() if not(entry.has_key('value') or entry.has_key('src') or entry.has_key('srcFileName'))]:
             if self.parameters.get(entry['parameter'].name):
                 entry['value'] = self.parameters.get(entry['parameter'].name,None)
             else:
                 entry['src'] = self.parameters.get(entry['parameter'].name+'.src',None)
                 entry['srcFileName'] = self.parameters.get(entry['parameter'].name+'.srcFileName',None)
+        # in-degree of each task: the number of its inputs which have no value yet
+        self._valued = set()
+        self._missing = {}
+        self._ready = deque()
+        self._running = []
+        for t in self.workflow.tasks:
+            self._missing[t.id] = len(self._task_inputs[t.id])
+            for entry in self._task_inputs[t.id]:
+                self._set_valued(entry)
+            if not(self._task_inputs[t.id]):
+                # the tasks with inputs are queued by _set_valued
+                self._ready.append(t.id)
+        for entry in self._inputs.values():
+            self._source_available(entry)
+
+    def _source_available(self, source):
+        """schedule the propagation of a data entry which has a value to the targets of its links"""
+        if source.has_key('src') or source.has_key('value'):
+            self._links_to_process.extend(self._links_from.get(id(source), []))
+
+    def _set_valued(self, entry):
+        """update the in-degree of the task of entry if entry has just got a value 
+        and mark the task as ready when all its inputs have a value"""
+        if entry['type'] != 'task_input' or id(entry) in self._valued:
+            return
+        if not(entry.has_key('value') or entry.has_key('srcFileName')):
+            return
+        self._valued.add(id(entry))
+        task_id = entry['task'].id
+        self._missing[task_id] -= 1
+        if self._missing[task_id] == 0:
+            self._ready.append(task_id)
 
     def validate(self):
         """ check that a value is provided for each mandatory field """
@@ -427,64 +528,208 @@ class WorkflowJob(object):
     def _iterate_tasks(self):
         """launch and monitor task executions"""
         job_signal = False
-        # starting jobs
-        for t in self.workflow.tasks:
-            input_entries = [entry for entry in self.data if (entry['type']=='task_input' and entry['task'].id==t.id)]
-            # if data available and not already running
-            if (len(input_entries)==len([entry for entry in input_entries if entry.has_key('value') or entry.has_key('srcFileName')])):
-                job_entry = [job_entry for job_entry in self.sub_jobs if job_entry['task'].id==t.id][0]
-                if job_entry.has_key('job_id'):
-                    job_id = job_entry['job_id']
-                    if not(job_entry['job_status'].isEnded()):
-                        j = Mobyle.JobFacade.JobFacade.getFromJobId(job_id)
-                        su_signal = self._process_subjob_status_update(j, job_entry, t)
-                        job_signal = job_signal or su_signal
-                else:
-                    # if job is not running, start it
-                    log.debug('starting job for task %s' % t.id)
-                    log.debug('registry.getProgramUrl(t.service = %s,t.server= %s)' %(t.service , t.server) )
-                    if t.server is None:
-                        t.server = 'local'
-                    job_parameters = {}
-                    try:
-                        url = registry.getProgramUrl(t.service,t.server)
-                        j = Mobyle.JobFacade.JobFacade.getFromService(programUrl=url, workflowId=self.id)
-                        job_parameters['programName'] = url
-                    except:
-                        url = registry.getWorkflowUrl(t.service,t.server)
-                        j = Mobyle.JobFacade.JobFacade.getFromService(workflowUrl=url, workflowId=self.id)                        
-                        job_parameters['workflowUrl'] = url
-                    job_signal = True
-                    for i_e in input_entries:
-                        if i_e.has_key('value'):
-                            job_parameters[i_e['parameter_id']]=i_e['value']
-                        else:
-                            job_parameters[i_e['parameter_id']+'.src']=i_e['src']
-                            job_parameters[i_e['parameter_id']+'.srcFileName']=i_e['srcFileName']
-                            job_parameters[i_e['parameter_id']+'.mode']='result'
-                            job_parameters[i_e['parameter_id']+'.name']=i_e['parameter_id']+'.data'
-                    job_parameters['email'] = self.email
-                    try:
-                        resp = j.create(request_dict=job_parameters)
-                    except Exception, e:
-                        raise WorkflowJobError("error during submission of task %s(%s)" \
-                                                  %(t.id, t.description))
-                    job_entry['job_id'] = resp['id']
-                    if resp.has_key('errorparam') or resp.has_key('errormsg'):
-                        raise WorkflowJobError("error during submission of task %s(%s).\n job %s message: %s: %s." \
-                                                  %(t.id, t.description,job_entry['job_id'],resp.get('errorparam'),resp.get('errormsg')))
-                    self.jobState.setTaskJob(t,job_entry['job_id'])
-                    self.jobState.commit()
-                    su_signal = self._process_subjob_status_update(j, job_entry, t)
-                    job_signal = job_signal or su_signal
-                    log.debug('job for task %s: %s' % (t.id, job_entry['job_id']))
+        # monitoring the running jobs
+        for task_id in list(self._running):
+            job_entry = self._job_entries[task_id]
+            if job_entry['job_status'].isEnded():
+                self._running.remove(task_id)
+                continue
+            if job_entry.get('remote') and not(self._poll_remote):
+                # the remote jobs are polled with an adaptive delay
+                continue
+            j = Mobyle.JobFacade.JobFacade.getFromJobId(job_entry['job_id'])
+            su_signal = self._process_subjob_status_update(j, job_entry, job_entry['task'])
+            job_signal = job_signal or su_signal
+            if job_entry.get('remote') and su_signal:
+                self._remote_changed = True
+            if job_entry['job_status'].isEnded():
+                self._running.remove(task_id)
+        # starting the jobs of the tasks which have all their inputs,
+        # in the order of the workflow
+        ready_entries = []
+        while self._ready:
+            job_entry = self._job_entries[self._ready.popleft()]
+            if not(job_entry.has_key('job_id')):
+                ready_entries.append(job_entry)
+        ready_entries.sort(key=lambda job_entry: self._task_index[job_entry['task'].id])
+        if ready_entries:
+            self._submit_tasks(ready_entries)
+            job_signal = True
+            for job_entry in ready_entries:
+                if job_entry.has_key('job_id') and not(job_entry.get('job_status') and job_entry['job_status'].isEnded()):
+                    self._running.append(job_entry['task'].id)
         return job_signal
 
+    def _submit_tasks(self, job_entries):
+        """start the jobs of several ready tasks.
+        The jobs are submitted concurrently to the remote servers, by at most 
+        WORKFLOW_SUBMISSION_THREADS threads for this workflow and WORKFLOW_SERVER_SUBMISSIONS
+        threads per server.
+        The identical jobs (same server, service and parameters) go through a creation 
+        throttle: at most SIMULTANEOUS_JOBS create requests of identical jobs are in flight 
+        at a time. It does not limit the running identical jobs, the jobs are not waited for: 
+        this is enforced by the server for the whole life of the jobs (Job.over_limit), the 
+        throttle only ensures that each create request is checked against the identical jobs 
+        already created rather than racing with them.
+        The local jobs are submitted one after the other by the main thread before 
+        the threads are started: their submission forks this process (RunnerFather), 
+        and a fork while the submission threads hold locks (logging, semaphores) could 
+        deadlock the child."""
+        submissions = []
+        for job_entry in job_entries:
+            t = job_entry['task']
+            j, job_parameters = self._prepare_submission(t, job_entry)
+            if isinstance(j, Mobyle.JobFacade.RemoteJobFacade) and self.cfg.workflow_submission_threads() > 1:
+                submissions.append([job_entry, j, job_parameters, None, None])
+            else:
+                resp = self._create_job(t, job_entry, j, job_parameters)
+                self._register_job(t, job_entry, j, resp)
+        if not submissions:
+            return
+        server_limits = {}
+        creation_throttles = {}
+        simultaneous_jobs = self.cfg.simultaneous_jobs()
+        pending = Queue.Queue()
+        for submission in submissions:
+            job_entry, j, job_parameters = submission[:3]
+            server = job_entry['task'].server
+            if not(server_limits.has_key(server)):
+                server_limits[server] = threading.BoundedSemaphore(self.cfg.workflow_server_submissions())
+            limits = []
+            if simultaneous_jobs:
+                key = (server, job_entry['task'].service, repr(sorted(job_parameters.items())))
+                if not(creation_throttles.has_key(key)):
+                    creation_throttles[key] = threading.BoundedSemaphore(simultaneous_jobs)
+                limits.append(creation_throttles[key])
+            # a slot of the server is not held while waiting for the throttle
+            limits.append(server_limits[server])
+            job_entry['queued_at'] = time.time()
+            pending.put((submission, limits))
+        def worker():
+            while True:
+                try:
+                    submission, limits = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                job_entry, j, job_parameters = submission[:3]
+                for limit in limits:
+                    limit.acquire()
+                try:
+                    try:
+                        submission[3] = self._create_job(job_entry['task'], job_entry, j, job_parameters)
+                    except Exception, err:
+                        submission[4] = err
+                finally:
+                    for limit in reversed(limits):
+                        limit.release()
+        threads = [threading.Thread(target=worker) for i in range(min(self.cfg.workflow_submission_threads(), len(submissions)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # the jobs are registered by the main thread, the first error is raised 
+        # once all the submitted jobs are recorded
+        error = None
+        for job_entry, j, job_parameters, resp, err in submissions:
+            if err is None:
+                try:
+                    self._register_job(job_entry['task'], job_entry, j, resp)
+                except WorkflowJobError, register_error:
+                    err = register_error
+            if err is not None and error is None:
+                error = err
+        if error is not None:
+            if isinstance(error, WorkflowJobError):
+                raise error
+            raise WorkflowJobError(str(error))
+
+    def _prepare_submission(self, t, job_entry):
+        """build the job facade and the parameters of the job of the task t
+        @return: the job facade and the request of the new job
+        @rtype: ( L{JobFacade} instance , dict )"""
+        input_entries = self._task_inputs[t.id]
+        # if job is not running, start it
+        log.debug('starting job for task %s' % t.id)
+        log.debug('registry.getProgramUrl(t.service = %s,t.server= %s)' %(t.service , t.server) )
+        if t.server is None:
+            t.server = 'local'
+        job_parameters = {}
+        try:
+            url = registry.getProgramUrl(t.service,t.server)
+            j = Mobyle.JobFacade.JobFacade.getFromService(programUrl=url, workflowId=self.id)
+            job_parameters['programName'] = url
+        except:
+            url = registry.getWorkflowUrl(t.service,t.server)
+            j = Mobyle.JobFacade.JobFacade.getFromService(workflowUrl=url, workflowId=self.id)                        
+            job_parameters['workflowUrl'] = url
+        for i_e in input_entries:
+            if i_e.has_key('value'):
+                job_parameters[i_e['parameter_id']]=i_e['value']
+            else:
+                job_parameters[i_e['parameter_id']+'.src']=i_e['src']
+                job_parameters[i_e['parameter_id']+'.srcFileName']=i_e['srcFileName']
+                job_parameters[i_e['parameter_id']+'.mode']='result'
+                job_parameters[i_e['parameter_id']+'.name']=i_e['parameter_id']+'.data'
+        job_parameters['email'] = self.email
+        # the inputs of the task are available since the end of its last predecessor
+        predecessors = [i_e['source_task'] for i_e in input_entries if i_e.has_key('source_task')]
+        job_entry['ready_at'] = max([self._start_time] + [self._job_entries[p]['ended_at'] for p in predecessors \
+                                                          if self._job_entries[p].has_key('ended_at')])
+        return j, job_parameters
+
+    def _create_job(self, t, job_entry, j, job_parameters):
+        """submit the job of the task t, this method may be called by a submission thread
+        @return: the response of the job creation
+        @rtype: dict"""
+        submission_start = time.time()
+        try:
+            resp = j.create(request_dict=job_parameters)
+        except Exception, e:
+            raise WorkflowJobError("error during submission of task %s(%s)" \
+                                      %(t.id, t.description))
+        job_entry['submitted_at'] = time.time()
+        job_entry['submission_time'] = job_entry['submitted_at'] - submission_start
+        job_entry['submission_wait'] = submission_start - job_entry.get('queued_at', submission_start)
+        log.info("workflow %s task %s: job submitted in %.3fs (waited %.3fs for a submission slot)" 
+                 % (self.id, t.id, job_entry['submission_time'], job_entry['submission_wait']))
+        return resp
+
+    def _register_job(self, t, job_entry, j, resp):
+        """record the new job of the task t in the workflow and check its status"""
+        job_entry['job_id'] = resp['id']
+        job_entry['remote'] = isinstance(j, Mobyle.JobFacade.RemoteJobFacade)
+        if not(job_entry['remote']):
+            try:
+                job_entry['dir'] = url2path(job_entry['job_id'])
+                if os.path.basename(job_entry['dir']) == 'index.xml':
+                    job_entry['dir'] = os.path.dirname(job_entry['dir'])
+            except MobyleError:
+                # the job is not in the local results tree
+                pass
+            else:
+                if self._watcher is not None:
+                    self._watcher.watch(job_entry['dir'])
+        if resp.has_key('errorparam') or resp.has_key('errormsg'):
+            raise WorkflowJobError("error during submission of task %s(%s).\n job %s message: %s: %s." \
+                                      %(t.id, t.description,job_entry['job_id'],resp.get('errorparam'),resp.get('errormsg')))
+        self.jobState.setTaskJob(t,job_entry['job_id'])
+        self.jobState.commit()
+        self._process_subjob_status_update(j, job_entry, t)
+        log.debug('job for task %s: %s' % (t.id, job_entry['job_id']))
+
     def _process_subjob_status_update(self, j, job_entry, t):
         """ check a subjob status and update the workflow job status, process outputs and raise an exception if relevant """
         new_status = j.getStatus()
         if not(job_entry.has_key('job_status')) or new_status!=job_entry['job_status']:
             job_entry['job_status'] = new_status
+            if new_status.isEnded():
+                job_entry['detected_at'] = time.time()
+                try:
+                    job_entry['ended_at'] = os.path.getmtime(os.path.join(job_entry['dir'], StatusManager.file_name))
+                except (KeyError, OSError):
+                    job_entry['ended_at'] = job_entry['detected_at']
+                if job_entry.has_key('dir') and self._watcher is not None:
+                    self._watcher.unwatch(job_entry['dir'])
             #update it if it changed since last check
             self.set_status(Status( code = 3 ,
                                         message="job %s: %s" % (job_entry['job_id'] , job_entry['job_status'])))             
@@ -492,12 +737,12 @@ class WorkflowJob(object):
                 raise WorkflowJobError("job %s for task %s failed." %(job_entry['job_id'], t.id)) # error, so nothing to be done
             if new_status.isEnded():
                 # if status complete copy job outputs to task output
-                output_entries = [entry for entry in self.data if (entry['type']=='task_output' and entry['task'].id==t.id)]
-                for o in output_entries:
+                for o in self._task_outputs[t.id]:
                     output_values = j.getOutputParameterRefs(o['parameter_id'])
                     if len(output_values)>0:
                         o['src'] = output_values[0]['src'] #FIXME WE TAKE ONLY THE FIRST VALUE INTO ACCOUNT!!!
                         o['srcFileName'] = output_values[0]['srcFileName']
+                        self._source_available(o)
                     else:
                         # if the expected result has not been produced
                         raise WorkflowJobError("expected output %s has not been produced by task %s (job %s)" 
@@ -509,36 +754,23 @@ class WorkflowJob(object):
     def _iterate_data(self):
         """link data between tasks"""
         data_signal = False
-        # linking data
-        new_data = self.data
-        for item in [item for item in self.data if item['type']=='link']:
+        # linking data: only the links whose source got a value since the last call
+        while self._links_to_process:
+            item, source, target = self._links_to_process.popleft()
             log.debug("processing data entry %s" % item)
-            link = item['link']
-            if not(link.from_task):
-                log.debug("from workflow input to task input")
-                source = [entry for entry in self.data if entry['type']=='input' and entry['parameter'].id==link.from_parameter][0]
-                target = [entry for entry in self.data if (entry['type']=='task_input' and entry['task'].id==link.to_task and entry['parameter_id']==link.to_parameter)][0]
-            elif link.to_task:
-                log.debug("from task output to task input")
-                source = [entry for entry in self.data if entry['type']=='task_output' and entry['task'].id==link.from_task and entry['parameter_id']==link.from_parameter][0]
-                target = [entry for entry in self.data if (entry['type']=='task_input' and entry['task'].id==link.to_task and entry['parameter_id']==link.to_parameter)][0]
-            else:
-                log.debug("from task output to workflow output")
-                source = [entry for entry in self.data if entry['type']=='task_output' and entry['task'].id==link.from_task and entry['parameter_id']==link.from_parameter][0]
-                target = [output for output in self.data if output['type']=='output' and output['parameter'].id==link.to_parameter][0]
             log.debug(source)
             log.debug(target)
-            if source.has_key('src') or source.has_key('value'):
-                if source.has_key('src'):
-                    target['src'] = source['src']
-                    target['srcFileName'] = source['srcFileName']
-                elif source.has_key('value'):
-                    target['value'] = source['value']                    
-                log.debug("processing %s" % target)
-                data_signal = True
-                log.debug("removing %s" % entry)
-                new_data.remove(item)
-        self.data = new_data
+            if source.has_key('src'):
+                target['src'] = source['src']
+                target['srcFileName'] = source['srcFileName']
+            elif source.has_key('value'):
+                target['value'] = source['value']                    
+            if source['type'] == 'task_output':
+                target['source_task'] = source['task'].id
+            log.debug("processing %s" % target)
+            data_signal = True
+            self._linked.add(id(item))
+            self._set_valued(target)
         return data_signal
 
     def _iterate_processing(self):
@@ -578,7 +810,8 @@ class WorkflowJob(object):
         log.debug("workflow job %s summary" % self.id)
         log.debug("data summary:")
         for entry in self.data:
-            log.debug(entry)
+            if id(entry) not in self._linked:
+                log.debug(entry)
         log.debug("jobs summary:")
         for entry in self.sub_jobs:
             log.debug(entry)
@@ -34,47 +34,77 @@ from pyramid.security import (
 
 
 
+from sqlalchemy import and_, select, union
+
 from mobyle2.core.models import auth, user, project
-from mobyle2.core.basemodel import R, P, SecuredObject
+from mobyle2.core.basemodel import (
+    R, P, SecuredObject, DBSession, PRINCIPALS_CACHE)
 
 @implementer(IAuthenticationPolicy)
 class AuthTktAuthenticationPolicy(BAuthTktAuthenticationPolicy):
     """Mobyle2 authn policy"""
 
 
+def get_role_names(uid, context=None):
+    """Names of the roles of a user: its global roles, the global roles
+    of its groups and, if the context is a SecuredObject, the roles
+    given by the resource to the user and to its groups.
+    Everything is loaded by one query"""
+    ugroups = select([user.AuthUserGroups.group_id]).where(
+        user.AuthUserGroups.user_id == uid)
+    queries = [
+        select([user.UserRole.role_id]).where(
+            user.UserRole.user_id == uid),
+        select([user.GroupRole.role_id]).where(
+            user.GroupRole.group_id.in_(ugroups)),
+    ]
+    if isinstance(context, SecuredObject):
+        if context.acluser is not None:
+            queries.append(
+                select([context.acluser.role_id]).where(and_(
+                    context.acluser.resource == context.context,
+                    context.acluser.user_id == uid)))
+        if context.aclgroup is not None:
+            queries.append(
+                select([context.aclgroup.role_id]).where(and_(
+                    context.aclgroup.resource == context.context,
+                    context.aclgroup.group_id.in_(ugroups))))
+    return [r[0]
+            for r in DBSession.query(auth.Role.name).filter(
+                auth.Role.id.in_(union(*queries))).order_by(auth.Role.id)]
+
+
 class ACLAuthorizationPolicy(BACLAuthorizationPolicy):
     """Mobyle2 authz policy"""
 
     def get_contextual_principals(self, context):
-        principals = []
+        """Principals of the request user on this context.
+        They are memoized on the request by user and by resource roles
+        (see SecuredObject.acl_key) as a page checks many permissions"""
         request = getattr(context, 'request', None)
         if request is None:
             request = get_current_request()
+        if not request:
+            return self.compute_contextual_principals(None, context)
+        ausr = request.user
+        ctxkey = None
+        if isinstance(context, SecuredObject):
+            ctxkey = context.acl_key()
+        key = (ausr and ausr.id, ctxkey)
+        cache = request.__dict__.setdefault(PRINCIPALS_CACHE, {})
+        if not key in cache:
+            cache[key] = self.compute_contextual_principals(request, context)
+        return list(cache[key])
+
+    def compute_contextual_principals(self, request, context):
+        principals = []
         anonym = True
         try:
             if request:
                 ausr = request.user
                 if ausr:
                     anonym = False
-                    usr = user.User.by_id(ausr.id)
-                    roles = []
-                    for r in usr.global_roles:
-                        roles.append(r)
-                    if isinstance(context, SecuredObject):
-                        noecho = [roles.append(r)
-                                  for r in context.get_roles_for_user(usr)
-                                  if not r in roles]
-                    for ag in request.user.groups:
-                        g = user.Group.by_id(ag.id)
-                        for r in g.global_roles:
-                            if not r in roles:
-                                roles.append(r)
-                        if isinstance(context, SecuredObject):
-                            noecho = [roles.append(r)
-                                      for r in context.get_roles_for_group(g)
-                                      if not r in roles]
-                    for r in roles:
-                        rn = r.name
+                    for rn in get_role_names(ausr.id, context):
                         if not rn in principals:
                             principals.append(rn)
             if not anonym:
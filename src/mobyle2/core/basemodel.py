@@ -21,6 +21,8 @@ from pyramid.security import (
     Authenticated,
 )
 
+from pyramid.threadlocal import get_current_request
+
 from sqlalchemy.orm import scoped_session, sessionmaker, reconstructor
 from sqlalchemy.ext.declarative import declarative_base
 import logging
@@ -62,6 +64,31 @@ class AbstractModel(object):
     def by_resource(cls,resource):
         return cls.session.query(cls).filter_by(resource=resource)
 
+PRINCIPALS_CACHE = '_mobyle2_principals'
+"""Attribute of the request where the auth policy memoizes the principals"""
+
+def invalidate_principals(request=None):
+    """Forget the principals computed during this request,
+    to call when roles are granted or revoked"""
+    if request is None:
+        request = get_current_request()
+    if request is not None:
+        request.__dict__.pop(PRINCIPALS_CACHE, None)
+
+QUERY_COUNT = 'mobyle2.sql_queries'
+"""Key of the request environ where the number of SQL queries is counted"""
+
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    """SQLAlchemy 'before_cursor_execute' listener counting
+    the queries of the current request"""
+    request = get_current_request()
+    if request is not None:
+        request.environ[QUERY_COUNT] = request.environ.get(QUERY_COUNT, 0) + 1
+
+def get_query_count(request):
+    """Number of SQL queries run by this request so far"""
+    return request.environ.get(QUERY_COUNT, 0)
+
 class MigrateAbstractModel(AbstractModel):
     session = MDBSession
     __table_args__ = {'keep_existing':True}
@@ -87,6 +114,7 @@ def acl_for_role_proxy_factory(self, rolename, acluser, aclgroup):
                 i = aclgroup(role=p.role, group=item, resource=self.context)
                 session.add(i)
                 session.commit()
+                invalidate_principals()
 
         def remove_group(p, item):
             if aclgroup is None: return
@@ -102,6 +130,7 @@ def acl_for_role_proxy_factory(self, rolename, acluser, aclgroup):
                         deleted.append(a)
                 if modified:
                     session.commit()
+                invalidate_principals()
 
 
         def append_user(p, item):
@@ -110,6 +139,7 @@ def acl_for_role_proxy_factory(self, rolename, acluser, aclgroup):
                 i = acluser(role=p.role, user=item, resource=self.context)
                 session.add(i)
                 session.commit()
+                invalidate_principals()
 
         def remove_user(p, item):
             if acluser is None: return
@@ -125,6 +155,7 @@ def acl_for_role_proxy_factory(self, rolename, acluser, aclgroup):
                         deleted.append(a)
                 if modified:
                     session.commit()
+                invalidate_principals()
         @property
         def list_users(p):
             l = []
@@ -319,6 +350,15 @@ class SecuredObject(Traversable):
                          resource=self.context, role=role).all()]
         return l
 
+    def acl_key(self):
+        """Hashable key of the resource roles of this object:
+        the objects with the same key give the same roles to a user.
+        None if this object does not give any role"""
+        if (self.acluser is None) and (self.aclgroup is None):
+            return None
+        return (self.acluser, self.aclgroup,
+                self.context.__class__, self.context.id)
+
     def get_roles_for_user(self, usr):
         l = []
         if self.acluser is not None:
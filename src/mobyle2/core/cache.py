@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__docformat__ = 'restructuredtext en'
+"""
+Process wide caches for the data which are expensive to build
+and shared by many requests.
+
+The entries expire after a ttl and the whole cache is invalidated
+when the models it depends on are modified in this process
+(see Cache.invalidate_on), the ttl bounds the staleness for the
+other processes of the portal.
+"""
+import threading
+import time
+
+from ordereddict import OrderedDict
+
+from sqlalchemy import event
+
+
+class Cache(object):
+    """LRU cache with a ttl"""
+
+    def __init__(self, ttl=300, maxsize=1000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        # (id of the listened object, event name), event.contains
+        # does not exist before sqlalchemy 0.9
+        self.listened = set()
+
+    def get(self, key, factory, ttl=None):
+        """Return the value cached for key or
+        build it with factory() and cache it"""
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        self.lock.acquire()
+        try:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] + ttl > now:
+                self.entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        finally:
+            self.lock.release()
+        value = factory()
+        self.lock.acquire()
+        try:
+            self.entries[key] = (now, value)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        finally:
+            self.lock.release()
+        return value
+
+    def invalidate(self, *args, **kw):
+        """Forget everything, usable as an event listener"""
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+        finally:
+            self.lock.release()
+
+    def listen(self, target, name):
+        key = (id(target), name)
+        if not key in self.listened:
+            event.listen(target, name, self.invalidate)
+            self.listened.add(key)
+
+    def invalidate_on(self, *models):
+        """Invalidate the cache when an instance of one of those
+        mapped classes is inserted, updated or deleted"""
+        for model in models:
+            for name in ('after_insert', 'after_update', 'after_delete'):
+                self.listen(model, name)
+
+    def invalidate_on_collection(self, *attributes):
+        """Invalidate the cache when an item is added to or removed from
+        one of those relationships (the rows of a secondary table
+        are not seen by the mapper events)"""
+        for attribute in attributes:
+            for name in ('append', 'remove'):
+                self.listen(attribute, name)
+
+# vim:set et sts=4 ts=4 tw=80:
@@ -6,6 +6,9 @@ from glob import glob
 import sys, os
 import logging
 import shutil
+import time
+import hashlib
+import multiprocessing
 
 from pyramid.paster import bootstrap
 
@@ -65,8 +68,206 @@ def import_mobyle1_service(path):
     except:
         logging.error("Error while parsing file %s." % path, exc_info=True)
 
-def import_mobyle1_service_directory(dir_path):
+BATCH_SIZE = 200
+"""Number of services inserted or updated by transaction"""
+SERVICE_FIELDS = ('type', 'description', 'package', 'classification')
+
+def file_hash(path):
+    """sha1 of the content of a file, None if it does not exist"""
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha1()
+    f = open(path, 'rb')
+    try:
+        for block in iter(lambda: f.read(65536), ''):
+            h.update(block)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+def parse_service_file(path):
+    """Parse a service and hash its file, run by the workers of the
+    process pool: return (path, service dict, error message)"""
+    try:
+        s_d = parse_service(path)
+        s_d['hash'] = file_hash(path)
+        return path, s_d, None
+    except Exception, e:
+        return path, None, '%s' % e
+
+def parse_service_files(paths, processes=None):
+    """Parse the services in a pool of processes
+    (one by cpu if processes is None)"""
+    if processes == 1 or len(paths) < 2:
+        return [parse_service_file(path) for path in paths]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(parse_service_file, paths,
+                        chunksize=max(1, len(paths) / (4 * processes)))
+    finally:
+        pool.close()
+        pool.join()
+
+def copy_service_file(path, dest, s_hash):
+    """Copy the xml of a service if its content changed,
+    return True if the file was copied"""
+    if file_hash(dest) == s_hash:
+        return False
+    dest_dir = os.path.dirname(dest)
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+    # no partial file if the copy fails
+    tmp = '%s.tmp' % dest
+    try:
+        shutil.copyfile(path, tmp)
+        os.rename(tmp, dest)
+    except:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
+
+def import_mobyle1_services(paths, batch_size=BATCH_SIZE, processes=None, dry_run=False):
+    """Import services in bulk: the files are parsed by a pool of
+    processes, the services of the local server of the public project
+    are loaded by one query, the inserts and updates are committed by
+    batches of batch_size services and the files are copied only if
+    their content changed.
+    A batch which fails is imported again service by service, so only
+    the invalid services are lost.
+    With dry_run nothing is written, the statistics tell what
+    would have been done.
+    Return the statistics of the import (counts and timings in sec)"""
+    stats = dict([(k, 0) for k in (
+        'files', 'errors', 'new', 'updated', 'unchanged', 'copied',
+        'parse_time', 'load_time', 'db_time', 'copy_time', 'total_time')])
+    stats['files'] = len(paths)
+    start = time.time()
+    server = public_project.servers[0]
+    services_dir = os.path.join(public_project.directory, server.name)
+    def xml_file(name):
+        # as Service.xml_file, without loading the service
+        return os.path.join(services_dir, name, '%s.xml' % name)
+    t = time.time()
+    parsed = []
+    for path, s_d, error in parse_service_files(paths, processes):
+        if error is not None:
+            logging.error("Error while parsing file %s: %s" % (path, error))
+            stats['errors'] += 1
+        else:
+            parsed.append((path, s_d))
+    stats['parse_time'] = time.time() - t
+    t = time.time()
+    server_id, project_id = server.id, public_project.id
+    columns = (Service.name,) + tuple(
+        getattr(Service, f) for f in SERVICE_FIELDS)
+    existing = {}
+    for row in session.query(*columns).filter(
+        Service.server_id == server_id).filter(
+            Service.project_id == project_id):
+        existing[row[0]] = dict(zip(SERVICE_FIELDS, row[1:]))
+    stats['load_time'] = time.time() - t
+
+    def import_batch(batch):
+        """Insert or update the services of the batch in one
+        transaction, return the counts and the imported values by name"""
+        counts = {'new': 0, 'updated': 0, 'unchanged': 0}
+        seen, pending = {}, {}
+        for path, s_d in batch:
+            name = s_d['name']
+            values = dict([(f, s_d[f]) for f in SERVICE_FIELDS])
+            current = seen.get(name, existing.get(name, None))
+            if current is None:
+                logging.info("service %s new, adding to the server" % name)
+                counts['new'] += 1
+                if not dry_run:
+                    svc = Service(name=name, server=server, project=public_project)
+                    for f in SERVICE_FIELDS:
+                        setattr(svc, f, values[f])
+                    session.add(svc)
+                    pending[name] = svc
+            elif [current[f] for f in SERVICE_FIELDS] != [values[f] for f in SERVICE_FIELDS]:
+                logging.info("service %s already here, updating" % name)
+                counts['updated'] += 1
+                if not dry_run and name in pending:
+                    # new in this batch, not flushed yet
+                    for f in SERVICE_FIELDS:
+                        setattr(pending[name], f, values[f])
+                elif not dry_run:
+                    session.query(Service).filter_by(
+                        name=name, server_id=server_id,
+                        project_id=project_id).update(
+                            values, synchronize_session=False)
+            else:
+                counts['unchanged'] += 1
+            seen[name] = values
+        if not dry_run:
+            session.commit()
+        return counts, seen
+
+    copies = []
+    for i in range(0, len(parsed), batch_size):
+        batch = parsed[i:i + batch_size]
+        t = time.time()
+        try:
+            counts, seen = import_batch(batch)
+            existing.update(seen)
+        except Exception:
+            session.rollback()
+            logging.error("Error while importing a batch of %s services, "
+                          "importing them one by one" % len(batch), exc_info=True)
+            counts = {'new': 0, 'updated': 0, 'unchanged': 0}
+            imported = []
+            for item in batch:
+                try:
+                    c, s = import_batch([item])
+                except Exception:
+                    session.rollback()
+                    logging.error("Error while importing file %s." % item[0], exc_info=True)
+                    stats['errors'] += 1
+                    continue
+                for k in counts:
+                    counts[k] += c[k]
+                # a service may be found again later in this batch
+                existing.update(s)
+                imported.append(item)
+            batch = imported
+        stats['db_time'] += time.time() - t
+        for k in counts:
+            stats[k] += counts[k]
+        copies.extend(batch)
+
+    t = time.time()
+    for path, s_d in copies:
+        dest = xml_file(s_d['name'])
+        try:
+            if dry_run:
+                copied = file_hash(dest) != s_d['hash']
+            else:
+                copied = copy_service_file(path, dest, s_d['hash'])
+        except Exception:
+            logging.error("Error while copying file %s." % path, exc_info=True)
+            stats['errors'] += 1
+            continue
+        if copied:
+            stats['copied'] += 1
+    stats['copy_time'] = time.time() - t
+    stats['total_time'] = time.time() - start
+    logging.info("%s%s files: %s new, %s updated, %s unchanged, %s copied, "
+                 "%s errors in %.2fs (parse %.2fs, load %.2fs, db %.2fs, copy %.2fs)" % (
+                     dry_run and "[dry run] " or "",
+                     stats['files'], stats['new'], stats['updated'],
+                     stats['unchanged'], stats['copied'], stats['errors'],
+                     stats['total_time'], stats['parse_time'],
+                     stats['load_time'], stats['db_time'], stats['copy_time']))
+    return stats
+
+def import_mobyle1_service_directory(dir_path, batch_size=BATCH_SIZE, processes=None, dry_run=False):
     """Import a whole directory - will scan all files
-    with an XML extension inside"""
-    for path in glob(os.path.join(dir_path,'*.xml')):
-        import_mobyle1_service(path)
+    with an XML extension inside, see import_mobyle1_services"""
+    return import_mobyle1_services(glob(os.path.join(dir_path,'*.xml')),
+                                   batch_size=batch_size,
+                                   processes=processes,
+                                   dry_run=dry_run)
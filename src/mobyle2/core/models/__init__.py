@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from sqlalchemy import MetaData
+from sqlalchemy import event
 from apex import models as apexmodels
-from mobyle2.core.basemodel import DBSession, Base, metadata
+from mobyle2.core.basemodel import DBSession, Base, metadata, count_query
 
 
 """
@@ -38,6 +39,10 @@ def initialize_sql(engine, create=False):
               'authentication_permission',
               'jobs']
     apex_create = False
+    # event.contains does not exist before sqlalchemy 0.9
+    if not getattr(engine, '_mobyle2_count_query', False):
+        event.listen(engine, 'before_cursor_execute', count_query)
+        engine._mobyle2_count_query = True
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
     apexmodels.Base.metadata.bind = engine
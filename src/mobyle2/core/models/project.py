@@ -10,6 +10,7 @@ from sqlalchemy import Unicode
 from sqlalchemy import Integer
 from sqlalchemy import ForeignKey
 from sqlalchemy.orm import relationship, synonym
+from sqlalchemy.sql import select, union, or_
 
 from pyramid.location import lineage
 from pyramid.security import (
@@ -196,23 +197,34 @@ class Project(Base):
 
     @classmethod
     def by_owner(cls, owner):
-        res = []
-        prs = session.query(cls).filter_by(owner=owner).all()
-        noecho = [res.append(p) for p in prs if not p in res]
-        return res
+        return session.query(cls).filter_by(owner=owner).all()
+
+    @classmethod
+    def participation_ids(cls, usr):
+        """Select of the ids of the projects where the user or
+        one of its groups has a role"""
+        # leave import there for circular problems
+        from mobyle2.core.models import user
+        ugroups = select([user.AuthUserGroups.group_id]).where(
+            user.AuthUserGroups.user_id == usr.id)
+        return union(
+            select([ProjectUserRole.rid]).where(
+                ProjectUserRole.user_id == usr.id),
+            select([ProjectGroupRole.rid]).where(
+                ProjectGroupRole.group_id.in_(ugroups)))
 
     @classmethod
     def by_participation(cls, usr):
-        # fiest get user projects
-        res = []
-        def uniq_append(items):
-            for p in items:
-                if not p.resource in res:
-                    res.append(p.resource)
-        uniq_append(session.query(ProjectUserRole).filter_by(user=usr).all())
-        for g in usr.groups:
-            uniq_append(session.query(ProjectGroupRole).filter_by(group=g).all())
-        return res
+        return session.query(cls).filter(
+            cls.id.in_(cls.participation_ids(usr))).all()
+
+    @classmethod
+    def by_member(cls, usr):
+        """Query of the projects owned by the user or where the user
+        or one of its groups has a role, each project once"""
+        return session.query(cls).filter(
+            or_(cls.user_id == usr.id,
+                cls.id.in_(cls.participation_ids(usr))))
 
     @classmethod
     def get_public_project(cls):
@@ -231,21 +243,19 @@ class Project(Base):
         return self.user.id == public_user.id
 
     def get_services(self, service_type=None, server=None):
-        services = []
         if server is not None:
             servers = [server]
         else:
             servers = self.servers
-        for s in servers:
-            kw = dict(server=s, project=self)
-            if service_type is not None:
-                kw['type'] = service_type
-                kw['enable'] = True
-            svcs = self.session.query(Service).filter_by(**kw).all()
-            for sv in svcs:
-                if not sv in services:
-                    services.append(sv)
-        return services
+        if not servers:
+            return []
+        # one query for all the servers of the project
+        query = self.session.query(Service).filter(
+            Service.project == self).filter(
+                Service.server_id.in_([s.id for s in servers]))
+        if service_type is not None:
+            query = query.filter_by(type=service_type, enable=True)
+        return query.order_by(Service.server_id, Service.id).all()
 
     def get_services_by_something(self,category_getter):
         """Get a tree of the available services, sorted using the hierarchy
@@ -307,6 +317,23 @@ class ProjectResource(SecuredObject):
 class Projects(SecuredObject):
     __default_acls__  = default_projects_acls
     __description__ = _("Projects")
+
+    def find_context(self, item, public_project=None):
+        """Resource of a project, without building the
+        resources of all the projects"""
+        if item is None:
+            return None
+        if public_project is None:
+            public_project = Project.get_public_project()
+        if public_project == item:
+            name = _('Public project')
+            id = None
+        else:
+            name = item.name
+            id = "%s" % item.id
+        pr = ProjectResource(item, self, id=id, name=name)
+        return {'key': pr.__name__, 'item': pr}
+
     @property
     def items(self):
         default_p = Project.get_public_project()
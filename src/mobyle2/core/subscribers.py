@@ -1,6 +1,7 @@
 import logging
 from pyramid.i18n import get_localizer
 from pyramid.threadlocal import get_current_registry
+from pyramid.settings import asbool
 
 from mobyle2.core.views import get_base_params
 
@@ -8,6 +9,7 @@ from mobyle2.core.models import DBSession as session
 from mobyle2.core.models.project import Project, ProjectResource, ProjectUserRole, ProjectGroupRole, projects_dir
 from mobyle2.core.models.registry import set_registry_key, get_registry_key, set_registry_key
 from mobyle2.core.models.user import User
+from mobyle2.core.basemodel import get_query_count
 
 from mobyle2.core.utils import _
 from mobyle2.core.utils import __
@@ -30,6 +32,17 @@ def add_globals(event):
     request.translate = auto_translate
     request.projects_dir = projects_dir()
 
+def report_query_count(event):
+    """Log the number of SQL queries of the request and, if
+    mobyle2.expose_query_count is set, send it in the X-Mobyle2-Queries header"""
+    request = event.request
+    count = get_query_count(request)
+    logging.getLogger('mobyle2.queries').debug(
+        '%s: %d SQL queries' % (request.path, count))
+    settings = request.registry.settings
+    if asbool(settings.get('mobyle2.expose_query_count', False)):
+        event.response.headers['X-Mobyle2-Queries'] = str(count)
+
 def regenerate_velruse_config(event):
     set_registry_key('mobyle2.needrestart', True)
 
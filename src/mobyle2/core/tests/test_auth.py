@@ -1,10 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 __docformat__ = 'restructuredtext en'
+import shutil
+import tempfile
 import unittest
 from pyramid import testing
+from pyramid.security import has_permission
 
+from apex.models import create_user
+
+from mobyle2.core import auth as pauth
+from mobyle2.core.basemodel import R, P, SecuredObject, get_query_count
 from mobyle2.core.models import auth
+from mobyle2.core.models import user
+from mobyle2.core.models.project import Project, ProjectResource, \
+        ProjectUserRole, ProjectGroupRole, projects_dir
+from mobyle2.core.models.server import create_local_server
 from mobyle2.core.views import auth as vauth
 from mobyle2.core.tests import utils
 
@@ -27,6 +38,122 @@ class TestAuth(utils.PyramidTestCase):
         )
         info = vauth.Add(request)()
 
+
+def old_role_names(uid, context=None):
+    """The roles of a user as they were computed before
+    get_role_names, one query per group and per resource"""
+    usr = user.User.by_id(uid)
+    roles = []
+    for r in usr.global_roles:
+        roles.append(r)
+    if isinstance(context, SecuredObject):
+        noecho = [roles.append(r)
+                  for r in context.get_roles_for_user(usr)
+                  if not r in roles]
+    for ag in usr.groups:
+        g = user.Group.by_id(ag.id)
+        for r in g.global_roles:
+            if not r in roles:
+                roles.append(r)
+        if isinstance(context, SecuredObject):
+            noecho = [roles.append(r)
+                      for r in context.get_roles_for_group(g)
+                      if not r in roles]
+    return [r.name for r in roles]
+
+
+class TestPrincipals(unittest.TestCase):
+    layer = utils.PyramidLayer
+
+    def setUp(self):
+        self.session = utils.get_session()
+        self.directory = tempfile.mkdtemp()
+        projects_dir(self.directory)
+        create_local_server()
+        # the database is shared by the tests
+        name = self.id().split('.')[-1]
+        self.usr = self.create_user(u'%s_user' % name)
+        self.owner = self.create_user(u'%s_owner' % name)
+        self.group = user.Group(name=u'%s_group' % name)
+        self.session.add(self.group)
+        self.usr.groups.append(self.group)
+        self.usr.global_roles.append(
+            auth.Role.by_name(R['internal_user']))
+        self.group.global_roles.append(
+            auth.Role.by_name(R['external_user']))
+        self.project = Project.create(u'%s_project' % name,
+                                      u'roles', self.owner)
+        self.session.add(ProjectUserRole(
+            self.project, auth.Role.by_name(R['project_watcher']), self.usr))
+        self.session.add(ProjectGroupRole(
+            self.project, auth.Role.by_name(R['project_contributor']),
+            self.group))
+        self.session.commit()
+        self.request = utils.DummyRequest()
+        self.request.user = utils.DummyAuthUser(self.usr.id)
+        self.request.matched_route = None
+        self.config = testing.setUp(request=self.request)
+        self.config.add_static_view('static', 'mobyle2.core:static')
+        self.config.set_authorization_policy(pauth.ACLAuthorizationPolicy())
+        self.config.set_authentication_policy(
+            pauth.AuthTktAuthenticationPolicy('secret'))
+
+    def tearDown(self):
+        testing.tearDown()
+        shutil.rmtree(self.directory)
+
+    def create_user(self, login):
+        ausr = create_user(login=login, username=login,
+                           email=u'%s@internal' % login)
+        usr = user.User(base_user=ausr)
+        self.session.add(usr)
+        self.session.commit()
+        return usr
+
+    def test_role_names(self):
+        resource = ProjectResource(self.project, request=self.request)
+        for context in (None, resource):
+            self.assertEquals(
+                sorted(pauth.get_role_names(self.usr.id, context)),
+                sorted(old_role_names(self.usr.id, context)))
+        self.assertEquals(
+            sorted(pauth.get_role_names(self.usr.id, resource)),
+            sorted([R['internal_user'], R['external_user'],
+                    R['project_watcher'], R['project_contributor']]))
+        # the owner does not inherit the roles of the user
+        self.assertEquals(
+            pauth.get_role_names(self.owner.id, resource),
+            old_role_names(self.owner.id, resource))
+
+    def test_contextual_principals(self):
+        policy = pauth.ACLAuthorizationPolicy()
+        resource = ProjectResource(self.project, request=self.request)
+        principals = policy.get_contextual_principals(resource)
+        self.assertEquals(sorted(principals),
+                          sorted(old_role_names(self.usr.id, resource)))
+        # no resource role outside of the project
+        self.assertEquals(
+            sorted(policy.get_contextual_principals(self.request.root)),
+            sorted(old_role_names(self.usr.id)))
+
+    def test_memoized_principals(self):
+        resource = ProjectResource(self.project, request=self.request)
+        self.assertTrue(has_permission(P['project_view'], resource,
+                                       self.request))
+        count = get_query_count(self.request)
+        for i in range(10):
+            self.assertTrue(has_permission(P['notebook_create'], resource,
+                                           self.request))
+            self.assertFalse(has_permission(P['project_delete'], resource,
+                                            self.request))
+        self.assertEquals(get_query_count(self.request), count)
+        # granting a role forgets the memoized principals
+        resource.proxy_roles[R['project_owner']].append_user(self.usr)
+        self.assertTrue(has_permission(P['project_delete'], resource,
+                                       self.request))
+        self.assertTrue(get_query_count(self.request) > count)
+
+
 def test_suite():
     return unittest.defaultTestLoader.loadTestsFromName(__name__)
 # vim:set et sts=4 ts=4 tw=80:
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__docformat__ = 'restructuredtext en'
+import os
+import shutil
+import tempfile
+import unittest
+from glob import glob
+from pyramid import testing
+
+from apex.models import create_user, AuthUser
+
+from mobyle2.core.models import user
+from mobyle2.core.models.project import projects_dir, PUBLIC_PROJECT_USERNAME
+from mobyle2.core.models.server import create_local_server
+from mobyle2.core.models.service import Service
+from mobyle2.core.tests import utils
+
+SERVICE_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<%(type)s>
+  <head>
+    <name>%(name)s</name>
+    <doc><description><text>%(description)s</text></description></doc>
+    <category>%(classification)s</category>
+    <package><name>%(package)s</name></package>
+  </head>
+  %(extra)s
+</%(type)s>
+"""
+
+class TestImport(unittest.TestCase):
+    def setUp(self):
+        self.config = testing.setUp()
+        # the session (and the database) is shared by the tests
+        self.session = utils.get_session()
+        self.directory = tempfile.mkdtemp()
+        projects_dir(os.path.join(self.directory, 'projects'))
+        create_local_server()
+        if AuthUser.get_by_login(PUBLIC_PROJECT_USERNAME) is None:
+            ausr = create_user(login=PUBLIC_PROJECT_USERNAME,
+                               username=PUBLIC_PROJECT_USERNAME,
+                               email=u'public@internal')
+            self.session.add(user.User(base_user=ausr))
+            self.session.commit()
+        # the module works on the public project, it must exist first
+        from mobyle2.core import insert_legacy_xml
+        self.legacy = insert_legacy_xml
+        self.public = insert_legacy_xml.public_project
+        self.name = self.id().split('.')[-1]
+        self.xml_dir = os.path.join(self.directory, 'xml')
+        os.makedirs(self.xml_dir)
+
+    def tearDown(self):
+        testing.tearDown()
+        # the public project may be in the directory of another test
+        services_dir = os.path.join(self.public.directory,
+                                    self.public.servers[0].name)
+        if os.path.exists(services_dir):
+            for name in os.listdir(services_dir):
+                if name.startswith(self.name):
+                    shutil.rmtree(os.path.join(services_dir, name))
+        shutil.rmtree(self.directory)
+
+    def write(self, name, type='program', description='desc',
+              classification='Alignment', package='pkg', extra=''):
+        name = '%s_%s' % (self.name, name)
+        path = os.path.join(self.xml_dir, '%s.xml' % name)
+        f = open(path, 'w')
+        f.write(SERVICE_XML % locals())
+        f.close()
+        return path
+
+    def services(self):
+        return dict([(s.name[len(self.name) + 1:], s)
+                     for s in self.session.query(Service).filter(
+                         Service.name.like(u'%s_%%' % self.name))])
+
+    def xml_file(self, name):
+        name = '%s_%s' % (self.name, name)
+        return os.path.join(self.public.directory,
+                            self.public.servers[0].name,
+                            name, '%s.xml' % name)
+
+    def run_import(self, paths=None, **kw):
+        if paths is None:
+            paths = sorted(glob(os.path.join(self.xml_dir, '*.xml')))
+        kw.setdefault('processes', 1)
+        stats = self.legacy.import_mobyle1_services(paths, **kw)
+        return dict([(k, stats[k]) for k in (
+            'files', 'errors', 'new', 'updated', 'unchanged', 'copied')])
+
+    def test_import(self):
+        for name in ('a', 'b', 'c'):
+            self.write(name)
+        self.assertEquals(
+            self.run_import(batch_size=2),
+            {'files': 3, 'errors': 0, 'new': 3, 'updated': 0,
+             'unchanged': 0, 'copied': 3})
+        services = self.services()
+        self.assertEquals(sorted(services.keys()), ['a', 'b', 'c'])
+        a = services['a']
+        self.assertEquals(
+            (a.type, a.description, a.classification, a.package),
+            ('program', 'desc', 'Alignment', 'pkg'))
+        self.assertEquals(open(self.xml_file('a')).read(),
+                          open(os.path.join(self.xml_dir, '%s_a.xml'
+                                            % self.name)).read())
+        # nothing changed
+        self.assertEquals(
+            self.run_import(batch_size=2),
+            {'files': 3, 'errors': 0, 'new': 0, 'updated': 0,
+             'unchanged': 3, 'copied': 0})
+        # a field changed, the file is copied
+        self.write('a', description='other desc')
+        # same fields, the file content changed: copied
+        self.write('b', extra='<!-- comment -->')
+        self.assertEquals(
+            self.run_import(batch_size=2),
+            {'files': 3, 'errors': 0, 'new': 0, 'updated': 1,
+             'unchanged': 2, 'copied': 2})
+        self.session.expire_all()
+        self.assertEquals(self.services()['a'].description, 'other desc')
+        self.assertTrue('comment' in open(self.xml_file('b')).read())
+
+    def test_dry_run(self):
+        self.write('a')
+        self.assertEquals(
+            self.run_import(dry_run=True),
+            {'files': 1, 'errors': 0, 'new': 1, 'updated': 0,
+             'unchanged': 0, 'copied': 1})
+        self.assertEquals(self.services(), {})
+        self.assertFalse(os.path.exists(self.xml_file('a')))
+        self.run_import()
+        self.write('a', package='other')
+        self.assertEquals(
+            self.run_import(dry_run=True),
+            {'files': 1, 'errors': 0, 'new': 0, 'updated': 1,
+             'unchanged': 0, 'copied': 1})
+        self.session.expire_all()
+        self.assertEquals(self.services()['a'].package, 'pkg')
+
+    def test_invalid_service(self):
+        """a batch which fails is imported service by service"""
+        self.write('a')
+        # not a service type, refused by the database
+        self.write('b', type='unknown')
+        self.write('c')
+        self.write('d', type='<invalid xml')
+        self.assertEquals(
+            self.run_import(batch_size=10),
+            {'files': 4, 'errors': 2, 'new': 2, 'updated': 0,
+             'unchanged': 0, 'copied': 2})
+        self.assertEquals(sorted(self.services().keys()), ['a', 'c'])
+        self.assertFalse(os.path.exists(self.xml_file('b')))
+
+    def test_duplicate_in_failed_batch(self):
+        """a service imported one by one is known
+        by the next items of the batch"""
+        # the same service in another file
+        second = os.path.join(self.xml_dir, 'second.xml')
+        os.rename(self.write('a', description='second'), second)
+        paths = [self.write('a'), self.write('b', type='unknown'), second]
+        self.assertEquals(
+            self.run_import(paths, batch_size=10),
+            {'files': 3, 'errors': 1, 'new': 1, 'updated': 1,
+             'unchanged': 0, 'copied': 2})
+        self.session.expire_all()
+        self.assertEquals(self.services()['a'].description, 'second')
+
+    def test_directory(self):
+        for name in ('a', 'b', 'c', 'd'):
+            self.write(name)
+        stats = self.legacy.import_mobyle1_service_directory(
+            self.xml_dir, processes=2)
+        self.assertEquals(
+            dict([(k, stats[k]) for k in (
+                'files', 'errors', 'new', 'updated', 'unchanged', 'copied')]),
+            {'files': 4, 'errors': 0, 'new': 4, 'updated': 0,
+             'unchanged': 0, 'copied': 4})
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
+
+# vim:set et sts=4 ts=4 tw=80:
@@ -1,38 +1,268 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 __docformat__ = 'restructuredtext en'
+import os
+import shutil
+import tempfile
 import unittest
 from pyramid.config import Configurator
 from pyramid import testing
 
+from apex.models import create_user, AuthUser
 
-from mobyle2.core.models import initialize_sql, DBSession, Base
-from mobyle2.core.models.project import Project
+from mobyle2.core import auth as pauth
+from mobyle2.core.basemodel import R
+from mobyle2.core.models import auth, user
+from mobyle2.core.models.project import Project, ProjectResource, \
+        ProjectUserRole, ProjectGroupRole, projects_dir, \
+        PUBLIC_PROJECT_USERNAME
+from mobyle2.core.models.server import Server, ProjectServer, \
+        create_local_server
+from mobyle2.core.models.service import Service
+from mobyle2.core.views import project as vproject
+from mobyle2.core.tests import utils
 
 def _initTestingDB():
-    from sqlalchemy import create_engine
-    initialize_sql(create_engine('sqlite://'))
-    session = DBSession()
-    return session
+    # the session (and the database) is shared by the tests
+    return utils.get_session()
 
-class TestProject(unittest.TestCase):
+class ProjectTestCase(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp()
         self.session = _initTestingDB()
+        self.directory = tempfile.mkdtemp()
+        projects_dir(self.directory)
+        create_local_server()
+        self.name = self.id().split('.')[-1]
 
     def tearDown(self):
         testing.tearDown()
+        shutil.rmtree(self.directory)
+
+    def create_user(self, login):
+        ausr = AuthUser.get_by_login(login)
+        if ausr is None:
+            ausr = create_user(login=login, username=login,
+                               email=u'%s@internal' % login)
+            usr = user.User(base_user=ausr)
+            self.session.add(usr)
+            self.session.commit()
+        return user.User.by_id(ausr.id)
 
-    def test_creation(self):
-        import pdb;pdb.set_trace()  ## Breakpoint ##
 
+class TestProject(ProjectTestCase):
+    def test_creation(self):
+        owner = self.create_user(u'%s_owner' % self.name)
+        p = Project.create(u'%s_project' % self.name, u'desc', owner)
+        self.assertEquals(p.owner, owner)
+        self.assertTrue(os.path.isdir(p.directory))
+        self.assertEquals(
+            [r.name for r in ProjectResource(p).get_roles_for_user(owner)],
+            [R['project_owner']])
 
     #def test_it(self):
     #    from tutorial.views import my_view
     #    request = testing.DummyRequest()
     #    info = my_view(request)
     #    self.assertEqual(info['root'].name, 'root')
-    #    self.assertEqual(info['project'], 'tutorial') 
+    #    self.assertEqual(info['project'], 'tutorial')
+
+
+class TestProjectsList(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+        self.public = self.create_user(PUBLIC_PROJECT_USERNAME).projects[0]
+        n = self.name
+        self.usr = self.create_user(u'%s_user' % n)
+        owner = self.create_user(u'%s_owner' % n)
+        group = user.Group(name=u'%s_group' % n)
+        self.session.add(group)
+        self.usr.groups.append(group)
+        watcher = auth.Role.by_name(R['project_watcher'])
+        contributor = auth.Role.by_name(R['project_contributor'])
+        # owned: an owner role and a group role on the same project
+        a1 = Project.create(u'%s_a1' % n, u'a1', self.usr)
+        self.session.add(ProjectGroupRole(a1, contributor, group))
+        Project.create(u'%s_a2' % n, u'a2', self.usr)
+        # a user role and a group role on the same project
+        b = Project.create(u'%s_b' % n, u'b', owner)
+        self.session.add(ProjectUserRole(b, watcher, self.usr))
+        self.session.add(ProjectGroupRole(b, contributor, group))
+        c = Project.create(u'%s_c' % n, u'c', owner)
+        self.session.add(ProjectGroupRole(c, watcher, group))
+        # no role
+        Project.create(u'%s_d' % n, u'd', owner)
+        self.session.commit()
+        self.own = [self.usr.projects[0].name, u'%s_a1' % n, u'%s_a2' % n]
+        self.activity = [u'%s_b' % n, u'%s_c' % n]
+
+    def request(self, view=vproject.List, **params):
+        request = utils.DummyRequest(params=params)
+        request.user = utils.DummyAuthUser(self.usr.id)
+        request.matched_route = None
+        request.context = request.root['projects']
+        self.config = testing.setUp(request=request)
+        self.config.set_authorization_policy(pauth.ACLAuthorizationPolicy())
+        return view(request)
+
+    def get_page(self, **params):
+        data = self.request(**params).get_page()
+        return data, [(section, resource.context.name)
+                      for section, resource in data['items']]
+
+    def test_one_row_per_project(self):
+        data, items = self.get_page()
+        self.assertEquals(
+            items,
+            [('public', self.public.name)]
+            + [('own', p) for p in self.own]
+            + [('activity', p) for p in self.activity])
+        self.assertFalse(data['has_next'])
+
+    def test_pages(self):
+        data, items = self.get_page(page_size='2')
+        self.assertEquals(
+            items,
+            [('public', self.public.name),
+             ('own', self.own[0]), ('own', self.own[1])])
+        self.assertTrue(data['has_next'])
+        # the public project is only on the first page
+        data, items = self.get_page(page_size='2', page='2')
+        self.assertEquals(items, [('own', self.own[2]),
+                                  ('activity', self.activity[0])])
+        self.assertTrue(data['has_next'])
+        data, items = self.get_page(page_size='2', page='3')
+        self.assertEquals(items, [('activity', self.activity[1])])
+        self.assertFalse(data['has_next'])
+        data, items = self.get_page(page_size='2', page='4')
+        self.assertEquals(items, [])
+        self.assertFalse(data['has_next'])
+
+    def test_reverse_order(self):
+        data, items = self.get_page(order='-name')
+        self.assertEquals(data['order'], '-name')
+        self.assertEquals(
+            items,
+            [('public', self.public.name)]
+            + [('own', p) for p in reversed(self.own)]
+            + [('activity', p) for p in reversed(self.activity)])
+        # unknown orders fall back to the name
+        data, items = self.get_page(order='owner')
+        self.assertEquals(data['order'], 'name')
+
+    def test_public_project(self):
+        # the public project is listed once even when it is a member
+        public_group = self.usr.groups[0]
+        self.session.add(ProjectGroupRole(
+            self.public, auth.Role.by_name(R['project_watcher']),
+            public_group))
+        self.session.commit()
+        data, items = self.get_page()
+        self.assertEquals([i for i in items if i[1] == self.public.name],
+                          [('public', self.public.name)])
+
+    def test_json(self):
+        data = self.request(vproject.AjaxList, page_size='3')()
+        self.assertEquals(
+            (data['page'], data['page_size'], data['order'],
+             data['has_next']),
+            (1, 3, 'name', True))
+        self.assertEquals(
+            [(i['section'], i['name']) for i in data['items']],
+            [('public', self.public.name)]
+            + [('own', p) for p in self.own])
+        a1 = Project.by_name(self.own[1])
+        self.assertEquals(
+            data['items'][2],
+            {'id': a1.id, 'name': a1.name, 'description': a1.description,
+             'section': 'own',
+             'url': 'http://example.com/projects/%s/' % a1.id})
+        data = self.request(vproject.AjaxList, page_size='3', page='2')()
+        self.assertEquals(
+            [(i['section'], i['name']) for i in data['items']],
+            [('activity', p) for p in self.activity])
+        self.assertFalse(data['has_next'])
+
+class TestServicesTreeview(ProjectTestCase):
+    def setUp(self):
+        ProjectTestCase.setUp(self)
+        self.public = self.create_user(PUBLIC_PROJECT_USERNAME).projects[0]
+        self.usr = self.create_user(u'%s_user' % self.name)
+        self.project = self.usr.projects[0]
+        self.server = Server.get_local_server()
+
+    def add_service(self, name, classification, project):
+        s = Service(name=u'%s_%s' % (self.name, name),
+                    classification=u'%s:%s' % (self.name, classification),
+                    server=self.server, project=project)
+        self.session.add(s)
+        self.session.commit()
+        return s
+
+    def get_tree(self):
+        """The branch of the classifications of this test"""
+        request = utils.DummyRequest()
+        request.user = utils.DummyAuthUser(self.usr.id)
+        request.matched_route = None
+        self.config = testing.setUp(request=request)
+        self.config.set_authorization_policy(pauth.ACLAuthorizationPolicy())
+        tree = vproject.ClassificationsServicesTreeview(request)()[0]
+        programs = [c for c in tree['children']
+                    if c['data']['title'] == 'Programs']
+        self.assertEquals(len(programs), 1)
+        return [self.branch(c) for c in programs[0]['children']
+                if c['data']['title'] == self.name]
+
+    def branch(self, node):
+        return (node['data']['title'],
+                [self.branch(c) for c in node['children']])
+
+    def test_merge(self):
+        """the categories of the public project and of the
+        user project are merged"""
+        self.add_service('s1', 'Multiple', self.public)
+        self.add_service('s2', 'Pairwise', self.project)
+        self.add_service('s3', 'Multiple', self.project)
+        n = self.name
+        self.assertEquals(
+            self.get_tree(),
+            [(n, [('Multiple', [('%s_s1' % n, []), ('%s_s3' % n, [])]),
+                  ('Pairwise', [('%s_s2' % n, [])])])])
+
+    def test_invalidation(self):
+        n = self.name
+        self.add_service('s1', 'Multiple', self.public)
+        self.assertEquals(
+            self.get_tree(),
+            [(n, [('Multiple', [('%s_s1' % n, [])])])])
+        # a new service
+        s2 = self.add_service('s2', 'Pairwise', self.project)
+        self.assertEquals(
+            self.get_tree(),
+            [(n, [('Multiple', [('%s_s1' % n, [])]),
+                  ('Pairwise', [('%s_s2' % n, [])])])])
+        # a modified service
+        s2.classification = u'%s:Other' % n
+        self.session.commit()
+        self.assertEquals(
+            self.get_tree(),
+            [(n, [('Multiple', [('%s_s1' % n, [])]),
+                  ('Other', [('%s_s2' % n, [])])])])
+        # the server is unlinked from the project
+        self.project.servers.remove(self.server)
+        self.session.commit()
+        self.assertEquals(
+            self.get_tree(),
+            [(n, [('Multiple', [('%s_s1' % n, [])])])])
+        # and linked again
+        self.session.add(ProjectServer(self.project, self.server))
+        self.session.commit()
+        self.session.expire(self.project)
+        self.assertEquals(
+            self.get_tree(),
+            [(n, [('Multiple', [('%s_s1' % n, [])]),
+                  ('Other', [('%s_s2' % n, [])])])])
+
 
 def test_suite():
     return unittest.defaultTestLoader.loadTestsFromName(__name__)
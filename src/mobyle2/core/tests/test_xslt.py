@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__docformat__ = 'restructuredtext en'
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from mobyle2.core import xslt
+
+PROGRAM_XML = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<program>
+  <head>
+    <name>%(name)s</name>
+    <version>0.0</version>
+    <doc>
+      <title>%(title)s</title>
+      <description>
+        <text lang="en">XSLT test</text>
+      </description>
+    </doc>
+    <category>cat1</category>
+    <command>the_command</command>
+    <interface type="form">
+      <fieldset xmlns="http://www.w3.org/1999/xhtml">
+        <label for="param1">parameter 1</label>
+        <input name="param1" value="10"/>
+        <select name="param2">
+          <option value="a">first</option>
+          <option value="b">second</option>
+        </select>
+      </fieldset>
+    </interface>
+  </head>
+  <parameters>
+    <parameter ismandatory="1" issimple="1">
+      <name>param1</name>
+      <prompt lang="en">parameter 1</prompt>
+      <type>
+        <datatype><class>Integer</class></datatype>
+      </type>
+      <vdef><value>10</value></vdef>
+    </parameter>
+    <parameter>
+      <name>param2</name>
+      <prompt lang="en">parameter 2</prompt>
+      <type>
+        <datatype><class>Choice</class></datatype>
+      </type>
+      <vdef><value>a</value></vdef>
+      <vlist>
+        <velem><value>a</value><label>first</label></velem>
+        <velem><value>b</value><label>second</label></velem>
+      </vlist>
+    </parameter>
+  </parameters>
+</program>
+"""
+
+def old_render(xml_url, xsl_pipe):
+    """The rendering of JobCreate.render_xml_service before the cache"""
+    parser = etree.XMLParser(no_network=False)
+    parser.resolvers.add(xslt.CustomResolver())
+    xml = etree.parse(xml_url, parser)
+    for uri, params in xsl_pipe:
+        xslt_doc = etree.parse(uri, parser)
+        transform = etree.XSLT(xslt_doc)
+        parser = etree.XMLParser(no_network=False)
+        xml = transform(xml, **params)
+    return xml
+
+
+class FakeServer(object):
+    name = 'localhost'
+
+
+class FakeService(object):
+    server = FakeServer()
+
+    def __init__(self, name, xml_file):
+        self.name = name
+        self.xml_file = xml_file
+        self.xml_url = 'file://%s' % xml_file
+
+
+class TestXSLT(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        xslt.form_cache.invalidate()
+        xslt.xslt_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        xslt.form_cache.invalidate()
+        xslt.xslt_cache.clear()
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        f = open(path, 'w')
+        f.write(content)
+        f.close()
+        return path
+
+    def write_program(self, name, title='XSLT test'):
+        return 'file://%s' % self.write('%s.xml' % name, PROGRAM_XML % {
+            'name': name, 'title': title})
+
+    def test_render(self):
+        xml_url = self.write_program('prog')
+        pipe = xslt.form_pipe('localhost.prog')
+        old = old_render(xml_url, pipe)
+        form = xslt.render(xml_url, pipe)
+        self.assertTrue(isinstance(form, unicode))
+        self.assertEquals(form, unicode(old))
+        self.assertTrue('param1' in form)
+        # the same form, from the cache
+        hits = xslt.form_cache.hits
+        self.assertEquals(xslt.render(xml_url, pipe), form)
+        self.assertEquals(xslt.form_cache.hits, hits + 1)
+        # another program PID
+        pipe = xslt.form_pipe('other.prog')
+        self.assertEquals(xslt.render(xml_url, pipe),
+                          unicode(old_render(xml_url, pipe)))
+
+    def test_modified_service(self):
+        xml_url = self.write_program('prog')
+        pipe = xslt.form_pipe('localhost.prog')
+        xslt.render(xml_url, pipe)
+        xml_url = self.write_program('prog', title='Modified title')
+        form = xslt.render(xml_url, pipe)
+        self.assertEquals(form, unicode(old_render(xml_url, pipe)))
+
+    def test_modified_stylesheet(self):
+        xml_url = self.write_program('prog')
+        xsl = ('<xsl:stylesheet version="1.0" '
+               'xmlns:xsl="http://www.w3.org/1999/XSL/Transform">'
+               '<xsl:output method="text"/>'
+               '<xsl:template match="/">%s<xsl:value-of '
+               'select="/program/head/name"/></xsl:template>'
+               '</xsl:stylesheet>')
+        path = self.write('test.xsl', xsl % 'first ')
+        self.assertEquals(xslt.render(xml_url, [(path, {})]), u'first prog')
+        self.write('test.xsl', xsl % 'second ')
+        # mtime resolution of the file system
+        mtime = os.stat(path).st_mtime + 1
+        os.utime(path, (mtime, mtime))
+        self.assertEquals(xslt.render(xml_url, [(path, {})]), u'second prog')
+
+    def test_warm_up(self):
+        services = [FakeService('a', self.write_program('a')[7:]),
+                    FakeService('b', self.write_program('b')[7:]),
+                    FakeService('missing',
+                                os.path.join(self.directory, 'missing.xml'))]
+        forms = xslt.service_forms(services)
+        self.assertEquals(
+            forms,
+            [(services[0].xml_url, 'localhost.a'),
+             (services[1].xml_url, 'localhost.b')])
+        misses = xslt.form_cache.misses
+        self.assertEquals(xslt.warm_up_forms(forms), 2)
+        # each form rendered once
+        self.assertEquals(xslt.form_cache.misses, misses + 2)
+        hits = xslt.form_cache.hits
+        form = xslt.render(services[0].xml_url, xslt.form_pipe('localhost.a'))
+        self.assertEquals(xslt.form_cache.hits, hits + 1)
+        self.assertEquals(
+            form, unicode(old_render(services[0].xml_url,
+                                     xslt.form_pipe('localhost.a'))))
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
+
+# vim:set et sts=4 ts=4 tw=80:
@@ -15,7 +15,7 @@ from sqlalchemy import create_engine
 
 from mobyle2.core.models import DBSession
 from mobyle2.core.models import root
-from mobyle2.core.models.init import initialize_sql
+from mobyle2.core.models import initialize_sql
 from mobyle2.core.utils import _
 
 from pyramid.i18n import get_localizer
@@ -85,7 +85,7 @@ def get_sa_url():
     return 'sqlite://'
 
 def get_session():
-    from mobyle2.core.tests.utils import __session__
+    global __session__
     if not __session__:
         initialize_sql(create_engine(get_sa_url()))
         __session__ = DBSession()
@@ -168,4 +168,12 @@ class DummyRequest(testing.DummyRequest):
         localizer = get_localizer(self)
         return localizer.translate(_(string)) 
 
+
+class DummyAuthUser(object):
+    """request.user as set by apex"""
+    last_login = None
+
+    def __init__(self, id):
+        self.id = id
+
 # vim:set et sts=4 ts=4 tw=80:
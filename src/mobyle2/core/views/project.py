@@ -2,15 +2,10 @@
 # -*- coding: utf-8 -*-
 import os
 import copy
-import urllib
 import logging
 
 from ordereddict import OrderedDict
 
-import pkg_resources
-
-from lxml import etree
-
 from sqlalchemy.sql import expression as se
 
 import colander
@@ -20,30 +15,49 @@ import deform
 from pyramid.renderers import render_to_response
 from pyramid.security import has_permission
 from pyramid.httpexceptions import HTTPFound
+from pyramid.interfaces import IAuthorizationPolicy
 
 from mobyle2.core.basemodel import P
 from mobyle2.core.views import Base, get_base_params
-from mobyle2.core.utils import _
+from mobyle2.core.utils import _, normalizeId, mobyle2_settings
 from mobyle2.core import widget
+from mobyle2.core.cache import Cache
+from mobyle2.core import xslt
+from mobyle2.core.xslt import SERVICE_STYLES_DIR, CustomResolver
 from mobyle2.core.models import (
     project,
+    server,
+    service,
     user,
     auth as a,
     DBSession as session
 )
 from mobyle2.core import validator as v
 
-SERVICE_STYLES_DIR = pkg_resources.resource_filename('mobyle2.core', 'static/service_styles')
 R = a.R
 J = os.path.join
 
-class CustomResolver(etree.Resolver):
-    """CustomResolver is a Resolver for lxml that allows
-    (among other things) to handle HTTPS protocol,
-    which is not handled natively by lxml/libxml2.
-    """
-    def resolve(self, url, id, context):
-        return self.resolve_file(urllib.urlopen(url), context)
+TREEVIEW_CACHE_TTL = 300
+"""Default lifetime (in seconds) of the cached treeviews,
+see the mobyle2.treeview_cache_ttl setting"""
+treeview_cache = Cache(ttl=TREEVIEW_CACHE_TTL)
+"""Branches of the services treeviews by project and role set"""
+treeview_cache.invalidate_on(
+    service.Service,
+    server.Server,
+    server.ProjectServer,
+    project.ProjectUserRole,
+    project.ProjectGroupRole,
+    user.UserRole,
+    user.GroupRole,
+    user.AuthUserGroups,
+)
+treeview_cache.invalidate_on_collection(
+    project.Project.servers,
+    user.User.global_roles,
+    user.User.groups,
+    user.Group.global_roles,
+)
 
 class ProjectView(Base):
     def __init__(self, request):
@@ -117,24 +131,25 @@ class Add(ProjectView):
         return render_to_response(self.template, params, self.request)
 
 
+PROJECTS_PAGE_SIZE = 50
+PROJECTS_MAX_PAGE_SIZE = 500
+PROJECTS_ORDERS = OrderedDict([
+    ('name', project.Project.name),
+    ('id', project.Project.id),
+    ('description', project.Project.description),
+])
+"""Orderings of the projects list, prefix them with - to reverse"""
+
 class List(Base):
+    """Public project, projects owned by the user and projects where the
+    user has a role. The projects are loaded by one query, a page at a
+    time (page and page_size parameters), sorted by the order parameter
+    (see PROJECTS_ORDERS)"""
     template = '../templates/project/project_list.pt'
-    def __call__(self):
-        c = self.request.context
-        request = self.request
-        params = {}
-        params.update(get_base_params(self))
-        projects = OrderedDict()
-        projects['public'] = {
-            'label':_('Public projects') ,
-            'items':[c.find_context(project.Project.get_public_project())['item']]}
-        def not_present(p):
-            ids = []
-            for k in projects:
-                if p.id in [q.context.id for q in projects[k]['items']]:
-                    return False
-            return True
+
+    def get_user(self):
         # maybe we are admin and want to see projects from a particular user
+        request = self.request
         usr, id = None, -666
         anonym = not getattr(self.request, 'user', False)
         if not anonym:
@@ -148,21 +163,109 @@ class List(Base):
                 pass
         if usr is None and not anonym:
             usr = user.User.by_id(self.request.user.id)
+        return usr
+
+    def get_int_param(self, name, default, minimum, maximum=None):
+        try:
+            value = int(self.request.params.get(name, default))
+        except ValueError:
+            value = default
+        value = max(value, minimum)
+        if maximum is not None:
+            value = min(value, maximum)
+        return value
+
+    def get_page(self):
+        """The projects of the requested page as (section, resource)
+        and the pagination parameters"""
+        c, request = self.request.context, self.request
+        page = self.get_int_param('page', 1, 1)
+        page_size = self.get_int_param('page_size', PROJECTS_PAGE_SIZE,
+                                       1, PROJECTS_MAX_PAGE_SIZE)
+        order = request.params.get('order', 'name')
+        if not order.lstrip('-') in PROJECTS_ORDERS:
+            order = 'name'
+        data = {'page': page, 'page_size': page_size, 'order': order,
+                'items': [], 'has_next': False, 'user': self.get_user()}
+        public_project = project.Project.get_public_project()
+        if page == 1 and public_project is not None:
+            data['items'].append(
+                ('public',
+                 c.find_context(public_project, public_project)['item']))
+        usr = data['user']
         if usr is not None:
+            Project = project.Project
+            column = PROJECTS_ORDERS[order.lstrip('-')]
+            if order.startswith('-'):
+                column = column.desc()
+            query = Project.by_member(usr)
+            if public_project is not None:
+                query = query.filter(Project.id != public_project.id)
+            # the owned projects first, then the other ones
+            query = query.order_by(
+                se.case([(Project.user_id == usr.id, 0)], else_=1),
+                column, Project.id)
+            # one more row tells if there is a next page
+            rows = query.offset((page - 1) * page_size).limit(page_size + 1).all()
+            data['has_next'] = len(rows) > page_size
+            for p in rows[:page_size]:
+                section = 'activity'
+                if p.user_id == usr.id:
+                    section = 'own'
+                data['items'].append(
+                    (section, c.find_context(p, public_project)['item']))
+        return data
+
+    def page_url(self, data, page):
+        query = {'page': page,
+                 'page_size': data['page_size'],
+                 'order': data['order']}
+        if 'id' in self.request.params:
+            query['id'] = self.request.params['id']
+        return self.request.resource_url(
+            self.request.context, '@@%s' % self.request.view_name, query=query)
+
+    def __call__(self):
+        params = {}
+        params.update(get_base_params(self))
+        data = self.get_page()
+        projects = OrderedDict()
+        projects['public'] = {'label':_('Public projects'), 'items': []}
+        if data['user'] is not None:
             projects['own'] = {'label':_('My projects'), 'items': []}
-            pr = project.Project.by_owner(usr)
-            for p in pr:
-                if not_present(p) and p is not None:
-                    projects['own']['items'].append(c.find_context(p)['item'])
             projects['activity'] = {'label':_('Projects where i have activities'), 'items': []}
-            pr = project.Project.by_participation(usr)
-            for p in pr:
-                if not_present(p) and p is not None:
-                    projects['activity']['items'].append(c.find_context(p)['item'])
+        for section, resource in data['items']:
+            projects[section]['items'].append(resource)
         params['projects_map'] = projects
+        params['previous_url'] = params['next_url'] = None
+        if data['page'] > 1:
+            params['previous_url'] = self.page_url(data, data['page'] - 1)
+        if data['has_next']:
+            params['next_url'] = self.page_url(data, data['page'] + 1)
         return render_to_response(self.template, params, self.request)
 
 
+class AjaxList(List):
+    """JSON variant of the projects list, for infinite scrolling"""
+
+    def __call__(self):
+        request = self.request
+        data = self.get_page()
+        items = []
+        for section, resource in data['items']:
+            p = resource.context
+            items.append({'id': p.id,
+                          'name': p.name,
+                          'description': p.description,
+                          'section': section,
+                          'url': request.resource_url(resource)})
+        return {'page': data['page'],
+                'page_size': data['page_size'],
+                'order': data['order'],
+                'has_next': data['has_next'],
+                'items': items}
+
+
 class View(Base):
     template = '../templates/project/project_view.pt'
     def __call__(self):
@@ -364,26 +467,20 @@ class JobCreate(ServersHome):
         # uniqueness on the server and (2) display execution server on the
         # portal
         self.service_pid = '%s.%s' % (c.server.name, c.service.name)
-        self.xsl_form_path = J(SERVICE_STYLES_DIR, "form.xsl")
+        self.xsl_form_path = xslt.FORM_XSL
         self.xsl_form_url = 'file://%s' % self.xsl_form_path
-        self.xsl_nspath = J(SERVICE_STYLES_DIR, "remove_ns.xsl")
+        self.xsl_nspath = xslt.REMOVE_NS_XSL
         self.xsl_nsurl =  'file://%s' % self.xsl_nspath
-        self.xsl_pipe = [(self.xsl_form_path,
-                          {'programPID': "'"+self.service_pid+"'"}), (self.xsl_nspath, {})]
+        self.xsl_pipe = xslt.form_pipe(self.service_pid)
         self.xml_url = c.service.xml_url
 
     def render_xml_service(self, xml_url=None, xsl_pipe=None):
+        """Render the form of the service as a unicode string (it was
+        the lxml result tree), the compiled stylesheets and the
+        rendered forms are cached (see mobyle2.core.xslt)"""
         if not xml_url: xml_url = self.xml_url
         if not xsl_pipe: xsl_pipe = self.xsl_pipe
-        parser = etree.XMLParser(no_network=False)
-        parser.resolvers.add(CustomResolver())
-        xml = etree.parse(xml_url, parser)
-        for uri, params in xsl_pipe:
-            xslt_doc = etree.parse(uri, parser)
-            transform = etree.XSLT(xslt_doc)
-            parser = etree.XMLParser(no_network=False)
-            xml = transform(xml, **params)
-        return xml
+        return xslt.render(xml_url, xsl_pipe)
 
     def __call__(self):
         form, request, context = None, self.request, self.request.context
@@ -492,65 +589,92 @@ class Treeview(Base):
         """Implement treeview construction here"""
 
     def __call__(self):
-        """A CACHER !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"""
         self.construct_treeview()
         return [self.tree]
 
 
 class ServicesTreeview(Treeview):
+    """Tree of the services of the public project and of the user
+    projects. The branches of each project are cached by project
+    and by the roles of the user in the project (treeview_cache)"""
     treeview_title = _('Services')
     by_packages = False
     by_classifications = False
 
-    def fill_treeview(self, data, name='', parent=None):
+    def __init__(s, request):
+        Treeview.__init__(s, request)
+        # children of the nodes by title, to merge the branches
+        s.children_index = {}
+
+    def get_categories(self, rproject):
+        if ((not self.by_classifications)
+            and (not self.by_packages)):
+            raise Exception('by classif or by package!')
+        if self.by_packages:
+            return rproject.context.get_services_by_package()
+        return rproject.context.get_services_by_classification()
+
+    def build_branches(self, data):
+        """Convert the services categories of a project to
+        (title, href, children) tuples"""
+        request = self.request
+        branches = []
+        for node_title in data['children']:
+            child = data['children'][node_title]
+            title, href = self.titles.get(node_title, node_title), '#'
+            resource = child.get('resource', None)
+            if resource is not None:
+                rserver = self.get_server_resource(resource.server, resource.project)
+                # the url of the service resource, without building
+                # the resources of all the services of the server
+                href = request.resource_url(
+                    rserver, '%ss' % resource.type,
+                    normalizeId(resource.name), '@@job_create')
+                title = resource.name
+            branches.append((title, href, self.build_branches(child)))
+        return tuple(branches)
+
+    def get_branches(self, rproject):
         request = self.request
-        attr = {}
-        name = data.get('name', name)
-        resource = data.get('resource', None)
-        if resource is not None:
-            rserver = self.get_server_resource(resource.server, resource.project)
-            service = rserver.items[
-            '%ss' % resource.type].find_context(resource)['item']
-            attr['href'] = '%s@@job_create' % request.resource_url(service)
-            name = service.context.name
-        subdata = self.treeview_node(name, attr)
-        # the first node must be skipped, empty node
+        ap = request.registry.queryUtility(IAuthorizationPolicy)
+        principals = tuple(sorted(ap.get_contextual_principals(rproject)))
+        key = (self.__class__.__name__,
+               rproject.context.id,
+               principals,
+               request.locale_name,
+               request.application_url)
+        ttl = float(mobyle2_settings('treeview_cache_ttl',
+                                     TREEVIEW_CACHE_TTL,
+                                     registry=request.registry))
+        return treeview_cache.get(
+            key,
+            lambda: self.build_branches(self.get_categories(rproject)),
+            ttl=ttl)
+
+    def fill_treeview(self, branches, parent=None):
+        """Merge the branches in the tree, the nodes
+        with the same title under a parent are merged"""
         if parent is None:
             parent = self.tree
-        else:
-            if not subdata["data"]["title"] in [s["data"]["title"] for s in parent['children']]:
-                parent['children'].append(subdata)
-                parent = subdata
-            else:
-                parent = [s
-                          for s in parent['children']
-                          if subdata['data']['title'] == s['data']['title']][0]
-        if data.has_key('children'):
-            for node_title in data['children']:
-                self.fill_treeview(data['children'][node_title],
-                                   self.titles.get(node_title, node_title), parent)
+        index = self.children_index.setdefault(id(parent), {})
+        for title, href, children in branches:
+            node = index.get(title, None)
+            if node is None:
+                node = index[title] = self.treeview_node(title, href=href)
+                parent['children'].append(node)
+            self.fill_treeview(children, node)
 
     def construct_treeview(self):
         req = self.request
-        services = OrderedDict()
         projects = req.root['projects']
         public_project = project.Project.get_public_project()
-        rpublic_project = projects.find_context(public_project)['item']
-        def add_ressource(rproject):
-            if ((not self.by_classifications)
-                and (not self.by_packages)):
-                raise Exception('by classif or by package!')
-            if self.by_packages:
-                categs = rproject.context.get_services_by_package()
-            elif self.by_classifications:
-                categs = rproject.context.get_services_by_classification()
-            self.fill_treeview(categs)
-        add_ressource(rpublic_project)
+        rpublic_project = projects.find_context(public_project, public_project)['item']
+        self.fill_treeview(self.get_branches(rpublic_project))
         if req.user:
             usr = user.User.by_id(req.user.id)
             for pr in usr.projects:
-                rproject = projects.find_context(pr)['item']
-                add_ressource(rproject)
+                rproject = projects.find_context(pr, public_project)['item']
+                self.fill_treeview(self.get_branches(rproject))
 
 
 class ClassificationsServicesTreeview(ServicesTreeview):
@@ -3,6 +3,9 @@
 __docformat__ = 'restructuredtext en'
 
 import os
+import time
+import logging
+import threading
 #import pkg_resources
 from webob import Request, exc
 from pyramid.config import Configurator
@@ -10,6 +13,7 @@ from pyramid_beaker import session_factory_from_settings
 from mobyle2.core import utils
 from pyramid.threadlocal import get_current_registry
 from pyramid.exceptions import Forbidden
+from pyramid.settings import asbool
 
 from sqlalchemy import engine_from_config
 
@@ -172,6 +176,7 @@ def includeme(config, debug=False):
     config.add_subscriber('%s.subscribers.user_created'%dn, 'apex.events.UserCreatedEvent')
     config.add_subscriber('%s.subscribers.user_deleted'%dn, 'apex.events.UserDeletedEvent')
     config.add_subscriber('%s.subscribers.add_globals'%dn, 'pyramid.events.NewRequest')
+    config.add_subscriber('%s.subscribers.report_query_count'%dn, 'pyramid.events.NewResponse')
     config.add_subscriber('%s.subscribers.regenerate_velruse_config'%dn, '%s.events.RegenerateVelruseConfigEvent' % dn)
     # static files
     config.add_static_view('s', '%s:static'%dn)
@@ -193,6 +198,7 @@ def includeme(config, debug=False):
     # project urls
     config.add_view('%s.views.project.Home' % dn, name='', context='%s.models.project.Projects' % dn, permission = P['global_view'])
     config.add_view('%s.views.project.List' % dn, name='list', context='%s.models.project.Projects' % dn, permission = P['project_list'])
+    config.add_view('%s.views.project.AjaxList' % dn, name='ajax_projects_list', context='%s.models.project.Projects' % dn, renderer='json', permission = P['project_list'])
     config.add_view('%s.views.project.Edit' % dn, name='edit', context='%s.models.project.ProjectResource' % dn, permission = P['project_edit'])
     config.add_view('%s.views.project.Add' % dn,  name='add', context='%s.models.project.Projects' % dn, permission = P['project_create'])
     config.add_view('%s.views.project.View' % dn, name='',   context='%s.models.project.ProjectResource' % dn, permission = P['project_view'])
@@ -250,12 +256,36 @@ def includeme(config, debug=False):
     projects_dir(settings[PROJECTS_DIR])
     create_local_server(registry=config.registry)
     create_public_workspace(registry=config.registry)
+    if asbool(settings.get('mobyle2.warmup_forms', True)):
+        warm_up_forms(settings)
     # reflect configuration because we do not have the registry avalaible in the pyramid machinery
     # at the server configuration
 
     set_registry_key('mobyle2.needrestart', False)
     return config
 
+def warm_up_forms(settings):
+    """Compile the services stylesheets and render the forms of all
+    the enabled services in a background thread, each form once.
+    Set mobyle2.warmup_forms = false to skip it"""
+    from sqlalchemy.orm import joinedload
+    from mobyle2.core.models.service import Service
+    from mobyle2.core import xslt
+    services = DBSession.query(Service).options(
+        joinedload(Service.server)).filter(Service.enable == True).all()
+    # read the services here, the thread does not use the session
+    forms = xslt.service_forms(services)
+    def warm_up():
+        start = time.time()
+        rendered = xslt.warm_up_forms(forms)
+        logging.getLogger('mobyle2.xslt').info(
+            '%s forms of %s services rendered in %.2fs' % (
+                rendered, len(services), time.time() - start))
+    thread = threading.Thread(target=warm_up, name='mobyle2-warmup-forms')
+    thread.setDaemon(True)
+    thread.start()
+    return thread
+
 def wsgi_app_factory(global_config, **local_config):
     """
     A paste.httpfactory to wrap a pyramid WSGI based application.
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+__docformat__ = 'restructuredtext en'
+"""
+Rendering of the services XML descriptions with the XSLT stylesheets.
+
+Compiling the stylesheets (form.xsl is large) dominates the rendering
+of a job form, the compiled transforms are kept for the life of the
+process and recompiled only when a stylesheet (or a stylesheet it
+includes) is modified on disk.
+The rendered forms are cached by the hash of the service XML and the
+program PID (form_cache) and may be computed at the application start
+(warm_up_forms). The stylesheets do not depend on the locale.
+"""
+import os
+import hashlib
+import logging
+import threading
+import urllib
+import urlparse
+
+import pkg_resources
+
+from lxml import etree
+
+from mobyle2.core.cache import Cache
+
+SERVICE_STYLES_DIR = pkg_resources.resource_filename('mobyle2.core', 'static/service_styles')
+FORM_XSL = os.path.join(SERVICE_STYLES_DIR, "form.xsl")
+REMOVE_NS_XSL = os.path.join(SERVICE_STYLES_DIR, "remove_ns.xsl")
+XSL_NS = 'http://www.w3.org/1999/XSL/Transform'
+
+FORM_CACHE_TTL = 24 * 3600
+"""Lifetime (in seconds) of the rendered forms, the key contains the
+hash of the service XML so it only bounds the memory held by the forms
+of the services which are not requested anymore"""
+form_cache = Cache(ttl=FORM_CACHE_TTL, maxsize=2000)
+"""Rendered forms by service XML hash and program PID"""
+
+
+class CustomResolver(etree.Resolver):
+    """CustomResolver is a Resolver for lxml that allows
+    (among other things) to handle HTTPS protocol,
+    which is not handled natively by lxml/libxml2.
+    """
+    def resolve(self, url, id, context):
+        return self.resolve_file(urllib.urlopen(url), context)
+
+
+def get_parser():
+    parser = etree.XMLParser(no_network=False)
+    parser.resolvers.add(CustomResolver())
+    return parser
+
+
+def form_pipe(program_pid):
+    """The stylesheets and their parameters which render
+    the form of a service"""
+    return [(FORM_XSL, {'programPID': "'%s'" % program_pid}),
+            (REMOVE_NS_XSL, {})]
+
+
+class XSLTCache(object):
+    """Compiled XSLT transforms by stylesheet path, a transform is
+    compiled again if the mtime of the stylesheet or of one of the
+    stylesheets it includes or imports has changed"""
+
+    def __init__(self):
+        # path: (signature, dependencies, transform)
+        self.transforms = {}
+        self.lock = threading.Lock()
+
+    def signature(self, paths):
+        sig = []
+        for path in paths:
+            try:
+                sig.append(os.stat(path).st_mtime)
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def dependencies(self, path, doc):
+        """The stylesheet and the local stylesheets it includes,
+        recursively"""
+        deps, todo = [path], [(path, doc)]
+        while todo:
+            current, current_doc = todo.pop()
+            for node in current_doc.iter('{%s}include' % XSL_NS,
+                                         '{%s}import' % XSL_NS):
+                href = node.get('href')
+                if not href or urlparse.urlparse(href)[0] not in ('', 'file'):
+                    continue
+                dep = os.path.normpath(os.path.join(
+                    os.path.dirname(current), urlparse.urlparse(href)[2]))
+                if dep not in deps and os.path.exists(dep):
+                    deps.append(dep)
+                    todo.append((dep, etree.parse(dep)))
+        return tuple(deps)
+
+    def get(self, path):
+        """Return the signature of the stylesheet and its
+        compiled transform"""
+        entry = self.transforms.get(path, None)
+        if entry is not None:
+            signature, deps, transform = entry
+            if self.signature(deps) == signature:
+                return signature, transform
+        self.lock.acquire()
+        try:
+            # compiled by another thread in the meantime ?
+            entry = self.transforms.get(path, None)
+            if entry is not None:
+                signature, deps, transform = entry
+                if self.signature(deps) == signature:
+                    return signature, transform
+            doc = etree.parse(path, get_parser())
+            deps = self.dependencies(path, doc)
+            # signature before compilation, a stylesheet modified
+            # meanwhile will be compiled again next time
+            signature = self.signature(deps)
+            transform = etree.XSLT(doc)
+            self.transforms[path] = (signature, deps, transform)
+            return signature, transform
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.transforms.clear()
+        finally:
+            self.lock.release()
+
+xslt_cache = XSLTCache()
+
+
+def transform(xml, xsl_pipe):
+    """Apply the stylesheets of the pipe to the xml tree"""
+    for path, params in xsl_pipe:
+        signature, xslt = xslt_cache.get(path)
+        xml = xslt(xml, **params)
+    return xml
+
+
+def render(xml_url, xsl_pipe):
+    """Render the XML at xml_url with the stylesheets of the pipe.
+    The result is serialized: a unicode string and not the lxml result
+    tree, it is cached by the hash of the XML and the pipe"""
+    data = urllib.urlopen(xml_url).read()
+    pipe = tuple((path, tuple(sorted(params.items())),
+                  xslt_cache.get(path)[0])
+                 for path, params in xsl_pipe)
+    key = (hashlib.sha1(data).hexdigest(), pipe)
+    def factory():
+        xml = etree.fromstring(data, get_parser(), base_url=xml_url)
+        return unicode(transform(etree.ElementTree(xml), xsl_pipe))
+    return form_cache.get(key, factory)
+
+
+def service_forms(services):
+    """(xml url, program PID) of the services which have an XML file"""
+    forms = []
+    for service in services:
+        if os.path.exists(service.xml_file):
+            forms.append((service.xml_url,
+                          '%s.%s' % (service.server.name, service.name)))
+    return forms
+
+
+def warm_up_forms(forms):
+    """Compile the stylesheets and render each form once,
+    forms are (xml url, program PID) as returned by service_forms.
+    Return the number of forms rendered"""
+    rendered = 0
+    for xml_url, program_pid in forms:
+        try:
+            render(xml_url, form_pipe(program_pid))
+            rendered += 1
+        except Exception, e:
+            logging.getLogger('mobyle2.xslt').error(
+                'Cannot render the form of %s: %s' % (program_pid, e))
+    return rendered
+
+# vim:set et sts=4 ts=4 tw=80: